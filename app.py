@@ -4,10 +4,12 @@
 import os
 
 from app import create_app
+from app.startup import warm_up
 
 
 def main():
     app = create_app()
+    warm_up(app)
     ssl_context = (
         app.config["SSL_CERTIFICATE"],
         app.config["SSL_PRIVATE_KEY"]
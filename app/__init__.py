@@ -1,70 +1,152 @@
 # -*- coding: utf-8 -*-
 
 
+import time
+from typing import Any
+
+import click
 from flask import Flask
 from flask_cors import CORS
+from sqlalchemy.orm import configure_mappers
 
 from . import api
+from . import cache
+from . import coalescing
+from . import compression
+from . import datagen
+from . import events
+from . import jobs
+from . import metrics
+from . import profiling
+from . import serialization
+from . import server
+from . import stamps
+from . import startup
+from . import tracing
 from .config import Config
+from .database import initialize_database
+from .database import print_sync
+from .database import print_reports
+from .database import seed
+from .database import synchronize_schema
 from .extensions import db
 from .extensions import jwt
 from .routes import auth
 from .routes import data
+from .routes import system
+from .startup import STARTUP_EXTENSION
+from .startup import StartupProfiler
+from .startup import install_routes
 
 
-def create_app() -> Flask:
-    app = Flask(__name__)
-    app.config.from_object(Config)
-    CORS(
-        app,
-        origins=[
-            "http://localhost:*",
-            "http://127.0.0.1:*",
-            "https://localhost:*",
-            "https://127.0.0.1:*",
-        ],
-        supports_credentials=True,
-    )
-
-    # 初始化扩展
-    db.init_app(app)
-    jwt.init_app(app)
-
-    api.initialize_hooks(app)
-    auth.initialize_hooks(app)
-    data.initialize_hooks(app)
+def create_app(**config: Any) -> Flask:
+    """
+    创建应用
 
-    app.register_blueprint(auth.bp, url_prefix="/api/auth")
-    app.register_blueprint(data.bp, url_prefix="/api/data")
+    :param config: 覆盖 :py:class:`Config` 中的配置项
+    :type config: Any
+
+    :return: 应用
+    :rtype: Flask
+    """
+    profiler = StartupProfiler()
+    with profiler.phase("create_app"):
+        with profiler.phase("加载配置"):
+            app = Flask(__name__)
+            app.config.from_object(Config)
+            app.config.update(config)
+            app.extensions[STARTUP_EXTENSION] = profiler
+            CORS(
+                app,
+                origins=[
+                    "http://localhost:*",
+                    "http://127.0.0.1:*",
+                    "https://localhost:*",
+                    "https://127.0.0.1:*",
+                ],
+                supports_credentials=True,
+            )
+
+        # 初始化扩展
+        with profiler.phase("初始化数据库"):
+            initialize_database(app)
+        with profiler.phase("初始化 JWT"):
+            jwt.init_app(app)
+
+        with profiler.phase("注册钩子与命令"):
+            tracing.initialize_hooks(app)
+            profiling.initialize_hooks(app)
+            metrics.initialize_hooks(app)
+            compression.initialize_compression(app)
+            stamps.initialize_stamps(app)
+            cache.initialize_cache(app)
+            coalescing.initialize_coalescing(app)
+            serialization.initialize_serialization(app)
+            events.initialize_events(app)
+            jobs.initialize_jobs(app)
+            api.initialize_hooks(app)
+            auth.initialize_hooks(app)
+            data.initialize_hooks(app)
+
+            auth.initialize_commands(app)
+            data.initialize_commands(app)
+            server.initialize_commands(app)
+            startup.initialize_commands(app)
+            datagen.initialize_commands(app)
+            tracing.initialize_commands(app)
+            profiling.initialize_commands(app)
+            jobs.initialize_commands(app)
+
+        with profiler.phase("配置映射"):
+            configure_mappers()
+
+        install_routes(app, register_blueprints)
 
     # 添加初始化命令
     @app.cli.command("init")
-    def init() -> None:
-        """初始化应用程序"""
+    @click.option("--force", is_flag=True, help="忽略已保存的摘要，重新写入所有种子数据")
+    def init(force: bool) -> None:
+        """初始化应用程序，可重复执行"""
 
         print("正在初始化应用程序")
-        for setup in [
-            create_all_with_progress,
-            auth.initialize_setup,
-            data.initialize_setup,
-        ]:
-            print()
-            setup()
+        start = time.perf_counter()
+        print()
+        create_all_with_progress()
+        print()
+        print("正在写入种子数据")
+        print()
+        with db.engine.begin() as connection:
+            reports = seed(connection, [*auth.seed_sets(), *data.seed_sets()], force=force)
+        stamps.invalidate_all()
+        print_reports(reports)
         print()
-        print("应用程序初始化完成")
+        print(f"应用程序初始化完成，耗时 {(time.perf_counter() - start) * 1000:.1f} ms")
 
     return app
 
 
+def register_blueprints(app: Flask) -> None:
+    auth.load_views()
+    data.load_views()
+    system.load_views()
+    app.register_blueprint(auth.bp, url_prefix="/api/auth")
+    app.register_blueprint(data.bp, url_prefix="/api/data")
+    app.register_blueprint(system.bp, url_prefix="/api")
+
+
 def create_all_with_progress() -> None:
-    print("正在创建数据库")
+    print("正在检查数据库结构")
     print()
 
-    for key in db.metadatas:
-        metadata, engine = db.metadatas[key], db.engines[key]
-        for table in metadata.sorted_tables:
-            print(f"正在创建表： {table.name}")
-            table.create(bind=engine, checkfirst=True)
+    for key, metadata in db.metadatas.items():
+        # 只读副本等绑定没有声明表
+        if not metadata.tables:
+            continue
+        sync = synchronize_schema(db.engines[key], metadata, apply=True)
+        if sync is None:
+            print("数据库结构未变化，跳过")
+        else:
+            print_sync(sync)
 
     print()
-    print("数据库创建完成")
+    print("数据库结构检查完成")
@@ -0,0 +1,473 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+学生数据分析
+
+每个进程在内存中以 NumPy 列数组保存 ``students`` 的维度（外键与布尔字段）与度量（数值字段），
+分组、筛选与聚合均为向量化运算，不再对宽表执行 ``GROUP BY``。
+
+列数组首次查询时整表加载，此后每次查询前按 :py:mod:`app.database.changes` 的变更记录增量更新；
+变更记录已被压缩或表被批量改写时重新加载。删除的行先标记，标记的行超过四分之一时再从数组中移除
+"""
+
+import threading
+from collections.abc import Sequence
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Optional
+
+from flask import current_app
+import numpy as np
+from numpy.typing import NDArray
+from sqlalchemy import Connection
+from sqlalchemy import Row
+from sqlalchemy import Table
+from sqlalchemy import select
+
+from .database import ChangeSet
+from .database import changes_since
+from .database import table_version
+from .extensions import db
+from .model_utils.utils import ColumnInfo
+
+TABLE_NAME = "students"
+ANALYTICS_EXTENSION = "analytics"
+
+DIMENSION = "dimension"
+FLAG = "flag"
+MEASURE = "measure"
+AGGREGATES = ("count", "sum", "mean", "min", "max")
+
+LOAD_CHUNK = 50000
+CHANGES_PAGE = 10000
+ID_CHUNK = 900
+"""
+按主键读取变更的行时每条语句的主键数，低于 SQLite 的参数个数限制
+"""
+COMPACT_RATIO = 0.25
+NULL_CODE = -1
+"""
+维度与布尔字段中表示 NULL 的值
+"""
+
+
+class AnalyticsError(ValueError):
+    """
+    查询参数无效
+
+    :ivar argument: 无效的参数名
+    """
+
+    def __init__(self, argument: str, message: str) -> None:
+        super().__init__(f"{argument}: {message}")
+        self.argument = argument
+        self.message = message
+
+
+@dataclass(frozen=True)
+class Field:
+    name: str
+    kind: str
+    """
+    :py:data:`DIMENSION`、:py:data:`FLAG` 或 :py:data:`MEASURE`
+    """
+    integer: bool = False
+    """
+    度量是否为整数
+    """
+    target: Optional[str] = None
+    """
+    维度引用的表名
+    """
+
+
+def cube_fields(columns: dict[str, ColumnInfo]) -> dict[str, Field]:
+    """
+    由字段信息选出维度与度量：外键为维度，布尔字段为标志，其余数值字段为度量
+
+    :param columns: 字段信息
+    :type columns: dict[str, ColumnInfo]
+
+    :return: 字段名到分析字段的映射
+    :rtype: dict[str, Field]
+    """
+    fields: dict[str, Field] = {}
+    for name, info in columns.items():
+        if info.primary_key:
+            continue
+        if info.foreign_key is not None:
+            fields[name] = Field(name, DIMENSION, target=info.foreign_key.partition(".")[0])
+        elif info.type == "BOOLEAN":
+            fields[name] = Field(name, FLAG)
+        elif info.type in ("INTEGER", "FLOAT"):
+            fields[name] = Field(name, MEASURE, integer=info.type == "INTEGER")
+    return fields
+
+
+@dataclass(frozen=True)
+class Aggregate:
+    op: str
+    field: Optional[str] = None
+
+    @property
+    def label(self) -> str:
+        return self.op if self.field is None else f"{self.op}({self.field})"
+
+
+@dataclass(frozen=True)
+class CubeQuery:
+    """
+    分析查询
+
+    ``filters`` 为字段名与条件，条件可指定 ``in``（取值列表，可包含 None）以及 ``min`` / ``max``（闭区间），
+    各条件同时满足；
+    ``bins`` 为度量指定分组的区间边界，分组值为 ``[下界, 上界)``，超出边界的一侧为 None
+    """
+    group_by: list[str] = field(default_factory=list)
+    filters: list[tuple[str, dict[str, Any]]] = field(default_factory=list)
+    aggregates: list[Aggregate] = field(default_factory=lambda: [Aggregate("count")])
+    bins: dict[str, list[float]] = field(default_factory=dict)
+    limit: Optional[int] = None
+    """
+    只返回按第一个聚合值降序排列的前若干组
+    """
+
+
+@dataclass(frozen=True)
+class CubeResult:
+    version: int
+    """
+    数据对应的表版本号
+    """
+    total: int
+    """
+    满足筛选条件的行数
+    """
+    columns: list[str]
+    rows: list[list[Any]]
+
+
+def to_array(values: Sequence[Any], fld: Field) -> NDArray[Any]:
+    # 经 float64 转换时 None 成为 NaN
+    array = np.array(values, dtype=np.float64)
+    if fld.kind == MEASURE:
+        return array
+    return np.where(np.isnan(array), NULL_CODE, array).astype(np.int32 if fld.kind == DIMENSION else np.int8)
+
+
+def output_value(fld: Field, value: Any) -> Any:
+    if fld.kind == MEASURE:
+        return None if np.isnan(value) else (int(value) if fld.integer else float(value))
+    if value == NULL_CODE:
+        return None
+    return bool(value) if fld.kind == FLAG else int(value)
+
+
+def bin_labels(edges: list[float]) -> list[Optional[list[Optional[float]]]]:
+    """
+    :py:func:`numpy.digitize` 各编号对应的区间，最后一个编号为 NULL
+    """
+    bounds: list[Optional[float]] = [None, *edges, None]
+    return [[bounds[i], bounds[i + 1]] for i in range(len(edges) + 1)] + [None]
+
+
+class AnalyticsCube:
+    """
+    一张表的列数组
+
+    :ivar version: 数组对应的表版本号，未加载时为 -1
+    """
+
+    def __init__(self, table: Table, fields: dict[str, Field]) -> None:
+        self.table = table
+        self.fields = fields
+        self.version = -1
+        self.ids: NDArray[np.int64] = np.empty(0, dtype=np.int64)
+        self.alive: NDArray[np.bool_] = np.empty(0, dtype=np.bool_)
+        self.columns: dict[str, NDArray[Any]] = {}
+        self._lock = threading.Lock()
+
+    def select(self) -> Any:
+        return select(self.table.c.id, *(self.table.c[name] for name in self.fields))
+
+    def to_arrays(self, rows: Sequence[Sequence[Any]]) -> tuple[NDArray[np.int64], dict[str, NDArray[Any]]]:
+        values = list(zip(*rows)) or [()] * (len(self.fields) + 1)
+        ids = np.array(values[0], dtype=np.int64)
+        return ids, {name: to_array(values[i + 1], fld) for i, (name, fld) in enumerate(self.fields.items())}
+
+    def reload(self, connection: Connection) -> None:
+        """
+        整表加载
+        """
+        # 先读取版本号，之后的变更在下次更新时重复应用，结果不变
+        version = table_version(connection, self.table.name).version
+        chunks = [
+            self.to_arrays(part)
+            for part in connection.execution_options(stream_results=True).execute(self.select()).partitions(LOAD_CHUNK)
+        ]
+        ids, columns = self.to_arrays([])
+        if chunks:
+            ids = np.concatenate([chunk[0] for chunk in chunks])
+            columns = {name: np.concatenate([chunk[1][name] for chunk in chunks]) for name in self.fields}
+        order = np.argsort(ids, kind="stable")
+        self.ids = ids[order]
+        self.columns = {name: column[order] for name, column in columns.items()}
+        self.alive = np.ones(len(self.ids), dtype=np.bool_)
+        self.version = version
+
+    def mark_deleted(self, ids: NDArray[np.int64]) -> None:
+        position = np.searchsorted(self.ids, ids)
+        found = position < len(self.ids)
+        found[found] = self.ids[position[found]] == ids[found]
+        self.alive[position[found]] = False
+
+    def apply(self, connection: Connection, change_set: ChangeSet) -> None:
+        """
+        应用一段变更：新增或修改的行重新读取，删除的行标记为删除
+        """
+        self.mark_deleted(np.array(change_set.deleted, dtype=np.int64))
+        upserted = change_set.upserted
+        rows: list[Row[Any]] = []
+        for start in range(0, len(upserted), ID_CHUNK):
+            chunk = upserted[start:start + ID_CHUNK]
+            rows.extend(connection.execute(self.select().where(self.table.c.id.in_(chunk))).all())
+        # 读取时已不存在的行，其删除记录在更新的版本中
+        ids, columns = self.to_arrays(rows)
+        self.mark_deleted(np.setdiff1d(np.array(upserted, dtype=np.int64), ids))
+        if rows:
+            self.upsert(ids, columns)
+        self.version = change_set.version
+
+    def upsert(self, ids: NDArray[np.int64], columns: dict[str, NDArray[Any]]) -> None:
+        position = np.searchsorted(self.ids, ids)
+        exists = position < len(self.ids)
+        exists[exists] = self.ids[position[exists]] == ids[exists]
+        for name, column in columns.items():
+            self.columns[name][position[exists]] = column[exists]
+        self.alive[position[exists]] = True
+
+        new = ~exists
+        if not new.any():
+            return
+        self.ids = np.concatenate([self.ids, ids[new]])
+        self.alive = np.concatenate([self.alive, np.ones(int(new.sum()), dtype=np.bool_)])
+        self.columns = {name: np.concatenate([self.columns[name], column[new]]) for name, column in columns.items()}
+        if len(self.ids) > 1 and not (np.diff(self.ids) > 0).all():
+            order = np.argsort(self.ids, kind="stable")
+            self.ids = self.ids[order]
+            self.alive = self.alive[order]
+            self.columns = {name: column[order] for name, column in self.columns.items()}
+
+    def compact(self) -> None:
+        if len(self.alive) and (~self.alive).sum() > COMPACT_RATIO * len(self.alive):
+            keep = self.alive
+            self.ids = self.ids[keep]
+            self.columns = {name: column[keep] for name, column in self.columns.items()}
+            self.alive = np.ones(len(self.ids), dtype=np.bool_)
+
+    def refresh(self, connection: Connection) -> None:
+        """
+        更新到表的当前版本
+        """
+        if self.version < 0:
+            self.reload(connection)
+            return
+        while table_version(connection, self.table.name).version != self.version:
+            change_set = changes_since(connection, self.table.name, self.version, CHANGES_PAGE)
+            if change_set is None:
+                self.reload(connection)
+                return
+            self.apply(connection, change_set)
+            if not change_set.more:
+                break
+        self.compact()
+
+    def filter_mask(self, name: str, spec: dict[str, Any]) -> NDArray[np.bool_]:
+        fld = self.field(name, "filters")
+        column = self.columns[name]
+        mask = np.ones(len(column), dtype=np.bool_)
+        if (values := spec.get("in")) is not None:
+            try:
+                present = to_array([v for v in values if v is not None], fld)
+            except (TypeError, ValueError):
+                raise AnalyticsError("filters", f"invalid values for {name!r}")
+            mask &= np.isin(column, present)
+            if None in values:
+                mask |= np.isnan(column) if fld.kind == MEASURE else column == NULL_CODE
+        low, high = spec.get("min"), spec.get("max")
+        if low is not None or high is not None:
+            # NULL 不在任何区间内；NaN 的比较结果本就为假，维度需排除 NULL_CODE
+            if fld.kind != MEASURE:
+                mask &= column != NULL_CODE
+            if low is not None:
+                mask &= column >= low
+            if high is not None:
+                mask &= column <= high
+        return mask
+
+    def field(self, name: str, argument: str) -> Field:
+        if (fld := self.fields.get(name)) is None:
+            raise AnalyticsError(argument, f"unknown field {name!r}")
+        return fld
+
+    def group_codes(
+            self,
+            name: str,
+            mask: NDArray[np.bool_],
+            edges: Optional[list[float]],
+    ) -> tuple[NDArray[Any], list[Any]]:
+        """
+        :return: 每行的分组编号与各编号对应的分组值
+        :rtype: tuple[NDArray[Any], list[Any]]
+        """
+        fld = self.field(name, "group_by")
+        values = self.columns[name][mask]
+        if edges is None:
+            uniques, codes = np.unique(values, return_inverse=True)
+            return codes, [output_value(fld, v) for v in uniques]
+        codes = np.where(np.isnan(values), len(edges) + 1, np.digitize(values, edges))
+        return codes, bin_labels(edges)
+
+    def aggregate(self, agg: Aggregate, mask: NDArray[np.bool_], inverse: NDArray[Any], n: int) -> list[Any]:
+        if agg.op not in AGGREGATES:
+            raise AnalyticsError("aggregates", f"unknown aggregate {agg.op!r}")
+        if agg.op == "count":
+            return [int(c) for c in np.bincount(inverse, minlength=n)]
+        if agg.field is None or (fld := self.field(agg.field, "aggregates")).kind != MEASURE:
+            raise AnalyticsError("aggregates", f"{agg.op} requires a measure field")
+        values = self.columns[agg.field][mask]
+        valid = ~np.isnan(values)
+        values, groups = values[valid], inverse[valid]
+        counts = np.bincount(groups, minlength=n)
+        if agg.op in ("sum", "mean"):
+            result = np.bincount(groups, weights=values, minlength=n)
+            if agg.op == "mean":
+                result = np.divide(result, counts, out=np.full(n, np.nan), where=counts > 0)
+        else:
+            result = np.full(n, np.inf if agg.op == "min" else -np.inf)
+            (np.minimum if agg.op == "min" else np.maximum).at(result, groups, values)
+            result[counts == 0] = np.nan
+        as_value = int if fld.integer and agg.op != "mean" else float
+        return [None if np.isnan(v) else as_value(v) for v in result]
+
+    def group(self, query: CubeQuery, mask: NDArray[np.bool_]) -> tuple[NDArray[Any], list[list[Any]]]:
+        """
+        :return: 每行的组号与各组的分组值
+        :rtype: tuple[NDArray[Any], list[list[Any]]]
+        """
+        total = int(mask.sum())
+        if not query.group_by:
+            return np.zeros(total, dtype=np.intp), [[]]
+        keys = [self.group_codes(name, mask, query.bins.get(name)) for name in query.group_by]
+        shape = tuple(len(labels) for _codes, labels in keys)
+        if np.prod(shape, dtype=np.float64) < 2 ** 62:
+            flat = np.ravel_multi_index([codes for codes, _labels in keys], shape)
+            groups, inverse = np.unique(flat, return_inverse=True)
+            indices = np.unravel_index(groups, shape)
+        else:
+            stacked = np.stack([codes for codes, _labels in keys], axis=1)
+            stacked, inverse = np.unique(stacked, axis=0, return_inverse=True)
+            indices = tuple(stacked.T)
+        labels = [[keys[d][1][int(i)] for i in indices[d]] for d in range(len(keys))]
+        return inverse.ravel(), [list(values) for values in zip(*labels)]
+
+    def query(self, query: CubeQuery) -> CubeResult:
+        for name, edges in query.bins.items():
+            if self.field(name, "bins").kind != MEASURE:
+                raise AnalyticsError("bins", f"{name!r} is not a measure")
+            if any(low >= high for low, high in zip(edges, edges[1:])):
+                raise AnalyticsError("bins", f"edges of {name!r} must be increasing")
+        mask = self.alive.copy()
+        for name, spec in query.filters:
+            mask &= self.filter_mask(name, spec)
+        inverse, keys = self.group(query, mask)
+        measures = [self.aggregate(agg, mask, inverse, len(keys)) for agg in query.aggregates]
+        rows = [key + [m[i] for m in measures] for i, key in enumerate(keys)]
+        if query.limit is not None and measures:
+            order = sorted(range(len(rows)), key=lambda i: (measures[0][i] is None, -(measures[0][i] or 0)))
+            rows = [rows[i] for i in order[:query.limit]]
+        return CubeResult(
+            version=self.version,
+            total=int(mask.sum()),
+            columns=[*query.group_by, *(agg.label for agg in query.aggregates)],
+            rows=rows,
+        )
+
+    def run(self, connection: Connection, query: CubeQuery) -> CubeResult:
+        """
+        更新到当前版本后执行查询
+
+        :param connection: 读取变更所用的连接
+        :type connection: Connection
+        :param query: 查询
+        :type query: CubeQuery
+
+        :return: 查询结果
+        :rtype: CubeResult
+
+        :raise AnalyticsError: 查询参数无效
+        """
+        with self._lock:
+            self.refresh(connection)
+            return self.query(query)
+
+
+def group_labels(connection: Connection, cube: AnalyticsCube, result: CubeResult) -> dict[str, dict[int, str]]:
+    """
+    获取结果中外键维度的取值对应的名称
+
+    :return: 字段名到主键与名称映射的映射
+    :rtype: dict[str, dict[int, str]]
+    """
+    labels: dict[str, dict[int, str]] = {}
+    for i, name in enumerate(result.columns):
+        fld = cube.fields.get(name)
+        if fld is None or fld.target is None or (target := db.metadata.tables.get(fld.target)) is None:
+            continue
+        if "name" not in target.c:
+            continue
+        ids = sorted({row[i] for row in result.rows if row[i] is not None})
+        labels[name] = {}
+        for start in range(0, len(ids), ID_CHUNK):
+            statement = select(target.c.id, target.c.name).where(target.c.id.in_(ids[start:start + ID_CHUNK]))
+            labels[name].update(connection.execute(statement).tuples().all())
+    return labels
+
+
+def get_cube(columns: dict[str, ColumnInfo]) -> AnalyticsCube:
+    """
+    获取本进程的学生数据列数组，首次调用时创建（尚未加载）
+
+    :param columns: ``students`` 的字段信息
+    :type columns: dict[str, ColumnInfo]
+
+    :return: 列数组
+    :rtype: AnalyticsCube
+    """
+    cube: Optional[AnalyticsCube] = current_app.extensions.get(ANALYTICS_EXTENSION)
+    if cube is None:
+        cube = current_app.extensions.setdefault(
+            ANALYTICS_EXTENSION,
+            AnalyticsCube(db.metadata.tables[TABLE_NAME], cube_fields(columns)),
+        )
+    return cube
+
+
+__all__ = (
+    "DIMENSION",
+    "FLAG",
+    "MEASURE",
+    "TABLE_NAME",
+    "AGGREGATES",
+    "AnalyticsError",
+    "Field",
+    "cube_fields",
+    "Aggregate",
+    "CubeQuery",
+    "CubeResult",
+    "AnalyticsCube",
+    "group_labels",
+    "get_cube",
+)
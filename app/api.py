@@ -16,14 +16,21 @@
 1. API接口相关
 2. 身份验证相关
 3. 数据表相关
+4. 系统相关
 """
 
 import dataclasses
+import functools
+import time
+from collections.abc import Iterator
 from dataclasses import dataclass
 from dataclasses import field
+from datetime import datetime
+from datetime import timezone
 from http import HTTPStatus
 from typing import Any
 from typing import Callable
+from typing import ClassVar
 from typing import Optional
 from typing import cast
 from typing import overload
@@ -31,20 +38,40 @@ from typing import override
 
 from flask import Flask
 from flask import Response
-from flask import jsonify
+from flask import send_file
 from flask_jwt_extended import set_access_cookies
 from flask_jwt_extended import unset_jwt_cookies
 from werkzeug.exceptions import HTTPException
 from wrapt import decorator  # type: ignore[import-untyped]
 
+from .coalescing import CONTEXT_ATTR
+from .coalescing import SharedResponse
+from .coalescing import get_coalescer
+from .coalescing import identity_context
+from .coalescing import request_key
+from .coalescing import shared_response
+from .compression import compress_response
 from .extensions import jwt
+from .metrics import CONTENT_TYPE
+from .metrics import record_request
 from .model_utils.utils import ColumnInfo
+from .serialization import encode_response
+from .tracing import span
+from .tracing import traced
 
 
 @dataclass(kw_only=True)
 class APIResult:
     code: int
     message: str
+    immutable: ClassVar[bool] = False
+    """
+    响应内容是否只由参数决定，是则缓存压缩结果
+    """
+    compressible: ClassVar[bool] = True
+    """
+    响应是否经过响应压缩，文件下载为否，以便零拷贝发送并响应条件请求与范围请求
+    """
 
     @property
     def ignore_fields(self) -> tuple[str, ...]:
@@ -57,7 +84,7 @@ class APIResult:
         for f in self.ignore_fields:
             if f in json:
                 del json[f]
-        return jsonify(json)
+        return encode_response(json)
 
 
 API_CODES: dict[int, str] = {}
@@ -153,11 +180,20 @@ class GetPermissions(APIResult):
     permissions: list[dict[str, Any]]
 
 
+@register
+@dataclass(kw_only=True)
+class CreateAccounts(APIResult):
+    code: int = d(621)
+    message: str = d("Create Accounts Finished")
+    results: list[dict[str, Any]]
+
+
 @dataclass(kw_only=True)
 class GetTables(APIResult):
     code: int = d(131)
     message: str = d("Get Tables Success")
     tables: dict[str, dict[str, ColumnInfo]]
+    immutable = True
 
 
 @dataclass(kw_only=True)
@@ -167,6 +203,272 @@ class GetRows(APIResult):
     rows: list[dict[str, Any]]
 
 
+@dataclass(kw_only=True)
+class GetRowArrays(APIResult):
+    """
+    列名只出现一次，每行为按列顺序排列的数组
+    """
+    code: int = d(331)
+    message: str = d("Get Data Success")
+    columns: list[dict[str, Any]]
+    rows: list[tuple[Any, ...]]
+
+    @override
+    def build_response(self) -> Response:
+        # 行数据不含数据类，无需 asdict 逐个复制
+        return encode_response(dict(code=self.code, message=self.message, columns=self.columns, rows=self.rows))
+
+
+@dataclass(kw_only=True)
+class GetColumnArrays(APIResult):
+    """
+    列名只出现一次，每列的值为一个数组，与 ``columns`` 的顺序一致
+    """
+    code: int = d(431)
+    message: str = d("Get Data Success")
+    columns: list[dict[str, Any]]
+    data: list[list[Any]]
+
+    @override
+    def build_response(self) -> Response:
+        return encode_response(dict(code=self.code, message=self.message, columns=self.columns, data=self.data))
+
+
+@dataclass(kw_only=True)
+class GetChanges(APIResult):
+    """
+    增量同步的变更，新增或修改的行以数组形式给出，列信息只出现一次
+    """
+    code: int = d(531)
+    message: str = d("Get Changes Success")
+    version: int
+    """
+    本次变更的结束版本号，下次同步时作为 ``since``
+    """
+    more: bool
+    columns: list[dict[str, Any]]
+    rows: list[tuple[Any, ...]]
+    deleted: list[int]
+
+    @override
+    def build_response(self) -> Response:
+        return encode_response(dict(
+            code=self.code, message=self.message, version=self.version, more=self.more,
+            columns=self.columns, rows=self.rows, deleted=self.deleted,
+        ))
+
+
+@dataclass(kw_only=True)
+class EventStream(APIResult):
+    """
+    Server-Sent Events 事件流
+    """
+    code: int = d(631)
+    message: str = d("Subscribe Success")
+    events: Iterator[str]
+    on_close: Callable[[], None]
+    """
+    响应关闭时调用，事件流未开始迭代时也会调用
+    """
+
+    @override
+    def build_response(self) -> Response:
+        response = Response(self.events, mimetype="text/event-stream")
+        response.headers["Cache-Control"] = "no-cache"
+        # 禁止反向代理缓冲事件
+        response.headers["X-Accel-Buffering"] = "no"
+        response.call_on_close(self.on_close)
+        return response
+
+
+@dataclass(kw_only=True)
+class GetAnalytics(APIResult):
+    """
+    学生数据的分组聚合结果，``rows`` 中先为各分组字段的值，再为各聚合值
+    """
+    code: int = d(731)
+    message: str = d("Get Analytics Success")
+    version: int
+    """
+    结果对应的表版本号
+    """
+    total: int
+    """
+    满足筛选条件的行数
+    """
+    columns: list[str]
+    rows: list[list[Any]]
+    labels: dict[str, dict[int, str]]
+    """
+    外键维度的取值对应的名称
+    """
+
+    @override
+    def build_response(self) -> Response:
+        return encode_response(dict(
+            code=self.code, message=self.message, version=self.version, total=self.total,
+            columns=self.columns, rows=self.rows, labels=self.labels,
+        ))
+
+
+@dataclass(kw_only=True)
+class CachedResult(APIResult):
+    """
+    :py:mod:`app.cache` 缓存的已序列化响应，``code`` 与 ``message`` 为原结果的值
+    """
+    code: int
+    message: str
+    content_type: str
+    vary: tuple[str, ...]
+    body: bytes
+    immutable = True
+
+    @override
+    def build_response(self) -> Response:
+        response = Response(self.body, content_type=self.content_type)
+        response.vary.update(self.vary)
+        return response
+
+
+@register
+@dataclass(kw_only=True)
+class NotModified(APIResult):
+    """
+    客户端保存的响应仍然有效，见 :py:mod:`app.conditional`
+    """
+    code: int = d(831)
+    message: str = d("Not Modified")
+    http_code: int = d(HTTPStatus.NOT_MODIFIED)
+    etag: str
+    last_modified: Optional[float]
+    cache_control: str
+
+    @override
+    def build_response(self) -> Response:
+        response = Response(status=HTTPStatus.NOT_MODIFIED)
+        response.set_etag(self.etag, weak=True)
+        if self.last_modified is not None:
+            response.last_modified = datetime.fromtimestamp(self.last_modified, timezone.utc)
+        response.headers["Cache-Control"] = self.cache_control
+        # 与完整响应的 Vary 一致
+        response.vary.update(("Accept", "Accept-Encoding"))
+        return response
+
+
+@dataclass(kw_only=True)
+class Validated(APIResult):
+    """
+    带有 ETag 与 ``Last-Modified`` 的成功结果，``code`` 与 ``message`` 为原结果的值。
+    响应内容由 ETag 所依赖的请求参数与表版本决定
+    """
+    code: int
+    message: str
+    result: APIResult
+    etag: str
+    last_modified: Optional[float]
+    cache_control: str
+    immutable = True
+
+    @override
+    def build_response(self) -> Response:
+        response = self.result.build_response()
+        response.set_etag(self.etag, weak=True)
+        if self.last_modified is not None:
+            response.last_modified = datetime.fromtimestamp(self.last_modified, timezone.utc)
+        response.headers["Cache-Control"] = self.cache_control
+        return response
+
+
+@register
+@dataclass(kw_only=True)
+class GetMetrics(APIResult):
+    code: int = d(141)
+    message: str = d("Get Metrics Success")
+    text: str
+    """
+    Prometheus 文本格式的指标
+    """
+
+    @override
+    def build_response(self) -> Response:
+        return Response(self.text, content_type=CONTENT_TYPE)
+
+
+@register
+@dataclass(kw_only=True)
+class GetProfiles(APIResult):
+    code: int = d(241)
+    message: str = d("Get Profiles Success")
+    profiles: list[dict[str, Any]]
+
+
+@register
+@dataclass(kw_only=True)
+class GetProfile(APIResult):
+    code: int = d(341)
+    message: str = d("Get Profile Success")
+    profile: dict[str, Any]
+
+
+@register
+@dataclass(kw_only=True)
+class DownloadProfile(APIResult):
+    code: int = d(441)
+    message: str = d("Download Profile Success")
+    path: str
+    filename: str
+    compressible = False
+
+    @override
+    def build_response(self) -> Response:
+        return send_file(
+            self.path,
+            mimetype="application/octet-stream",
+            as_attachment=True,
+            download_name=self.filename,
+        )
+
+
+@register
+@dataclass(kw_only=True)
+class GetJobs(APIResult):
+    code: int = d(541)
+    message: str = d("Get Jobs Success")
+    jobs: list[dict[str, Any]]
+
+
+@register
+@dataclass(kw_only=True)
+class GetJob(APIResult):
+    code: int = d(641)
+    message: str = d("Get Job Success")
+    job: dict[str, Any]
+
+
+@register
+@dataclass(kw_only=True)
+class DownloadJobResult(APIResult):
+    """
+    任务结果文件，支持条件请求与断点续传
+    """
+    code: int = d(741)
+    message: str = d("Download Job Result Success")
+    path: str
+    filename: str
+    mimetype: str
+    compressible = False
+
+    @override
+    def build_response(self) -> Response:
+        return send_file(
+            self.path,
+            mimetype=self.mimetype,
+            as_attachment=True,
+            download_name=self.filename,
+            conditional=True,
+        )
+
+
 @register
 @dataclass(kw_only=True)
 class APINotFound(APIResult):
@@ -246,30 +548,110 @@ class DataTableNotFound(APIResult):
     message: str = d("Data Table Not Found")
 
 
+@register
+@dataclass(kw_only=True)
+class ChangesCompacted(APIResult):
+    """
+    无法从 ``since`` 增量同步，客户端需在记下 ``version`` 后全量同步
+    """
+    code: int = d(232)
+    message: str = d("Changes Compacted")
+    version: int
+
+
+@register
+@dataclass(kw_only=True)
+class ProfileNotFound(APIResult):
+    code: int = d(142)
+    message: str = d("Profile Not Found")
+
+
+@register
+@dataclass(kw_only=True)
+class JobNotFound(APIResult):
+    code: int = d(242)
+    message: str = d("Job Not Found")
+
+
+@register
+@dataclass(kw_only=True)
+class JobResultNotFound(APIResult):
+    """
+    任务未成功结束、没有结果文件或结果已过期
+    """
+    code: int = d(342)
+    message: str = d("Job Result Not Found")
+
+
+@register
+@dataclass(kw_only=True)
+class JobQueueFull(APIResult):
+    """
+    排队与执行中的任务已达上限
+    """
+    code: int = d(442)
+    message: str = d("Job Queue Full")
+
+
 class APIException(Exception):
     def __init__(self, result: APIResult) -> None:
         self.result = result
 
 
-def api(func: Callable[..., APIResult]) -> Callable[..., Response | tuple[Response, int]]:
-    @decorator  # type: ignore[misc]
-    def wrapper(wrapped: Callable[..., Any], _instance: Any, args: tuple[Any, ...], kwargs: dict[str, Any]) -> Any:
-        try:
-            api_result = wrapped(*args, **kwargs)
-        except APIException as err:
-            api_result = err.result
+type Outcome = tuple[int, Response, Optional[int]]
+"""
+API 代码、响应与 HTTP 状态码（结果未指定时为 None）
+"""
 
-        if not isinstance(api_result, APIResult):
-            raise RuntimeError(f"APIResult expected, got {api_result!r}")
 
-        ext_return: list[Any] = []
-        if hasattr(api_result, HTTP_CODE_ATTR):
-            ext_return.append(getattr(api_result, HTTP_CODE_ATTR))
+def respond(view: Callable[[], APIResult], started: float) -> Outcome:
+    try:
+        with span("view", "api"):
+            api_result = view()
+    except APIException as err:
+        api_result = err.result
 
+    if not isinstance(api_result, APIResult):
+        raise RuntimeError(f"APIResult expected, got {api_result!r}")
+
+    with span("build_response", "api"):
         response = api_result.build_response()
-        if ext_return:
-            return response, *ext_return
+    if api_result.compressible:
+        with span("compress", "api"):
+            response = compress_response(response, cacheable=api_result.immutable)
+    record_request(api_result.code, response, started)
+    return api_result.code, response, getattr(api_result, HTTP_CODE_ATTR, None)
+
+
+def share(outcome: Outcome) -> tuple[Outcome, Optional[SharedResponse]]:
+    code, response, http_code = outcome
+    return outcome, None if http_code is not None else shared_response(code, response)
+
 
+def api(func: Callable[..., APIResult]) -> Callable[..., Response | tuple[Response, int]]:
+    context = getattr(func, CONTEXT_ATTR, identity_context)
+
+    @decorator  # type: ignore[misc]
+    @traced("api", "api")
+    def wrapper(wrapped: Callable[..., Any], _instance: Any, args: tuple[Any, ...], kwargs: dict[str, Any]) -> Any:
+        started = time.perf_counter()
+        view = functools.partial(wrapped, *args, **kwargs)
+
+        # 同时到达的相同读取请求只计算一次
+        if (coalescer := get_coalescer()) is None or (key := request_key(context)) is None:
+            outcome = respond(view, started)
+        else:
+            with span("coalesce", "api"):
+                shared = coalescer.run(key, lambda: share(respond(view, started)))
+            if isinstance(shared, SharedResponse):
+                response = shared.response()
+                record_request(shared.code, response, started)
+                return response
+            outcome = shared
+
+        _code, response, http_code = outcome
+        if http_code is not None:
+            return response, http_code
         return response
 
     return cast(Callable[..., Any], wrapper(func))
@@ -288,8 +670,8 @@ def initialize_hooks(app: Flask) -> None:
         code, message = (None, e.description) if api_code is None else (api_code, API_CODES[api_code])
 
         if e.code is None:
-            return jsonify(code=code, message=message)
-        return jsonify(code=code, message=message), e.code
+            return encode_response(dict(code=code, message=message))
+        return encode_response(dict(code=code, message=message)), e.code
 
 
 __all__ = (
@@ -305,9 +687,26 @@ __all__ = (
     "GetAccounts",
     "GetRoles",
     "GetPermissions",
+    "CreateAccounts",
 
     "GetTables",
     "GetRows",
+    "GetRowArrays",
+    "GetColumnArrays",
+    "GetChanges",
+    "EventStream",
+    "GetAnalytics",
+    "CachedResult",
+    "NotModified",
+    "Validated",
+
+    "GetMetrics",
+    "GetProfiles",
+    "GetProfile",
+    "DownloadProfile",
+    "GetJobs",
+    "GetJob",
+    "DownloadJobResult",
 
     "APINotFound",
     "WrongMethod",
@@ -321,6 +720,11 @@ __all__ = (
     "DisabledAccount",
 
     "DataTableNotFound",
+    "ChangesCompacted",
+    "ProfileNotFound",
+    "JobNotFound",
+    "JobResultNotFound",
+    "JobQueueFull",
 
     "APIException",
 
@@ -0,0 +1,452 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+数据读取接口的 ASGI 异步实现
+
+``/api/data`` 下的只读接口在事件循环中直接处理，
+数据库通过 ``create_async_engine`` 访问，令牌黑名单通过 ``redis.asyncio`` 查询，
+等待 I/O 时不占用线程；其余接口交由原 Flask 应用在线程池中处理。
+声明了依赖表的接口与 Flask 应用共用响应缓存（:py:mod:`app.cache`），同一条目未命中时不合并计算；
+行数据接口同样响应条件请求（:py:mod:`app.conditional`），ETag 与 Flask 应用计算的相同
+
+URL、返回格式与错误处理均与 Flask 应用保持一致::
+
+    uvicorn --factory app.asgi:create_asgi_app
+"""
+
+import asyncio
+import io
+import sys
+from collections.abc import Awaitable
+from collections.abc import Callable
+from collections.abc import Collection
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Any
+from typing import Optional
+
+import redis.asyncio
+from asgiref.wsgi import WsgiToAsgi
+from flask import Flask
+from flask import Response
+from flask import g
+from flask import request
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import NoAuthorizationError
+from flask_jwt_extended.exceptions import RevokedTokenError
+from flask_jwt_extended.exceptions import UserLookupError
+from flask_jwt_extended.utils import get_unverified_jwt_headers
+from sqlalchemy import URL
+from sqlalchemy import make_url
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine
+from werkzeug.exceptions import HTTPException
+
+from . import create_app
+from .api import APIResult
+from .api import DataTableNotFound
+from .api import GetRows
+from .api import GetTables
+from .api import HTTP_CODE_ATTR
+from .api import PermissionDenied
+from .cache import build_entry
+from .cache import get_cache
+from .cache import request_key
+from .compression import compress_response
+from .conditional import entity_tag
+from .conditional import last_modified
+from .conditional import not_modified
+from .conditional import validated
+from .database import apply_pragmas
+from .database import bind_profile
+from .database import finish_profile
+from .database import start_profile
+from .extensions import db
+from .extensions import jwt_redis_blocklist
+from .memory_redis import AsyncMemoryRedis
+from .metrics import CACHE_REQUESTS
+from .metrics import record_request
+from .metrics import request_finished
+from .metrics import request_started
+from .memory_redis import MemoryRedis
+from .models.auth import Permission
+from .models.auth import User
+from .models.auth import role_permissions
+from .models.auth import user_roles
+from .models.data import EDITABLE_TABLE_NAMES
+from .permission import PERMISSIONS
+from .routes.data.routers import COLUMN_INFO
+from .routes.data.routers import LIMIT_VISIBILITY
+from .routes.data.routers import NAME2TABLE
+from .routes.data.routers import array_rows
+from .routes.data.routers import requested_row_format
+from .routes.data.routers import row_format_error
+from .routes.data.routers import row_tables
+from .routes.data.routers import select_rows
+from .stamps import Stamp
+from .stamps import get_stamps
+from .startup import warm_up
+from .tracing import finish_trace
+from .tracing import span
+from .tracing import start_trace
+
+type Scope = dict[str, Any]
+type Receive = Callable[[], Awaitable[dict[str, Any]]]
+type Send = Callable[[dict[str, Any]], Awaitable[None]]
+type ASGIApp = Callable[[Scope, Receive, Send], Awaitable[None]]
+type AsyncView = Callable[..., Awaitable[APIResult]]
+type Tables = Collection[str] | Callable[..., Collection[str]]
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+"""
+同步驱动到默认异步驱动的映射
+"""
+
+
+@dataclass
+class AsyncEndpoint:
+    view: AsyncView
+    permission_names: Collection[str]
+    tables: Optional[Tables] = None
+    """
+    响应所依赖的表名，或由路径参数得到表名的函数；声明后使用响应缓存
+    """
+    conditional: bool = False
+    """
+    是否响应条件请求，须同时声明 ``tables``
+    """
+
+
+ASYNC_ENDPOINTS: dict[str, AsyncEndpoint] = {}
+
+
+def async_endpoint(
+        endpoint: str, permission_names: Collection[str], tables: Optional[Tables] = None, conditional: bool = False,
+) -> Callable[[AsyncView], AsyncView]:
+    """
+    注册异步接口
+
+    :param endpoint: 对应的 Flask 端点名，URL 规则沿用 Flask 应用中的定义
+    :type endpoint: str
+    :param permission_names: 需求的权限，全部满足才可访问
+    :type permission_names: Collection[str]
+    :param tables: 响应所依赖的表，与 Flask 视图的 ``@cached_response`` 一致
+    :type tables: Optional[Tables]
+    :param conditional: 是否响应条件请求，与 Flask 视图的 ``@conditional_response`` 一致
+    :type conditional: bool
+    """
+
+    def wrapper(func: AsyncView) -> AsyncView:
+        ASYNC_ENDPOINTS[endpoint] = AsyncEndpoint(func, permission_names, tables, conditional)
+        return func
+
+    return wrapper
+
+
+@async_endpoint("data.get_tables", [PERMISSIONS.TABLE.LIST, PERMISSIONS.TABLE.GET], ())
+async def get_tables(_session: AsyncSession) -> APIResult:
+    return GetTables(tables={k: COLUMN_INFO[k] for k in EDITABLE_TABLE_NAMES})
+
+
+@async_endpoint("data.get_table", [PERMISSIONS.TABLE.GET], ())
+async def get_table(_session: AsyncSession, table_name: str) -> APIResult:
+    if LIMIT_VISIBILITY and table_name not in EDITABLE_TABLE_NAMES:
+        return DataTableNotFound()
+    return GetTables(tables={table_name: COLUMN_INFO[table_name]})
+
+
+@async_endpoint("data.get_rows", [PERMISSIONS.DATA.GET], row_tables, conditional=True)
+async def get_rows(session: AsyncSession, table_name: str, offset: int, limit: int) -> APIResult:
+    if LIMIT_VISIBILITY and table_name not in EDITABLE_TABLE_NAMES:
+        return DataTableNotFound()
+    row_format = requested_row_format()
+    if row_format is None:
+        return row_format_error()
+    if row_format != "objects":
+        rows = await session.execute(select_rows(table_name, offset, limit))
+        return array_rows(table_name, row_format, rows.all())
+    table = NAME2TABLE[table_name]
+    result = await session.scalars(select(table).offset(offset).limit(limit))
+    return GetRows(rows=[row.to_dict() for row in result.all()])
+
+
+async def offload[T](func: Callable[[], T]) -> T:
+    """
+    执行可能访问 Redis 的同步操作（读取版本戳与共享缓存）
+
+    ``REDIS_URL`` 为 ``memory://`` 时版本戳与缓存都在进程内，直接执行；否则在线程池中执行，不阻塞事件循环
+    """
+    if isinstance(jwt_redis_blocklist, MemoryRedis):
+        return func()
+    return await asyncio.to_thread(func)
+
+
+def async_database_url(app: Flask) -> URL:
+    """
+    获取异步数据库地址
+
+    优先使用 ``ASYNC_SQLALCHEMY_DATABASE_URI``，否则将同步地址的驱动替换为对应的异步驱动
+
+    :param app: 应用
+    :type app: Flask
+
+    :return: 异步数据库地址
+    :rtype: URL
+    """
+    if app.config["ASYNC_SQLALCHEMY_DATABASE_URI"]:
+        return make_url(app.config["ASYNC_SQLALCHEMY_DATABASE_URI"])
+    with app.app_context():
+        # 使用 Flask-SQLAlchemy 处理后的地址，SQLite 相对路径已指向 instance 目录
+        url = db.engine.url
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+
+def build_environ(scope: Scope) -> dict[str, Any]:
+    """
+    由 ASGI scope 构造 WSGI environ，用于创建 Flask 请求上下文
+
+    :param scope: ASGI scope
+    :type scope: Scope
+
+    :return: WSGI environ
+    :rtype: dict[str, Any]
+    """
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client")
+    environ: dict[str, Any] = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "REMOTE_ADDR": client[0] if client else "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": False,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for raw_name, raw_value in scope["headers"]:
+        name = raw_name.decode("latin-1").upper().replace("-", "_")
+        value = raw_value.decode("latin-1")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = f"HTTP_{name}"
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+class AsyncDataApp:
+    """
+    ASGI 应用
+    """
+
+    def __init__(self, app: Flask) -> None:
+        self.app = app
+        url = async_database_url(app)
+        profile = bind_profile(app, None)
+        self.engine: AsyncEngine = create_async_engine(url, **profile.engine_options(url))
+        apply_pragmas(self.engine.sync_engine, profile)
+        self.session_factory = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.blocklist: redis.asyncio.StrictRedis | AsyncMemoryRedis
+        if isinstance(jwt_redis_blocklist, MemoryRedis):
+            self.blocklist = AsyncMemoryRedis(jwt_redis_blocklist)
+        else:
+            self.blocklist = redis.asyncio.StrictRedis.from_url(app.config["REDIS_URL"], decode_responses=True)
+        # asgiref 未提供类型注解
+        self.fallback: ASGIApp = WsgiToAsgi(app)  # type: ignore[no-untyped-call]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+
+        endpoint: Optional[AsyncEndpoint] = None
+        view_args: Mapping[str, Any] = {}
+        if scope["type"] == "http":
+            adapter = self.app.url_map.bind_to_environ(build_environ(scope))
+            try:
+                endpoint_name, view_args = adapter.match()
+                endpoint = ASYNC_ENDPOINTS.get(str(endpoint_name))
+            except HTTPException:
+                endpoint = None
+
+        if endpoint is None:
+            await self.fallback(scope, receive, send)
+            return
+
+        response = await self.handle(scope, endpoint, view_args)
+        await send({
+            "type": "http.response.start",
+            "status": response.status_code,
+            "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in response.headers.items()],
+        })
+        await send({"type": "http.response.body", "body": response.get_data()})
+
+    async def lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.engine.dispose()
+                await self.blocklist.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def handle(self, scope: Scope, endpoint: AsyncEndpoint, view_args: Mapping[str, Any]) -> Response:
+        with self.app.request_context(build_environ(scope)):
+            start_trace()
+            request_started()
+            start_profile()
+            try:
+                return await self.dispatch(endpoint, view_args)
+            finally:
+                finish_profile()
+                request_finished()
+                finish_trace()
+
+    async def dispatch(self, endpoint: AsyncEndpoint, view_args: Mapping[str, Any]) -> Response:
+        try:
+            async with self.session_factory() as session:
+                with span("authorize", "auth"):
+                    api_result = await self.authorize(session, endpoint.permission_names)
+                if api_result is None:
+                    with span("view", "api"):
+                        api_result = await self.respond(session, endpoint, view_args)
+            with span("build_response", "api"):
+                response = api_result.build_response()
+            if api_result.compressible:
+                with span("compress", "api"):
+                    response = compress_response(response, cacheable=api_result.immutable)
+            if hasattr(api_result, HTTP_CODE_ATTR):
+                response.status_code = getattr(api_result, HTTP_CODE_ATTR)
+            record_request(api_result.code, response)
+        except HTTPException as err:
+            response = self.app.make_response(self.app.handle_user_exception(err))
+        except Exception as err:
+            try:
+                response = self.app.make_response(self.app.handle_user_exception(err))
+            except Exception as unhandled:
+                response = self.app.make_response(self.app.handle_exception(unhandled))
+        return self.app.process_response(response)
+
+    async def respond(self, session: AsyncSession, endpoint: AsyncEndpoint, view_args: Mapping[str, Any]) -> APIResult:
+        """
+        执行视图，声明了依赖表的接口先响应条件请求，再查找响应缓存
+        """
+        cache = get_cache()
+        if endpoint.tables is None or (cache is None and not endpoint.conditional):
+            return await endpoint.view(session, **view_args)
+        tables = endpoint.tables
+        names = tuple(tables(**view_args) if callable(tables) else tables)
+        # 条件请求与响应缓存共用一次读取的版本戳
+        if (stamps := await offload(lambda: get_stamps(names))) is None:
+            if cache is not None:
+                CACHE_REQUESTS.inc(endpoint=request.endpoint or "unknown", result="bypass")
+            return await endpoint.view(session, **view_args)
+        if not endpoint.conditional:
+            return await self.cached(session, endpoint, view_args, names, stamps)
+
+        etag = entity_tag(names, stamps)
+        modified = last_modified(stamps)
+        if (unchanged := not_modified(etag, modified)) is not None:
+            return unchanged
+        return validated(await self.cached(session, endpoint, view_args, names, stamps), etag, modified)
+
+    async def cached(
+            self, session: AsyncSession, endpoint: AsyncEndpoint, view_args: Mapping[str, Any],
+            names: tuple[str, ...], stamps: list[Stamp],
+    ) -> APIResult:
+        """
+        查找响应缓存，未命中时执行视图，只缓存成功的结果
+        """
+        if (cache := get_cache()) is None:
+            return await endpoint.view(session, **view_args)
+        endpoint_name = request.endpoint or "unknown"
+        # 权限集合已由 authorize 取得，计算键时不再查询
+        key = request_key(names, stamps)
+        entry, tier = await offload(lambda: cache.lookup(key))
+        if entry is not None:
+            CACHE_REQUESTS.inc(endpoint=endpoint_name, result=tier)
+            return entry.result()
+        CACHE_REQUESTS.inc(endpoint=endpoint_name, result="miss")
+        result = await endpoint.view(session, **view_args)
+        if (entry := build_entry(result, cache.max_entry_bytes)) is None:
+            return result
+        await offload(lambda: cache.store(key, entry))
+        return entry.result()
+
+    async def authorize(self, session: AsyncSession, permission_names: Collection[str]) -> Optional[APIResult]:
+        """
+        验证令牌并检查权限，对应 ``jwt_required`` 与 ``permissions_required``
+
+        令牌相关的异常交由 Flask-JWT-Extended 注册的错误处理函数处理
+
+        :return: 验证失败时返回结果，否则返回 None
+        :rtype: Optional[APIResult]
+        """
+        cookie_name = self.app.config["JWT_ACCESS_COOKIE_NAME"]
+        encoded_token = request.cookies.get(cookie_name)
+        if encoded_token is None:
+            raise NoAuthorizationError(f'Missing cookie "{cookie_name}"')
+
+        jwt_header = get_unverified_jwt_headers(encoded_token)
+        jwt_data = decode_token(encoded_token)
+        if await self.blocklist.get(jwt_data["jti"]) is not None:
+            raise RevokedTokenError(jwt_header, jwt_data)
+
+        # 令牌中的 sub 为字符串，asyncpg 不会将其隐式转换为整数列的类型
+        user_id = int(jwt_data["sub"])
+        active = await session.scalar(select(User.active).where(User.id == user_id))
+        if active is None:
+            raise UserLookupError(f"user_lookup returned None for {user_id}", jwt_header, jwt_data)
+
+        # 供 after_request 中刷新令牌使用
+        g._jwt_extended_jwt_header = jwt_header
+        g._jwt_extended_jwt = jwt_data
+        g._jwt_extended_jwt_location = "cookies"
+
+        owned_permissions = set((await session.scalars(
+            select(Permission.name)
+            .join(role_permissions, role_permissions.c.permission_id == Permission.id)
+            .join(user_roles, user_roles.c.role_id == role_permissions.c.role_id)
+            .where(user_roles.c.user_id == user_id)
+        )).all())
+        # 与 app.cache.permission_set 一致，供计算缓存键使用
+        g._permission_set = sorted(owned_permissions)
+        missing_permissions = [name for name in permission_names if name not in owned_permissions]
+        if not active or missing_permissions:
+            return PermissionDenied(missing_permissions=missing_permissions)
+        return None
+
+
+def create_asgi_app() -> AsyncDataApp:
+    """
+    创建 ASGI 应用
+    """
+    app = create_app()
+    warm_up(app)
+    return AsyncDataApp(app)
+
+
+__all__ = (
+    "ASYNC_DRIVERS",
+    "ASYNC_ENDPOINTS",
+    "async_endpoint",
+    "async_database_url",
+    "build_environ",
+    "AsyncDataApp",
+    "create_asgi_app",
+)
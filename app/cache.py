@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+读取接口的响应缓存
+
+以 :py:func:`cached_response` 装饰的视图，其序列化后的响应按规范化的请求（端点、路径参数、查询参数、
+``Accept`` 与请求体）、调用者的有效权限集合以及所依赖的各表版本戳（:py:mod:`app.stamps`）缓存。缓存分两级：
+进程内按字节数限制大小的 LRU，以及 Redis 中各进程共享的条目。``REDIS_URL`` 为 ``memory://`` 时只使用进程内缓存。
+
+写入提交后相关表的版本戳递增，此后的请求使用新的键，旧条目不再命中，在 LRU 中自然淘汰或在 Redis 中过期，
+无需扫描。同一进程中同一条目未命中时只由一个请求计算，其余请求等待其结果（:py:class:`app.coalescing.SingleFlight`）
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from collections.abc import Collection
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Optional
+from typing import cast
+
+import redis
+from flask import Flask
+from flask import current_app
+from flask import g
+from flask import request
+from flask_jwt_extended import current_user
+from sqlalchemy import select
+from wrapt import decorator  # type: ignore[import-untyped]
+
+from .api import APIResult
+from .api import CachedResult
+from .api import HTTP_CODE_ATTR
+from .coalescing import CONTEXT_ATTR
+from .coalescing import SingleFlight
+from .database import pin_primary
+from .extensions import db
+from .extensions import jwt_redis_blocklist
+from .memory_redis import MemoryRedis
+from .metrics import CACHE_EVICTIONS
+from .metrics import CACHE_LOCAL_BYTES
+from .metrics import CACHE_REQUESTS
+from .models.auth import Permission
+from .models.auth import role_permissions
+from .models.auth import user_roles
+from .stamps import GENERATION
+from .stamps import Stamp
+from .stamps import get_stamps
+
+CACHE_EXTENSION = "cache"
+ENTRY_OVERHEAD = 256
+"""
+进程内条目除响应体外的估计字节数
+"""
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    """
+    序列化后的响应
+    """
+    code: int
+    message: str
+    content_type: str
+    vary: tuple[str, ...]
+    body: bytes
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + ENTRY_OVERHEAD
+
+    def dumps(self) -> bytes:
+        header = json.dumps([self.code, self.message, self.content_type, self.vary], ensure_ascii=False)
+        return header.encode() + b"\n" + self.body
+
+    @classmethod
+    def loads(cls, data: bytes) -> "CacheEntry":
+        header, body = data.split(b"\n", 1)
+        code, message, content_type, vary = json.loads(header)
+        return cls(code=code, message=message, content_type=content_type, vary=tuple(vary), body=body)
+
+    def result(self) -> CachedResult:
+        return CachedResult(
+            code=self.code, message=self.message, content_type=self.content_type, vary=self.vary, body=self.body,
+        )
+
+
+class LocalTier:
+    """
+    进程内缓存，总字节数超过 ``max_bytes`` 时淘汰最久未使用的条目
+    """
+
+    def __init__(self, max_bytes: int, ttl: float) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._entries: OrderedDict[str, tuple[CacheEntry, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            if (item := self._entries.get(key)) is None:
+                return None
+            entry, expires = item
+            if expires <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, entry: CacheEntry) -> None:
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (entry, time.monotonic() + self.ttl)
+            self.size += entry.size
+            CACHE_LOCAL_BYTES.inc(entry.size)
+            evicted = 0
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                evicted += 1
+        if evicted:
+            CACHE_EVICTIONS.inc(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            CACHE_LOCAL_BYTES.dec(self.size)
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, key: str) -> None:
+        entry, _expires = self._entries.pop(key)
+        self.size -= entry.size
+        CACHE_LOCAL_BYTES.dec(entry.size)
+
+
+class SharedTier:
+    """
+    Redis 中的共享缓存，条目在 ``ttl`` 秒后过期
+    """
+
+    def __init__(self, client: redis.StrictRedis, prefix: str, ttl: float) -> None:
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        try:
+            data = cast(Optional[bytes], self.client.get(f"{self.prefix}entry:{key}"))
+        except redis.exceptions.RedisError:
+            logger.warning("读取共享响应缓存失败", exc_info=True)
+            return None
+        return None if data is None else CacheEntry.loads(data)
+
+    def put(self, key: str, entry: CacheEntry) -> None:
+        try:
+            self.client.set(f"{self.prefix}entry:{key}", entry.dumps(), ex=max(int(self.ttl), 1))
+        except redis.exceptions.RedisError:
+            logger.warning("写入共享响应缓存失败", exc_info=True)
+
+
+@dataclass
+class ResponseCache:
+    local: LocalTier
+    shared: Optional[SharedTier]
+    max_entry_bytes: int
+    wait_seconds: float
+    flights: SingleFlight = field(default_factory=SingleFlight)
+
+    def lookup(self, key: str) -> tuple[Optional[CacheEntry], str]:
+        """
+        依次查找进程内与共享缓存，共享缓存命中时同时存入进程内缓存
+
+        :return: 条目与命中的层级（``local``、``shared`` 或 ``miss``）
+        :rtype: tuple[Optional[CacheEntry], str]
+        """
+        if (entry := self.local.get(key)) is not None:
+            return entry, "local"
+        if self.shared is not None and (entry := self.shared.get(key)) is not None:
+            self.local.put(key, entry)
+            return entry, "shared"
+        return None, "miss"
+
+    def store(self, key: str, entry: CacheEntry) -> None:
+        self.local.put(key, entry)
+        if self.shared is not None:
+            self.shared.put(key, entry)
+
+
+def get_cache() -> Optional[ResponseCache]:
+    cache: Optional[ResponseCache] = current_app.extensions.get(CACHE_EXTENSION)
+    return cache
+
+
+def permission_set() -> list[str]:
+    """
+    获取调用者通过各角色拥有的全部权限名，同一请求中只查询一次
+    """
+    if (names := g.get("_permission_set")) is None:
+        statement = (
+            select(Permission.name)
+            .join(role_permissions, role_permissions.c.permission_id == Permission.id)
+            .join(user_roles, user_roles.c.role_id == role_permissions.c.role_id)
+            .where(user_roles.c.user_id == current_user.id)
+            .distinct()
+        )
+        names = g._permission_set = sorted(db.session.scalars(statement))
+    return cast(list[str], names)
+
+
+def permission_context() -> Any:
+    """
+    请求合并的调用者上下文：账户是否激活与权限集合，见 :py:data:`app.coalescing.CONTEXT_ATTR`
+    """
+    return [bool(current_user.active), permission_set()]
+
+
+def request_body() -> Any:
+    """
+    获取规范化的请求体，JSON 按键排序，其余格式使用原始内容的摘要
+    """
+    data = request.get_data(cache=True)
+    if not data:
+        return None
+    if request.is_json:
+        try:
+            return json.dumps(json.loads(data), sort_keys=True, ensure_ascii=False)
+        except ValueError:
+            pass
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def request_key(tables: Collection[str], stamps: list[Stamp]) -> str:
+    """
+    由规范化的请求、调用者的权限集合与各表的版本号计算缓存键
+    """
+    parts = [
+        request.endpoint,
+        sorted((request.view_args or {}).items()),
+        sorted(request.args.items(multi=True)),
+        str(request.accept_mimetypes),
+        request_body(),
+        permission_set(),
+        dict(zip((GENERATION, *tables), ((stamp.version, stamp.modified) for stamp in stamps))),
+    ]
+    return hashlib.blake2b(json.dumps(parts, default=str).encode(), digest_size=20).hexdigest()
+
+
+def build_entry(result: APIResult, max_bytes: int) -> Optional[CacheEntry]:
+    """
+    序列化成功的结果，错误结果、流式响应与过大的响应返回 None
+    """
+    if result.code % 10 != 1 or hasattr(result, HTTP_CODE_ATTR):
+        return None
+    response = result.build_response()
+    if response.status_code != 200 or response.is_streamed:
+        return None
+    body = response.get_data()
+    if len(body) > max_bytes:
+        return None
+    return CacheEntry(
+        code=result.code,
+        message=result.message,
+        content_type=response.content_type or "",
+        vary=tuple(response.vary),
+        body=body,
+    )
+
+
+def compute(cache: ResponseCache, key: str, view: Callable[[], APIResult]) -> APIResult:
+    """
+    在主库上计算并存储条目：键中的版本戳在提交后递增，落后的副本可能还未包含该提交，
+    其结果不能存储在新的键下
+    """
+    pin_primary()
+    result = view()
+    if (entry := build_entry(result, cache.max_entry_bytes)) is None:
+        return result
+    cache.store(key, entry)
+    return entry.result()
+
+
+def cached_response[C: Callable[..., APIResult]](
+        tables: Collection[str] | Callable[..., Collection[str]] = (),
+) -> Callable[[C], C]:
+    """
+    缓存视图的响应，位于 ``@permissions_required`` 之后，权限检查不通过时不查找缓存::
+
+        @bp.route("/tables/<string:table_name>/rows/<int:offset>/<int:limit>", methods=["GET"])
+        @jwt_required()
+        @api
+        @permissions_required([PERMISSIONS.DATA.GET])
+        @cached_response(lambda table_name, **_: (table_name,))
+        @read_only
+        def get_rows(table_name: str, offset: int, limit: int) -> GetRows:
+            ...
+
+    只缓存成功的结果，错误结果每次重新计算；未命中时视图在主库上执行，命中时不查询数据库
+
+    :param tables: 响应所依赖的表名，或由视图参数得到表名的函数
+    :type tables: Collection[str] | Callable[..., Collection[str]]
+    """
+
+    def wrapper(func: C) -> C:
+        @decorator  # type: ignore[untyped-decorator]
+        def inner(wrapped: C, _instance: Any, args: tuple[Any, ...], kwargs: dict[str, Any]) -> APIResult:
+            if (cache := get_cache()) is None:
+                return wrapped(*args, **kwargs)
+            names = tuple(tables(*args, **kwargs) if callable(tables) else tables)
+            endpoint = request.endpoint or "unknown"
+            if (stamps := get_stamps(names)) is None:
+                CACHE_REQUESTS.inc(endpoint=endpoint, result="bypass")
+                return wrapped(*args, **kwargs)
+
+            key = request_key(names, stamps)
+            entry, tier = cache.lookup(key)
+            if entry is not None:
+                CACHE_REQUESTS.inc(endpoint=endpoint, result=tier)
+                return entry.result()
+
+            call, leader = cache.flights.join(key)
+            if leader:
+                CACHE_REQUESTS.inc(endpoint=endpoint, result="miss")
+                try:
+                    return compute(cache, key, lambda: wrapped(*args, **kwargs))
+                finally:
+                    cache.flights.leave(key)
+
+            # 等待领头者的结果；其结果不可缓存或等待超时则自行计算
+            call.done.wait(cache.wait_seconds)
+            if (entry := cache.local.get(key)) is not None:
+                CACHE_REQUESTS.inc(endpoint=endpoint, result="coalesced")
+                return entry.result()
+            CACHE_REQUESTS.inc(endpoint=endpoint, result="miss")
+            return compute(cache, key, lambda: wrapped(*args, **kwargs))
+
+        view = inner(func)
+        # 响应只由权限决定，权限相同的调用者的相同请求可以合并
+        setattr(view, CONTEXT_ATTR, permission_context)
+        return view  # type: ignore[no-any-return]
+
+    return wrapper
+
+
+def initialize_cache(app: Flask) -> None:
+    """
+    根据配置创建响应缓存，未启用时 :py:func:`cached_response` 直接调用视图
+
+    :param app: 应用
+    :type app: Flask
+    """
+    if not app.config["CACHE_ENABLED"]:
+        return
+    ttl = app.config["CACHE_TTL_SECONDS"]
+    prefix = app.config["CACHE_KEY_PREFIX"]
+    shared: Optional[SharedTier] = None
+    if not isinstance(jwt_redis_blocklist, MemoryRedis):
+        # 响应体为二进制，不能使用解码响应的黑名单客户端
+        shared = SharedTier(redis.StrictRedis.from_url(app.config["REDIS_URL"]), prefix, ttl)
+    app.extensions[CACHE_EXTENSION] = ResponseCache(
+        local=LocalTier(app.config["CACHE_LOCAL_MAX_BYTES"], ttl),
+        shared=shared,
+        max_entry_bytes=app.config["CACHE_MAX_ENTRY_BYTES"],
+        wait_seconds=app.config["CACHE_WAIT_SECONDS"],
+    )
+
+
+__all__ = (
+    "CacheEntry",
+    "LocalTier",
+    "SharedTier",
+    "ResponseCache",
+    "cached_response",
+    "initialize_cache",
+)
@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+读取请求合并
+
+:py:func:`app.api.api` 对 GET / HEAD 请求按规范化的请求（方法、路径、查询参数、``Accept``、
+``Accept-Encoding``、条件请求头与请求体）与调用者的上下文计算键。同一进程中键相同的请求同时到达时，只有第一个请求
+（领头者）执行视图、序列化与压缩，其余请求等待并直接使用其响应体；领头者完成后到达的请求重新计算，不会读到过期内容。
+
+调用者的上下文默认为令牌中的身份；响应只由权限决定的视图（如 :py:func:`app.cache.cached_response` 装饰的视图）
+通过 :py:data:`CONTEXT_ATTR` 声明以权限集合为上下文，不同用户之间也可以合并。
+``COALESCE_ACROSS_PROCESSES`` 启用时，领头者另外通过 Redis 中的短时锁在进程间合并，其余进程的请求轮询其结果
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Optional
+
+import redis
+from flask import Flask
+from flask import Response
+from flask import current_app
+from flask import g
+from flask import request
+from flask_jwt_extended import get_jwt_identity
+
+from .extensions import jwt_redis_blocklist
+from .memory_redis import MemoryRedis
+from .metrics import REQUESTS_COALESCED
+
+COALESCE_EXTENSION = "coalescing"
+CONTEXT_ATTR = "__coalesce_context__"
+"""
+视图上返回调用者上下文的函数，上下文相同的调用者对相同请求得到相同的响应
+"""
+COALESCED_METHODS = frozenset(("GET", "HEAD"))
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class SharedResponse:
+    """
+    领头者交给等待者的响应
+    """
+    code: int
+    """
+    API 代码
+    """
+    headers: list[tuple[str, str]]
+    body: bytes
+
+    def dumps(self) -> bytes:
+        return json.dumps([self.code, self.headers]).encode() + b"\n" + self.body
+
+    @classmethod
+    def loads(cls, data: bytes) -> "SharedResponse":
+        header, body = data.split(b"\n", 1)
+        code, headers = json.loads(header)
+        return cls(code=code, headers=[(name, value) for name, value in headers], body=body)
+
+    def response(self) -> Response:
+        return Response(self.body, headers=self.headers)
+
+
+def shared_response(code: int, response: Response) -> Optional[SharedResponse]:
+    """
+    提取可交给其他请求的响应，只有状态码为 200、非流式且不设置 Cookie 的响应可以共享
+    """
+    if response.status_code != 200 or response.is_streamed or "Set-Cookie" in response.headers:
+        return None
+    # Content-Length 由新的响应重新计算
+    headers = [(name, value) for name, value in response.headers.items() if name != "Content-Length"]
+    return SharedResponse(code=code, headers=headers, body=response.get_data())
+
+
+@dataclass(eq=False)
+class Call:
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Optional[SharedResponse] = None
+    """
+    领头者的响应，不可共享时为 None
+    """
+
+
+class SingleFlight:
+    """
+    同一个键同时只有一个调用者（领头者）执行计算，其余调用者等待其完成
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[str, Call] = {}
+        self._lock = threading.Lock()
+
+    def join(self, key: str) -> tuple[Call, bool]:
+        """
+        加入对 ``key`` 的计算
+
+        :return: 计算与调用者是否为领头者，领头者完成后必须调用 :py:meth:`leave`
+        :rtype: tuple[Call, bool]
+        """
+        with self._lock:
+            if (call := self._calls.get(key)) is not None:
+                return call, False
+            call = self._calls[key] = Call()
+            return call, True
+
+    def leave(self, key: str, result: Optional[SharedResponse] = None) -> None:
+        with self._lock:
+            call = self._calls.pop(key)
+        call.result = result
+        call.done.set()
+
+
+class RemoteFlights:
+    """
+    通过 Redis 在进程间合并：领头者持有短时锁，完成后写入结果并释放锁，
+    结果与锁的有效期相同，只有在锁存在时开始等待的请求会读取
+    """
+
+    def __init__(self, client: redis.StrictRedis, prefix: str, lock_ms: int, poll_ms: int) -> None:
+        self.client = client
+        self.prefix = prefix
+        self.lock_ms = lock_ms
+        self.poll_ms = poll_ms
+
+    def acquire(self, key: str) -> bool:
+        """
+        :return: 是否获得锁；Redis 不可用时视为获得，各进程分别计算
+        :rtype: bool
+        """
+        try:
+            return bool(self.client.set(f"{self.prefix}lock:{key}", 1, nx=True, px=self.lock_ms))
+        except redis.exceptions.RedisError:
+            logger.warning("获取请求合并锁失败", exc_info=True)
+            return True
+
+    def release(self, key: str, result: Optional[SharedResponse]) -> None:
+        try:
+            pipeline = self.client.pipeline(transaction=False)
+            if result is not None:
+                pipeline.set(f"{self.prefix}result:{key}", result.dumps(), px=self.lock_ms)
+            pipeline.delete(f"{self.prefix}lock:{key}")
+            pipeline.execute()
+        except redis.exceptions.RedisError:
+            logger.warning("释放请求合并锁失败", exc_info=True)
+
+    def wait(self, key: str, timeout: float) -> Optional[SharedResponse]:
+        """
+        等待其他进程的领头者完成
+
+        :return: 其结果，锁已释放但没有结果（不可共享）或超时时返回 None
+        :rtype: Optional[SharedResponse]
+        """
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                pipeline = self.client.pipeline(transaction=False)
+                pipeline.get(f"{self.prefix}result:{key}")
+                pipeline.exists(f"{self.prefix}lock:{key}")
+                data, locked = pipeline.execute()
+                if data is not None:
+                    return SharedResponse.loads(data)
+                if not locked or time.monotonic() >= deadline:
+                    return None
+                time.sleep(self.poll_ms / 1000)
+        except redis.exceptions.RedisError:
+            logger.warning("等待请求合并结果失败", exc_info=True)
+            return None
+
+
+def record_coalesced(source: str) -> None:
+    REQUESTS_COALESCED.inc(endpoint=request.endpoint or "unknown", source=source)
+
+
+@dataclass
+class Coalescer:
+    wait_seconds: float
+    remote: Optional[RemoteFlights]
+    flights: SingleFlight = field(default_factory=SingleFlight)
+
+    def run[T](self, key: str, compute: Callable[[], tuple[T, Optional[SharedResponse]]]) -> T | SharedResponse:
+        """
+        合并对 ``key`` 的计算
+
+        :param key: 请求的键
+        :type key: str
+        :param compute: 执行请求，返回其结果与可共享的响应
+        :type compute: Callable[[], tuple[T, Optional[SharedResponse]]]
+
+        :return: 自行计算的结果，或其他请求共享的响应
+        :rtype: T | SharedResponse
+        """
+        call, leader = self.flights.join(key)
+        if not leader:
+            call.done.wait(self.wait_seconds)
+            if call.result is not None:
+                record_coalesced("local")
+                return call.result
+            # 领头者的响应不可共享或等待超时则自行计算
+            return compute()[0]
+
+        result: Optional[SharedResponse] = None
+        try:
+            if self.remote is None:
+                value, result = compute()
+                return value
+            if not self.remote.acquire(key):
+                # 其他进程的领头者正在计算
+                if (result := self.remote.wait(key, self.wait_seconds)) is not None:
+                    record_coalesced("remote")
+                    return result
+                value, result = compute()
+                return value
+            try:
+                value, result = compute()
+            finally:
+                self.remote.release(key, result)
+            return value
+        finally:
+            self.flights.leave(key, result)
+
+
+def get_coalescer() -> Optional[Coalescer]:
+    coalescer: Optional[Coalescer] = current_app.extensions.get(COALESCE_EXTENSION)
+    return coalescer
+
+
+def identity_context() -> Any:
+    """
+    默认的调用者上下文：令牌中的身份，未验证令牌的接口为 None
+    """
+    try:
+        return get_jwt_identity()
+    except RuntimeError:
+        return None
+
+
+def request_key(context: Callable[[], Any]) -> Optional[str]:
+    """
+    计算请求的键
+
+    :param context: 返回调用者上下文的函数
+    :type context: Callable[[], Any]
+
+    :return: 键，不合并的请求返回 None
+    :rtype: Optional[str]
+    """
+    if request.method not in COALESCED_METHODS:
+        return None
+    body = request.get_data(cache=True)
+    parts = [
+        request.method,
+        request.endpoint,
+        request.path,
+        sorted(request.args.items(multi=True)),
+        request.headers.get("Accept", ""),
+        request.headers.get("Accept-Encoding", ""),
+        # 条件请求可能得到 304，不与普通请求合并
+        request.headers.get("If-None-Match", ""),
+        request.headers.get("If-Modified-Since", ""),
+        hashlib.blake2b(body, digest_size=16).hexdigest() if body else None,
+        # 写入后固定使用主库的请求不与读取副本的请求合并
+        bool(g.get("_db_pinned")),
+        context(),
+    ]
+    return hashlib.blake2b(json.dumps(parts, default=str).encode(), digest_size=20).hexdigest()
+
+
+def initialize_coalescing(app: Flask) -> None:
+    """
+    根据配置启用请求合并
+
+    :param app: 应用
+    :type app: Flask
+    """
+    if not app.config["COALESCE_ENABLED"]:
+        return
+    remote: Optional[RemoteFlights] = None
+    if app.config["COALESCE_ACROSS_PROCESSES"] and not isinstance(jwt_redis_blocklist, MemoryRedis):
+        remote = RemoteFlights(
+            redis.StrictRedis.from_url(app.config["REDIS_URL"]),
+            app.config["COALESCE_KEY_PREFIX"],
+            app.config["COALESCE_LOCK_MS"],
+            app.config["COALESCE_POLL_MS"],
+        )
+    app.extensions[COALESCE_EXTENSION] = Coalescer(wait_seconds=app.config["COALESCE_WAIT_SECONDS"], remote=remote)
+
+
+__all__ = (
+    "CONTEXT_ATTR",
+    "SharedResponse",
+    "shared_response",
+    "SingleFlight",
+    "RemoteFlights",
+    "Coalescer",
+    "get_coalescer",
+    "identity_context",
+    "request_key",
+    "record_coalesced",
+    "initialize_coalescing",
+)
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+响应压缩
+
+:py:func:`app.api.api` 在构造响应后调用 :py:func:`compress_response`，按请求的 ``Accept-Encoding``
+选择 ``COMPRESSION_ENCODINGS`` 中的压缩算法。gzip 总是可用，br 与 zstd 分别需要安装 ``brotli`` 与
+``zstandard``，未安装时跳过。流式响应逐块压缩并立即刷新，每块到达客户端时都可以解压；
+内容只由参数决定的响应（:py:attr:`app.api.APIResult.immutable`）缓存压缩结果
+"""
+
+import hashlib
+import importlib
+import threading
+import zlib
+from collections import OrderedDict
+from collections.abc import Callable
+from collections.abc import Iterable
+from collections.abc import Iterator
+from dataclasses import dataclass
+from types import ModuleType
+from typing import Any
+from typing import Optional
+from typing import Protocol
+
+from flask import Flask
+from flask import Response
+from flask import current_app
+from flask import request
+
+COMPRESSION_EXTENSION = "compression"
+
+
+class StreamCompressor(Protocol):
+    def compress(self, data: bytes) -> bytes:
+        """
+        压缩一块数据并刷新，返回的数据可以立即解压
+        """
+        ...
+
+    def finish(self) -> bytes:
+        ...
+
+
+class GzipStream:
+    def __init__(self, level: int) -> None:
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+class BrotliStream:
+    def __init__(self, brotli: Any, quality: int) -> None:
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return bytes(self.compressor.process(data) + self.compressor.flush())
+
+    def finish(self) -> bytes:
+        return bytes(self.compressor.finish())
+
+
+class ZstdStream:
+    def __init__(self, zstandard: Any, level: int) -> None:
+        self.zstandard = zstandard
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return bytes(self.compressor.compress(data) + self.compressor.flush(self.zstandard.COMPRESSOBJ_FLUSH_BLOCK))
+
+    def finish(self) -> bytes:
+        return bytes(self.compressor.flush())
+
+
+@dataclass(frozen=True)
+class Codec:
+    """
+    压缩算法
+    """
+    name: str
+    """
+    ``Content-Encoding`` 中的名称
+    """
+    compress: Callable[[bytes, int], bytes]
+    stream: Callable[[int], StreamCompressor]
+    level_key: str
+    """
+    压缩级别的配置项
+    """
+
+
+def optional_module(name: str) -> Optional[ModuleType]:
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+def available_codecs() -> dict[str, Codec]:
+    """
+    获取已安装的压缩算法
+
+    :return: 名称到压缩算法的映射
+    :rtype: dict[str, Codec]
+    """
+    codecs = {
+        "gzip": Codec(
+            name="gzip",
+            compress=lambda data, level: zlib.compress(data, level, wbits=31),
+            stream=GzipStream,
+            level_key="COMPRESSION_GZIP_LEVEL",
+        ),
+    }
+    if (brotli := optional_module("brotli")) is not None:
+        codecs["br"] = Codec(
+            name="br",
+            compress=lambda data, level: bytes(brotli.compress(data, quality=level)),
+            stream=lambda level: BrotliStream(brotli, level),
+            level_key="COMPRESSION_BROTLI_QUALITY",
+        )
+    if (zstandard := optional_module("zstandard")) is not None:
+        codecs["zstd"] = Codec(
+            name="zstd",
+            compress=lambda data, level: bytes(zstandard.ZstdCompressor(level=level).compress(data)),
+            stream=lambda level: ZstdStream(zstandard, level),
+            level_key="COMPRESSION_ZSTD_LEVEL",
+        )
+    return codecs
+
+
+class CompressionCache:
+    """
+    压缩结果缓存，以响应体的摘要为键，超过 ``max_entries`` 时淘汰最久未使用的条目
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, bytes], bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def compress(self, codec: Codec, level: int, body: bytes) -> bytes:
+        key = (codec.name, hashlib.blake2b(body, digest_size=16).digest())
+        with self._lock:
+            if (compressed := self._entries.get(key)) is not None:
+                self._entries.move_to_end(key)
+                return compressed
+        compressed = codec.compress(body, level)
+        with self._lock:
+            self._entries[key] = compressed
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return compressed
+
+
+@dataclass(frozen=True)
+class CompressionSettings:
+    codecs: dict[str, tuple[Codec, int]]
+    """
+    按优先顺序排列的名称到压缩算法及其级别的映射
+    """
+    min_size: int
+    mimetypes: frozenset[str]
+    cache: CompressionCache
+
+
+def compress_stream(chunks: Iterable[bytes | str], compressor: StreamCompressor) -> Iterator[bytes]:
+    """
+    逐块压缩流式响应，结束时关闭原响应体
+    """
+    try:
+        for chunk in chunks:
+            if data := compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk):
+                yield data
+        yield compressor.finish()
+    finally:
+        if (close := getattr(chunks, "close", None)) is not None:
+            close()
+
+
+def compress_response(response: Response, *, cacheable: bool = False) -> Response:
+    """
+    按请求的 ``Accept-Encoding`` 压缩响应
+
+    只压缩状态码为 200、类型在 ``COMPRESSION_MIMETYPES`` 中且未编码的响应；
+    非流式响应还需不小于 ``COMPRESSION_MIN_SIZE``。响应带有 ETag 时在其后追加编码名。
+    ``send_file`` 等设置了 ``direct_passthrough`` 的文件响应原样发送，以便服务器零拷贝发送并响应条件请求与范围请求
+
+    :param response: 响应
+    :type response: Response
+    :param cacheable: 是否缓存压缩结果，只用于内容只由参数决定的响应
+    :type cacheable: bool
+
+    :return: 原响应
+    :rtype: Response
+    """
+    settings: Optional[CompressionSettings] = current_app.extensions.get(COMPRESSION_EXTENSION)
+    if (
+            settings is None
+            or response.status_code != 200
+            or response.direct_passthrough
+            or response.mimetype not in settings.mimetypes
+            or "Content-Encoding" in response.headers
+            or "no-transform" in response.headers.get("Cache-Control", "")
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = request.accept_encodings.best_match(settings.codecs)
+    if encoding is None:
+        return response
+    codec, level = settings.codecs[encoding]
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, codec.stream(level))
+        response.direct_passthrough = False
+        response.headers.pop("Content-Length", None)
+    else:
+        body = response.get_data()
+        if len(body) < settings.min_size:
+            return response
+        response.set_data(settings.cache.compress(codec, level, body) if cacheable else codec.compress(body, level))
+
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag is not None:
+        response.set_etag(f"{etag}-{encoding}", bool(weak))
+    return response
+
+
+def initialize_compression(app: Flask) -> None:
+    """
+    根据配置选择压缩算法，未启用时 :py:func:`compress_response` 不做任何事
+
+    :param app: 应用
+    :type app: Flask
+    """
+    if not app.config["COMPRESSION_ENABLED"]:
+        return
+    available = available_codecs()
+    names = [name.strip() for name in app.config["COMPRESSION_ENCODINGS"].split(",")]
+    app.extensions[COMPRESSION_EXTENSION] = CompressionSettings(
+        codecs={
+            name: (available[name], int(app.config[available[name].level_key]))
+            for name in names if name in available
+        },
+        min_size=app.config["COMPRESSION_MIN_SIZE"],
+        mimetypes=frozenset(m.strip() for m in app.config["COMPRESSION_MIMETYPES"].split(",")),
+        cache=CompressionCache(app.config["COMPRESSION_CACHE_SIZE"]),
+    )
+
+
+__all__ = (
+    "Codec",
+    "available_codecs",
+    "CompressionCache",
+    "compress_stream",
+    "compress_response",
+    "initialize_compression",
+)
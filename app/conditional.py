@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+条件请求
+
+以 :py:func:`conditional_response` 装饰的视图，其成功响应带有由规范化的请求（端点、路径参数、查询参数与
+``Accept``）与所依赖各表的版本戳（:py:mod:`app.stamps`）计算的弱 ETag，以及各表中最晚的修改时间。
+请求的 ``If-None-Match`` 与之匹配，或未带 ``If-None-Match`` 而 ``If-Modified-Since`` 不早于修改时间时，
+在执行视图前返回 304，不查询数据，也不序列化响应。带有 ETag 的响应在主库上计算，落后的副本中的旧数据
+不会以新的 ETag 发送。
+
+响应的 ``Cache-Control`` 为 ``private, no-cache``：客户端可以保存响应，但每次使用前须重新验证
+"""
+
+import hashlib
+import json
+import time
+from collections.abc import Callable
+from collections.abc import Collection
+from typing import Any
+from typing import Optional
+
+from flask import request
+from wrapt import decorator  # type: ignore[import-untyped]
+
+from .api import APIResult
+from .api import HTTP_CODE_ATTR
+from .api import NotModified
+from .api import Validated
+from .database import pin_primary
+from .stamps import GENERATION
+from .stamps import Stamp
+from .stamps import get_stamps
+
+CACHE_CONTROL = "private, no-cache"
+MODIFIED_DELAY = 1
+"""
+HTTP 日期只精确到秒，修改时间距今不足一秒时不发送 ``Last-Modified``，避免同一秒内的后续写入不被发现
+"""
+
+
+def entity_tag(tables: Collection[str], stamps: list[Stamp]) -> str:
+    """
+    由规范化的请求与各表的版本戳计算 ETag
+    """
+    parts = [
+        request.endpoint,
+        sorted((request.view_args or {}).items()),
+        sorted(request.args.items(multi=True)),
+        str(request.accept_mimetypes),
+        dict(zip((GENERATION, *tables), ((stamp.version, stamp.modified) for stamp in stamps))),
+    ]
+    return hashlib.blake2b(json.dumps(parts, default=str).encode(), digest_size=16).hexdigest()
+
+
+def last_modified(stamps: list[Stamp]) -> Optional[float]:
+    """
+    获取各表中最晚的修改时间，距今不足 :py:data:`MODIFIED_DELAY` 秒时返回 None
+    """
+    modified = max(stamp.modified for stamp in stamps)
+    return modified if time.time() - modified >= MODIFIED_DELAY else None
+
+
+def matched_tag(etag: str) -> Optional[str]:
+    """
+    在 ``If-None-Match`` 中查找与 ``etag`` 匹配的标签
+
+    压缩后的响应在 ETag 后追加了编码名，比较时去掉；按弱比较规则，强弱标签均可匹配
+
+    :return: 匹配的标签（原样返回给客户端），不匹配时返回 None
+    :rtype: Optional[str]
+    """
+    tags = request.if_none_match
+    if tags.star_tag:
+        return etag
+    for tag in tags.as_set(include_weak=True):
+        if tag.split("-", 1)[0] == etag:
+            return tag
+    return None
+
+
+def not_modified(etag: str, modified: Optional[float]) -> Optional[NotModified]:
+    """
+    按 ``If-None-Match`` 与 ``If-Modified-Since`` 判断客户端保存的响应是否仍然有效
+
+    :return: 有效时返回 304 结果，否则返回 None
+    :rtype: Optional[NotModified]
+    """
+    if request.if_none_match:
+        if (tag := matched_tag(etag)) is not None:
+            return NotModified(etag=tag, last_modified=modified, cache_control=CACHE_CONTROL)
+        return None
+    # 带有 If-None-Match 时忽略 If-Modified-Since
+    since = request.if_modified_since
+    if since is not None and modified is not None and int(modified) <= since.timestamp():
+        return NotModified(etag=etag, last_modified=modified, cache_control=CACHE_CONTROL)
+    return None
+
+
+def validated(result: APIResult, etag: str, modified: Optional[float]) -> APIResult:
+    """
+    为成功的结果附加 ETag 与 ``Last-Modified``，错误结果原样返回
+    """
+    if result.code % 10 != 1 or hasattr(result, HTTP_CODE_ATTR):
+        return result
+    return Validated(
+        code=result.code,
+        message=result.message,
+        result=result,
+        etag=etag,
+        last_modified=modified,
+        cache_control=CACHE_CONTROL,
+    )
+
+
+def conditional_response[C: Callable[..., APIResult]](
+        tables: Collection[str] | Callable[..., Collection[str]] = (),
+) -> Callable[[C], C]:
+    """
+    为视图的成功响应设置 ETag 与 ``Last-Modified``，并响应条件请求，
+    位于 ``@permissions_required`` 之后，权限检查不通过时不返回 304::
+
+        @bp.route("/tables/<string:table_name>/rows/<int:offset>/<int:limit>", methods=["GET"])
+        @jwt_required()
+        @api
+        @permissions_required([PERMISSIONS.DATA.GET])
+        @conditional_response(lambda table_name, **_: (table_name,))
+        @cached_response(lambda table_name, **_: (table_name,))
+        @read_only
+        def get_rows(table_name: str, offset: int, limit: int) -> GetRows:
+            ...
+
+    视图的响应须只由请求参数与 ``tables`` 中各表的内容决定
+
+    :param tables: 响应所依赖的表名，或由视图参数得到表名的函数
+    :type tables: Collection[str] | Callable[..., Collection[str]]
+    """
+
+    @decorator  # type: ignore[untyped-decorator]
+    def inner(wrapped: C, _instance: Any, args: tuple[Any, ...], kwargs: dict[str, Any]) -> APIResult:
+        names = tuple(tables(*args, **kwargs) if callable(tables) else tables)
+        if request.method not in ("GET", "HEAD") or (stamps := get_stamps(names)) is None:
+            return wrapped(*args, **kwargs)
+        etag = entity_tag(names, stamps)
+        modified = last_modified(stamps)
+        if (unchanged := not_modified(etag, modified)) is not None:
+            return unchanged
+
+        # ETag 中的版本戳在提交后递增，副本可能还未包含该提交
+        pin_primary()
+        return validated(wrapped(*args, **kwargs), etag, modified)
+
+    return inner  # type: ignore[no-any-return]
+
+
+__all__ = (
+    "CACHE_CONTROL",
+    "entity_tag",
+    "last_modified",
+    "not_modified",
+    "validated",
+    "conditional_response",
+)
@@ -14,3 +14,147 @@ class Config:
     SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
     SQLALCHEMY_DATABASE_URI = os.getenv("SQLALCHEMY_DATABASE_URI", "sqlite:///app.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # 数据库性能配置，可选 durable / throughput / readonly-replica
+    DATABASE_PROFILE = os.getenv("DATABASE_PROFILE", "throughput")
+    # 绑定名到性能配置的映射，未指定的绑定使用 DATABASE_PROFILE
+    DATABASE_BIND_PROFILES: dict[str | None, str] = {}
+    # 连接到同一 SQLite 数据库文件的只读副本数量
+    DATABASE_READ_REPLICAS = int(os.getenv("DATABASE_READ_REPLICAS", 0))
+    # 独立只读副本的地址，以逗号分隔
+    DATABASE_REPLICA_URIS = [uri for uri in os.getenv("DATABASE_REPLICA_URIS", "").split(",") if uri]
+    # 客户端写入后多少秒内的请求均使用主库，独立副本存在复制延迟时使用
+    DATABASE_READ_YOUR_WRITES_SECONDS = int(os.getenv("DATABASE_READ_YOUR_WRITES_SECONDS", 0))
+    # 启动服务前比较数据库结构指纹，不一致时输出差异
+    DATABASE_SCHEMA_CHECK = os.getenv("DATABASE_SCHEMA_CHECK", "true").lower() == "true"
+    # 结构不一致时自动添加缺少的表、列与索引（不修改或删除已有结构）
+    DATABASE_SCHEMA_AUTO_APPLY = os.getenv("DATABASE_SCHEMA_AUTO_APPLY", "false").lower() == "true"
+    DATABASE_PROFILE_REPORT = os.getenv("DATABASE_PROFILE_REPORT", "true").lower() == "true"
+    # 异步读取接口使用的数据库，留空时由 SQLALCHEMY_DATABASE_URI 推导
+    ASYNC_SQLALCHEMY_DATABASE_URI = os.getenv("ASYNC_SQLALCHEMY_DATABASE_URI")
+    # memory:// 使用进程内的替代实现，仅适用于单进程
+    REDIS_URL = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
+    # 多进程服务器 (flask serve)
+    SERVER_BIND = os.getenv("SERVER_BIND", "0.0.0.0:5000")
+    SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", os.cpu_count() or 1))
+    SERVER_THREADS = int(os.getenv("SERVER_THREADS", 4))
+    SERVER_MAX_REQUESTS = int(os.getenv("SERVER_MAX_REQUESTS", 10000))
+    SERVER_MAX_REQUESTS_JITTER = int(os.getenv("SERVER_MAX_REQUESTS_JITTER", 1000))
+    SERVER_GRACEFUL_TIMEOUT = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", 30))
+    SERVER_TIMEOUT = int(os.getenv("SERVER_TIMEOUT", 60))
+    # 通过 Flask 命令行运行时，路由延迟到第一个请求时再加载，不处理请求的命令无需导入视图模块
+    # （flask routes 需设置为 false 才能列出路由）
+    STARTUP_LAZY_ROUTES = os.getenv("STARTUP_LAZY_ROUTES", "true").lower() == "true"
+    # 是否收集接口监控指标
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    # 多进程共享的指标目录，为空时单进程只使用内存，flask serve 会自动创建临时目录
+    METRICS_DIR = os.getenv("METRICS_DIR", "")
+    # 各进程将指标写入共享目录的最短间隔（秒）
+    METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", 1))
+    # 是否统计每个请求执行的 SQL 语句（次数、耗时与语句指纹）
+    QUERY_PROFILE_ENABLED = os.getenv("QUERY_PROFILE_ENABLED", "true").lower() == "true"
+    # 是否在响应头中返回查询次数与数据库耗时（X-Query-Count、X-Query-Repeated、Server-Timing）
+    QUERY_PROFILE_HEADERS = os.getenv("QUERY_PROFILE_HEADERS", "false").lower() == "true"
+    # 同一请求中同一语句指纹执行多少次视为 N+1 查询
+    QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", 5))
+    # 慢查询阈值（毫秒）
+    QUERY_SLOW_MS = float(os.getenv("QUERY_SLOW_MS", 100))
+    # 慢查询日志文件，为空时输出到标准错误
+    QUERY_SLOW_LOG = os.getenv("QUERY_SLOW_LOG", "")
+    # 请求追踪的采样率（0 到 1），0 表示不追踪
+    TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0))
+    # 追踪文件目录，每个进程写入 trace-<pid>.json，为空时使用实例目录下的 traces
+    TRACE_DIR = os.getenv("TRACE_DIR", "")
+    # 单个追踪文件的最大字节数，超过后轮转
+    TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", 10 * 1024 * 1024))
+    # 每个进程保留的轮转追踪文件数
+    TRACE_BACKUP_COUNT = int(os.getenv("TRACE_BACKUP_COUNT", 5))
+    # 触发请求剖析的令牌的签名密钥，为空时不能通过请求头触发
+    PROFILE_SECRET = os.getenv("PROFILE_SECRET", "")
+    # 随机剖析请求的概率（0 到 1）
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+    # 随机剖析限定的端点，逗号分隔，如 data.get_rows,auth.get_accounts，为空时不限定
+    PROFILE_ENDPOINTS = os.getenv("PROFILE_ENDPOINTS", "")
+    # 剖析结果目录，为空时使用实例目录下的 profiles
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "")
+    # 最多保留的剖析数
+    PROFILE_MAX_CAPTURES = int(os.getenv("PROFILE_MAX_CAPTURES", 100))
+    # 内存分配追踪记录的调用栈深度
+    PROFILE_TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", 10))
+    # 是否按 Accept-Encoding 压缩接口响应
+    COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+    # 按优先顺序排列的压缩算法，br 与 zstd 需要安装 brotli 与 zstandard，未安装时跳过
+    COMPRESSION_ENCODINGS = os.getenv("COMPRESSION_ENCODINGS", "zstd,br,gzip")
+    # 小于该字节数的响应不压缩（流式响应总是压缩）
+    COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+    # 各算法的压缩级别：gzip 1-9，brotli 0-11，zstd 1-22
+    COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+    COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4))
+    COMPRESSION_ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", 3))
+    # 压缩的响应类型，逗号分隔；下载的文件（send_file）无论类型均不压缩
+    COMPRESSION_MIMETYPES = os.getenv(
+        "COMPRESSION_MIMETYPES",
+        "application/json,application/msgpack,application/x-msgpack,application/vnd.msgpack,application/cbor,"
+        "text/plain,text/event-stream",
+    )
+    # 不可变响应（如数据表结构）的压缩结果缓存条数
+    COMPRESSION_CACHE_SIZE = int(os.getenv("COMPRESSION_CACHE_SIZE", 128))
+    # 可按 Accept / Content-Type 协商的二进制格式，按优先顺序排列，msgpack 与 cbor 需要安装 msgpack 与 cbor2，未安装时跳过
+    SERIALIZATION_FORMATS = os.getenv("SERIALIZATION_FORMATS", "msgpack,cbor")
+    # 增量同步每次返回的最多变更记录数
+    CHANGES_PAGE_SIZE = int(os.getenv("CHANGES_PAGE_SIZE", 1000))
+    # flask compact-changes 为每张表保留的变更记录数，更早版本的客户端需要全量同步
+    CHANGES_KEEP = int(os.getenv("CHANGES_KEEP", 100000))
+    # 变更推送的 Redis 频道，REDIS_URL 为 memory:// 时只在进程内推送
+    EVENTS_CHANNEL = os.getenv("EVENTS_CHANNEL", "tusr:changes")
+    # 每个订阅连接缓冲的变更批次数，缓冲满时丢弃并通知客户端补齐
+    EVENTS_BUFFER_SIZE = int(os.getenv("EVENTS_BUFFER_SIZE", 256))
+    # 订阅连接空闲时的心跳间隔（秒）
+    EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", 15))
+    # 订阅连接持续的最长时间（秒），到期后客户端自动重连并重新验证身份
+    EVENTS_MAX_SECONDS = float(os.getenv("EVENTS_MAX_SECONDS", 300))
+    # 客户端断开后的重连间隔（毫秒）
+    EVENTS_RETRY_MS = int(os.getenv("EVENTS_RETRY_MS", 3000))
+    # 每个进程执行后台任务的线程数，0 表示只由 flask run-jobs 启动的进程执行
+    JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", 2))
+    # 后台任务的上传文件与结果文件目录，为空时使用实例目录下的 jobs
+    JOBS_DIR = os.getenv("JOBS_DIR", "")
+    # 空闲的工作线程查询排队任务的间隔（秒），同一进程中创建的任务会立即唤醒工作线程
+    JOBS_POLL_SECONDS = float(os.getenv("JOBS_POLL_SECONDS", 2))
+    # 执行中任务的心跳间隔（秒），同时也是清理过期任务的间隔
+    JOBS_HEARTBEAT_SECONDS = float(os.getenv("JOBS_HEARTBEAT_SECONDS", 10))
+    # 超过该秒数没有心跳的执行中任务视为所在进程已退出，标记为失败
+    JOBS_STALE_SECONDS = float(os.getenv("JOBS_STALE_SECONDS", 60))
+    # 任务结束后保留记录与结果文件的秒数
+    JOBS_RESULT_TTL = float(os.getenv("JOBS_RESULT_TTL", 24 * 3600))
+    # 每个用户排队与执行中的任务数上限
+    JOBS_MAX_PENDING = int(os.getenv("JOBS_MAX_PENDING", 10))
+    # 导入任务每次提交的行数
+    JOBS_IMPORT_BATCH = int(os.getenv("JOBS_IMPORT_BATCH", 1000))
+    # 数据表版本戳的 Redis 键前缀，REDIS_URL 为 memory:// 时版本戳保存在进程内
+    STAMPS_KEY_PREFIX = os.getenv("STAMPS_KEY_PREFIX", "tusr:stamps:")
+    # 是否缓存读取接口（数据表结构、行数据、角色与权限列表）的响应
+    CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+    # 进程内响应缓存的最大字节数
+    CACHE_LOCAL_MAX_BYTES = int(os.getenv("CACHE_LOCAL_MAX_BYTES", 64 * 1024 * 1024))
+    # 超过该字节数的响应不缓存
+    CACHE_MAX_ENTRY_BYTES = int(os.getenv("CACHE_MAX_ENTRY_BYTES", 1024 * 1024))
+    # 缓存条目的有效期（秒）；写入会使相关条目立即失效，有效期只限制只读副本复制延迟等情况下读到的旧内容
+    CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", 300))
+    # 共享响应缓存的 Redis 键前缀，REDIS_URL 为 memory:// 时只使用进程内缓存
+    CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "tusr:cache:")
+    # 同一条目正在计算时，其余请求等待结果的最长时间（秒）
+    CACHE_WAIT_SECONDS = float(os.getenv("CACHE_WAIT_SECONDS", 5))
+    # 是否合并同时到达的相同读取请求（GET / HEAD），只由第一个请求计算，其余请求使用其响应
+    COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "true").lower() == "true"
+    # 是否通过 Redis 中的短时锁在进程间合并，REDIS_URL 为 memory:// 时只在进程内合并
+    COALESCE_ACROSS_PROCESSES = os.getenv("COALESCE_ACROSS_PROCESSES", "false").lower() == "true"
+    # 等待其他请求的响应的最长时间（秒），超时后自行计算
+    COALESCE_WAIT_SECONDS = float(os.getenv("COALESCE_WAIT_SECONDS", 5))
+    # 进程间合并的锁的有效期（毫秒），也是响应在 Redis 中保留的时间
+    COALESCE_LOCK_MS = int(os.getenv("COALESCE_LOCK_MS", 2000))
+    # 其他进程的请求轮询响应的间隔（毫秒）
+    COALESCE_POLL_MS = int(os.getenv("COALESCE_POLL_MS", 10))
+    # 进程间合并使用的 Redis 键前缀
+    COALESCE_KEY_PREFIX = os.getenv("COALESCE_KEY_PREFIX", "tusr:coalesce:")
+    # 批量创建账户时用于计算密码哈希的进程数
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
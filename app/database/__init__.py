@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+
+from flask import Flask
+
+from .changes import ChangeBatch
+from .changes import ChangeSet
+from .changes import PENDING_CHANGES
+from .changes import changes_since
+from .changes import compact_changes
+from .changes import record_changes
+from .changes import reset_changes
+from .changes import table_version
+from .changes import track_tables
+from .changes import tracked_tables
+from .profile import DatabaseProfile
+from .profile import PROFILES
+from .profile import apply_pragmas
+from .profile import apply_profiles
+from .profile import bind_profile
+from .profile import configure_engine_options
+from .profile import get_profile
+from .profile import report_settings
+from .queries import QueryProfile
+from .queries import current_profile
+from .queries import finish_profile
+from .queries import fingerprint
+from .queries import initialize_query_profiler
+from .queries import start_profile
+from .routing import configure_replicas
+from .routing import get_router
+from .routing import initialize_routing
+from .routing import pin_primary
+from .routing import read_only
+from .routing import read_write
+from .schema import SchemaDiff
+from .schema import print_sync
+from .schema import synchronize_schema
+from .schema import verify_schema
+from .seeding import PasswordHash
+from .seeding import Ref
+from .seeding import SeedSet
+from .seeding import print_reports
+from .seeding import seed
+from .timing import ExecutedStatement
+from .timing import on_statement
+from ..extensions import db
+
+
+def initialize_database(app: Flask) -> None:
+    """
+    初始化数据库扩展、性能配置、读写分离及查询分析
+
+    :param app: 应用
+    :type app: Flask
+    """
+    configure_replicas(app)
+    configure_engine_options(app)
+    db.init_app(app)
+    apply_profiles(app)
+    initialize_routing(app)
+    initialize_query_profiler(app)
+    if app.config["DATABASE_PROFILE_REPORT"]:
+        report_settings(app)
+
+
+__all__ = (
+    "ChangeBatch",
+    "ChangeSet",
+    "PENDING_CHANGES",
+    "changes_since",
+    "compact_changes",
+    "record_changes",
+    "reset_changes",
+    "table_version",
+    "track_tables",
+    "tracked_tables",
+    "DatabaseProfile",
+    "PROFILES",
+    "apply_pragmas",
+    "bind_profile",
+    "get_profile",
+    "report_settings",
+    "QueryProfile",
+    "current_profile",
+    "finish_profile",
+    "start_profile",
+    "fingerprint",
+    "get_router",
+    "pin_primary",
+    "read_only",
+    "read_write",
+    "SchemaDiff",
+    "print_sync",
+    "synchronize_schema",
+    "verify_schema",
+    "PasswordHash",
+    "Ref",
+    "SeedSet",
+    "print_reports",
+    "seed",
+    "ExecutedStatement",
+    "on_statement",
+    "initialize_database",
+)
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+数据表变更记录
+
+通过 :py:func:`track_tables` 登记的表，经 ORM 会话的每次写入（新增、修改、删除）都在 flush 时
+以同一事务追加到 ``change_log``，并递增该表在 ``table_versions`` 中的版本号。递增版本号的 UPDATE
+会锁定该表的版本行直至提交，同一张表的变更按版本号顺序提交，客户端按版本号增量同步不会遗漏。
+
+绕过 ORM 的批量写入（如 ``flask generate-data``）不逐行记录，而是调用 :py:func:`reset_changes`，
+客户端下次同步时收到需要全量同步的提示。:py:func:`compact_changes` 合并同一行的重复记录并丢弃过旧的记录
+"""
+
+from collections import defaultdict
+from collections.abc import Iterable
+from dataclasses import dataclass
+from typing import Any
+from typing import Optional
+
+from flask import Flask
+from flask import current_app
+from flask import has_app_context
+from sqlalchemy import Connection
+from sqlalchemy import delete
+from sqlalchemy import event
+from sqlalchemy import insert
+from sqlalchemy import inspect
+from sqlalchemy import select
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from ..models.system import change_log
+from ..models.system import table_versions
+from ..session import RoutingSession
+
+CHANGES_EXTENSION = "changes"
+PENDING_CHANGES = "pending_changes"
+"""
+``Session.info`` 中当前事务已记录、尚未提交的变更批次，提交后由 :py:mod:`app.events` 推送
+"""
+INSERT = "insert"
+UPDATE = "update"
+DELETE = "delete"
+
+
+@dataclass(frozen=True)
+class TableVersion:
+    version: int
+    """
+    最新一次变更的版本号，没有变更时为 0
+    """
+    compacted: int
+    """
+    该版本号以前（含）的变更记录已被丢弃，从更早的版本无法增量同步
+    """
+
+
+@dataclass(frozen=True)
+class ChangeBatch:
+    """
+    一次 flush 中一张表的变更，版本号连续
+    """
+    table: str
+    since: int
+    """
+    批次之前的版本号，与客户端已知的版本号不一致时说明有遗漏
+    """
+    version: int
+    changes: list[tuple[int, str]]
+    """
+    按发生顺序排列的主键与操作
+    """
+
+
+@dataclass(frozen=True)
+class ChangeSet:
+    """
+    一段版本区间内的变更，同一行只保留最后一次操作
+    """
+    version: int
+    """
+    区间的结束版本号，下次同步从该版本开始
+    """
+    upserted: list[int]
+    """
+    新增或修改的行的主键
+    """
+    deleted: list[int]
+    more: bool
+    """
+    是否还有更新的变更未包含在内
+    """
+
+
+def track_tables(app: Flask, table_names: Iterable[str]) -> None:
+    """
+    登记需要记录变更的表
+
+    :param app: 应用
+    :type app: Flask
+    :param table_names: 表名
+    :type table_names: Iterable[str]
+    """
+    tracked: set[str] = app.extensions.setdefault(CHANGES_EXTENSION, set())
+    tracked.update(table_names)
+
+
+def tracked_tables() -> frozenset[str]:
+    return frozenset(current_app.extensions.get(CHANGES_EXTENSION, ()))
+
+
+def bump_version(connection: Connection, table_name: str, count: int) -> int:
+    """
+    将表的版本号递增 ``count``
+
+    :return: 递增后的版本号
+    :rtype: int
+    """
+    result = connection.execute(
+        update(table_versions)
+        .where(table_versions.c.table_name == table_name)
+        .values(version=table_versions.c.version + count)
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(table_versions).values(table_name=table_name, version=count, compacted=0))
+        return count
+    return int(connection.execute(
+        select(table_versions.c.version).where(table_versions.c.table_name == table_name)
+    ).scalar_one())
+
+
+def record_changes(connection: Connection, table_name: str, changes: list[tuple[int, str]]) -> ChangeBatch:
+    """
+    在当前事务中追加变更记录
+
+    :param connection: 数据写入所在的连接
+    :type connection: Connection
+    :param table_name: 表名
+    :type table_name: str
+    :param changes: 按发生顺序排列的主键与操作，不能为空
+    :type changes: list[tuple[int, str]]
+
+    :return: 记录的变更批次
+    :rtype: ChangeBatch
+    """
+    version = bump_version(connection, table_name, len(changes))
+    since = version - len(changes)
+    connection.execute(insert(change_log), [
+        dict(table_name=table_name, version=since + i + 1, row_id=row_id, op=op)
+        for i, (row_id, op) in enumerate(changes)
+    ])
+    return ChangeBatch(table=table_name, since=since, version=version, changes=changes)
+
+
+def reset_changes(connection: Connection, table_name: str) -> None:
+    """
+    标记表已被批量改写：递增版本号并丢弃其全部变更记录，更早版本的客户端需要全量同步
+    """
+    version = bump_version(connection, table_name, 1)
+    connection.execute(
+        update(table_versions).where(table_versions.c.table_name == table_name).values(compacted=version)
+    )
+    connection.execute(delete(change_log).where(change_log.c.table_name == table_name))
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def record_flush(session: Session, _flush_context: Any) -> None:
+    # after_flush 中 new / dirty / deleted 仍为 flush 前的状态，新增的行已有主键
+    if not has_app_context() or not (tracked := tracked_tables()):
+        return
+    changes: defaultdict[str, list[tuple[int, str]]] = defaultdict(list)
+    for op, objects in ((INSERT, session.new), (UPDATE, session.dirty), (DELETE, session.deleted)):
+        for obj in objects:
+            table_name = getattr(obj, "__tablename__", None)
+            if table_name not in tracked:
+                continue
+            if op == UPDATE and not session.is_modified(obj, include_collections=False):
+                continue
+            changes[table_name].append((inspect(obj).mapper.primary_key_from_instance(obj)[0], op))
+    if changes:
+        connection = session.connection()
+        pending: list[ChangeBatch] = session.info.setdefault(PENDING_CHANGES, [])
+        for table_name, entries in changes.items():
+            pending.append(record_changes(connection, table_name, entries))
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def discard_pending(session: Session) -> None:
+    session.info.pop(PENDING_CHANGES, None)
+
+
+def table_version(connection: Connection, table_name: str) -> TableVersion:
+    row = connection.execute(
+        select(table_versions.c.version, table_versions.c.compacted).where(table_versions.c.table_name == table_name)
+    ).one_or_none()
+    return TableVersion(0, 0) if row is None else TableVersion(row.version, row.compacted)
+
+
+def changes_since(connection: Connection, table_name: str, since: int, limit: int) -> Optional[ChangeSet]:
+    """
+    获取 ``since`` 之后的变更
+
+    :param connection: 连接
+    :type connection: Connection
+    :param table_name: 表名
+    :type table_name: str
+    :param since: 客户端已同步到的版本号
+    :type since: int
+    :param limit: 最多读取的变更记录数
+    :type limit: int
+
+    :return: 变更，``since`` 早于已丢弃的记录或晚于当前版本时返回 None，客户端需要全量同步
+    :rtype: Optional[ChangeSet]
+    """
+    current = table_version(connection, table_name)
+    if since < current.compacted or since > current.version:
+        return None
+    entries = connection.execute(
+        select(change_log.c.version, change_log.c.row_id, change_log.c.op)
+        .where(change_log.c.table_name == table_name, change_log.c.version > since)
+        .order_by(change_log.c.version)
+        .limit(limit + 1)
+    ).all()
+    more = len(entries) > limit
+    entries = entries[:limit]
+    # 先读取版本号再读取记录，不晚于该版本号的记录均已提交
+    version = current.version
+    if entries and (more or entries[-1].version > version):
+        version = entries[-1].version
+    latest: dict[int, str] = {}
+    for _version, row_id, op in entries:
+        latest.pop(row_id, None)
+        latest[row_id] = op
+    return ChangeSet(
+        version=version,
+        upserted=[row_id for row_id, op in latest.items() if op != DELETE],
+        deleted=[row_id for row_id, op in latest.items() if op == DELETE],
+        more=more,
+    )
+
+
+def compact_changes(connection: Connection, table_name: str, keep: int) -> tuple[int, int]:
+    """
+    压缩表的变更记录：删除同一行被更新的记录覆盖的旧记录，再只保留最新的 ``keep`` 条
+
+    合并不影响增量同步的结果；丢弃的记录会提高 ``compacted``，更早版本的客户端需要全量同步
+
+    :return: 合并的记录数与丢弃的记录数
+    :rtype: tuple[int, int]
+    """
+    newer = change_log.alias("newer")
+    merged = connection.execute(
+        delete(change_log).where(
+            change_log.c.table_name == table_name,
+            select(newer.c.version).where(
+                newer.c.table_name == change_log.c.table_name,
+                newer.c.row_id == change_log.c.row_id,
+                newer.c.version > change_log.c.version,
+            ).exists(),
+        )
+    ).rowcount
+
+    # 保留的记录的版本号均大于 compacted（reset_changes 会删除全部记录）
+    cutoff = connection.execute(
+        select(change_log.c.version)
+        .where(change_log.c.table_name == table_name)
+        .order_by(change_log.c.version.desc())
+        .offset(keep)
+        .limit(1)
+    ).scalar_one_or_none()
+    if cutoff is None:
+        return merged, 0
+    dropped = connection.execute(
+        delete(change_log).where(change_log.c.table_name == table_name, change_log.c.version <= cutoff)
+    ).rowcount
+    connection.execute(
+        update(table_versions)
+        .where(table_versions.c.table_name == table_name)
+        .values(compacted=cutoff)
+    )
+    return merged, dropped
+
+
+__all__ = (
+    "INSERT",
+    "UPDATE",
+    "DELETE",
+    "PENDING_CHANGES",
+    "TableVersion",
+    "ChangeBatch",
+    "ChangeSet",
+    "track_tables",
+    "tracked_tables",
+    "record_changes",
+    "reset_changes",
+    "table_version",
+    "changes_since",
+    "compact_changes",
+)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+
+from typing import Optional
+
+from sqlalchemy import Connection
+from sqlalchemy import select
+
+from ..models.system import app_meta
+
+
+def read_meta(connection: Connection, key: str) -> Optional[str]:
+    """
+    读取应用元数据
+
+    :param connection: 数据库连接
+    :type connection: Connection
+    :param key: 键
+    :type key: str
+
+    :return: 值，不存在时返回 None
+    :rtype: Optional[str]
+    """
+    value: Optional[str] = connection.scalar(select(app_meta.c.value).where(app_meta.c.key == key))
+    return value
+
+
+def read_meta_prefix(connection: Connection, prefix: str) -> dict[str, str]:
+    """
+    读取键以指定前缀开头的所有应用元数据
+
+    :param connection: 数据库连接
+    :type connection: Connection
+    :param prefix: 键名前缀
+    :type prefix: str
+
+    :return: 去除前缀后的键到值的映射
+    :rtype: dict[str, str]
+    """
+    result = connection.execute(select(app_meta.c.key, app_meta.c.value).where(app_meta.c.key.startswith(prefix)))
+    return {key.removeprefix(prefix): value for key, value in result.tuples()}
+
+
+def write_meta(connection: Connection, key: str, value: str) -> None:
+    """
+    写入应用元数据，调用方负责提交事务
+
+    :param connection: 数据库连接
+    :type connection: Connection
+    :param key: 键
+    :type key: str
+    :param value: 值
+    :type value: str
+    """
+    connection.execute(app_meta.delete().where(app_meta.c.key == key))
+    connection.execute(app_meta.insert().values(key=key, value=value))
+
+
+__all__ = (
+    "read_meta",
+    "read_meta_prefix",
+    "write_meta",
+)
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+
+
+from dataclasses import dataclass
+from typing import Any
+from typing import Optional
+
+from flask import Flask
+from sqlalchemy import Engine
+from sqlalchemy import URL
+from sqlalchemy import event
+from sqlalchemy import make_url
+from sqlalchemy import text
+from sqlalchemy.pool import QueuePool
+
+from ..extensions import db
+
+
+PRAGMA_NAMES = ("journal_mode", "synchronous", "cache_size", "mmap_size", "temp_store", "busy_timeout", "query_only")
+
+
+@dataclass(frozen=True, kw_only=True)
+class DatabaseProfile:
+    """
+    数据库性能配置
+
+    PRAGMA 仅对 SQLite 生效，连接池配置对所有数据库生效
+    """
+    journal_mode: Optional[str]
+    """
+    日志模式，None 表示不修改（只读连接无法修改日志模式）
+    """
+    synchronous: str
+    cache_size: int
+    """
+    页缓存大小，负数表示 KiB
+    """
+    mmap_size: int
+    """
+    内存映射大小（字节）
+    """
+    temp_store: str
+    busy_timeout: int
+    """
+    数据库被锁定时的等待时间（毫秒）
+    """
+    query_only: bool = False
+
+    pool_size: int
+    max_overflow: int
+    pool_pre_ping: bool
+    pool_recycle: int
+    """
+    连接回收时间（秒）
+    """
+
+    def pragmas(self) -> dict[str, str]:
+        """
+        获取连接时执行的 PRAGMA
+
+        :return: PRAGMA 名到值的映射
+        :rtype: dict[str, str]
+        """
+        pragmas = dict(
+            journal_mode=self.journal_mode,
+            synchronous=self.synchronous,
+            cache_size=self.cache_size,
+            mmap_size=self.mmap_size,
+            temp_store=self.temp_store,
+            busy_timeout=self.busy_timeout,
+            query_only="ON" if self.query_only else "OFF",
+        )
+        return {k: str(v) for k, v in pragmas.items() if v is not None}
+
+    def engine_options(self, url: str | URL) -> dict[str, Any]:
+        """
+        获取 ``create_engine`` 的连接池参数
+
+        SQLite 内存数据库使用 ``StaticPool``，不设置连接池大小
+
+        :param url: 数据库地址
+        :type url: str | URL
+
+        :return: 引擎参数
+        :rtype: dict[str, Any]
+        """
+        url = make_url(url)
+        options: dict[str, Any] = dict(pool_pre_ping=self.pool_pre_ping, pool_recycle=self.pool_recycle)
+        if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+            return options
+        return options | dict(pool_size=self.pool_size, max_overflow=self.max_overflow)
+
+
+PROFILES: dict[str, DatabaseProfile] = {
+    # 每次提交都同步到磁盘，断电不丢失已提交的事务
+    "durable": DatabaseProfile(
+        journal_mode="WAL",
+        synchronous="FULL",
+        cache_size=-16000,
+        mmap_size=0,
+        temp_store="DEFAULT",
+        busy_timeout=5000,
+        pool_size=5,
+        max_overflow=10,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+    ),
+    # WAL 模式下 NORMAL 仅在断电时可能丢失最近的事务，不会损坏数据库
+    "throughput": DatabaseProfile(
+        journal_mode="WAL",
+        synchronous="NORMAL",
+        cache_size=-64000,
+        mmap_size=256 * 1024 * 1024,
+        temp_store="MEMORY",
+        busy_timeout=10000,
+        pool_size=10,
+        max_overflow=20,
+        pool_pre_ping=False,
+        pool_recycle=3600,
+    ),
+    # 只读副本，连接到同一个 WAL 数据库文件或独立的副本
+    "readonly-replica": DatabaseProfile(
+        journal_mode=None,
+        synchronous="NORMAL",
+        cache_size=-64000,
+        mmap_size=256 * 1024 * 1024,
+        temp_store="MEMORY",
+        busy_timeout=10000,
+        query_only=True,
+        pool_size=10,
+        max_overflow=20,
+        pool_pre_ping=False,
+        pool_recycle=3600,
+    ),
+}
+
+
+def get_profile(name: str) -> DatabaseProfile:
+    """
+    获取数据库性能配置
+
+    :param name: 配置名
+    :type name: str
+
+    :return: 数据库性能配置
+    :rtype: DatabaseProfile
+
+    :raise ValueError: 配置不存在
+    """
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"unknown database profile {name!r}, expected one of {list(PROFILES)}") from None
+
+
+def apply_pragmas(engine: Engine, profile: DatabaseProfile) -> None:
+    """
+    在每个新连接上执行 PRAGMA，非 SQLite 引擎不做处理
+
+    :param engine: 引擎，异步引擎应传入 ``AsyncEngine.sync_engine``
+    :type engine: Engine
+    :param profile: 数据库性能配置
+    :type profile: DatabaseProfile
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    pragmas = profile.pragmas()
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection: Any, _connection_record: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def bind_profile(app: Flask, bind_key: Optional[str]) -> DatabaseProfile:
+    """
+    获取绑定使用的数据库性能配置
+
+    :param app: 应用
+    :type app: Flask
+    :param bind_key: 绑定名，None 为默认绑定
+    :type bind_key: Optional[str]
+
+    :return: 数据库性能配置
+    :rtype: DatabaseProfile
+    """
+    name = app.config["DATABASE_BIND_PROFILES"].get(bind_key, app.config["DATABASE_PROFILE"])
+    return get_profile(name)
+
+
+def configure_engine_options(app: Flask) -> None:
+    """
+    根据数据库性能配置设置引擎参数，需在 ``db.init_app`` 之前调用
+
+    已显式配置的参数不会被覆盖
+
+    :param app: 应用
+    :type app: Flask
+    """
+    profile = bind_profile(app, None)
+    options = profile.engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options | app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {})
+
+    binds: dict[str, Any] = {}
+    for key, bind in app.config.get("SQLALCHEMY_BINDS", {}).items():
+        if not isinstance(bind, dict):
+            bind = dict(url=bind)
+        binds[key] = bind_profile(app, key).engine_options(bind["url"]) | bind
+    app.config["SQLALCHEMY_BINDS"] = binds
+
+
+def apply_profiles(app: Flask) -> None:
+    """
+    为所有引擎注册 PRAGMA，需在 ``db.init_app`` 之后调用
+
+    :param app: 应用
+    :type app: Flask
+    """
+    with app.app_context():
+        for key, engine in db.engines.items():
+            apply_pragmas(engine, bind_profile(app, key))
+
+
+def effective_settings(engine: Engine) -> dict[str, Any]:
+    """
+    获取引擎实际生效的设置
+
+    :param engine: 引擎
+    :type engine: Engine
+
+    :return: 设置名到值的映射
+    :rtype: dict[str, Any]
+    """
+    settings: dict[str, Any] = dict(pool=type(engine.pool).__name__)
+    if isinstance(engine.pool, QueuePool):
+        settings["pool_size"] = engine.pool.size()
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as connection:
+            for name in PRAGMA_NAMES:
+                settings[name] = connection.execute(text(f"PRAGMA {name}")).scalar()
+    return settings
+
+
+def report_settings(app: Flask) -> None:
+    """
+    输出各引擎实际生效的设置
+
+    :param app: 应用
+    :type app: Flask
+    """
+    with app.app_context():
+        for key, engine in db.engines.items():
+            settings = effective_settings(engine)
+            name = "default" if key is None else key
+            profile_name = app.config["DATABASE_BIND_PROFILES"].get(key, app.config["DATABASE_PROFILE"])
+            print(f"数据库 {name} ({engine.url.render_as_string()}) 使用配置 {profile_name}：")
+            print("    " + " ".join(f"{k}={v}" for k, v in settings.items()))
+
+
+__all__ = (
+    "PRAGMA_NAMES",
+    "DatabaseProfile",
+    "PROFILES",
+    "get_profile",
+    "apply_pragmas",
+    "bind_profile",
+    "configure_engine_options",
+    "apply_profiles",
+    "effective_settings",
+    "report_settings",
+)
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+SQL 查询分析
+
+在请求中执行的每条语句都会被统计：次数、耗时以及归一化后的语句指纹（字面量与参数替换为 ``?``）。
+同一请求中同一指纹执行的次数达到 ``QUERY_REPEAT_THRESHOLD`` 时视为 N+1 查询并记录警告；
+耗时超过 ``QUERY_SLOW_MS`` 的语句写入慢查询日志，日志只包含参数的类型，不包含参数值
+
+请求之外（如命令行）执行的语句不做统计。语句的计时来自 :py:mod:`app.database.timing`
+"""
+
+import functools
+import json
+import logging
+import re
+from collections.abc import Mapping
+from collections.abc import Sequence
+from contextvars import ContextVar
+from contextvars import Token
+from dataclasses import dataclass
+from dataclasses import field
+from datetime import datetime
+from typing import Any
+from typing import Optional
+
+from flask import Flask
+from flask import Response
+from flask import current_app
+from flask import g
+from flask import request
+
+from .timing import ExecutedStatement
+from .timing import on_statement
+
+PROFILER_EXTENSION = "query_profiler"
+COUNT_HEADER = "X-Query-Count"
+REPEATED_HEADER = "X-Query-Repeated"
+TIMING_HEADER = "Server-Timing"
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger(f"{__name__}.slow")
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|:\w+|\$\d+|\?")
+PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+WHITESPACE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=2048)
+def fingerprint(statement: str) -> str:
+    """
+    归一化语句，相同结构的语句得到相同的指纹
+
+    字符串与数字字面量、各种风格的绑定参数均替换为 ``?``，``IN`` 列表合并为 ``(?, ...)``
+
+    :param statement: SQL 语句
+    :type statement: str
+
+    :return: 语句指纹
+    :rtype: str
+    """
+    statement = STRING_LITERAL.sub("?", statement)
+    statement = NUMBER_LITERAL.sub("?", statement)
+    statement = PLACEHOLDER.sub("?", statement)
+    statement = PLACEHOLDER_LIST.sub("(?, ...)", statement)
+    return WHITESPACE.sub(" ", statement).strip()
+
+
+def value_shape(value: Any) -> str:
+    return "None" if value is None else type(value).__name__
+
+
+def parameter_shape(parameters: Any, executemany: bool = False) -> str:
+    """
+    获取绑定参数的形状，只包含参数的类型
+
+    :param parameters: 传给 DBAPI 的参数
+    :type parameters: Any
+    :param executemany: 是否为批量执行，此时 ``parameters`` 为参数列表
+    :type executemany: bool
+
+    :return: 如 ``(int, str)``、``{name: str}``、``100 × (int, str)``
+    :rtype: str
+    """
+    if executemany:
+        rows = list(parameters or ())
+        return f"{len(rows)} × {parameter_shape(rows[0]) if rows else '()'}"
+    if isinstance(parameters, Mapping):
+        return "{" + ", ".join(f"{k}: {value_shape(v)}" for k, v in parameters.items()) + "}"
+    if isinstance(parameters, Sequence) and not isinstance(parameters, str):
+        return "(" + ", ".join(value_shape(v) for v in parameters) + ")"
+    return value_shape(parameters)
+
+
+@dataclass
+class StatementStats:
+    """
+    同一指纹的语句统计
+    """
+    statement: str
+    """
+    语句指纹
+    """
+    count: int = 0
+    time: float = 0
+    """
+    总耗时（秒）
+    """
+
+
+@dataclass
+class QueryProfile:
+    """
+    一个请求的查询统计
+    """
+    method: str = ""
+    endpoint: Optional[str] = None
+    count: int = 0
+    time: float = 0
+    """
+    总耗时（秒）
+    """
+    statements: dict[str, StatementStats] = field(default_factory=dict)
+
+    def record(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.time += duration
+        stats = self.statements.get(statement)
+        if stats is None:
+            stats = self.statements[statement] = StatementStats(statement)
+        stats.count += 1
+        stats.time += duration
+
+    def repeated(self, threshold: int) -> list[StatementStats]:
+        """
+        获取重复执行的语句，即可能的 N+1 查询
+
+        :param threshold: 执行次数达到该值视为重复
+        :type threshold: int
+
+        :return: 按执行次数降序排列的语句统计
+        :rtype: list[StatementStats]
+        """
+        repeated = [stats for stats in self.statements.values() if stats.count >= threshold]
+        return sorted(repeated, key=lambda stats: stats.count, reverse=True)
+
+
+@dataclass(frozen=True)
+class ProfilerSettings:
+    repeat_threshold: int
+    slow_seconds: float
+    headers: bool
+
+
+_current_profile: ContextVar[Optional[tuple[QueryProfile, ProfilerSettings]]] = ContextVar(
+    "query_profile", default=None,
+)
+"""
+当前请求的查询统计
+
+使用上下文变量而不是 ``g``，语句在 ASGI 应用的异步引擎中执行时同样可以取得：
+SQLAlchemy 在复制了当前上下文的 greenlet 中执行语句，:py:func:`asyncio.to_thread` 同样复制上下文
+"""
+
+
+def start_profile() -> None:
+    """
+    开始统计当前请求的查询，对应 :py:func:`finish_profile`，未启用查询分析时不做任何事
+
+    Flask 应用在请求开始的钩子中调用，ASGI 应用在处理请求前调用
+    """
+    settings: Optional[ProfilerSettings] = current_app.extensions.get(PROFILER_EXTENSION)
+    if settings is None:
+        return
+    profile = QueryProfile(method=request.method, endpoint=request.endpoint)
+    g._query_profile_token = _current_profile.set((profile, settings))
+
+
+def finish_profile() -> None:
+    token: Optional[Token[Optional[tuple[QueryProfile, ProfilerSettings]]]] = g.pop("_query_profile_token", None)
+    if token is not None:
+        _current_profile.reset(token)
+
+
+def current_profile() -> Optional[QueryProfile]:
+    """
+    获取当前请求的查询统计，不在请求中时返回 None
+    """
+    current = _current_profile.get()
+    return None if current is None else current[0]
+
+
+def record_statement(executed: ExecutedStatement) -> None:
+    if (current := _current_profile.get()) is None:
+        return
+    profile, settings = current
+    statement_fingerprint = fingerprint(executed.statement)
+    profile.record(statement_fingerprint, executed.duration)
+
+    if executed.duration >= settings.slow_seconds:
+        slow_query_logger.warning(json.dumps(dict(
+            time=datetime.now().astimezone().isoformat(timespec="milliseconds"),
+            duration_ms=round(executed.duration * 1000, 3),
+            method=profile.method,
+            endpoint=profile.endpoint,
+            statement=statement_fingerprint,
+            parameters=parameter_shape(executed.parameters, executed.executemany),
+        ), ensure_ascii=False))
+
+
+def configure_slow_query_log(path: str) -> None:
+    """
+    将慢查询日志写入文件，重复调用时不会重复添加处理器
+
+    :param path: 日志文件路径，为空时使用默认处理（输出到标准错误）
+    :type path: str
+    """
+    if not path or any(getattr(h, "baseFilename", None) == path for h in slow_query_logger.handlers):
+        return
+    handler = logging.FileHandler(path, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    slow_query_logger.addHandler(handler)
+    slow_query_logger.propagate = False
+
+
+def initialize_query_profiler(app: Flask) -> None:
+    """
+    注册查询分析所需的事件与钩子
+
+    :param app: 应用
+    :type app: Flask
+    """
+    if not app.config["QUERY_PROFILE_ENABLED"]:
+        return
+    settings = ProfilerSettings(
+        repeat_threshold=app.config["QUERY_REPEAT_THRESHOLD"],
+        slow_seconds=app.config["QUERY_SLOW_MS"] / 1000,
+        headers=app.config["QUERY_PROFILE_HEADERS"],
+    )
+    app.extensions[PROFILER_EXTENSION] = settings
+    configure_slow_query_log(app.config["QUERY_SLOW_LOG"])
+
+    on_statement(record_statement)
+
+    @app.before_request
+    def start() -> None:
+        start_profile()
+
+    @app.after_request
+    def report_queries[R: Response](response: R) -> R:
+        profile = current_profile()
+        if profile is None:
+            return response
+        repeated = profile.repeated(settings.repeat_threshold)
+        for stats in repeated:
+            logger.warning(
+                "可能的 N+1 查询：%s %s 中以下语句执行了 %d 次，共 %.1f ms：%s",
+                request.method, request.endpoint, stats.count, stats.time * 1000, stats.statement,
+            )
+        if settings.headers:
+            response.headers[COUNT_HEADER] = str(profile.count)
+            response.headers[REPEATED_HEADER] = str(len(repeated))
+            response.headers[TIMING_HEADER] = f'db;dur={profile.time * 1000:.2f};desc="{profile.count} queries"'
+        return response
+
+    @app.teardown_request
+    def finish(_exc: Optional[BaseException]) -> None:
+        finish_profile()
+
+
+__all__ = (
+    "fingerprint",
+    "parameter_shape",
+    "StatementStats",
+    "QueryProfile",
+    "start_profile",
+    "finish_profile",
+    "current_profile",
+    "initialize_query_profiler",
+)
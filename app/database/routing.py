@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+读写分离
+
+路由通过 :py:func:`read_only` 声明为只读后，该请求中的所有查询（包括令牌中用户的加载）
+轮流使用只读副本；请求中一旦发生写入（flush 或 INSERT/UPDATE/DELETE 语句），
+或调用了 :py:func:`pin_primary`，该请求余下的查询全部使用主库
+
+副本可以是连接到同一 WAL 数据库文件的只读连接 (``DATABASE_READ_REPLICAS``)，
+也可以是独立的副本 (``DATABASE_REPLICA_URIS``)
+"""
+
+import itertools
+import threading
+from collections.abc import Callable
+from dataclasses import asdict
+from dataclasses import dataclass
+from typing import Any
+from typing import Optional
+from weakref import WeakKeyDictionary
+
+from flask import Flask
+from flask import Response
+from flask import current_app
+from flask import g
+from flask import has_request_context
+from flask import request
+from sqlalchemy import Engine
+from sqlalchemy import event
+
+from .timing import ExecutedStatement
+from .timing import on_statement
+from ..extensions import db
+from ..session import REPLICA_SELECTOR_EXTENSION
+from ..session import RoutingSession
+
+READ = "read"
+WRITE = "write"
+ROUTE_ATTR = "__db_route__"
+REPLICA_PREFIX = "replica_"
+PIN_COOKIE = "db_pin"
+ROUTER_EXTENSION = "replica_router"
+
+
+def read_only[F: Callable[..., Any]](func: F) -> F:
+    """
+    声明路由为只读，查询使用只读副本
+
+    与其余装饰器一同使用，位置不限::
+
+        @bp.route("/tables", methods=["GET"])
+        @jwt_required()
+        @api
+        @permissions_required([PERMISSIONS.TABLE.GET])
+        @read_only
+        def get_tables() -> GetTables:
+            ...
+    """
+    setattr(func, ROUTE_ATTR, READ)
+    return func
+
+
+def read_write[F: Callable[..., Any]](func: F) -> F:
+    """
+    声明路由为读写，查询使用主库（未声明的路由默认为读写）
+    """
+    setattr(func, ROUTE_ATTR, WRITE)
+    return func
+
+
+def pin_primary() -> None:
+    """
+    当前请求余下的查询全部使用主库
+    """
+    g._db_pinned = True
+
+
+@dataclass
+class BindMetrics:
+    """
+    绑定统计
+    """
+    requests: int = 0
+    """
+    路由到该绑定的请求数
+    """
+    queries: int = 0
+    query_time: float = 0
+    """
+    查询总耗时（秒）
+    """
+
+
+class ReplicaRouter:
+    """
+    副本路由，按请求轮询选择副本
+    """
+
+    def __init__(self, replicas: list[str]) -> None:
+        self.replicas = replicas
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._metrics: dict[str, BindMetrics] = {}
+
+    def select(self, writing: bool) -> Optional[str]:
+        """
+        选择查询使用的副本
+
+        :param writing: 是否为写入
+        :type writing: bool
+
+        :return: 副本的绑定名，None 表示使用主库
+        :rtype: Optional[str]
+        """
+        if not self.replicas or not has_request_context():
+            return None
+        if writing:
+            pin_primary()
+        if g.get("_db_pinned") or g.get("_db_route") != READ:
+            return None
+
+        replica_key: Optional[str] = g.get("_db_replica")
+        if replica_key is None:
+            replica_key = self.replicas[next(self._counter) % len(self.replicas)]
+            g._db_replica = replica_key
+            self.record(replica_key, requests=1)
+        return replica_key
+
+    def record(self, bind_key: str, *, requests: int = 0, queries: int = 0, query_time: float = 0) -> None:
+        with self._lock:
+            metrics = self._metrics.setdefault(bind_key, BindMetrics())
+            metrics.requests += requests
+            metrics.queries += queries
+            metrics.query_time += query_time
+
+    def metrics(self) -> dict[str, dict[str, Any]]:
+        """
+        获取各绑定的统计
+
+        :return: 绑定名到统计的映射，默认绑定名为 ``default``
+        :rtype: dict[str, dict[str, Any]]
+        """
+        with self._lock:
+            return {k: asdict(v) for k, v in self._metrics.items()}
+
+
+def get_router() -> ReplicaRouter:
+    """
+    获取当前应用的副本路由
+    """
+    router: ReplicaRouter = current_app.extensions[ROUTER_EXTENSION]
+    return router
+
+
+def configure_replicas(app: Flask) -> None:
+    """
+    根据配置添加副本绑定，需在 ``db.init_app`` 之前调用
+
+    :param app: 应用
+    :type app: Flask
+    """
+    uris = [app.config["SQLALCHEMY_DATABASE_URI"]] * app.config["DATABASE_READ_REPLICAS"]
+    uris += app.config["DATABASE_REPLICA_URIS"]
+
+    binds = dict(app.config.get("SQLALCHEMY_BINDS", {}))
+    bind_profiles = dict(app.config["DATABASE_BIND_PROFILES"])
+    for i, uri in enumerate(uris):
+        key = f"{REPLICA_PREFIX}{i}"
+        binds[key] = uri
+        bind_profiles.setdefault(key, "readonly-replica")
+    app.config["SQLALCHEMY_BINDS"] = binds
+    app.config["DATABASE_BIND_PROFILES"] = bind_profiles
+
+
+_engine_binds: WeakKeyDictionary[Engine, tuple[ReplicaRouter, str]] = WeakKeyDictionary()
+"""
+各应用的引擎对应的副本路由与绑定名
+"""
+
+
+def record_query_metrics(executed: ExecutedStatement) -> None:
+    if (bind := _engine_binds.get(executed.engine)) is not None:
+        router, bind_key = bind
+        router.record(bind_key, queries=1, query_time=executed.duration)
+
+
+def initialize_routing(app: Flask) -> None:
+    """
+    注册读写分离所需的钩子，需在 ``db.init_app`` 之后调用
+
+    :param app: 应用
+    :type app: Flask
+    """
+    replicas = [key for key in app.config["SQLALCHEMY_BINDS"] if key.startswith(REPLICA_PREFIX)]
+    router = ReplicaRouter(replicas)
+    app.extensions[ROUTER_EXTENSION] = router
+    with app.app_context():
+        for key, engine in db.engines.items():
+            _engine_binds[engine] = (router, "default" if key is None else key)
+    on_statement(record_query_metrics)
+    if not replicas:
+        return
+    app.extensions[REPLICA_SELECTOR_EXTENSION] = router.select
+
+    pin_seconds = app.config["DATABASE_READ_YOUR_WRITES_SECONDS"]
+
+    @app.before_request
+    def route_request() -> None:
+        view = app.view_functions.get(request.endpoint or "")
+        g._db_route = getattr(view, ROUTE_ATTR, WRITE)
+        if pin_seconds and request.cookies.get(PIN_COOKIE):
+            pin_primary()
+
+    @app.after_request
+    def pin_after_write[R: Response](response: R) -> R:
+        # 写入后的一段时间内该客户端的请求均使用主库，以便读到自己的写入
+        if pin_seconds and g.get("_db_route") == WRITE and g.get("_db_pinned"):
+            response.set_cookie(PIN_COOKIE, "1", max_age=pin_seconds, httponly=True, secure=True, samesite="None")
+        return response
+
+
+@event.listens_for(RoutingSession, "before_flush")
+def pin_on_flush(*_: Any) -> None:
+    if has_request_context():
+        pin_primary()
+
+
+__all__ = (
+    "READ",
+    "WRITE",
+    "read_only",
+    "read_write",
+    "pin_primary",
+    "BindMetrics",
+    "ReplicaRouter",
+    "get_router",
+    "configure_replicas",
+    "initialize_routing",
+)
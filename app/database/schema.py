@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+数据库结构指纹
+
+由模型声明（``BaseModel`` 字段注册表）、关联表及索引定义计算指纹，保存在 ``app_meta`` 表中。
+启动和初始化时只需一次查询比较指纹，一致时跳过反射；
+不一致时反射数据库并给出与模型的差异，可选择自动应用其中只新增不修改的部分
+"""
+
+import hashlib
+import json
+from dataclasses import asdict
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Optional
+from typing import cast
+
+from flask import Flask
+from sqlalchemy import Connection
+from sqlalchemy import Engine
+from sqlalchemy import Index
+from sqlalchemy import MetaData
+from sqlalchemy import Table
+from sqlalchemy import UniqueConstraint
+from sqlalchemy import inspect
+from sqlalchemy.engine.interfaces import ReflectedUniqueConstraint
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateColumn
+
+from .meta import read_meta
+from .meta import write_meta
+from ..extensions import db
+from ..model_utils import BaseModel
+from ..model_utils.utils import ColumnInfo
+from ..models.system import app_meta
+
+SCHEMA_FINGERPRINT_KEY = "schema:fingerprint"
+
+
+def describe_table(table: Table) -> dict[str, Any]:
+    """
+    生成表结构的描述，用于计算指纹
+
+    ``BaseModel`` 的表使用字段注册表中的信息，其余表（关联表等）使用表定义
+
+    :param table: 表
+    :type table: Table
+
+    :return: 表结构描述
+    :rtype: dict[str, Any]
+    """
+    # BaseModel 本身没有 __tablename__，返回全部表的字段注册表
+    registry = cast(dict[str, dict[str, ColumnInfo]], BaseModel.get_columns_info())
+    if table.name in registry:
+        columns = {name: asdict(info) for name, info in registry[table.name].items()}
+    else:
+        columns = {
+            column.name: dict(
+                type=str(column.type),
+                primary_key=column.primary_key,
+                nullable=bool(column.nullable),
+                foreign_key=[fk.target_fullname for fk in column.foreign_keys],
+            )
+            for column in table.columns
+        }
+    return dict(
+        columns=columns,
+        indexes=sorted(
+            (index.name or "", [column.name for column in index.columns], bool(index.unique))
+            for index in table.indexes
+        ),
+        unique_constraints=sorted(
+            (constraint.name or "", [column.name for column in constraint.columns])
+            for constraint in table.constraints if isinstance(constraint, UniqueConstraint)
+        ),
+    )
+
+
+def schema_fingerprint(metadata: MetaData) -> str:
+    """
+    计算模型声明的数据库结构指纹
+
+    :param metadata: 元数据
+    :type metadata: MetaData
+
+    :return: SHA-256 十六进制摘要
+    :rtype: str
+    """
+    description = {table.name: describe_table(table) for table in metadata.sorted_tables}
+    content = json.dumps(description, default=str, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def stored_fingerprint(engine: Engine) -> Optional[str]:
+    """
+    读取数据库中保存的结构指纹
+
+    :param engine: 引擎
+    :type engine: Engine
+
+    :return: 指纹，数据库未初始化或未保存指纹时返回 None
+    :rtype: Optional[str]
+    """
+    try:
+        with engine.connect() as connection:
+            return read_meta(connection, SCHEMA_FINGERPRINT_KEY)
+    except DBAPIError:
+        # app_meta 表不存在
+        return None
+
+
+@dataclass
+class SchemaDiff:
+    """
+    数据库与模型声明的差异
+    """
+    missing_tables: list[str] = field(default_factory=list)
+    extra_tables: list[str] = field(default_factory=list)
+    missing_columns: dict[str, list[str]] = field(default_factory=dict)
+    extra_columns: dict[str, list[str]] = field(default_factory=dict)
+    changed_columns: dict[str, dict[str, str]] = field(default_factory=dict)
+    """
+    表名到列名到变化描述的映射
+    """
+    missing_indexes: dict[str, list[str]] = field(default_factory=dict)
+    extra_indexes: dict[str, list[str]] = field(default_factory=dict)
+    missing_unique_constraints: dict[str, list[str]] = field(default_factory=dict)
+    """
+    表名到唯一约束的映射，唯一约束按列比较，以 ``名称(列, ...)`` 表示
+    """
+    extra_unique_constraints: dict[str, list[str]] = field(default_factory=dict)
+
+    @property
+    def empty(self) -> bool:
+        return not any(asdict(self).values())
+
+    @property
+    def compatible(self) -> bool:
+        """
+        数据库是否满足模型的需要，多余的表、列、索引和唯一约束不影响使用
+        """
+        return not (
+            self.missing_tables or self.missing_columns or self.changed_columns or self.missing_indexes
+            or self.missing_unique_constraints
+        )
+
+    def lines(self) -> list[str]:
+        """
+        生成便于阅读的差异描述
+
+        :return: 每行一条差异
+        :rtype: list[str]
+        """
+        lines = [f"+ 表 {name}" for name in self.missing_tables]
+        lines += [f"- 表 {name}" for name in self.extra_tables]
+        for sign, kind, items in (
+                ("+", "列", self.missing_columns),
+                ("-", "列", self.extra_columns),
+                ("+", "索引", self.missing_indexes),
+                ("-", "索引", self.extra_indexes),
+                ("+", "唯一约束", self.missing_unique_constraints),
+                ("-", "唯一约束", self.extra_unique_constraints),
+        ):
+            lines += [f"{sign} {kind} {table}.{name}" for table, names in items.items() for name in names]
+        lines += [
+            f"~ 列 {table}.{name}：{change}"
+            for table, changes in self.changed_columns.items() for name, change in changes.items()
+        ]
+        return lines
+
+
+def unique_constraints(table: Table, reflected: list[ReflectedUniqueConstraint]) -> tuple[list[str], list[str]]:
+    """
+    按列比较声明与反射的唯一约束，未命名的约束（如列上的 ``unique=True``）在不同数据库中名称不同
+
+    :return: 缺少与多余的唯一约束
+    :rtype: tuple[list[str], list[str]]
+    """
+    declared = {
+        tuple(column.name for column in constraint.columns): name if isinstance(name := constraint.name, str) else None
+        for constraint in table.constraints if isinstance(constraint, UniqueConstraint)
+    }
+    existing = {tuple(constraint["column_names"]): constraint["name"] for constraint in reflected}
+
+    def label(columns: tuple[str, ...], name: Optional[str]) -> str:
+        return f"{name or ''}({', '.join(columns)})"
+
+    return (
+        sorted(label(columns, name) for columns, name in declared.items() if columns not in existing),
+        sorted(label(columns, name) for columns, name in existing.items() if columns not in declared),
+    )
+
+
+def compare_schema(connection: Connection, metadata: MetaData) -> SchemaDiff:
+    """
+    反射数据库并与模型声明比较
+
+    列类型按类型类别与长度比较，以忽略不同数据库对同一类型的不同命名；唯一约束按列比较
+
+    :param connection: 数据库连接
+    :type connection: Connection
+    :param metadata: 元数据
+    :type metadata: MetaData
+
+    :return: 差异
+    :rtype: SchemaDiff
+    """
+    inspector = inspect(connection)
+    existing = set(inspector.get_table_names())
+    diff = SchemaDiff(
+        missing_tables=[table.name for table in metadata.sorted_tables if table.name not in existing],
+        extra_tables=sorted(existing - set(metadata.tables)),
+    )
+
+    for table in metadata.sorted_tables:
+        if table.name not in existing:
+            continue
+        reflected = {column["name"]: column for column in inspector.get_columns(table.name)}
+        missing = [column.name for column in table.columns if column.name not in reflected]
+        extra = [name for name in reflected if name not in table.columns]
+        changed: dict[str, str] = {}
+        for column in table.columns:
+            if column.name not in reflected:
+                continue
+            reflected_column = reflected[column.name]
+            reflected_type = reflected_column["type"]
+            if (
+                    reflected_type._type_affinity is not column.type._type_affinity
+                    or getattr(reflected_type, "length", None) != getattr(column.type, "length", None)
+            ):
+                changed[column.name] = f"类型 {reflected_type} -> {column.type}"
+            elif not column.primary_key and bool(reflected_column["nullable"]) != bool(column.nullable):
+                changed[column.name] = f"可空 {reflected_column['nullable']} -> {column.nullable}"
+
+        indexes = {name for index in inspector.get_indexes(table.name) if (name := index["name"]) is not None}
+        declared_indexes = {str(name) for index in table.indexes if (name := index.name)}
+        missing_unique, extra_unique = unique_constraints(table, inspector.get_unique_constraints(table.name))
+
+        for target, items in (
+                (diff.missing_columns, missing),
+                (diff.extra_columns, extra),
+                (diff.missing_indexes, sorted(declared_indexes - indexes)),
+                (diff.extra_indexes, sorted(indexes - declared_indexes)),
+                (diff.missing_unique_constraints, missing_unique),
+                (diff.extra_unique_constraints, extra_unique),
+        ):
+            if items:
+                target[table.name] = items
+        if changed:
+            diff.changed_columns[table.name] = changed
+    return diff
+
+
+def apply_additive(connection: Connection, metadata: MetaData, diff: SchemaDiff) -> list[str]:
+    """
+    应用差异中只新增不修改的部分：创建缺少的表、列与索引
+
+    新增的列必须可空或带有服务器端默认值，否则无法添加到已有数据的表中
+
+    :param connection: 数据库连接
+    :type connection: Connection
+    :param metadata: 元数据
+    :type metadata: MetaData
+    :param diff: 差异
+    :type diff: SchemaDiff
+
+    :return: 已执行的操作
+    :rtype: list[str]
+    """
+    applied: list[str] = []
+    tables = [metadata.tables[name] for name in diff.missing_tables]
+    metadata.create_all(connection, tables=tables, checkfirst=False)
+    applied += [f"创建表 {table.name}" for table in tables]
+
+    preparer = connection.dialect.identifier_preparer
+    for table_name, column_names in diff.missing_columns.items():
+        table = metadata.tables[table_name]
+        for name in column_names:
+            column = table.columns[name]
+            if not column.nullable and column.server_default is None:
+                continue
+            ddl = CreateColumn(column).compile(dialect=connection.dialect)
+            connection.exec_driver_sql(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}")
+            applied.append(f"添加列 {table_name}.{name}")
+
+    for table_name, index_names in diff.missing_indexes.items():
+        indexes: dict[Optional[str], Index] = {index.name: index for index in metadata.tables[table_name].indexes}
+        for name in index_names:
+            indexes[name].create(connection)
+            applied.append(f"创建索引 {name}")
+    return applied
+
+
+@dataclass
+class SchemaSync:
+    """
+    结构同步结果
+    """
+    diff: SchemaDiff
+    """
+    同步前的差异
+    """
+    applied: list[str]
+    remaining: SchemaDiff
+    """
+    同步后仍存在的差异
+    """
+
+
+def synchronize_schema(engine: Engine, metadata: MetaData, *, apply: bool) -> Optional[SchemaSync]:
+    """
+    比较结构指纹，不一致时反射数据库并比较差异
+
+    同步后数据库满足模型需要时保存新的指纹，此后启动不再反射
+
+    :param engine: 引擎
+    :type engine: Engine
+    :param metadata: 元数据
+    :type metadata: MetaData
+    :param apply: 是否自动应用只新增不修改的差异
+    :type apply: bool
+
+    :return: 指纹一致时返回 None，否则返回同步结果
+    :rtype: Optional[SchemaSync]
+    """
+    fingerprint = schema_fingerprint(metadata)
+    if stored_fingerprint(engine) == fingerprint:
+        return None
+
+    with engine.begin() as connection:
+        diff = remaining = compare_schema(connection, metadata)
+        applied: list[str] = []
+        if apply and not diff.compatible:
+            applied = apply_additive(connection, metadata, diff)
+            remaining = compare_schema(connection, metadata)
+        if remaining.compatible:
+            write_meta(connection, SCHEMA_FINGERPRINT_KEY, fingerprint)
+    return SchemaSync(diff=diff, applied=applied, remaining=remaining)
+
+
+def print_sync(sync: SchemaSync) -> None:
+    """
+    输出结构同步结果
+
+    :param sync: 同步结果
+    :type sync: SchemaSync
+    """
+    if not sync.diff.empty:
+        print("数据库结构与模型声明不一致：")
+        for line in sync.diff.lines():
+            print(f"    {line}")
+    for action in sync.applied:
+        print(f"已{action}")
+    if not sync.remaining.compatible:
+        print("以下差异无法自动应用，请手动迁移数据库：" if sync.applied else "数据库缺少模型所需的结构：")
+        for line in sync.remaining.lines():
+            # 多余的结构不影响使用
+            if not line.startswith("-"):
+                print(f"    {line}")
+
+
+def verify_schema(app: Flask) -> bool:
+    """
+    启动服务前检查数据库结构，指纹一致时只执行一次查询
+
+    :param app: 应用
+    :type app: Flask
+
+    :return: 数据库是否满足模型需要
+    :rtype: bool
+    """
+    if not app.config["DATABASE_SCHEMA_CHECK"]:
+        return True
+    with app.app_context():
+        apply = app.config["DATABASE_SCHEMA_AUTO_APPLY"]
+        sync = synchronize_schema(db.engine, db.metadata, apply=apply)
+    if sync is None:
+        return True
+    if app_meta.name in sync.diff.missing_tables and not apply:
+        print("数据库尚未初始化，请执行 flask init")
+        return False
+
+    print_sync(sync)
+    if not sync.remaining.compatible and not apply:
+        print("可执行 flask init 或设置 DATABASE_SCHEMA_AUTO_APPLY=true 添加缺少的表、列与索引")
+    return sync.remaining.compatible
+
+
+__all__ = (
+    "SCHEMA_FINGERPRINT_KEY",
+    "describe_table",
+    "schema_fingerprint",
+    "stored_fingerprint",
+    "SchemaDiff",
+    "compare_schema",
+    "apply_additive",
+    "SchemaSync",
+    "synchronize_schema",
+    "print_sync",
+    "verify_schema",
+)
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+种子数据
+
+每个种子数据集按表分组声明需要存在的行，初始化时：
+
+* 所有数据集在同一个事务中写入，每张表只执行一条批量插入语句
+* 插入时忽略已存在的行 (``ON CONFLICT DO NOTHING``)，重复执行不会因唯一约束失败，
+  也不会覆盖已被修改的数据（如已修改的密码）
+* 数据集内容的摘要保存在 ``app_meta`` 表中，内容未变化的数据集直接跳过
+"""
+
+import hashlib
+import json
+from collections.abc import Iterable
+from collections.abc import Mapping
+from collections.abc import Sequence
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+
+from sqlalchemy import Connection
+from sqlalchemy import Insert
+from sqlalchemy import Table
+from sqlalchemy import select
+from sqlalchemy.dialects import mysql
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects import sqlite
+from werkzeug.security import generate_password_hash
+
+from .meta import read_meta_prefix
+from .meta import write_meta
+from ..extensions import db
+
+SEED_DIGEST_PREFIX = "seed:"
+"""
+数据集摘要在 ``app_meta`` 中的键名前缀
+"""
+
+
+@dataclass(frozen=True)
+class Ref:
+    """
+    引用其他表中某一行的主键，写入时按唯一列查找
+    """
+    table: str
+    column: str
+    value: Any
+
+
+@dataclass(frozen=True)
+class PasswordHash:
+    """
+    写入时计算的密码哈希，摘要只记录明文，避免随机盐使摘要每次都不同
+    """
+    password: str
+
+
+@dataclass
+class SeedSet:
+    """
+    种子数据集
+    """
+    name: str
+    rows: dict[str, list[dict[str, Any]]] = field(default_factory=dict)
+    """
+    表名到行的映射，按声明顺序写入，被引用的表需在前
+    """
+
+    def add(self, table: str, *rows: dict[str, Any]) -> None:
+        self.rows.setdefault(table, []).extend(rows)
+
+    def digest(self) -> str:
+        """
+        计算数据集内容的摘要
+
+        :return: SHA-256 十六进制摘要
+        :rtype: str
+        """
+
+        def encode(value: Any) -> Any:
+            if isinstance(value, (Ref, PasswordHash)):
+                return {type(value).__name__: value.__dict__}
+            raise TypeError(f"unsupported seed value {value!r}")
+
+        content = json.dumps(self.rows, default=encode, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class SeedReport:
+    """
+    种子数据写入结果
+    """
+    name: str
+    skipped: bool
+    inserted: dict[str, int] = field(default_factory=dict)
+    """
+    表名到新插入行数的映射
+    """
+
+
+def insert_ignore(connection: Connection, table: Table) -> Insert:
+    """
+    构造忽略唯一约束冲突的插入语句
+
+    :param connection: 数据库连接
+    :type connection: Connection
+    :param table: 表
+    :type table: Table
+
+    :return: 插入语句
+    :rtype: Insert
+
+    :raise NotImplementedError: 数据库不支持
+    """
+    match connection.dialect.name:
+        case "sqlite":
+            return sqlite.insert(table).on_conflict_do_nothing()
+        case "postgresql":
+            return postgresql.insert(table).on_conflict_do_nothing()
+        case "mysql" | "mariadb":
+            return mysql.insert(table).prefix_with("IGNORE")
+    raise NotImplementedError(f"insert ignore is not supported on {connection.dialect.name}")
+
+
+def resolve_refs(connection: Connection, rows: Iterable[Mapping[str, Any]]) -> dict[Ref, Any]:
+    """
+    查找行中引用的主键，每个被引用的列只查询一次
+
+    :param connection: 数据库连接
+    :type connection: Connection
+    :param rows: 行
+    :type rows: Iterable[Mapping[str, Any]]
+
+    :return: 引用到主键的映射
+    :rtype: dict[Ref, Any]
+
+    :raise LookupError: 被引用的行不存在
+    """
+    wanted: dict[tuple[str, str], set[Any]] = {}
+    for row in rows:
+        for value in row.values():
+            if isinstance(value, Ref):
+                wanted.setdefault((value.table, value.column), set()).add(value.value)
+
+    resolved: dict[Ref, Any] = {}
+    for (table_name, column_name), values in wanted.items():
+        table = db.metadata.tables[table_name]
+        column = table.c[column_name]
+        primary_key, = table.primary_key.columns
+        found = dict(connection.execute(select(column, primary_key).where(column.in_(values))).tuples().all())
+        missing = values - found.keys()
+        if missing:
+            raise LookupError(f"{table_name}.{column_name} not found: {sorted(missing)}")
+        resolved.update({Ref(table_name, column_name, value): pk for value, pk in found.items()})
+    return resolved
+
+
+def prepare_rows(connection: Connection, rows: Sequence[Mapping[str, Any]]) -> list[dict[str, Any]]:
+    """
+    将行中的引用与密码替换为实际写入的值
+
+    :param connection: 数据库连接
+    :type connection: Connection
+    :param rows: 行
+    :type rows: Sequence[Mapping[str, Any]]
+
+    :return: 可直接插入的行
+    :rtype: list[dict[str, Any]]
+    """
+    refs = resolve_refs(connection, rows)
+
+    def prepare(value: Any) -> Any:
+        if isinstance(value, Ref):
+            return refs[value]
+        if isinstance(value, PasswordHash):
+            return generate_password_hash(value.password)
+        return value
+
+    return [{k: prepare(v) for k, v in row.items()} for row in rows]
+
+
+def seed(connection: Connection, seed_sets: Iterable[SeedSet], *, force: bool = False) -> list[SeedReport]:
+    """
+    写入种子数据，调用方负责提交事务
+
+    :param connection: 数据库连接
+    :type connection: Connection
+    :param seed_sets: 数据集，按顺序写入
+    :type seed_sets: Iterable[SeedSet]
+    :param force: 忽略已保存的摘要，重新写入所有数据集
+    :type force: bool
+
+    :return: 各数据集的写入结果
+    :rtype: list[SeedReport]
+    """
+    digests = {} if force else read_meta_prefix(connection, SEED_DIGEST_PREFIX)
+    reports: list[SeedReport] = []
+    for seed_set in seed_sets:
+        digest = seed_set.digest()
+        if digests.get(seed_set.name) == digest:
+            reports.append(SeedReport(name=seed_set.name, skipped=True))
+            continue
+
+        report = SeedReport(name=seed_set.name, skipped=False)
+        for table_name, rows in seed_set.rows.items():
+            if not rows:
+                continue
+            table = db.metadata.tables[table_name]
+            result = connection.execute(insert_ignore(connection, table), prepare_rows(connection, rows))
+            report.inserted[table_name] = max(result.rowcount, 0)
+        write_meta(connection, f"{SEED_DIGEST_PREFIX}{seed_set.name}", digest)
+        reports.append(report)
+    return reports
+
+
+def print_reports(reports: Iterable[SeedReport]) -> None:
+    """
+    输出种子数据写入结果
+
+    :param reports: 写入结果
+    :type reports: Iterable[SeedReport]
+    """
+    for report in reports:
+        if report.skipped:
+            print(f"跳过{report.name}：内容未变化")
+            continue
+        inserted = "，".join(f"{table} {count} 行" for table, count in report.inserted.items())
+        print(f"写入{report.name}：新增 {inserted or '0 行'}")
+
+
+__all__ = (
+    "Ref",
+    "PasswordHash",
+    "SeedSet",
+    "SeedReport",
+    "insert_ignore",
+    "seed",
+    "print_reports",
+)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+语句计时
+
+所有引擎（包括 ASGI 应用异步引擎的同步部分）共用一对 ``before_cursor_execute`` 与 ``after_cursor_execute``
+监听器，每条语句只计时一次，执行完成后依次通知通过 :py:func:`on_statement` 订阅的函数，
+如读写分离的绑定统计、接口指标的查询计数、查询分析与请求追踪。执行失败的语句不通知
+"""
+
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+from sqlalchemy import Engine
+from sqlalchemy import event
+
+START_ATTR = "_statement_start"
+
+
+@dataclass(frozen=True)
+class ExecutedStatement:
+    """
+    执行完成的语句
+    """
+    engine: Engine
+    statement: str
+    parameters: Any
+    """
+    传给 DBAPI 的参数，批量执行时为参数列表
+    """
+    executemany: bool
+    start: float
+    """
+    :py:func:`time.perf_counter` 表示的开始时间
+    """
+    end: float
+
+    @property
+    def duration(self) -> float:
+        """
+        耗时（秒）
+        """
+        return self.end - self.start
+
+
+type StatementListener = Callable[[ExecutedStatement], None]
+
+_listeners: list[StatementListener] = []
+
+
+def before_cursor_execute(_conn: Any, _cursor: Any, _statement: str, _parameters: Any, context: Any, *_: Any) -> None:
+    if context is not None:
+        setattr(context, START_ATTR, time.perf_counter())
+
+
+def after_cursor_execute(
+        conn: Any,
+        _cursor: Any,
+        statement: str,
+        parameters: Any,
+        context: Any,
+        executemany: bool,
+) -> None:
+    start = getattr(context, START_ATTR, None)
+    if start is None:
+        return
+    executed = ExecutedStatement(
+        engine=conn.engine,
+        statement=statement,
+        parameters=parameters,
+        executemany=executemany,
+        start=start,
+        end=time.perf_counter(),
+    )
+    for listener in _listeners:
+        listener(executed)
+
+
+def on_statement(listener: StatementListener) -> None:
+    """
+    订阅语句执行完成的通知，重复订阅无效
+
+    订阅者在执行语句的线程中同步调用，应只做计数等轻量的工作
+
+    :param listener: 接收 :py:class:`ExecutedStatement` 的函数
+    :type listener: StatementListener
+    """
+    if listener not in _listeners:
+        _listeners.append(listener)
+    if not event.contains(Engine, "before_cursor_execute", before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+
+
+__all__ = (
+    "ExecutedStatement",
+    "StatementListener",
+    "on_statement",
+)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+
+import sys
+
+import click
+from flask import Flask
+
+from ..extensions import db
+from ..stamps import invalidate_all
+
+
+def initialize_commands(app: Flask) -> None:
+    @app.cli.command("generate-data")
+    @click.option("--students", "-n", type=int, default=100000, show_default=True, help="学生数")
+    @click.option("--classes", type=int, default=2000, show_default=True, help="班级数")
+    @click.option("--accounts", type=int, default=1000, show_default=True, help="账户数")
+    @click.option("--roles", type=int, default=50, show_default=True, help="角色数")
+    @click.option("--skew", type=float, default=1.0, show_default=True, help="班级、角色与枚举值分布的偏斜程度，0 为均匀分布")
+    @click.option("--batch-size", type=int, default=50000, show_default=True, help="每批写入的学生数")
+    @click.option("--cities-per-province", type=int, default=8, show_default=True, help="每个省生成的市数")
+    @click.option("--counties-per-city", type=int, default=6, show_default=True, help="每个市生成的县数")
+    @click.option("--seed", type=int, default=0, show_default=True, help="随机数种子")
+    def generate_data(
+            students: int,
+            classes: int,
+            accounts: int,
+            roles: int,
+            skew: float,
+            batch_size: int,
+            cities_per_province: int,
+            counties_per_city: int,
+            seed: int,
+    ) -> None:
+        """生成用于性能测试的模拟数据"""
+        # numpy 只在执行本命令时导入，避免拖慢应用启动
+        from .generator import GenerateOptions
+        from .generator import generate
+
+        options = GenerateOptions(
+            students=students,
+            classes=classes,
+            accounts=accounts,
+            roles=roles,
+            skew=skew,
+            batch_size=batch_size,
+            cities_per_province=cities_per_province,
+            counties_per_city=counties_per_city,
+            seed=seed,
+        )
+        try:
+            for progress in generate(db.engine, options):
+                print(
+                    f"{progress.table}：{progress.done}/{progress.total}，"
+                    f"耗时 {progress.elapsed:.1f} 秒（{progress.rate:.0f} 行/秒）"
+                )
+        except LookupError as e:
+            print(f"枚举数据不完整（{e}），请先执行 flask init")
+            sys.exit(1)
+        finally:
+            # 批量写入绕过 ORM 会话，已提交的批次不会递增响应缓存的版本号
+            invalidate_all()
+
+
+__all__ = (
+    "initialize_commands",
+)
@@ -0,0 +1,607 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+按批向量化生成学生、班级、账户与角色数据
+
+每批数据先以 numpy 数组按列生成，再通过驱动的 ``executemany`` 一次写入，
+绕过 ORM 与逐行的参数处理。写入的数据表不逐行记录变更，而是在同一事务中重置其变更记录
+"""
+
+import time
+from collections.abc import Iterator
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+from numpy.typing import NDArray
+from sqlalchemy import Connection
+from sqlalchemy import Engine
+from sqlalchemy import Table
+from sqlalchemy import func
+from sqlalchemy import insert
+from sqlalchemy import select
+from werkzeug.security import generate_password_hash
+
+from ..database import reset_changes
+from ..model_utils import BaseModel
+from ..models.auth import Permission
+from ..models.auth import Role
+from ..models.auth import User
+from ..models.auth import role_permissions
+from ..models.auth import user_roles
+from ..models.data import CertificateType
+from ..models.data import EducationSystem
+from ..models.data import EnrollmentQuarter
+from ..models.data import EthnicGroup
+from ..models.data import FamilyDifficultyType
+from ..models.data import FinancialAidType
+from ..models.data import Gender
+from ..models.data import HealthStatus
+from ..models.data import HouseholdArea
+from ..models.data import HouseholdCity
+from ..models.data import HouseholdCounty
+from ..models.data import HouseholdProvince
+from ..models.data import HouseholdType
+from ..models.data import Nationality
+from ..models.data import OriginalRank
+from ..models.data import PoliticalStatus
+from ..models.data import PreviousEducationLevel
+from ..models.data import RetireType
+from ..models.data import SchoolClass
+from ..models.data import Student
+from ..models.data import StudentCategory
+from ..models.data import StudentOrigin
+from ..models.data import StudentStatus
+from ..models.data import StudyMode
+from ..models.data import TrainingLevel
+
+type ColumnValues = NDArray[Any] | Sequence[Any]
+type Lookups = dict[type[BaseModel], NDArray[np.int64]]
+
+LOOKUP_MODELS: tuple[type[BaseModel], ...] = (
+    CertificateType,
+    Gender,
+    EthnicGroup,
+    PreviousEducationLevel,
+    StudentOrigin,
+    StudentCategory,
+    PoliticalStatus,
+    HouseholdType,
+    HouseholdArea,
+    EnrollmentQuarter,
+    TrainingLevel,
+    EducationSystem,
+    StudentStatus,
+    StudyMode,
+    OriginalRank,
+    RetireType,
+    HealthStatus,
+    FinancialAidType,
+    Nationality,
+    FamilyDifficultyType,
+)
+"""
+学生外键引用的枚举表，由 ``flask init`` 写入
+"""
+
+PROVINCES = (
+    "北京", "天津", "河北", "山西", "内蒙古", "辽宁", "吉林", "黑龙江", "上海", "江苏", "浙江", "安徽",
+    "福建", "江西", "山东", "河南", "湖北", "湖南", "广东", "广西", "海南", "重庆", "四川", "贵州",
+    "云南", "西藏", "陕西", "甘肃", "青海", "宁夏", "新疆",
+)
+SURNAMES = tuple("王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘于蒋蔡余杜叶程苏魏吕丁任沈")
+GIVEN_NAME_CHARS = tuple("伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚桂英华玉兰飞鹏辉宇浩然欣怡子轩梓涵一诺思远晨阳")
+CAMPUSES = ("本部", "东校区", "西校区", "南校区")
+BANKS = ("中国银行", "工商银行", "建设银行", "农业银行", "交通银行")
+HOBBIES = ("篮球", "足球", "音乐", "阅读", "编程", "绘画", "书法")
+INCOME_SOURCES = ("工资", "务农", "个体经营", "其他")
+MAJOR_CODES = ("660101", "660102", "660201", "660301", "660402", "660501", "660603", "660704", "660801")
+PHONE_PREFIXES = ("130", "135", "138", "150", "158", "177", "186", "199")
+ACCOUNT_PASSWORD = "password"
+"""
+生成的账户共用的密码，只计算一次哈希
+"""
+YEAR = 365.25
+
+
+@dataclass(kw_only=True)
+class GenerateOptions:
+    """
+    生成选项
+    """
+    students: int
+    classes: int
+    accounts: int
+    roles: int
+    batch_size: int = 50000
+    skew: float = 1.0
+    """
+    班级、角色及各枚举值分布的偏斜程度（Zipf 指数），0 为均匀分布
+    """
+    cities_per_province: int = 8
+    counties_per_city: int = 6
+    seed: int = 0
+
+
+@dataclass
+class Progress:
+    """
+    生成进度
+    """
+    table: str
+    done: int
+    total: int
+    elapsed: float
+    """
+    该阶段开始以来经过的秒数
+    """
+
+    @property
+    def rate(self) -> float:
+        """
+        每秒写入的行数
+        """
+        return self.done / self.elapsed if self.elapsed > 0 else 0
+
+
+@dataclass
+class Regions:
+    """
+    省、市、县三级地区，各数组按县对齐
+    """
+    counties: NDArray[np.int64]
+    cities: NDArray[np.int64]
+    provinces: NDArray[np.int64]
+    codes: NDArray[np.str_]
+    """
+    六位行政区划代码，用于证件号码与邮政编码
+    """
+
+
+# 向量化工具
+
+def skewed_choice(rng: np.random.Generator, values: NDArray[Any], size: int, skew: float) -> NDArray[Any]:
+    """
+    按 Zipf 分布抽样，排在前面的值出现得更多
+
+    :param rng: 随机数生成器
+    :type rng: np.random.Generator
+    :param values: 候选值
+    :type values: NDArray[Any]
+    :param size: 抽样数量
+    :type size: int
+    :param skew: Zipf 指数，0 为均匀分布
+    :type skew: float
+
+    :return: 抽样结果
+    :rtype: NDArray[Any]
+    """
+    weights = 1 / np.arange(1, len(values) + 1) ** skew
+    return rng.choice(values, size=size, p=weights / weights.sum())
+
+
+def concat(*parts: NDArray[Any] | str) -> NDArray[np.str_]:
+    """
+    逐元素拼接字符串，标量会被广播
+    """
+    result = np.asarray(parts[0]).astype(np.str_)
+    for part in parts[1:]:
+        result = np.char.add(result, np.asarray(part).astype(np.str_))
+    return result
+
+
+def digits(rng: np.random.Generator, size: int, width: int) -> NDArray[np.str_]:
+    """
+    生成固定位数的随机数字串
+    """
+    return np.char.zfill(rng.integers(0, 10 ** width, size=size).astype(np.str_), width)
+
+
+def choose(rng: np.random.Generator, values: Sequence[str], size: int) -> NDArray[np.str_]:
+    return rng.choice(np.array(values), size=size)
+
+
+def person_names(rng: np.random.Generator, size: int) -> NDArray[np.str_]:
+    given = concat(choose(rng, GIVEN_NAME_CHARS, size), choose(rng, GIVEN_NAME_CHARS, size))
+    # 约三分之一为单字名
+    single = choose(rng, GIVEN_NAME_CHARS, size)
+    return concat(choose(rng, SURNAMES, size), np.where(rng.random(size) < 0.35, single, given))
+
+
+def phones(rng: np.random.Generator, size: int) -> NDArray[np.str_]:
+    return concat(choose(rng, PHONE_PREFIXES, size), digits(rng, size, 8))
+
+
+def addresses(rng: np.random.Generator, size: int) -> NDArray[np.str_]:
+    return concat("幸福路", rng.integers(1, 1000, size=size), "号")
+
+
+def new_years(values: NDArray[Any]) -> NDArray[np.datetime64]:
+    """
+    各年份的 1 月 1 日
+    """
+    return (values - 1970).astype("datetime64[Y]").astype("datetime64[D]")
+
+
+def days(values: NDArray[Any]) -> NDArray[np.timedelta64]:
+    return values.astype("timedelta64[D]")
+
+
+def iso_dates(values: NDArray[np.datetime64]) -> NDArray[np.str_]:
+    return np.datetime_as_string(values, unit="D")
+
+
+def nullable(rng: np.random.Generator, values: NDArray[Any], ratio: float) -> list[Any]:
+    """
+    将约 ``ratio`` 比例的值替换为 None
+    """
+    result: list[Any] = values.tolist()
+    for i in np.flatnonzero(rng.random(len(result)) < ratio).tolist():
+        result[i] = None
+    return result
+
+
+def only_where(mask: NDArray[np.bool_], values: NDArray[Any]) -> list[Any]:
+    """
+    将 ``mask`` 为假的位置替换为 None
+    """
+    return [value if keep else None for value, keep in zip(values.tolist(), mask.tolist())]
+
+
+# 数据库操作
+
+def bulk_insert(connection: Connection, table: Table, columns: dict[str, ColumnValues]) -> int:
+    """
+    通过驱动的 ``executemany`` 批量插入按列组织的数据
+
+    语句只编译一次，参数按方言要求的位置或名称组织。
+    参数不经过 SQLAlchemy 的类型处理，因此日期需以 ISO 字符串给出
+
+    :param connection: 数据库连接
+    :type connection: Connection
+    :param table: 表
+    :type table: Table
+    :param columns: 列名到该列所有值的映射
+    :type columns: dict[str, ColumnValues]
+
+    :return: 插入的行数
+    :rtype: int
+    """
+    names = list(columns)
+    values = [column.tolist() if isinstance(column, np.ndarray) else column for column in columns.values()]
+    compiled = insert(table).compile(dialect=connection.dialect, column_keys=names)
+    if compiled.positiontup is not None:
+        order = [names.index(name) for name in compiled.positiontup]
+        rows: list[Any] = list(zip(*(values[i] for i in order)))
+    else:
+        rows = [dict(zip(names, row)) for row in zip(*values)]
+    if rows:
+        connection.exec_driver_sql(str(compiled), rows)
+    return len(rows)
+
+
+def next_id(connection: Connection, table: Table) -> int:
+    return int(connection.scalar(select(func.coalesce(func.max(table.c.id), 0))) or 0) + 1
+
+
+def table_ids(connection: Connection, table: Table, start: int = 0) -> NDArray[np.int64]:
+    """
+    读取主键不小于 ``start`` 的所有行的主键，按主键排序
+    """
+    query = select(table.c.id).where(table.c.id >= start).order_by(table.c.id)
+    return np.array(connection.scalars(query).all(), dtype=np.int64)
+
+
+def load_lookups(connection: Connection) -> Lookups:
+    """
+    读取各枚举表的主键
+
+    主键按升序排列，因此在偏斜分布下，先写入的枚举值更常见
+
+    :raise LookupError: 存在空的枚举表
+    """
+    lookups: Lookups = {}
+    for model in LOOKUP_MODELS:
+        ids = table_ids(connection, model.__table__)
+        if not len(ids):
+            raise LookupError(f"lookup table {model.__tablename__} is empty")
+        lookups[model] = ids
+    return lookups
+
+
+def ensure_names(connection: Connection, table: Table, rows: list[dict[str, Any]]) -> dict[str, int]:
+    """
+    插入名称尚不存在的行
+
+    :return: 名称到主键的映射
+    :rtype: dict[str, int]
+    """
+    existing = dict(connection.execute(select(table.c.name, table.c.id)).tuples().all())
+    missing = [row for row in rows if row["name"] not in existing]
+    if missing:
+        connection.execute(insert(table), missing)
+        reset_changes(connection, table.name)
+        existing = dict(connection.execute(select(table.c.name, table.c.id)).tuples().all())
+    return existing
+
+
+def generate_regions(connection: Connection, options: GenerateOptions) -> Regions:
+    """
+    生成省、市、县三级地区，已存在的同名地区会被复用，因此可重复执行
+
+    :return: 地区层级
+    :rtype: Regions
+    """
+    layout = [
+        (p, c, k)
+        for p in range(len(PROVINCES))
+        for c in range(options.cities_per_province)
+        for k in range(options.counties_per_city)
+    ]
+
+    def city_name(p: int, c: int) -> str:
+        return f"{PROVINCES[p]}第{c + 1}市"
+
+    def county_name(p: int, c: int, k: int) -> str:
+        return f"{city_name(p, c)}第{k + 1}县"
+
+    provinces = ensure_names(connection, HouseholdProvince.__table__, [dict(name=name) for name in PROVINCES])
+    cities = ensure_names(connection, HouseholdCity.__table__, [
+        dict(name=city_name(p, c), household_province_id=provinces[PROVINCES[p]])
+        for p, c, k in layout if k == 0
+    ])
+    counties = ensure_names(connection, HouseholdCounty.__table__, [
+        dict(name=county_name(p, c, k), household_city_id=cities[city_name(p, c)])
+        for p, c, k in layout
+    ])
+    return Regions(
+        counties=np.array([counties[county_name(p, c, k)] for p, c, k in layout], dtype=np.int64),
+        cities=np.array([cities[city_name(p, c)] for p, c, _ in layout], dtype=np.int64),
+        provinces=np.array([provinces[PROVINCES[p]] for p, _, _ in layout], dtype=np.int64),
+        codes=np.array([f"{p + 11:02d}{c % 99 + 1:02d}{k % 99 + 1:02d}" for p, c, k in layout]),
+    )
+
+
+def generate_classes(connection: Connection, rng: np.random.Generator, count: int) -> NDArray[np.int64]:
+    """
+    生成班级
+
+    :return: 所有班级（包括已存在的）的主键
+    :rtype: NDArray[np.int64]
+    """
+    table = SchoolClass.__table__
+    start = next_id(connection, table)
+    grades = rng.integers(2015, 2026, size=count)
+    bulk_insert(connection, table, dict(name=concat(grades, "级", np.arange(start, start + count), "班")))
+    reset_changes(connection, table.name)
+    return table_ids(connection, table)
+
+
+def generate_roles(connection: Connection, rng: np.random.Generator, count: int) -> NDArray[np.int64]:
+    """
+    生成角色，每个角色随机拥有约三成的权限
+
+    :return: 生成的角色的主键
+    :rtype: NDArray[np.int64]
+    """
+    table = Role.__table__
+    start = next_id(connection, table)
+    bulk_insert(connection, table, dict(
+        name=concat("角色", np.arange(start, start + count)),
+        description=np.full(count, "生成的角色"),
+    ))
+    role_ids = table_ids(connection, table, start)
+
+    permission_ids = table_ids(connection, Permission.__table__)
+    role_index, permission_index = np.nonzero(rng.random((len(role_ids), len(permission_ids))) < 0.3)
+    bulk_insert(connection, role_permissions, dict(
+        role_id=role_ids[role_index],
+        permission_id=permission_ids[permission_index],
+    ))
+    return role_ids
+
+
+def generate_accounts(
+        connection: Connection,
+        rng: np.random.Generator,
+        count: int,
+        role_ids: NDArray[np.int64],
+        skew: float,
+) -> None:
+    """
+    生成账户，每个账户按偏斜分布抽取 1 至 3 个角色
+    """
+    table = User.__table__
+    start = next_id(connection, table)
+    bulk_insert(connection, table, dict(
+        username=concat("user", np.arange(start, start + count)),
+        password_hash=[generate_password_hash(ACCOUNT_PASSWORD)] * count,
+        active=rng.random(count) < 0.95,
+    ))
+    if not len(role_ids):
+        return
+    user_ids = table_ids(connection, table, start)
+    users = np.repeat(user_ids, rng.integers(1, 4, size=len(user_ids)))
+    roles = skewed_choice(rng, role_ids, len(users), skew)
+    pairs = np.unique(np.stack([users, roles], axis=1), axis=0)
+    bulk_insert(connection, user_roles, dict(user_id=pairs[:, 0], role_id=pairs[:, 1]))
+
+
+def student_batch(
+        rng: np.random.Generator,
+        seq: NDArray[np.int64],
+        options: GenerateOptions,
+        lookups: Lookups,
+        class_ids: NDArray[np.int64],
+        regions: Regions,
+) -> dict[str, ColumnValues]:
+    """
+    生成一批学生
+
+    各列之间保持一致：入学时间位于招生年份的九月，出生日期早于入学 15 至 25 年，
+    户籍省、市、县属于同一层级，证件号码包含行政区划代码与出生日期，
+    只有退役士兵填写服役信息
+
+    :param rng: 随机数生成器
+    :type rng: np.random.Generator
+    :param seq: 本批学生的序号，用于生成唯一的学号
+    :type seq: NDArray[np.int64]
+    :param options: 生成选项
+    :type options: GenerateOptions
+    :param lookups: 枚举表主键
+    :type lookups: Lookups
+    :param class_ids: 班级主键
+    :type class_ids: NDArray[np.int64]
+    :param regions: 地区层级
+    :type regions: Regions
+
+    :return: 列名到该列所有值的映射
+    :rtype: dict[str, ColumnValues]
+    """
+    size = len(seq)
+
+    def pick(model: type[BaseModel]) -> NDArray[np.int64]:
+        return skewed_choice(rng, lookups[model], size, options.skew)
+
+    admission_year = rng.integers(2015, 2026, size=size)
+    admission = (
+            new_years(admission_year)
+            + np.timedelta64(243, "D")
+            + days(rng.integers(0, 14, size=size))
+    )
+    birthday = admission - days(rng.uniform(15, 25, size=size) * YEAR)
+    birthday_text = iso_dates(birthday)
+    birthday_digits = np.char.replace(birthday_text, "-", "")
+
+    county = rng.integers(0, len(regions.counties), size=size)
+    code = regions.codes[county]
+
+    veteran = rng.random(size) < 0.05
+    enlistment = birthday + days(np.full(size, 18 * YEAR) + rng.integers(0, 365, size=size))
+    retirement = enlistment + np.timedelta64(2 * 365, "D")
+
+    income = np.round(rng.lognormal(11, 0.6, size=size)).astype(np.int64)
+    family_size = rng.integers(2, 7, size=size)
+
+    return dict(
+        campus_name=choose(rng, CAMPUSES, size),
+        school_class_id=skewed_choice(rng, class_ids, size, options.skew),
+        student_id=concat(admission_year, np.char.zfill(seq.astype(np.str_), 8)),
+        certificate_type_id=pick(CertificateType),
+        certificate_number=concat(code, birthday_digits, digits(rng, size, 4)),
+        name=person_names(rng, size),
+        gender_id=rng.choice(lookups[Gender], size=size),
+        birthday=birthday_text,
+        ethnic_group_id=pick(EthnicGroup),
+        phone=phones(rng, size),
+        bank_name=nullable(rng, choose(rng, BANKS, size), 0.4),
+        bank_account=nullable(rng, concat("6222", digits(rng, size, 12)), 0.4),
+        previous_education_level_id=pick(PreviousEducationLevel),
+        student_origin_id=pick(StudentOrigin),
+        student_category_id=pick(StudentCategory),
+        political_status_id=pick(PoliticalStatus),
+        household_type_id=pick(HouseholdType),
+        household_area_id=pick(HouseholdArea),
+        household_address=addresses(rng, size),
+        household_province_id=regions.provinces[county],
+        household_city_id=regions.cities[county],
+        household_county_id=regions.counties[county],
+        is_overseas_chinese=nullable(rng, rng.random(size) < 0.01, 0.5),
+        admission_year=admission_year,
+        enrollment_quarter_id=pick(EnrollmentQuarter),
+        major_code=choose(rng, MAJOR_CODES, size),
+        training_level_id=pick(TrainingLevel),
+        education_system_id=pick(EducationSystem),
+        admission_time=iso_dates(admission),
+        student_status_id=pick(StudentStatus),
+        study_mode_id=pick(StudyMode),
+        family_contact_name=person_names(rng, size),
+        family_contact_phone=phones(rng, size),
+        family_address=addresses(rng, size),
+        postal_code=concat(code),
+        hobby=nullable(rng, choose(rng, HOBBIES, size), 0.5),
+        award_situation=nullable(rng, np.full(size, "校级三好学生"), 0.9),
+        old_army=only_where(veteran, np.full(size, "某部")),
+        original_rank_id=only_where(veteran, pick(OriginalRank)),
+        military_base=only_where(veteran, np.full(size, "某基地")),
+        enlistment_time=only_where(veteran, iso_dates(enlistment)),
+        retirement_time=only_where(veteran, iso_dates(retirement)),
+        retire_type_id=only_where(veteran, pick(RetireType)),
+        health_status_id=nullable(rng, pick(HealthStatus), 0.2),
+        national_student_id=nullable(rng, concat("G", code, birthday_digits, digits(rng, size, 4)), 0.3),
+        is_guangdong_technical_school_graduation=rng.random(size) < 0.1,
+        graduation_school=concat(choose(rng, PROVINCES, size), "第", rng.integers(1, 30, size=size), "中学"),
+        graduation_certificate_number=digits(rng, size, 12),
+        graduation_major=nullable(rng, np.full(size, "普通高中"), 0.6),
+        graduation_skill_level=nullable(rng, np.full(size, "初级"), 0.8),
+        comprehensive_score=nullable(rng, np.round(rng.normal(180, 30, size=size), 1), 0.5),
+        science_score=nullable(rng, np.round(rng.normal(180, 30, size=size), 1), 0.5),
+        family_annual_income=income,
+        family_per_capita_income=income // family_size,
+        family_income_source=choose(rng, INCOME_SOURCES, size),
+        is_ethnic_minority_below_100k=rng.random(size) < 0.01,
+        is_low_income=rng.random(size) < 0.05,
+        financial_aid_type_id=pick(FinancialAidType),
+        is_poor_households=rng.random(size) < 0.03,
+        father_name=person_names(rng, size),
+        father_certificate_type_id=pick(CertificateType),
+        father_certificate_number=concat(code, digits(rng, size, 12)),
+        mother_name=person_names(rng, size),
+        mother_certificate_type_id=pick(CertificateType),
+        mother_certificate_number=concat(code, digits(rng, size, 12)),
+        guardian_certificate_type_id=pick(CertificateType),
+        guardian_certificate_number=concat(code, digits(rng, size, 12)),
+        guardian_name=person_names(rng, size),
+        guardian_contact=phones(rng, size),
+        nationality_id=pick(Nationality),
+        is_family_difficulty=rng.random(size) < 0.12,
+        family_difficulty_type_id=pick(FamilyDifficultyType),
+    )
+
+
+def generate(engine: Engine, options: GenerateOptions) -> Iterator[Progress]:
+    """
+    生成数据并逐阶段报告进度
+
+    地区、班级、角色与账户在同一个事务中写入；学生每批一个事务，中断时已提交的批次会保留
+
+    :param engine: 数据库引擎
+    :type engine: Engine
+    :param options: 生成选项
+    :type options: GenerateOptions
+
+    :return: 进度迭代器
+    :rtype: Iterator[Progress]
+
+    :raise LookupError: 存在空的枚举表
+    """
+    rng = np.random.default_rng(options.seed)
+    start = time.perf_counter()
+    with engine.begin() as connection:
+        lookups = load_lookups(connection)
+        regions = generate_regions(connection, options)
+        class_ids = generate_classes(connection, rng, options.classes)
+        role_ids = generate_roles(connection, rng, options.roles)
+        generate_accounts(connection, rng, options.accounts, role_ids, options.skew)
+        first = next_id(connection, Student.__table__)
+    base_rows = options.classes + options.roles + options.accounts
+    yield Progress("班级、角色与账户", base_rows, base_rows, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    done = 0
+    while done < options.students:
+        seq = np.arange(first + done, first + min(done + options.batch_size, options.students))
+        batch = student_batch(rng, seq, options, lookups, class_ids, regions)
+        with engine.begin() as connection:
+            done += bulk_insert(connection, Student.__table__, batch)
+            reset_changes(connection, Student.__tablename__)
+        yield Progress("学生", done, options.students, time.perf_counter() - start)
+
+
+__all__ = (
+    "GenerateOptions",
+    "Progress",
+    "generate",
+)
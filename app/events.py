@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+数据变更推送
+
+会话提交后，:py:mod:`app.database.changes` 记录的变更批次经代理分发给订阅了相应数据表的客户端
+（``/api/data/events``，Server-Sent Events）。``REDIS_URL`` 为 ``memory://`` 时使用进程内的代理，
+否则通过 Redis 发布/订阅在各工作进程间分发，每个进程只持有一个订阅连接。
+
+每个客户端有长度为 ``EVENTS_BUFFER_SIZE`` 的缓冲，客户端读取过慢导致缓冲已满时丢弃其中的事件并发送
+``overflow`` 事件，客户端应通过 ``/tables/<name>/changes`` 从已知的版本补齐。每个变更事件都带有
+``since``，与客户端已知的版本号不一致时同样说明有遗漏。连接在 ``EVENTS_MAX_SECONDS`` 后结束，
+客户端重连时重新验证身份
+"""
+
+import dataclasses
+import json
+import logging
+import queue
+import threading
+import time
+from collections.abc import Collection
+from collections.abc import Iterator
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Optional
+
+import redis
+from flask import Flask
+from flask import current_app
+from flask import has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .database import ChangeBatch
+from .database import PENDING_CHANGES
+from .extensions import jwt_redis_blocklist
+from .memory_redis import MemoryRedis
+from .session import RoutingSession
+
+EVENTS_EXTENSION = "events"
+RECONNECT_SECONDS = 1
+"""
+Redis 订阅出错后重新订阅的间隔（秒）
+"""
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(eq=False)
+class Subscriber:
+    """
+    一个订阅者（连接）
+
+    :ivar tables: 订阅的表名
+    :ivar events: 待发送的变更批次
+    :ivar overflowed: 缓冲已满、有事件被丢弃
+    """
+    tables: frozenset[str]
+    events: queue.Queue[ChangeBatch]
+    overflowed: threading.Event = field(default_factory=threading.Event)
+
+    def offer(self, batch: ChangeBatch) -> None:
+        try:
+            self.events.put_nowait(batch)
+        except queue.Full:
+            self.overflowed.set()
+
+
+class Broker:
+    """
+    进程内的代理，发布的变更批次直接分发给本进程的订阅者
+    """
+
+    def __init__(self, buffer_size: int) -> None:
+        self.buffer_size = buffer_size
+        self._subscribers: set[Subscriber] = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, tables: Collection[str]) -> Subscriber:
+        subscriber = Subscriber(frozenset(tables), queue.Queue(self.buffer_size))
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def subscribers(self) -> list[Subscriber]:
+        with self._lock:
+            return list(self._subscribers)
+
+    def dispatch(self, batch: ChangeBatch) -> None:
+        for subscriber in self.subscribers():
+            if batch.table in subscriber.tables:
+                subscriber.offer(batch)
+
+    def publish(self, batches: list[ChangeBatch]) -> None:
+        for batch in batches:
+            self.dispatch(batch)
+
+
+class RedisBroker(Broker):
+    """
+    通过 Redis 发布/订阅分发的代理
+
+    发布的变更批次写入频道，本进程有订阅者后启动一个后台线程订阅该频道并分发给本进程的订阅者。
+    订阅出错期间的事件无法送达，重新订阅后向所有订阅者发送 ``overflow``；无法解析的消息记录日志后跳过。
+    线程意外退出时同样发送 ``overflow``，并在下一个订阅者订阅时重新启动
+    """
+
+    def __init__(self, buffer_size: int, client: redis.StrictRedis, channel: str) -> None:
+        super().__init__(buffer_size)
+        self.client = client
+        self.channel = channel
+        self._listener: Optional[threading.Thread] = None
+
+    def subscribe(self, tables: Collection[str]) -> Subscriber:
+        with self._lock:
+            # 在预加载应用的主进程中不会启动，fork 后由各工作进程自行启动
+            if self._listener is None:
+                self._listener = threading.Thread(target=self.listen, name="events-listener", daemon=True)
+                self._listener.start()
+        return super().subscribe(tables)
+
+    def publish(self, batches: list[ChangeBatch]) -> None:
+        for batch in batches:
+            self.client.publish(self.channel, json.dumps(dataclasses.asdict(batch)))
+
+    def overflow(self) -> None:
+        """
+        通知所有订阅者有事件丢失
+        """
+        for subscriber in self.subscribers():
+            subscriber.overflowed.set()
+
+    def listen(self) -> None:
+        try:
+            while True:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)  # type: ignore[no-untyped-call]
+                try:
+                    pubsub.subscribe(self.channel)
+                    for message in pubsub.listen():
+                        if message["type"] == "message" and (batch := decode_batch(message["data"])) is not None:
+                            self.dispatch(batch)
+                except redis.exceptions.RedisError:
+                    logger.warning("变更推送的 Redis 订阅出错，%s 秒后重新订阅", RECONNECT_SECONDS, exc_info=True)
+                    time.sleep(RECONNECT_SECONDS)
+                    self.overflow()
+                finally:
+                    pubsub.close()
+        except Exception:
+            logger.exception("变更推送的订阅线程意外退出，下次订阅时重新启动")
+        finally:
+            with self._lock:
+                self._listener = None
+            self.overflow()
+
+
+def decode_batch(data: str | bytes) -> Optional[ChangeBatch]:
+    """
+    解析频道中的变更批次，无法解析时返回 None
+    """
+    try:
+        payload = json.loads(data)
+        changes = [(int(row_id), str(op)) for row_id, op in payload["changes"]]
+        return ChangeBatch(str(payload["table"]), int(payload["since"]), int(payload["version"]), changes)
+    except (ValueError, TypeError, KeyError):
+        logger.warning("无法解析的变更推送消息：%r", data, exc_info=True)
+        return None
+
+
+def format_event(name: str, data: Any) -> str:
+    return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+def event_stream(
+        broker: Broker,
+        subscriber: Subscriber,
+        versions: dict[str, int],
+        *,
+        heartbeat: float,
+        max_seconds: float,
+        retry_ms: int,
+) -> Iterator[str]:
+    """
+    生成 SSE 事件流
+
+    首先发送 ``ready``，包含订阅时各表的版本号；之后每个变更批次为一个 ``change`` 事件，
+    空闲时每 ``heartbeat`` 秒发送一行注释保持连接。流结束或客户端断开时取消订阅
+
+    :param broker: 代理
+    :type broker: Broker
+    :param subscriber: 已订阅的订阅者
+    :type subscriber: Subscriber
+    :param versions: 订阅时各表的版本号
+    :type versions: dict[str, int]
+    :param heartbeat: 心跳间隔（秒）
+    :type heartbeat: float
+    :param max_seconds: 连接持续的最长时间（秒）
+    :type max_seconds: float
+    :param retry_ms: 客户端断开后的重连间隔（毫秒）
+    :type retry_ms: int
+
+    :return: 事件文本
+    :rtype: Iterator[str]
+    """
+    try:
+        yield f"retry: {retry_ms}\n" + format_event("ready", dict(tables=versions))
+        deadline = time.monotonic() + max_seconds
+        while (remaining := deadline - time.monotonic()) > 0:
+            if subscriber.overflowed.is_set():
+                subscriber.overflowed.clear()
+                while not subscriber.events.empty():
+                    subscriber.events.get_nowait()
+                yield format_event("overflow", dict(tables=sorted(subscriber.tables)))
+            try:
+                batch = subscriber.events.get(timeout=min(heartbeat, remaining))
+            except queue.Empty:
+                yield ": heartbeat\n\n"
+                continue
+            yield format_event("change", dataclasses.asdict(batch))
+    finally:
+        broker.unsubscribe(subscriber)
+
+
+def get_broker() -> Broker:
+    broker: Broker = current_app.extensions[EVENTS_EXTENSION]
+    return broker
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def publish_committed(session: Session) -> None:
+    batches: Optional[list[ChangeBatch]] = session.info.pop(PENDING_CHANGES, None)
+    if not batches or not has_app_context() or EVENTS_EXTENSION not in current_app.extensions:
+        return
+    try:
+        get_broker().publish(batches)
+    except redis.exceptions.RedisError:
+        # 数据已提交，推送失败不影响请求；客户端可通过 since 发现遗漏
+        logger.warning("变更推送失败", exc_info=True)
+
+
+def initialize_events(app: Flask) -> None:
+    """
+    创建变更推送代理
+
+    :param app: 应用
+    :type app: Flask
+    """
+    buffer_size = app.config["EVENTS_BUFFER_SIZE"]
+    if isinstance(jwt_redis_blocklist, MemoryRedis):
+        app.extensions[EVENTS_EXTENSION] = Broker(buffer_size)
+    else:
+        app.extensions[EVENTS_EXTENSION] = RedisBroker(buffer_size, jwt_redis_blocklist, app.config["EVENTS_CHANNEL"])
+
+
+__all__ = (
+    "Subscriber",
+    "Broker",
+    "RedisBroker",
+    "decode_batch",
+    "format_event",
+    "event_stream",
+    "get_broker",
+    "initialize_events",
+)
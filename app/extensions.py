@@ -8,21 +8,52 @@ from flask_jwt_extended import JWTManager
 from flask_sqlalchemy import SQLAlchemy
 import redis
 
-db = SQLAlchemy()
+from .config import Config
+from .memory_redis import MEMORY_SCHEME
+from .memory_redis import MemoryRedis
+from .session import RoutingSession
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 jwt = JWTManager()
-jwt_redis_blocklist = redis.StrictRedis(
-    host="127.0.0.1",
-    decode_responses=True
-)
-try:
-    jwt_redis_blocklist.ping()
-except redis.exceptions.ConnectionError:
-    traceback.print_exc()
-    print("Redis 连接失败，请检查 Redis 服务是否启动")
-    sys.exit(1)
+
+
+def create_redis(url: str) -> redis.StrictRedis | MemoryRedis:
+    """
+    创建 Redis 客户端，``memory://`` 使用进程内的替代实现
+
+    :param url: Redis 地址
+    :type url: str
+
+    :return: Redis 客户端
+    :rtype: redis.StrictRedis | MemoryRedis
+    """
+    if url.startswith(MEMORY_SCHEME):
+        return MemoryRedis.from_url(url)
+    client: redis.StrictRedis = redis.StrictRedis.from_url(url, decode_responses=True)
+    return client
+
+
+jwt_redis_blocklist = create_redis(Config.REDIS_URL)
+
+
+def check_redis() -> None:
+    """
+    检查 Redis 连接，连接失败时退出
+
+    在启动服务前调用，不处理请求的命令行命令无需等待 Redis
+    """
+    try:
+        jwt_redis_blocklist.ping()
+    except redis.exceptions.ConnectionError:
+        traceback.print_exc()
+        print("Redis 连接失败，请检查 Redis 服务是否启动")
+        sys.exit(1)
+
 
 __all__ = (
     "db",
     "jwt",
+    "create_redis",
     "jwt_redis_blocklist",
+    "check_redis",
 )
@@ -0,0 +1,645 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+后台任务
+
+导出、导入等耗时较长的操作不在请求中执行：接口在 ``jobs`` 表中写入任务后立即返回任务 ID，由工作线程领取执行，
+客户端轮询任务的状态与进度，完成后下载结果文件。结果文件通过 ``send_file`` 发送且不经过响应压缩，
+服务器支持时（如 gunicorn）以 sendfile 从磁盘零拷贝发送，并响应条件请求与范围请求。
+
+每个进程在处理第一个请求时启动 ``JOBS_WORKERS`` 个工作线程，也可以通过 ``flask run-jobs`` 启动专门执行任务的进程。
+工作线程以一条带条件的 UPDATE 领取任务，条件中统计同一类型以及同一用户同一类型执行中的任务数，
+各进程共同遵守 :py:func:`job_kind` 登记的并发上限。执行中的任务定期更新心跳，长时间没有心跳
+（所在进程已退出）的任务标记为失败；结束超过 ``JOBS_RESULT_TTL`` 秒的任务连同其文件一并删除
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from dataclasses import dataclass
+from dataclasses import field
+from dataclasses import replace
+from typing import Any
+from typing import Optional
+from typing import cast
+
+import click
+from flask import Flask
+from flask import current_app
+from sqlalchemy import CursorResult
+from sqlalchemy import Row
+from sqlalchemy import delete
+from sqlalchemy import func
+from sqlalchemy import insert
+from sqlalchemy import select
+from sqlalchemy import update
+from werkzeug.datastructures import FileStorage
+
+from ..extensions import db
+from ..models.system import jobs
+
+JOBS_EXTENSION = "jobs"
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+PROGRESS_INTERVAL = 0.5
+"""
+两次写入进度的最短间隔（秒）
+"""
+CLAIM_CANDIDATES = 20
+"""
+每次领取时考察的排队任务数，排在前面的任务因并发上限无法执行时尝试后面的任务
+"""
+MESSAGE_LENGTH = 256
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    """
+    任务已被取消，由 :py:meth:`JobContext.progress` 抛出
+    """
+
+
+class JobFailed(Exception):
+    """
+    任务因输入有误等预期的原因失败，消息记录为任务的 ``message``，不记录调用栈
+    """
+
+
+@dataclass(frozen=True)
+class JobResult:
+    file: Optional[str] = None
+    """
+    结果文件名，由 :py:meth:`JobContext.result_file` 生成
+    """
+    filename: Optional[str] = None
+    """
+    下载时的文件名
+    """
+    message: Optional[str] = None
+
+
+class JobContext:
+    """
+    执行中的任务
+
+    :ivar job_id: 任务 ID
+    :ivar user_id: 创建任务的用户
+    :ivar params: 任务参数
+    :ivar directory: 任务文件目录
+    :ivar input_file: 上传的文件名
+    """
+
+    def __init__(
+            self,
+            job_id: int,
+            user_id: Optional[int],
+            params: dict[str, Any],
+            directory: str,
+            input_file: Optional[str],
+    ) -> None:
+        self.job_id = job_id
+        self.user_id = user_id
+        self.params = params
+        self.directory = directory
+        self.input_file = input_file
+        self.files: list[str] = []
+        self._reported = 0.0
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def result_file(self, suffix: str) -> str:
+        """
+        生成结果文件名，任务失败或被取消时删除该文件
+
+        :param suffix: 文件后缀
+        :type suffix: str
+
+        :return: 文件名，通过 :py:meth:`path` 获取路径
+        :rtype: str
+        """
+        name = f"job-{self.job_id}{suffix}"
+        self.files.append(name)
+        os.makedirs(self.directory, exist_ok=True)
+        return name
+
+    def progress(self, fraction: float, message: Optional[str] = None) -> None:
+        """
+        报告进度并检查任务是否已被取消，距上次写入不足 :py:data:`PROGRESS_INTERVAL` 秒时跳过
+
+        写入使用独立的连接，调用时任务所用的会话不应持有未提交的写入，否则 SQLite 下会互相等待
+
+        :param fraction: 完成比例（0 到 1）
+        :type fraction: float
+        :param message: 进度说明
+        :type message: Optional[str]
+
+        :raise JobCancelled: 任务已被取消
+        """
+        now = time.monotonic()
+        if now - self._reported < PROGRESS_INTERVAL:
+            return
+        self._reported = now
+        values: dict[str, Any] = dict(progress=min(max(fraction, 0.0), 1.0), heartbeat_at=time.time())
+        if message is not None:
+            values["message"] = message[:MESSAGE_LENGTH]
+        with db.engine.begin() as connection:
+            connection.execute(update(jobs).where(jobs.c.id == self.job_id).values(**values))
+            cancelled = connection.execute(
+                select(jobs.c.cancel_requested).where(jobs.c.id == self.job_id, jobs.c.state == RUNNING)
+            ).scalar_one_or_none()
+        # 任务已不在执行中（如被判定为进程已退出）时同样停止
+        if cancelled is None or cancelled:
+            raise JobCancelled()
+
+
+type JobFunction = Callable[[JobContext], Optional[JobResult]]
+
+
+@dataclass(frozen=True)
+class JobKind:
+    name: str
+    run: JobFunction
+    concurrency: int
+    """
+    所有进程中同时执行的该类型任务数上限
+    """
+    per_user: int
+    """
+    同一用户同时执行的该类型任务数上限
+    """
+
+
+JOB_KINDS: dict[str, JobKind] = {}
+
+
+def job_kind(name: str, *, concurrency: int, per_user: int) -> Callable[[JobFunction], JobFunction]:
+    """
+    登记任务类型
+
+    :param name: 类型名
+    :type name: str
+    :param concurrency: 同时执行的上限
+    :type concurrency: int
+    :param per_user: 同一用户同时执行的上限
+    :type per_user: int
+    """
+
+    def wrapper(func: JobFunction) -> JobFunction:
+        JOB_KINDS[name] = JobKind(name, func, concurrency, per_user)
+        return func
+
+    return wrapper
+
+
+@dataclass(frozen=True)
+class JobSettings:
+    workers: int
+    directory: str
+    poll_seconds: float
+    heartbeat_seconds: float
+    stale_seconds: float
+    result_ttl: float
+    max_pending: int
+
+
+def job_directory(app: Flask) -> str:
+    """
+    获取任务文件目录，未配置时使用实例目录下的 ``jobs``
+    """
+    return str(app.config["JOBS_DIR"] or os.path.join(app.instance_path, "jobs"))
+
+
+def get_settings() -> JobSettings:
+    return get_pool().settings
+
+
+def remove_files(directory: str, *names: Optional[str]) -> None:
+    for name in names:
+        if name:
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+
+
+def save_upload(storage: FileStorage, suffix: str) -> str:
+    """
+    保存上传的文件，作为任务的 ``input_file``
+
+    :return: 文件名
+    :rtype: str
+    """
+    directory = get_settings().directory
+    os.makedirs(directory, exist_ok=True)
+    name = f"upload-{uuid.uuid4().hex}{suffix}"
+    storage.save(os.path.join(directory, name))
+    return name
+
+
+def remove_upload(name: str) -> None:
+    """
+    删除未能创建任务的上传文件
+    """
+    remove_files(get_settings().directory, name)
+
+
+def enqueue(
+        kind: str,
+        params: dict[str, Any],
+        *,
+        user_id: Optional[int],
+        input_file: Optional[str] = None,
+) -> Optional[Row[Any]]:
+    """
+    创建任务
+
+    :param kind: 任务类型
+    :type kind: str
+    :param params: 任务参数，需能以 JSON 保存
+    :type params: dict[str, Any]
+    :param user_id: 创建任务的用户
+    :type user_id: Optional[int]
+    :param input_file: 已通过 :py:func:`save_upload` 保存的文件
+    :type input_file: Optional[str]
+
+    :return: 创建的任务，该用户排队与执行中的任务数已达 ``JOBS_MAX_PENDING`` 时返回 None
+    :rtype: Optional[Row[Any]]
+    """
+    if kind not in JOB_KINDS:
+        raise KeyError(kind)
+    settings = get_settings()
+    pending = db.session.execute(
+        select(func.count()).select_from(jobs).where(jobs.c.user_id == user_id, jobs.c.state.in_((QUEUED, RUNNING)))
+    ).scalar_one()
+    if pending >= settings.max_pending:
+        return None
+    inserted = cast(CursorResult[Any], db.session.execute(insert(jobs).values(
+        kind=kind,
+        user_id=user_id,
+        state=QUEUED,
+        params=json.dumps(params, ensure_ascii=False),
+        progress=0.0,
+        input_file=input_file,
+        cancel_requested=False,
+        created_at=time.time(),
+    )))
+    # 单行插入总有主键
+    assert inserted.inserted_primary_key is not None
+    job_id = inserted.inserted_primary_key[0]
+    db.session.commit()
+    get_pool().wake()
+    return db.session.execute(select(jobs).where(jobs.c.id == job_id)).one()
+
+
+def get_job(job_id: int) -> Optional[Row[Any]]:
+    return db.session.execute(select(jobs).where(jobs.c.id == job_id)).one_or_none()
+
+
+def list_jobs(user_id: Optional[int]) -> list[Row[Any]]:
+    """
+    获取用户的任务，最新的在前
+    """
+    return list(db.session.execute(select(jobs).where(jobs.c.user_id == user_id).order_by(jobs.c.id.desc())).all())
+
+
+def job_info(row: Row[Any]) -> dict[str, Any]:
+    return dict(
+        id=row.id,
+        kind=row.kind,
+        state=row.state,
+        params=json.loads(row.params),
+        progress=row.progress,
+        message=row.message,
+        result=row.result_name if row.result_file else None,
+        cancel_requested=row.cancel_requested,
+        created_at=row.created_at,
+        started_at=row.started_at,
+        finished_at=row.finished_at,
+    )
+
+
+def cancel_job(job_id: int) -> Optional[Row[Any]]:
+    """
+    取消任务：排队中的任务立即取消，执行中的任务在下次报告进度时结束，已结束的任务不受影响
+
+    :return: 取消后的任务，任务不存在时返回 None
+    :rtype: Optional[Row[Any]]
+    """
+    cancelled = cast(CursorResult[Any], db.session.execute(
+        update(jobs)
+        .where(jobs.c.id == job_id, jobs.c.state == QUEUED)
+        .values(state=CANCELLED, message="已取消", finished_at=time.time())
+    )).rowcount
+    db.session.execute(update(jobs).where(jobs.c.id == job_id, jobs.c.state == RUNNING).values(cancel_requested=True))
+    db.session.commit()
+    row = get_job(job_id)
+    if cancelled and row is not None:
+        remove_files(get_settings().directory, row.input_file)
+    return row
+
+
+def result_path(row: Row[Any]) -> Optional[str]:
+    """
+    获取任务结果文件的路径，任务未成功、没有结果或文件已被删除时返回 None
+    """
+    if row.state != SUCCEEDED or not row.result_file:
+        return None
+    path = os.path.join(get_settings().directory, row.result_file)
+    return path if os.path.exists(path) else None
+
+
+def claim_job() -> Optional[Row[Any]]:
+    """
+    领取一个排队中的任务，同类型或同一用户执行中的任务已达上限的任务留在队列中
+
+    :return: 领取的任务，没有可执行的任务时返回 None
+    :rtype: Optional[Row[Any]]
+    """
+    running = jobs.alias("running")
+
+    def running_count(*conditions: Any) -> Any:
+        statement = select(func.count()).select_from(running).where(running.c.state == RUNNING, *conditions)
+        return statement.scalar_subquery()
+
+    with db.engine.connect() as connection:
+        candidates = connection.execute(
+            select(jobs.c.id, jobs.c.kind, jobs.c.user_id)
+            .where(jobs.c.state == QUEUED)
+            .order_by(jobs.c.id)
+            .limit(CLAIM_CANDIDATES)
+        ).all()
+    for candidate in candidates:
+        now = time.time()
+        with db.engine.begin() as connection:
+            if (kind := JOB_KINDS.get(candidate.kind)) is None:
+                connection.execute(
+                    update(jobs)
+                    .where(jobs.c.id == candidate.id, jobs.c.state == QUEUED)
+                    .values(state=FAILED, message=f"未知的任务类型：{candidate.kind}", finished_at=now)
+                )
+                continue
+            # 计数与更新在同一条语句中，SQLite 下各进程的领取依次执行，不会超过上限
+            claimed = connection.execute(
+                update(jobs)
+                .where(
+                    jobs.c.id == candidate.id,
+                    jobs.c.state == QUEUED,
+                    running_count(running.c.kind == candidate.kind) < kind.concurrency,
+                    running_count(running.c.kind == candidate.kind, running.c.user_id == candidate.user_id)
+                    < kind.per_user,
+                )
+                .values(state=RUNNING, started_at=now, heartbeat_at=now)
+            ).rowcount
+            if claimed:
+                return connection.execute(select(jobs).where(jobs.c.id == candidate.id)).one()
+    return None
+
+
+def finish_job(job_id: int, state: str, **values: Any) -> bool:
+    """
+    结束执行中的任务
+
+    :return: 是否更新，任务已被判定为进程已退出时返回 False
+    :rtype: bool
+    """
+    if values.get("message") is not None:
+        values["message"] = values["message"][:MESSAGE_LENGTH]
+    with db.engine.begin() as connection:
+        return bool(connection.execute(
+            update(jobs)
+            .where(jobs.c.id == job_id, jobs.c.state == RUNNING)
+            .values(state=state, finished_at=time.time(), **values)
+        ).rowcount)
+
+
+def run_job(row: Row[Any], directory: str) -> None:
+    """
+    执行已领取的任务并记录结果
+    """
+    context = JobContext(row.id, row.user_id, json.loads(row.params), directory, row.input_file)
+    try:
+        result = JOB_KINDS[row.kind].run(context) or JobResult()
+    except JobCancelled:
+        finish_job(row.id, CANCELLED, message="已取消")
+        remove_files(directory, *context.files)
+    except JobFailed as err:
+        finish_job(row.id, FAILED, message=str(err))
+        remove_files(directory, *context.files)
+    except Exception as err:
+        logger.exception("后台任务 %s (%s) 失败", row.id, row.kind)
+        finish_job(row.id, FAILED, message=str(err) or type(err).__name__)
+        remove_files(directory, *context.files)
+    else:
+        finished = finish_job(
+            row.id,
+            SUCCEEDED,
+            progress=1.0,
+            message=result.message,
+            result_file=result.file,
+            result_name=result.filename,
+        )
+        if not finished:
+            remove_files(directory, *context.files)
+    finally:
+        remove_files(directory, row.input_file)
+
+
+def sweep_jobs(settings: JobSettings, running: list[int]) -> tuple[int, int]:
+    """
+    更新本进程执行中任务的心跳，将心跳超时的任务标记为失败，删除过期的任务及其文件
+
+    :param settings: 设置
+    :type settings: JobSettings
+    :param running: 本进程执行中的任务
+    :type running: list[int]
+
+    :return: 标记为失败的任务数与删除的任务数
+    :rtype: tuple[int, int]
+    """
+    now = time.time()
+    with db.engine.begin() as connection:
+        if running:
+            connection.execute(
+                update(jobs).where(jobs.c.id.in_(running), jobs.c.state == RUNNING).values(heartbeat_at=now)
+            )
+        lost = connection.execute(
+            update(jobs)
+            .where(jobs.c.state == RUNNING, jobs.c.heartbeat_at < now - settings.stale_seconds)
+            .values(state=FAILED, message="执行任务的进程已退出", finished_at=now)
+        ).rowcount
+        expired = connection.execute(
+            select(jobs.c.id, jobs.c.input_file, jobs.c.result_file)
+            .where(jobs.c.state.in_(FINISHED), jobs.c.finished_at < now - settings.result_ttl)
+        ).all()
+        if expired:
+            connection.execute(delete(jobs).where(jobs.c.id.in_([row.id for row in expired])))
+    for row in expired:
+        remove_files(settings.directory, row.input_file, row.result_file)
+    return lost, len(expired)
+
+
+@dataclass(eq=False)
+class WorkerPool:
+    """
+    一个进程中的工作线程，另有一个线程负责心跳与清理
+    """
+    app: Flask
+    settings: JobSettings
+    _running: set[int] = field(default_factory=set)
+    _threads: list[threading.Thread] = field(default_factory=list)
+    _pid: Optional[int] = None
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+    _condition: threading.Condition = field(default_factory=threading.Condition)
+    _stopping: threading.Event = field(default_factory=threading.Event)
+
+    def ensure_started(self) -> None:
+        """
+        在当前进程中启动工作线程，已启动时不做任何事；fork 出的子进程需要重新启动
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._running.clear()
+            self._stopping.clear()
+            self._threads = [
+                *(threading.Thread(target=self.work, name=f"jobs-worker-{i}", daemon=True)
+                  for i in range(self.settings.workers)),
+                threading.Thread(target=self.sweep, name="jobs-sweeper", daemon=True),
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        停止领取任务并等待执行中的任务结束
+        """
+        self._stopping.set()
+        self.wake()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._pid = None
+
+    def wake(self) -> None:
+        with self._condition:
+            self._condition.notify_all()
+
+    def work(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                with self.app.app_context():
+                    row = claim_job()
+                    if row is not None:
+                        self._running.add(row.id)
+                        try:
+                            run_job(row, self.settings.directory)
+                        finally:
+                            self._running.discard(row.id)
+                        continue
+            except Exception:
+                logger.exception("后台任务工作线程出错")
+            with self._condition:
+                self._condition.wait(self.settings.poll_seconds)
+
+    def sweep(self) -> None:
+        while not self._stopping.wait(self.settings.heartbeat_seconds):
+            try:
+                with self.app.app_context():
+                    sweep_jobs(self.settings, list(self._running))
+            except Exception:
+                logger.exception("清理后台任务出错")
+
+
+def get_pool() -> WorkerPool:
+    pool: WorkerPool = current_app.extensions[JOBS_EXTENSION]
+    return pool
+
+
+def initialize_jobs(app: Flask) -> None:
+    """
+    登记内置的任务类型，``JOBS_WORKERS`` 大于 0 时在每个进程处理第一个请求时启动工作线程
+
+    :param app: 应用
+    :type app: Flask
+    """
+    from . import tasks  # noqa: F401
+
+    config = app.config
+    pool = WorkerPool(app, JobSettings(
+        workers=config["JOBS_WORKERS"],
+        directory=job_directory(app),
+        poll_seconds=config["JOBS_POLL_SECONDS"],
+        heartbeat_seconds=config["JOBS_HEARTBEAT_SECONDS"],
+        stale_seconds=config["JOBS_STALE_SECONDS"],
+        result_ttl=config["JOBS_RESULT_TTL"],
+        max_pending=config["JOBS_MAX_PENDING"],
+    ))
+    app.extensions[JOBS_EXTENSION] = pool
+    if pool.settings.workers <= 0:
+        return
+
+    @app.before_request
+    def start_workers() -> None:
+        # 预加载应用的主进程不处理请求，工作线程在 fork 后由各工作进程启动
+        pool.ensure_started()
+
+
+def initialize_commands(app: Flask) -> None:
+    @app.cli.command("run-jobs")
+    @click.option("--workers", "-w", type=int, default=None, help="工作线程数，默认为 JOBS_WORKERS")
+    def run_jobs(workers: Optional[int]) -> None:
+        """执行后台任务，按 Ctrl+C 停止"""
+        settings = get_pool().settings
+        pool = WorkerPool(app, replace(settings, workers=workers or max(settings.workers, 1)))
+        pool.ensure_started()
+        print(f"正在执行后台任务（{pool.settings.workers} 个工作线程），按 Ctrl+C 停止")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print("正在等待执行中的任务结束")
+            pool.stop()
+
+
+__all__ = (
+    "QUEUED",
+    "RUNNING",
+    "SUCCEEDED",
+    "FAILED",
+    "CANCELLED",
+    "JobCancelled",
+    "JobFailed",
+    "JobResult",
+    "JobContext",
+    "JobKind",
+    "job_kind",
+    "save_upload",
+    "remove_upload",
+    "enqueue",
+    "get_job",
+    "list_jobs",
+    "job_info",
+    "cancel_job",
+    "result_path",
+    "claim_job",
+    "sweep_jobs",
+    "WorkerPool",
+    "get_pool",
+    "initialize_jobs",
+    "initialize_commands",
+)
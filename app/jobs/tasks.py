@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+内置的后台任务：数据表的导出与导入
+
+导出按主键顺序分批读取，写入 CSV 或 JSON Lines，默认以 gzip 压缩；压缩后的文件不再经过响应压缩，
+下载时可以零拷贝发送。导入读取带表头的 CSV，空单元格视为 NULL，与导出的格式一致；
+每 ``JOBS_IMPORT_BATCH`` 行经 ORM 会话提交一次，写入照常记录变更并推送，中途失败或取消时已提交的行保留
+"""
+
+import csv
+import gzip
+import json
+from collections.abc import Callable
+from datetime import date
+from datetime import datetime
+from typing import IO
+from typing import Any
+
+from flask import current_app
+from sqlalchemy import Column
+from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from . import JobContext
+from . import JobFailed
+from . import JobResult
+from . import job_kind
+from ..extensions import db
+from ..model_utils import BaseModel
+from ..models.data import TABLES
+
+EXPORT_FORMATS = {
+    "csv": ".csv",
+    "jsonl": ".jsonl",
+}
+EXPORT_CHUNK = 5000
+GZIP_LEVEL = 6
+
+DATA_TABLES: dict[str, type[BaseModel]] = {table.__tablename__: table for table in TABLES}
+
+
+def open_output(path: str, compress: bool) -> IO[str]:
+    if compress:
+        return gzip.open(path, "wt", compresslevel=GZIP_LEVEL, encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+@job_kind("export-table", concurrency=2, per_user=1)
+def export_table(context: JobContext) -> JobResult:
+    """
+    导出数据表
+
+    参数：``table`` 表名；``format`` 为 ``csv`` 或 ``jsonl``；``gzip`` 是否压缩
+    """
+    table_name = context.params["table"]
+    fmt = context.params.get("format", "csv")
+    suffix = EXPORT_FORMATS[fmt] + (".gz" if context.params.get("gzip", True) else "")
+    table = DATA_TABLES[table_name].__table__
+    name = context.result_file(suffix)
+
+    done = 0
+    with db.engine.connect() as connection, open_output(context.path(name), suffix.endswith(".gz")) as output:
+        total = connection.execute(select(func.count()).select_from(table)).scalar_one()
+        result = connection.execution_options(stream_results=True).execute(select(table).order_by(table.c.id))
+        names = list(result.keys())
+        writer = csv.writer(output)
+        if fmt == "csv":
+            writer.writerow(names)
+        for part in result.partitions(EXPORT_CHUNK):
+            if fmt == "csv":
+                writer.writerows(["" if value is None else value for value in row] for row in part)
+            else:
+                output.writelines(
+                    json.dumps(dict(zip(names, row)), ensure_ascii=False, default=str) + "\n" for row in part
+                )
+            done += len(part)
+            context.progress(done / total if total else 1.0, f"已导出 {done} / {total} 行")
+    return JobResult(file=name, filename=f"{table_name}{suffix}", message=f"已导出 {done} 行")
+
+
+def parse_bool(value: str) -> bool:
+    lowered = value.strip().lower()
+    if lowered in ("1", "true", "t", "yes", "y"):
+        return True
+    if lowered in ("0", "false", "f", "no", "n"):
+        return False
+    raise ValueError(f"invalid boolean {value!r}")
+
+
+def column_parser(column: Column[Any]) -> Callable[[str], Any]:
+    """
+    按字段类型解析单元格，空单元格为 None
+    """
+    python_type: type[Any]
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        python_type = str
+    parse: Callable[[str], Any]
+    # bool 是 int 的子类，datetime 是 date 的子类，须先判断
+    if issubclass(python_type, bool):
+        parse = parse_bool
+    elif issubclass(python_type, datetime):
+        parse = datetime.fromisoformat
+    elif issubclass(python_type, date):
+        parse = date.fromisoformat
+    elif issubclass(python_type, (int, float)):
+        parse = python_type
+    else:
+        parse = str
+    return lambda value: None if value == "" else parse(value)
+
+
+def count_records(path: str) -> int:
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        return max(sum(1 for _ in csv.reader(f)) - 1, 0)
+
+
+def commit_batch(batch: list[BaseModel], done: int) -> int:
+    """
+    提交一批记录
+
+    :return: 累计导入的行数
+    :rtype: int
+    """
+    db.session.add_all(batch)
+    try:
+        db.session.commit()
+    except IntegrityError as err:
+        db.session.rollback()
+        raise JobFailed(f"第 {done + 1}-{done + len(batch)} 条记录写入失败：{err.orig}（此前已导入 {done} 行）") from err
+    return done + len(batch)
+
+
+@job_kind("import-table", concurrency=1, per_user=1)
+def import_table(context: JobContext) -> JobResult:
+    """
+    从上传的 CSV 导入数据表，忽略 ``id`` 列
+
+    参数：``table`` 表名
+    """
+    table_name = context.params["table"]
+    model = DATA_TABLES[table_name]
+    table = model.__table__
+    if context.input_file is None:
+        raise JobFailed("缺少上传的文件")
+    path = context.path(context.input_file)
+    batch_size = current_app.config["JOBS_IMPORT_BATCH"]
+    total = count_records(path)
+
+    done = 0
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        headers = [name for name in reader.fieldnames or () if name != "id"]
+        if unknown := [name for name in headers if name not in table.c]:
+            raise JobFailed(f"未知的列：{', '.join(unknown)}")
+        parsers = {name: column_parser(table.c[name]) for name in headers}
+
+        batch: list[BaseModel] = []
+        for index, record in enumerate(reader, start=1):
+            try:
+                batch.append(model(**{name: parse(record[name] or "") for name, parse in parsers.items()}))
+            except ValueError as err:
+                raise JobFailed(f"第 {index} 条记录：{err}（此前已导入 {done} 行）") from err
+            if len(batch) >= batch_size:
+                done = commit_batch(batch, done)
+                batch = []
+                context.progress(done / total if total else 1.0, f"已导入 {done} / {total} 行")
+        if batch:
+            done = commit_batch(batch, done)
+    return JobResult(message=f"已导入 {done} 行")
+
+
+__all__ = (
+    "EXPORT_FORMATS",
+    "DATA_TABLES",
+    "export_table",
+    "import_table",
+)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+进程内的 Redis 替代实现
+
+仅实现应用用到的命令，用于基准测试和没有 Redis 服务的本地开发，
+数据不跨进程共享，多进程部署时必须使用真正的 Redis
+"""
+
+import threading
+import time
+from datetime import timedelta
+from typing import Any
+from typing import Optional
+
+MEMORY_SCHEME = "memory://"
+
+
+class MemoryRedis:
+    """
+    进程内的 Redis 替代实现，接口与 ``redis.StrictRedis(decode_responses=True)`` 一致
+    """
+
+    def __init__(self) -> None:
+        self._data: dict[str, tuple[Any, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_url(cls, _url: str, **_kwargs: Any) -> "MemoryRedis":
+        return cls()
+
+    def _get_alive(self, key: str) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expire_at = item
+        if expire_at is not None and expire_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def ping(self) -> bool:
+        return True
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._get_alive(key)
+        return None if value is None else str(value)
+
+    def set(self, key: str, value: Any, ex: Optional[int | timedelta] = None) -> bool:
+        if isinstance(ex, timedelta):
+            ex = int(ex.total_seconds())
+        with self._lock:
+            self._data[key] = (value, None if ex is None else time.monotonic() + ex)
+        return True
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        with self._lock:
+            value = int(self._get_alive(key) or 0) + amount
+            expire_at = self._data[key][1] if key in self._data else None
+            self._data[key] = (value, expire_at)
+        return value
+
+    def flushdb(self) -> bool:
+        with self._lock:
+            self._data.clear()
+        return True
+
+
+class AsyncMemoryRedis:
+    """
+    :py:class:`MemoryRedis` 的异步接口，与同步客户端共享数据
+    """
+
+    def __init__(self, store: MemoryRedis) -> None:
+        self.store = store
+
+    async def get(self, key: str) -> Optional[str]:
+        return self.store.get(key)
+
+    async def aclose(self) -> None:
+        pass
+
+
+__all__ = (
+    "MEMORY_SCHEME",
+    "MemoryRedis",
+    "AsyncMemoryRedis",
+)
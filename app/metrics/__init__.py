@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+接口监控指标
+
+所有接口都经过 :py:func:`app.api.api` 包装，在其中记录接口耗时、响应大小与数据库查询次数；
+进行中的请求数在请求开始与结束的钩子中记录；令牌黑名单的 Redis 命令耗时由 :py:mod:`app.redis_timing` 计时
+"""
+
+import tempfile
+import time
+from typing import Any
+from typing import Optional
+
+from flask import Flask
+from flask import Response
+from flask import current_app
+from flask import g
+from flask import has_app_context
+from flask import request
+
+from .registry import CONTENT_TYPE
+from .registry import Registry
+from ..database.timing import on_statement
+from ..extensions import jwt_redis_blocklist
+from ..redis_timing import ExecutedCommand
+from ..redis_timing import instrument_redis
+from ..redis_timing import on_command
+
+registry = Registry()
+
+REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds",
+    "Request latency by endpoint and API result code",
+    ("endpoint", "code"),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+RESPONSE_SIZE = registry.histogram(
+    "http_response_size_bytes",
+    "Response body size by endpoint",
+    ("endpoint",),
+    buckets=(128, 1024, 8192, 65536, 524288, 4194304, 33554432),
+)
+REQUEST_QUERIES = registry.histogram(
+    "http_request_db_queries",
+    "Database statements executed per request by endpoint",
+    ("endpoint",),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+REQUESTS_IN_FLIGHT = registry.gauge(
+    "http_requests_in_flight",
+    "Requests currently being processed",
+)
+REDIS_DURATION = registry.histogram(
+    "redis_command_duration_seconds",
+    "Redis command latency by command",
+    ("command",),
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5),
+)
+REQUESTS_COALESCED = registry.counter(
+    "http_requests_coalesced",
+    "Read requests answered with another request's response by endpoint and source (local or remote)",
+    ("endpoint", "source"),
+)
+CACHE_REQUESTS = registry.counter(
+    "response_cache_requests",
+    "Response cache lookups by endpoint and result (local, shared, coalesced, miss or bypass)",
+    ("endpoint", "result"),
+)
+CACHE_EVICTIONS = registry.counter(
+    "response_cache_evictions",
+    "Entries evicted from the in-process response cache",
+)
+CACHE_LOCAL_BYTES = registry.gauge(
+    "response_cache_local_bytes",
+    "Estimated bytes held by the in-process response cache",
+)
+
+METRICS_EXTENSION = "metrics"
+
+
+def enabled() -> bool:
+    return has_app_context() and METRICS_EXTENSION in current_app.extensions
+
+
+def request_started() -> None:
+    """
+    记录请求开始，对应 :py:func:`request_finished`
+    """
+    if not enabled():
+        return
+    g._metrics_started = time.perf_counter()
+    g._metrics_queries = 0
+    REQUESTS_IN_FLIGHT.inc()
+
+
+def request_finished() -> None:
+    # 应用上下文已存在时多个请求共用 g，因此结束时移除标记
+    if enabled() and g.pop("_metrics_started", None) is not None:
+        g.pop("_metrics_queries", None)
+        REQUESTS_IN_FLIGHT.dec()
+        registry.flush()
+
+
+def record_request(code: int, response: Response, started: Optional[float] = None) -> None:
+    """
+    记录接口的处理结果
+
+    耗时从请求开始的钩子算起，包括令牌验证；钩子未执行时从 ``started`` 算起
+
+    :param code: API 代码
+    :type code: int
+    :param response: 响应
+    :type response: Response
+    :param started: :py:func:`time.perf_counter` 表示的开始时间
+    :type started: Optional[float]
+    """
+    if not enabled():
+        return
+    started = g.get("_metrics_started", started)
+    endpoint = request.endpoint or "unknown"
+    if started is not None:
+        REQUEST_DURATION.observe(time.perf_counter() - started, endpoint=endpoint, code=str(code))
+    # 计算流式响应的长度需要读取整个响应体，此时只使用 Content-Length
+    size = response.content_length if response.is_streamed else response.calculate_content_length()
+    RESPONSE_SIZE.observe(size or 0, endpoint=endpoint)
+    REQUEST_QUERIES.observe(g.get("_metrics_queries", 0), endpoint=endpoint)
+
+
+def count_query(*_: Any) -> None:
+    if has_app_context() and "_metrics_queries" in g:
+        g._metrics_queries += 1
+
+
+def observe_command(executed: ExecutedCommand) -> None:
+    REDIS_DURATION.observe(executed.duration, command=executed.name)
+
+
+def metrics_directory(app: Flask) -> str:
+    """
+    获取多进程共享的指标目录，未配置时创建临时目录
+    """
+    if not app.config["METRICS_DIR"]:
+        app.config["METRICS_DIR"] = tempfile.mkdtemp(prefix="metrics-")
+    return str(app.config["METRICS_DIR"])
+
+
+def initialize_hooks(app: Flask) -> None:
+    if not app.config["METRICS_ENABLED"]:
+        return
+    app.extensions[METRICS_EXTENSION] = registry
+    registry.flush_interval = app.config["METRICS_FLUSH_SECONDS"]
+    if app.config["METRICS_DIR"]:
+        registry.use_directory(app.config["METRICS_DIR"])
+
+    # 所有引擎共用语句计时，包括异步引擎的同步部分；只在请求中计数
+    on_statement(count_query)
+    on_command(observe_command)
+    instrument_redis(jwt_redis_blocklist)
+
+    @app.before_request
+    def start() -> None:
+        request_started()
+
+    @app.teardown_request
+    def finish(_exc: Optional[BaseException]) -> None:
+        request_finished()
+
+
+__all__ = (
+    "CONTENT_TYPE",
+    "registry",
+    "REQUEST_DURATION",
+    "RESPONSE_SIZE",
+    "REQUEST_QUERIES",
+    "REQUESTS_IN_FLIGHT",
+    "REDIS_DURATION",
+    "REQUESTS_COALESCED",
+    "CACHE_REQUESTS",
+    "CACHE_EVICTIONS",
+    "CACHE_LOCAL_BYTES",
+    "request_started",
+    "request_finished",
+    "record_request",
+    "metrics_directory",
+    "initialize_hooks",
+)
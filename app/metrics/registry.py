@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+指标注册表
+
+指标值保存在进程内存中。多进程部署时，每个进程定期将全部指标写入目录中以进程号命名的文件，
+读取时合并目录中的所有文件：计数器与直方图求和；仪表只对仍在运行的进程求和，
+已退出进程的计数器继续计入，使总数保持单调递增
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from collections.abc import Iterable
+from collections.abc import Sequence
+from typing import ClassVar
+from typing import Optional
+
+type Labels = tuple[str, ...]
+type Series = dict[Labels, list[float]]
+type Snapshot = dict[str, list[tuple[list[str], list[float]]]]
+
+FILE_SUFFIX = ".json"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metric:
+    """
+    指标基类，每个标签组合对应一个序列，序列的值为一组浮点数
+    """
+    kind: ClassVar[str]
+    aggregate_dead: ClassVar[bool] = True
+    """
+    合并时是否计入已退出进程的值
+    """
+
+    def __init__(self, registry: "Registry", name: str, documentation: str, labelnames: Sequence[str]) -> None:
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.series: Series = {}
+
+    def initial(self) -> list[float]:
+        return [0.0]
+
+    def labels_of(self, labels: dict[str, str]) -> Labels:
+        if labels.keys() != set(self.labelnames):
+            raise ValueError(f"metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def values(self, labels: dict[str, str]) -> list[float]:
+        """
+        获取序列，调用方需持有注册表的锁
+        """
+        key = self.labels_of(labels)
+        if (values := self.series.get(key)) is None:
+            values = self.series[key] = self.initial()
+        return values
+
+    def samples(self, labels: Labels, values: list[float]) -> Iterable[tuple[str, dict[str, str], float]]:
+        yield self.name, dict(zip(self.labelnames, labels)), values[0]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        with self.registry.lock:
+            self.values(labels)[0] += amount
+
+    def samples(self, labels: Labels, values: list[float]) -> Iterable[tuple[str, dict[str, str], float]]:
+        yield f"{self.name}_total", dict(zip(self.labelnames, labels)), values[0]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+    aggregate_dead = False
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        with self.registry.lock:
+            self.values(labels)[0] += amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """
+    直方图，序列的值依次为各桶（不累计）的计数、总和与总数
+    """
+    kind = "histogram"
+
+    def __init__(
+            self,
+            registry: "Registry",
+            name: str,
+            documentation: str,
+            labelnames: Sequence[str],
+            buckets: Sequence[float],
+    ) -> None:
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def initial(self) -> list[float]:
+        return [0.0] * (len(self.buckets) + 3)
+
+    def observe(self, value: float, **labels: str) -> None:
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self.registry.lock:
+            values = self.values(labels)
+            values[index] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def samples(self, labels: Labels, values: list[float]) -> Iterable[tuple[str, dict[str, str], float]]:
+        base = dict(zip(self.labelnames, labels))
+        cumulative = 0.0
+        for bound, count in zip((*self.buckets, math.inf), values):
+            cumulative += count
+            yield f"{self.name}_bucket", base | dict(le=format_value(bound)), cumulative
+        yield f"{self.name}_sum", base, values[-2]
+        yield f"{self.name}_count", base, values[-1]
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(int(value)) if value == int(value) else repr(value)
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def sample_line(name: str, labels: dict[str, str], value: float) -> str:
+    if not labels:
+        return f"{name} {format_value(value)}"
+    label_text = ",".join(f'{key}="{escape(label)}"' for key, label in labels.items())
+    return f"{name}{{{label_text}}} {format_value(value)}"
+
+
+def pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    if os.name != "posix":
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Registry:
+    """
+    指标注册表
+
+    :ivar directory: 多进程共享的指标目录，为 None 时只使用本进程的指标
+    :ivar flush_interval: 两次写入指标文件之间的最短间隔（秒）
+    """
+
+    def __init__(self) -> None:
+        self.metrics: dict[str, Metric] = {}
+        self.lock = threading.Lock()
+        self.directory: Optional[str] = None
+        self.flush_interval = 1.0
+        self.last_flush = 0.0
+
+    def register[M: Metric](self, metric: M) -> M:
+        if metric.name in self.metrics:
+            raise ValueError(f"duplicate metric {metric.name!r}")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(self, name, documentation, labelnames))
+
+    def histogram(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Sequence[str] = (),
+            *,
+            buckets: Sequence[float],
+    ) -> Histogram:
+        return self.register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def reset(self) -> None:
+        """
+        清空本进程的指标，子进程启动时调用，丢弃从主进程继承的值
+        """
+        with self.lock:
+            for metric in self.metrics.values():
+                metric.series.clear()
+        self.last_flush = 0.0
+
+    def snapshot(self) -> Snapshot:
+        with self.lock:
+            return {
+                name: [(list(labels), list(values)) for labels, values in metric.series.items()]
+                for name, metric in self.metrics.items()
+            }
+
+    def use_directory(self, directory: Optional[str], *, clear: bool = False) -> None:
+        """
+        设置多进程共享的指标目录
+
+        :param directory: 目录，为 None 时只使用本进程的指标
+        :type directory: Optional[str]
+        :param clear: 是否删除目录中已有的指标文件，服务器启动时使用
+        :type clear: bool
+        """
+        self.directory = directory
+        if directory is None:
+            return
+        os.makedirs(directory, exist_ok=True)
+        if clear:
+            for name in os.listdir(directory):
+                if name.endswith(FILE_SUFFIX):
+                    os.remove(os.path.join(directory, name))
+
+    def flush(self, *, force: bool = False) -> None:
+        """
+        将本进程的指标写入文件，距上次写入不足 ``flush_interval`` 时跳过，除非 ``force`` 为真
+        """
+        if self.directory is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.last_flush < self.flush_interval:
+            return
+        self.last_flush = now
+        pid = os.getpid()
+        path = os.path.join(self.directory, f"{pid}{FILE_SUFFIX}")
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(dict(pid=pid, metrics=self.snapshot()), f)
+        os.replace(temporary, path)
+
+    def load_snapshots(self) -> list[tuple[bool, Snapshot]]:
+        """
+        读取所有进程的指标
+
+        :return: 每个进程是否仍在运行及其指标
+        :rtype: list[tuple[bool, Snapshot]]
+        """
+        if self.directory is None:
+            return [(True, self.snapshot())]
+        self.flush(force=True)
+        snapshots = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(FILE_SUFFIX):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                    content = json.load(f)
+            except (OSError, ValueError):
+                continue
+            snapshots.append((pid_alive(content["pid"]), content["metrics"]))
+        return snapshots
+
+    def collect(self) -> dict[str, Series]:
+        """
+        合并所有进程的指标
+
+        :return: 指标名到序列的映射
+        :rtype: dict[str, Series]
+        """
+        merged: dict[str, Series] = {name: {} for name in self.metrics}
+        for alive, snapshot in self.load_snapshots():
+            for name, series in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None or not (alive or metric.aggregate_dead):
+                    continue
+                for labels, values in series:
+                    total = merged[name].setdefault(tuple(labels), metric.initial())
+                    if len(total) != len(values):
+                        continue
+                    for i, value in enumerate(values):
+                        total[i] += value
+        return merged
+
+    def expose(self) -> str:
+        """
+        以 Prometheus 文本格式输出所有进程合并后的指标
+        """
+        lines = []
+        for name, series in self.collect().items():
+            metric = self.metrics[name]
+            lines.append(f"# HELP {name} {escape(metric.documentation)}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for labels, values in sorted(series.items()):
+                lines.extend(sample_line(*sample) for sample in metric.samples(labels, values))
+        return "\n".join(lines) + "\n"
+
+
+__all__ = (
+    "CONTENT_TYPE",
+    "Metric",
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "Registry",
+)
@@ -2,3 +2,4 @@
 
 from . import data  # noqa: F401
 from . import auth  # noqa: F401
+from . import system  # noqa: F401
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+
+from sqlalchemy import Boolean
+from sqlalchemy import Column
+from sqlalchemy import Float
+from sqlalchemy import Index
+from sqlalchemy import Integer
+from sqlalchemy import String
+from sqlalchemy import Text
+
+from ..extensions import db
+
+# 应用元数据（键值对），记录种子数据摘要等内部状态，不对外提供接口
+app_meta = db.Table(
+    "app_meta",
+    Column("key", String(128), primary_key=True),
+    Column("value", String(256), nullable=False),
+)
+
+# 各数据表的变更版本：version 为最新一次变更的版本号，compacted 以前（含）的变更记录已被丢弃
+table_versions = db.Table(
+    "table_versions",
+    Column("table_name", String(64), primary_key=True),
+    Column("version", Integer, nullable=False, default=0),
+    Column("compacted", Integer, nullable=False, default=0),
+)
+
+# 数据表变更记录，与数据写入在同一事务中追加，op 为 insert / update / delete
+change_log = db.Table(
+    "change_log",
+    Column("table_name", String(64), primary_key=True),
+    Column("version", Integer, primary_key=True),
+    Column("row_id", Integer, nullable=False),
+    Column("op", String(8), nullable=False),
+    Index("ix_change_log_row", "table_name", "row_id"),
+)
+
+# 后台任务：state 为 queued / running / succeeded / failed / cancelled，时间均为 Unix 时间戳，
+# 文件名相对于 JOBS_DIR，input_file 为导入等任务上传的文件，result_file 为可下载的结果
+jobs = db.Table(
+    "jobs",
+    Column("id", Integer, primary_key=True),
+    Column("kind", String(32), nullable=False),
+    Column("user_id", Integer, nullable=True),
+    Column("state", String(16), nullable=False),
+    Column("params", Text, nullable=False),
+    Column("progress", Float, nullable=False, default=0),
+    Column("message", String(256), nullable=True),
+    Column("input_file", String(128), nullable=True),
+    Column("result_file", String(128), nullable=True),
+    Column("result_name", String(256), nullable=True),
+    Column("cancel_requested", Boolean, nullable=False, default=False),
+    Column("created_at", Float, nullable=False),
+    Column("started_at", Float, nullable=True),
+    Column("finished_at", Float, nullable=True),
+    Column("heartbeat_at", Float, nullable=True),
+    Index("ix_jobs_state", "state", "kind"),
+    Index("ix_jobs_user", "user_id", "state"),
+)
+
+
+__all__ = (
+    "app_meta",
+    "table_versions",
+    "change_log",
+    "jobs",
+)
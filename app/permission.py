@@ -1,20 +1,24 @@
 # -*- coding: utf-8 -*-
 
 
+import functools
 from collections.abc import Callable, Collection
 from collections.abc import Iterable
 from enum import StrEnum
 from typing import Any
 from typing import cast
 
+from flask import current_app
 from flask import g
 from flask_jwt_extended import current_user
+from flask_jwt_extended import verify_jwt_in_request
 from werkzeug.local import LocalProxy
 from wrapt import decorator  # type: ignore[import-untyped]
 
 from .api import APIResult
 from .api import PermissionDenied
 from .models.auth import User
+from .tracing import span
 
 
 class PERMISSIONS:
@@ -45,6 +49,31 @@ class PERMISSIONS:
         UPDATE = "data/update"
         DELETE = "data/delete"
 
+    class SYSTEM(StrEnum):
+        METRICS = "system/metrics"
+        PROFILES = "system/profiles"
+
+
+def jwt_required[F: Callable[..., Any]](**options: Any) -> Callable[[F], F]:
+    """
+    要求请求带有有效的令牌，同 ``flask_jwt_extended.jwt_required``，
+    令牌验证（包括黑名单查询与用户加载）在追踪中记录为 ``jwt_required`` 跨度
+
+    :param options: 传给 ``verify_jwt_in_request`` 的参数，如 ``optional=True``
+    :type options: Any
+    """
+
+    def wrapper(func: F) -> F:
+        @functools.wraps(func)
+        def inner(*args: Any, **kwargs: Any) -> Any:
+            with span("jwt_required", "auth"):
+                verify_jwt_in_request(**options)
+            return current_app.ensure_sync(func)(*args, **kwargs)
+
+        return cast(F, inner)
+
+    return wrapper
+
 
 def verify_permissions_in_request(
         permission_names: Collection[str],
@@ -109,7 +138,9 @@ def permissions_required[C: Callable[..., APIResult]](
     def wrapper(func: C) -> C:
         @decorator  # type: ignore[misc]
         def inner(wrapped: C, _instance: Any, args: tuple[Any, ...], kwargs: dict[str, Any]) -> Any:
-            if not verify_permissions_in_request(permission_names, strategy=strategy, check_active=check_active):
+            with span("permissions_required", "auth"):
+                allowed = verify_permissions_in_request(permission_names, strategy=strategy, check_active=check_active)
+            if not allowed:
                 return PermissionDenied(missing_permissions=get_missing_permissions())
 
             return wrapped(*args, **kwargs)
@@ -189,6 +220,7 @@ account_active = LocalProxy(get_account_active)
 __all__ = (
     "PERMISSIONS",
 
+    "jwt_required",
     "verify_permissions_in_request",
     "permissions_required",
 
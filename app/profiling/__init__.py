@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+按需剖析
+
+对单个请求同时进行调用剖析（:py:mod:`cProfile`）与内存分配追踪（:py:mod:`tracemalloc`），
+结果连同端点与参数保存到 ``PROFILE_DIR``，管理员通过 ``/api/profiles`` 查看与下载。
+
+触发方式：
+
+* 请求头 ``X-Profile-Token`` 携带由 ``PROFILE_SECRET`` 签名的令牌，令牌由 ``flask profile-token`` 生成
+* 按 ``PROFILE_SAMPLE_RATE`` 随机采样，可通过 ``PROFILE_ENDPOINTS`` 限定端点
+
+未触发的请求只做一次请求头查找与一次随机数比较。两种剖析都作用于整个进程，
+因此同一进程中同时只剖析一个请求，其余被触发的请求照常处理但不剖析
+"""
+
+import cProfile
+import hashlib
+import hmac
+import itertools
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass
+from dataclasses import field
+from datetime import datetime
+from typing import Any
+from typing import Optional
+
+import click
+from flask import Flask
+from flask import Response
+from flask import current_app
+from flask import g
+from flask import request
+
+from .storage import FILE_SUFFIXES
+from .storage import ProfileStore
+
+PROFILING_EXTENSION = "profiling"
+TOKEN_HEADER = "X-Profile-Token"
+TOP_ENTRIES = 30
+"""
+元数据中记录的耗时最多的函数数与分配最多的代码行数
+"""
+
+_capture_lock = threading.Lock()
+_capture_ids = itertools.count(1)
+
+
+def sign_token(secret: str, expires: int) -> str:
+    """
+    生成触发剖析的令牌
+
+    :param secret: 签名密钥
+    :type secret: str
+    :param expires: 过期时间（Unix 时间戳）
+    :type expires: int
+
+    :return: ``<过期时间>.<签名>``
+    :rtype: str
+    """
+    signature = hmac.new(secret.encode(), f"profile:{expires}".encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{signature}"
+
+
+def verify_token(secret: str, token: str) -> bool:
+    """
+    验证令牌的签名与有效期
+    """
+    expires, _, _signature = token.partition(".")
+    if not secret or not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(sign_token(secret, int(expires)), token)
+
+
+@dataclass(frozen=True)
+class ProfilingSettings:
+    store: ProfileStore
+    secret: str
+    sample_rate: float
+    endpoints: frozenset[str]
+    frames: int
+
+
+@dataclass
+class Capture:
+    """
+    一次进行中的剖析
+    """
+    trigger: str
+    frames: int
+    profile: cProfile.Profile = field(default_factory=cProfile.Profile)
+    baseline: Optional[tracemalloc.Snapshot] = None
+    """
+    开始前已在追踪内存分配时，开始时的快照
+    """
+    started: float = 0
+
+    def start(self) -> None:
+        if tracemalloc.is_tracing():
+            self.baseline = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start(self.frames)
+        self.started = time.perf_counter()
+        # 最后开始、最先结束，调用剖析不包括内存快照的耗时
+        self.profile.enable()
+
+    def stop(self) -> tuple[float, tracemalloc.Snapshot, int]:
+        """
+        结束剖析
+
+        :return: 耗时（秒）、内存分配快照与内存峰值（字节）
+        :rtype: tuple[float, tracemalloc.Snapshot, int]
+        """
+        self.profile.disable()
+        duration = time.perf_counter() - self.started
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+        _size, peak = tracemalloc.get_traced_memory()
+        if self.baseline is None:
+            tracemalloc.stop()
+        return duration, snapshot, peak
+
+
+def requested_trigger(settings: ProfilingSettings) -> Optional[str]:
+    """
+    判断当前请求是否需要剖析
+
+    :return: 触发方式 ``header`` 或 ``sample``，不需要剖析时返回 None
+    :rtype: Optional[str]
+    """
+    token = request.headers.get(TOKEN_HEADER)
+    if token is not None and verify_token(settings.secret, token):
+        return "header"
+    if settings.sample_rate > 0 and random.random() < settings.sample_rate:
+        if not settings.endpoints or request.endpoint in settings.endpoints:
+            return "sample"
+    return None
+
+
+def top_functions(profile: cProfile.Profile) -> list[dict[str, Any]]:
+    # typeshed 未声明 Stats.stats，get_stats_profile 又会合并同名函数
+    stats: dict[tuple[str, int, str], tuple[int, int, float, float, Any]] = getattr(pstats.Stats(profile), "stats")
+    entries = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)
+    return [
+        dict(function=f"{file}:{line}({name})", calls=nc, primitive_calls=cc, total=tt, cumulative=ct)
+        for (file, line, name), (cc, nc, tt, ct, _callers) in entries[:TOP_ENTRIES]
+    ]
+
+
+def top_allocations(snapshot: tracemalloc.Snapshot, baseline: Optional[tracemalloc.Snapshot]) -> list[dict[str, Any]]:
+    if baseline is not None:
+        differences = snapshot.compare_to(baseline, "lineno")[:TOP_ENTRIES]
+        return [
+            dict(location=f"{d.traceback[0].filename}:{d.traceback[0].lineno}", size=d.size_diff, count=d.count_diff)
+            for d in differences
+        ]
+    return [
+        dict(location=f"{s.traceback[0].filename}:{s.traceback[0].lineno}", size=s.size, count=s.count)
+        for s in snapshot.statistics("lineno")[:TOP_ENTRIES]
+    ]
+
+
+def begin_capture(trigger: str, frames: int) -> None:
+    if not _capture_lock.acquire(blocking=False):
+        return
+    capture = Capture(trigger=trigger, frames=frames)
+    try:
+        capture.start()
+    except BaseException:
+        _capture_lock.release()
+        raise
+    g._profile_capture = capture
+
+
+def finish_capture(status: Optional[int]) -> None:
+    """
+    结束当前请求的剖析并保存，请求未被剖析或已保存时不做任何事
+
+    :param status: HTTP 状态码，请求因异常结束时为 None
+    :type status: Optional[int]
+    """
+    capture: Optional[Capture] = g.pop("_profile_capture", None)
+    if capture is None:
+        return
+    try:
+        duration, snapshot, peak = capture.stop()
+    finally:
+        _capture_lock.release()
+
+    settings: ProfilingSettings = current_app.extensions[PROFILING_EXTENSION]
+    now = datetime.now().astimezone()
+    meta = dict(
+        id=f"{now:%Y%m%d-%H%M%S}-{os.getpid()}-{next(_capture_ids)}",
+        time=now.isoformat(timespec="milliseconds"),
+        method=request.method,
+        path=request.path,
+        endpoint=request.endpoint,
+        view_args=request.view_args or {},
+        query=request.args.to_dict(flat=False),
+        status=status,
+        duration=duration,
+        trigger=capture.trigger,
+        peak_memory=peak,
+        functions=top_functions(capture.profile),
+        allocations=top_allocations(snapshot, capture.baseline),
+        files=list(FILE_SUFFIXES),
+    )
+    settings.store.save(meta, capture.profile, snapshot)
+
+
+def profile_directory(app: Flask) -> str:
+    """
+    获取剖析结果目录，未配置时使用实例目录下的 ``profiles``
+    """
+    return str(app.config["PROFILE_DIR"] or os.path.join(app.instance_path, "profiles"))
+
+
+def get_store() -> ProfileStore:
+    settings: ProfilingSettings = current_app.extensions[PROFILING_EXTENSION]
+    return settings.store
+
+
+def initialize_hooks(app: Flask) -> None:
+    """
+    注册剖析所需的钩子，未配置 ``PROFILE_SECRET`` 且采样率为 0 时不注册
+    """
+    settings = ProfilingSettings(
+        store=ProfileStore(profile_directory(app), app.config["PROFILE_MAX_CAPTURES"]),
+        secret=app.config["PROFILE_SECRET"],
+        sample_rate=app.config["PROFILE_SAMPLE_RATE"],
+        endpoints=frozenset(filter(None, (e.strip() for e in app.config["PROFILE_ENDPOINTS"].split(",")))),
+        frames=app.config["PROFILE_TRACEMALLOC_FRAMES"],
+    )
+    # 未启用时仍可查看已保存的剖析
+    app.extensions[PROFILING_EXTENSION] = settings
+    if not settings.secret and settings.sample_rate <= 0:
+        return
+
+    @app.before_request
+    def start_profile() -> None:
+        trigger = requested_trigger(settings)
+        if trigger is not None:
+            begin_capture(trigger, settings.frames)
+
+    @app.after_request
+    def stop_profile[R: Response](response: R) -> R:
+        finish_capture(response.status_code)
+        return response
+
+    @app.teardown_request
+    def discard_profile(_exc: Optional[BaseException]) -> None:
+        # 未经过 after_request（未处理的异常）时在此结束
+        finish_capture(None)
+
+
+def initialize_commands(app: Flask) -> None:
+    @app.cli.command("profile-token")
+    @click.option("--minutes", type=int, default=10, show_default=True, help="有效期（分钟）")
+    def profile_token(minutes: int) -> None:
+        """生成触发剖析的请求头"""
+        secret = app.config["PROFILE_SECRET"]
+        if not secret:
+            raise click.ClickException("未配置 PROFILE_SECRET，无法生成令牌")
+        print(f"{TOKEN_HEADER}: {sign_token(secret, int(time.time()) + minutes * 60)}")
+
+
+__all__ = (
+    "FILE_SUFFIXES",
+    "ProfileStore",
+    "TOKEN_HEADER",
+    "sign_token",
+    "verify_token",
+    "Capture",
+    "begin_capture",
+    "finish_capture",
+    "profile_directory",
+    "get_store",
+    "initialize_hooks",
+    "initialize_commands",
+)
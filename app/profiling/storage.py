@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+
+import cProfile
+import json
+import os
+import re
+import tracemalloc
+from typing import Any
+from typing import Optional
+
+META_SUFFIX = ".json"
+FILE_SUFFIXES = {
+    "cprofile": ".prof",
+    "tracemalloc": ".tracemalloc",
+}
+"""
+可下载的文件类型到文件后缀的映射：``cprofile`` 为 :py:mod:`pstats` 格式，``tracemalloc`` 为
+:py:meth:`tracemalloc.Snapshot.dump` 的输出
+"""
+CAPTURE_ID = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9]+-[0-9]+$")
+SUMMARY_FIELDS = ("id", "time", "method", "path", "endpoint", "status", "duration", "trigger", "peak_memory")
+
+
+class ProfileStore:
+    """
+    剖析结果的存储，每次剖析保存元数据与两个文件，超过 ``max_captures`` 时删除最早的剖析
+
+    :ivar directory: 存储目录
+    :ivar max_captures: 最多保留的剖析数
+    """
+
+    def __init__(self, directory: str, max_captures: int) -> None:
+        self.directory = directory
+        self.max_captures = max_captures
+
+    def path(self, capture_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{capture_id}{suffix}")
+
+    def save(self, meta: dict[str, Any], profile: cProfile.Profile, snapshot: tracemalloc.Snapshot) -> None:
+        """
+        保存一次剖析
+
+        :param meta: 元数据，需包含 ``id``
+        :type meta: dict[str, Any]
+        :param profile: 调用剖析
+        :type profile: cProfile.Profile
+        :param snapshot: 内存分配快照
+        :type snapshot: tracemalloc.Snapshot
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        capture_id = meta["id"]
+        profile.dump_stats(self.path(capture_id, FILE_SUFFIXES["cprofile"]))
+        snapshot.dump(self.path(capture_id, FILE_SUFFIXES["tracemalloc"]))
+        # 元数据最后写入，列表中只出现完整的剖析
+        with open(self.path(capture_id, META_SUFFIX), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        self.prune()
+
+    def ids(self) -> list[str]:
+        """
+        获取所有剖析的 ID，按时间先后排列
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        names = (name.removesuffix(META_SUFFIX) for name in os.listdir(self.directory) if name.endswith(META_SUFFIX))
+        return sorted(name for name in names if CAPTURE_ID.match(name))
+
+    def load(self, capture_id: str) -> Optional[dict[str, Any]]:
+        """
+        读取剖析的元数据
+
+        :param capture_id: 剖析 ID
+        :type capture_id: str
+
+        :return: 元数据，剖析不存在时返回 None
+        :rtype: Optional[dict[str, Any]]
+        """
+        if not CAPTURE_ID.match(capture_id):
+            return None
+        try:
+            with open(self.path(capture_id, META_SUFFIX), encoding="utf-8") as f:
+                meta: dict[str, Any] = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta
+
+    def summaries(self) -> list[dict[str, Any]]:
+        """
+        获取所有剖析的摘要，最新的在前
+        """
+        summaries = []
+        for capture_id in reversed(self.ids()):
+            if (meta := self.load(capture_id)) is not None:
+                summaries.append({k: meta.get(k) for k in SUMMARY_FIELDS})
+        return summaries
+
+    def file(self, capture_id: str, kind: str) -> Optional[str]:
+        """
+        获取剖析文件的路径
+
+        :param capture_id: 剖析 ID
+        :type capture_id: str
+        :param kind: 文件类型，见 :py:data:`FILE_SUFFIXES`
+        :type kind: str
+
+        :return: 文件路径，不存在时返回 None
+        :rtype: Optional[str]
+        """
+        if not CAPTURE_ID.match(capture_id) or kind not in FILE_SUFFIXES:
+            return None
+        path = self.path(capture_id, FILE_SUFFIXES[kind])
+        return path if os.path.exists(path) else None
+
+    def prune(self) -> None:
+        ids = self.ids()
+        for capture_id in ids[:max(0, len(ids) - self.max_captures)]:
+            for suffix in (META_SUFFIX, *FILE_SUFFIXES.values()):
+                try:
+                    os.remove(self.path(capture_id, suffix))
+                except FileNotFoundError:
+                    pass
+
+
+__all__ = (
+    "FILE_SUFFIXES",
+    "ProfileStore",
+)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Redis 命令计时
+
+:py:func:`instrument_redis` 包装客户端的方法，每条命令只计时一次，完成后依次通知通过
+:py:func:`on_command` 订阅的函数，如接口指标的命令耗时与请求追踪的跨度。
+与 :py:mod:`app.database.timing` 相对应
+"""
+
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+REDIS_COMMANDS = ("get", "set", "delete", "incr", "ping")
+"""
+计时的 Redis 命令，即令牌黑名单用到的命令
+"""
+
+
+@dataclass(frozen=True)
+class ExecutedCommand:
+    """
+    执行完成的 Redis 命令，包括执行失败的命令
+    """
+    name: str
+    start: float
+    """
+    :py:func:`time.perf_counter` 表示的开始时间
+    """
+    end: float
+
+    @property
+    def duration(self) -> float:
+        """
+        耗时（秒）
+        """
+        return self.end - self.start
+
+
+type CommandListener = Callable[[ExecutedCommand], None]
+
+_listeners: list[CommandListener] = []
+
+
+def on_command(listener: CommandListener) -> None:
+    """
+    订阅 Redis 命令执行完成的通知，重复订阅无效
+
+    :param listener: 接收 :py:class:`ExecutedCommand` 的函数
+    :type listener: CommandListener
+    """
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def timed_command(name: str, method: Callable[..., Any]) -> Callable[..., Any]:
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            executed = ExecutedCommand(name=name, start=start, end=time.perf_counter())
+            for listener in _listeners:
+                listener(executed)
+
+    return wrapper
+
+
+def instrument_redis(client: Any) -> None:
+    """
+    包装 Redis 客户端的方法以计时 :py:data:`REDIS_COMMANDS` 中的命令，重复调用无效
+    """
+    if getattr(client, "_timing_instrumented", False):
+        return
+    for name in REDIS_COMMANDS:
+        setattr(client, name, timed_command(name, getattr(client, name)))
+    client._timing_instrumented = True
+
+
+__all__ = (
+    "REDIS_COMMANDS",
+    "ExecutedCommand",
+    "CommandListener",
+    "on_command",
+    "instrument_redis",
+)
@@ -2,12 +2,15 @@
 
 
 import importlib
+import json
 from datetime import datetime
 from datetime import timedelta
 from datetime import timezone
 from typing import Any
+from typing import IO
 from typing import cast
 
+import click
 from flask import Flask
 from flask import Response
 from flask_jwt_extended import create_access_token
@@ -19,18 +22,19 @@ from .bp import bp
 from ...api import APIResult
 from ...api import Unauthorized
 from ...api import api
+from ...database import PasswordHash
+from ...database import Ref
+from ...database import SeedSet
 from ...extensions import jwt
 from ...extensions import jwt_redis_blocklist
 from ...models.auth import User
-
-
-importlib.import_module(".account", __package__)
-importlib.import_module(".permission", __package__)
-importlib.import_module(".role", __package__)
+from ...permission import PERMISSIONS
+from ...tracing import traced
 
 
 def initialize_hooks(app: Flask) -> None:  # noqa: C901 (too complex)
     @jwt.token_in_blocklist_loader
+    @traced("token_in_blocklist", "auth")
     def check_if_token_is_revoked(_jwt_header: dict[str, Any], jwt_payload: dict[str, Any]) -> bool:
         jti = jwt_payload["jti"]
         token_in_redis = jwt_redis_blocklist.get(jti)
@@ -43,6 +47,7 @@ def initialize_hooks(app: Flask) -> None:  # noqa: C901 (too complex)
         return str(user)
 
     @jwt.user_lookup_loader
+    @traced("user_lookup", "auth")
     def user_lookup_callback(_jwt_header: dict[str, Any], jwt_data: dict[str, Any]) -> User | None:
         identity = jwt_data["sub"]
         return cast(User | None, User.query.filter_by(id=identity).one_or_none())
@@ -53,6 +58,7 @@ def initialize_hooks(app: Flask) -> None:  # noqa: C901 (too complex)
         return Unauthorized()
 
     @app.after_request
+    @traced("refresh_expiring_jwts", "auth")
     def refresh_expiring_jwts[R: Response](response: R) -> R:
         try:
             jwt_info = get_jwt()
@@ -70,44 +76,77 @@ def initialize_hooks(app: Flask) -> None:  # noqa: C901 (too complex)
         return response
 
 
-def initialize_setup() -> None:
-    from ...extensions import db
-    from ...models.auth import Permission
-    from ...permission import PERMISSIONS
-    from ...models.auth import Role
-
-    print("正在初始化身份验证系统")
-    print()
-
-    # 创建权限
-    for name, desc in {
-        PERMISSIONS.ACCOUNT.CREATE: "创建账户",
-        PERMISSIONS.ACCOUNT.GET: "获取账户",
-        PERMISSIONS.ACCOUNT.LIST: "获取账户列表",
-        PERMISSIONS.ACCOUNT.UPDATE: "更新账户信息",
-        PERMISSIONS.ACCOUNT.UPDATE_SELF_PASSWORD: "更新自身密码",  # todo 待实装前端
-        PERMISSIONS.ACCOUNT.DELETE: "删除账户",
-        PERMISSIONS.ROLE.GET: "获取角色",
-        PERMISSIONS.ROLE.CREATE: "创建角色",
-        PERMISSIONS.ROLE.DELETE: "删除角色",
-        PERMISSIONS.PERMISSION.GET: "获取权限",
-        PERMISSIONS.TABLE.GET: "获取数据表",
-        PERMISSIONS.TABLE.LIST: "获取数据表列表",
-        PERMISSIONS.DATA.GET: "获取数据",
-        PERMISSIONS.DATA.LIST: "获取数据列表",
-        PERMISSIONS.DATA.CREATE: "创建数据",
-        PERMISSIONS.DATA.UPDATE: "更新数据",
-        PERMISSIONS.DATA.DELETE: "删除数据",
-    }.items():
-        print(f"创建权限：{name}")
-        # noinspection SpellCheckingInspection
-        db.session.add(Permission(name=name, description=desc))
-        db.session.commit()
+def load_views() -> None:
+    """
+    导入视图模块，将路由注册到蓝图
+    """
+    importlib.import_module(".account", __package__)
+    importlib.import_module(".permission", __package__)
+    importlib.import_module(".role", __package__)
+
+
+def initialize_commands(app: Flask) -> None:
+    @app.cli.command("create-accounts")
+    @click.argument("file", type=click.File("r", encoding="utf-8"))
+    @click.option("--workers", type=int, default=None, help="计算密码哈希的进程数")
+    def create_accounts(file: IO[str], workers: int | None) -> None:
+        """从 JSON 文件批量创建账户"""
+        from marshmallow import ValidationError
 
-    print()
+        from .account import UserCreateSchema
+        from .account import provision_accounts
 
-    # 创建角色
-    for name, (desc, permissions) in {
+        try:
+            accounts = UserCreateSchema(many=True).load(json.load(file), unknown="raise")
+        except ValidationError as err:
+            raise click.ClickException(f"账户数据格式错误：{err.messages}")
+
+        print(f"正在创建 {len(accounts)} 个账户")
+        results = provision_accounts(accounts, workers=workers)
+        for result in results:
+            if result["success"]:
+                print(f"创建用户：{result['username']} (id={result['id']})")
+            else:
+                print(f"跳过用户：{result['username']} {result['errors']}")
+        print(f"账户创建完成，成功 {sum(r['success'] for r in results)} 个，失败 {sum(not r['success'] for r in results)} 个")
+
+
+def seed_sets() -> list[SeedSet]:
+    """
+    身份验证系统的种子数据：权限、角色及默认用户
+
+    :return: 种子数据集
+    :rtype: list[SeedSet]
+    """
+    permissions = SeedSet("权限")
+    permissions.add("permissions", *(
+        dict(name=name, description=desc)
+        for name, desc in {
+            PERMISSIONS.ACCOUNT.CREATE: "创建账户",
+            PERMISSIONS.ACCOUNT.GET: "获取账户",
+            PERMISSIONS.ACCOUNT.LIST: "获取账户列表",
+            PERMISSIONS.ACCOUNT.UPDATE: "更新账户信息",
+            PERMISSIONS.ACCOUNT.UPDATE_SELF_PASSWORD: "更新自身密码",  # todo 待实装前端
+            PERMISSIONS.ACCOUNT.DELETE: "删除账户",
+            PERMISSIONS.ROLE.GET: "获取角色",
+            PERMISSIONS.ROLE.CREATE: "创建角色",
+            PERMISSIONS.ROLE.DELETE: "删除角色",
+            PERMISSIONS.PERMISSION.GET: "获取权限",
+            PERMISSIONS.TABLE.GET: "获取数据表",
+            PERMISSIONS.TABLE.LIST: "获取数据表列表",
+            PERMISSIONS.DATA.GET: "获取数据",
+            PERMISSIONS.DATA.LIST: "获取数据列表",
+            PERMISSIONS.DATA.CREATE: "创建数据",
+            PERMISSIONS.DATA.UPDATE: "更新数据",
+            PERMISSIONS.DATA.DELETE: "删除数据",
+            PERMISSIONS.SYSTEM.METRICS: "获取监控指标",
+            PERMISSIONS.SYSTEM.PROFILES: "查看与下载请求剖析",
+        }.items()
+    ))
+
+    roles = SeedSet("角色")
+    # 角色名到描述与权限名
+    role_seeds: dict[str, tuple[str, list[str]]] = {
         "admin": ("管理员", [
             PERMISSIONS.ACCOUNT.GET,
             PERMISSIONS.ACCOUNT.LIST,
@@ -126,28 +165,32 @@ def initialize_setup() -> None:
             PERMISSIONS.DATA.CREATE,
             PERMISSIONS.DATA.UPDATE,
             PERMISSIONS.DATA.DELETE,
+            PERMISSIONS.SYSTEM.METRICS,
+            PERMISSIONS.SYSTEM.PROFILES,
         ]),
         "user": ("用户", [
             PERMISSIONS.ACCOUNT.UPDATE_SELF_PASSWORD,
         ])
-    }.items():
-        print(f"创建角色：{name}")
-        db.session.add(Role.create(name=name, description=desc, permissions=cast(list[str], permissions)))
-        db.session.commit()
-
-    print()
-
-    # 创建用户
-    for name, (password, roles) in {
+    }
+    for name, (desc, permission_names) in role_seeds.items():
+        roles.add("roles", dict(name=name, description=desc))
+        roles.add("role_permissions", *(
+            dict(role_id=Ref("roles", "name", name), permission_id=Ref("permissions", "name", permission))
+            for permission in permission_names
+        ))
+
+    users = SeedSet("默认用户")
+    for name, (password, role_names) in {
         "admin": ("admin", ["admin"]),
         "user": ("user", ["user"]),
     }.items():
-        print(f"创建用户：{name}")
-        db.session.add(User.create(username=name, password=password, roles=roles))
-        db.session.commit()
+        users.add("users", dict(username=name, password_hash=PasswordHash(password), active=True))
+        users.add("user_roles", *(
+            dict(user_id=Ref("users", "username", name), role_id=Ref("roles", "name", role))
+            for role in role_names
+        ))
 
-    print()
-    print("身份验证系统初始化完成")
+    return [permissions, roles, users]
 
 
-__all__ = ("bp", "initialize_hooks", "initialize_setup")
+__all__ = ("bp", "initialize_hooks", "load_views", "initialize_commands", "seed_sets")
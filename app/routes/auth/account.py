@@ -1,23 +1,33 @@
 # -*- coding: utf-8 -*-
 
 
-from collections.abc import Iterable
+import multiprocessing
+from collections import defaultdict
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+from typing import Optional
 from typing import cast
 
 from flask import current_app
 from flask_jwt_extended import create_access_token
 from flask_jwt_extended import get_jwt
 from flask_jwt_extended import get_jwt_identity
-from flask_jwt_extended import jwt_required
 from marshmallow import Schema
 from marshmallow import fields
+from sqlalchemy import insert
+from sqlalchemy import Subquery
+from sqlalchemy import select
+from werkzeug.security import generate_password_hash
 
 from .bp import bp
+from ..utils import JSONLike
 from ..utils import validate_json_arguments
 from ...api import APIArgumentError
 from ...api import APIException
 from ...api import APIResult
 from ...api import AccountNotFound
+from ...api import CreateAccounts
 from ...api import DisabledAccount
 from ...api import GetAccounts
 from ...api import LoginSuccess
@@ -26,11 +36,14 @@ from ...api import RequestSuccess
 from ...api import Unauthorized
 from ...api import WrongUsernameOrPassword
 from ...api import api
+from ...database import read_only
 from ...extensions import db
 from ...extensions import jwt_redis_blocklist
 from ...models.auth import Role
 from ...models.auth import User
+from ...models.auth import user_roles
 from ...permission import PERMISSIONS
+from ...permission import jwt_required
 from ...permission import passed_permissions
 from ...permission import permissions_required
 
@@ -63,7 +76,7 @@ def login() -> LoginSuccess | WrongUsernameOrPassword | DisabledAccount:
 
 
 @bp.route("/logout", methods=["POST"])
-@jwt_required()  # type: ignore[misc]
+@jwt_required()
 @api
 def logout() -> LogoutSuccess:
     """
@@ -80,8 +93,9 @@ def logout() -> LogoutSuccess:
 
 
 @bp.route("/whoami", methods=["GET"])
-@jwt_required()  # type: ignore[misc]
+@jwt_required()
 @api
+@read_only
 def whoami() -> GetAccounts | Unauthorized:
     """
     获取当前用户信息
@@ -108,10 +122,35 @@ class AccountsFilterSchema(Schema):
     roles = fields.List(fields.String(allow_none=False), allow_none=True)
 
 
+def account_roles(account_ids: Subquery) -> dict[int, list[str]]:
+    """
+    以一次查询获取多个账户的角色名
+
+    ``User.roles`` 为动态关系，不能以 ``selectinload`` 预加载，逐个账户读取时每个账户执行一次查询
+
+    :param account_ids: 账户 ID 的子查询，只有一列 ``id``
+    :type account_ids: Subquery
+
+    :return: 账户 ID 到角色名列表的映射，没有角色的账户不在其中
+    :rtype: dict[int, list[str]]
+    """
+    roles: dict[int, list[str]] = defaultdict(list)
+    rows = db.session.execute(
+        select(user_roles.c.user_id, Role.name)
+        .join(Role, Role.id == user_roles.c.role_id)
+        .where(user_roles.c.user_id.in_(select(account_ids.c.id)))
+        .order_by(user_roles.c.user_id, Role.id)
+    ).tuples()
+    for user_id, name in rows:
+        roles[user_id].append(name)
+    return roles
+
+
 @bp.route("/accounts", methods=["GET"])
-@jwt_required()  # type: ignore[misc]
+@jwt_required()
 @api
 @permissions_required([PERMISSIONS.ACCOUNT.LIST, PERMISSIONS.ACCOUNT.GET])
+@read_only
 def get_accounts() -> GetAccounts:
     """
     获取账户列表
@@ -120,28 +159,26 @@ def get_accounts() -> GetAccounts:
     """
     data = validate_json_arguments(AccountsFilterSchema, optional=True)
 
-    accounts: list[User]
-    if not data:
-        accounts = User.query.all()
-    else:
-        query = User.query
+    query = User.query
+    if data:
         if data.get("username") is not None:
             query = query.filter(User.username.like(f"%{data['username']}%"))
         if data.get("active") is not None:
             query = query.filter(User.active == data["active"])
         if data.get("roles") is not None:
             query = query.filter(User.roles.any(Role.name.in_(data["roles"])))
-        accounts = query.all()
+    accounts: list[User] = query.all()
+    roles = account_roles(query.with_entities(User.id).subquery())
 
     return GetAccounts(accounts=[
-        dict(id=v.id, username=v.username, roles=[r.name for r in cast(Iterable[Role], v.roles)], active=v.active) for v
-        in accounts])
+        dict(id=v.id, username=v.username, roles=roles.get(cast(int, v.id), []), active=v.active) for v in accounts])
 
 
 @bp.route("/accounts/<int:account_id>", methods=["GET"])
-@jwt_required()  # type: ignore[misc]
+@jwt_required()
 @api
 @permissions_required([PERMISSIONS.ACCOUNT.GET])
+@read_only
 def get_account(account_id: int) -> GetAccounts | AccountNotFound:
     """
     获取账户
@@ -222,7 +259,7 @@ def validation_password(password: str) -> None:
 
 
 @bp.route("/accounts", methods=["POST"])
-@jwt_required()  # type: ignore[misc]
+@jwt_required()
 @api
 @permissions_required([PERMISSIONS.ACCOUNT.CREATE])
 def create_account() -> APIResult:
@@ -255,6 +292,171 @@ def create_account() -> APIResult:
     return RequestSuccess()
 
 
+class UsersBatchCreateSchema(Schema):
+    """
+    批量创建用户请求
+    """
+    accounts = fields.List(fields.Nested(UserCreateSchema), required=True, allow_none=False)
+
+
+PARALLEL_HASH_THRESHOLD = 8
+"""
+密码数量达到该值时才使用多进程计算哈希
+"""
+
+
+def hash_passwords(passwords: list[str], workers: Optional[int] = None) -> list[str]:
+    """
+    计算密码哈希
+
+    密码数量较多时在多个进程中并行计算
+
+    :param passwords: 密码
+    :type passwords: list[str]
+    :param workers: 进程数，默认读取 ``PASSWORD_HASH_WORKERS`` 配置
+    :type workers: Optional[int]
+
+    :return: 与输入顺序一致的密码哈希
+    :rtype: list[str]
+    """
+    if workers is None:
+        workers = current_app.config["PASSWORD_HASH_WORKERS"]
+    workers = max(1, min(workers, len(passwords) // PARALLEL_HASH_THRESHOLD))
+    if workers == 1:
+        return [generate_password_hash(password) for password in passwords]
+
+    # 使用 spawn 避免在多线程服务进程中 fork
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        chunksize = max(1, len(passwords) // (workers * 4))
+        return list(executor.map(generate_password_hash, passwords, chunksize=chunksize))
+
+
+def collect_argument_errors(*validators: Callable[[], None]) -> dict[str, list[str]]:
+    """
+    收集参数验证错误
+
+    :param validators: 会抛出 :py:class:`APIException` 的验证函数
+    :type validators: Callable[[], None]
+
+    :return: 参数名到错误信息的映射
+    :rtype: dict[str, list[str]]
+    """
+    errors: dict[str, list[str]] = {}
+    for validator in validators:
+        try:
+            validator()
+        except APIException as err:
+            arguments = cast(APIArgumentError, err.result).arguments
+            for name, messages in cast(dict[str, list[str]], arguments).items():
+                errors.setdefault(name, []).extend(messages)
+    return errors
+
+
+def check_batch_accounts(
+        accounts: list[JSONLike],
+        role_ids: dict[str, int],
+        existing_usernames: set[str],
+) -> list[dict[str, Any]]:
+    """
+    验证批量创建的账户
+
+    :param accounts: 账户数据
+    :type accounts: list[JSONLike]
+    :param role_ids: 角色名到角色 ID 的映射
+    :type role_ids: dict[str, int]
+    :param existing_usernames: 已存在的用户名
+    :type existing_usernames: set[str]
+
+    :return: 与输入顺序一致的每个账户的验证结果
+    :rtype: list[dict[str, Any]]
+    """
+    results: list[dict[str, Any]] = []
+    seen_usernames: set[str] = set()
+    for data in accounts:
+        username = data["username"]
+        errors = collect_argument_errors(
+            lambda: validation_username(username),
+            lambda: validation_password(data["password"]),
+        )
+        if username in existing_usernames:
+            errors.setdefault("username", []).append("username already exists")
+        elif username in seen_usernames:
+            errors.setdefault("username", []).append("username duplicated in request")
+        if any(name not in role_ids for name in data["roles"]):
+            errors.setdefault("roles", []).append("role not found")
+        seen_usernames.add(username)
+
+        results.append(dict(username=username, success=not errors, id=None, errors=errors))
+    return results
+
+
+def provision_accounts(accounts: list[JSONLike], *, workers: Optional[int] = None) -> list[dict[str, Any]]:
+    """
+    批量创建账户
+
+    所有角色与用户名仅各查询一次，密码哈希并行计算，
+    所有通过验证的用户及其角色在同一事务中批量插入
+
+    :param accounts: 已通过 :py:class:`UserCreateSchema` 验证的账户数据
+    :type accounts: list[JSONLike]
+    :param workers: 计算密码哈希的进程数
+    :type workers: Optional[int]
+
+    :return: 与输入顺序一致的每个账户的创建结果
+    :rtype: list[dict[str, Any]]
+    """
+    role_names = {name for data in accounts for name in data["roles"]}
+    role_ids: dict[str, int] = dict(
+        db.session.execute(select(Role.name, Role.id).where(Role.name.in_(role_names))).tuples().all()
+    )
+    usernames = [data["username"] for data in accounts]
+    existing_usernames = set(db.session.scalars(select(User.username).where(User.username.in_(usernames))).all())
+
+    results = check_batch_accounts(accounts, role_ids, existing_usernames)
+    accepted = [(result, data) for result, data in zip(results, accounts) if result["success"]]
+    if not accepted:
+        return results
+
+    password_hashes = hash_passwords([data["password"] for _, data in accepted], workers)
+    try:
+        user_ids = db.session.scalars(
+            insert(User).returning(User.id, sort_by_parameter_order=True),
+            [
+                dict(username=data["username"], password_hash=password_hash, active=data["active"])
+                for (_, data), password_hash in zip(accepted, password_hashes)
+            ],
+        ).all()
+        user_role_rows = [
+            dict(user_id=user_id, role_id=role_ids[name])
+            for user_id, (_, data) in zip(user_ids, accepted)
+            for name in dict.fromkeys(data["roles"])
+        ]
+        if user_role_rows:
+            db.session.execute(insert(user_roles), user_role_rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    for user_id, (result, _) in zip(user_ids, accepted):
+        result["id"] = user_id
+    return results
+
+
+@bp.route("/accounts/batch", methods=["POST"])
+@jwt_required()
+@api
+@permissions_required([PERMISSIONS.ACCOUNT.CREATE])
+def create_accounts() -> CreateAccounts:
+    """
+    批量创建账户
+
+    需求登录， :py:attr:`PERMISSIONS.ACCOUNT.CREATE`
+    """
+    data = validate_json_arguments(UsersBatchCreateSchema)
+    return CreateAccounts(results=provision_accounts(data["accounts"]))
+
+
 class UserUpdateSchema(Schema):
     """
     更新用户信息
@@ -274,7 +476,7 @@ class UserUpdateSelfPasswordSchema(Schema):
 
 
 @bp.route("/accounts/<int:account_id>", methods=["PUT"])
-@jwt_required()  # type: ignore[misc]
+@jwt_required()
 @api
 @permissions_required([PERMISSIONS.ACCOUNT.UPDATE, PERMISSIONS.ACCOUNT.UPDATE_SELF_PASSWORD, ], strategy=any)
 def update_account(account_id: int) -> APIResult:
@@ -321,7 +523,7 @@ def update_account(account_id: int) -> APIResult:
 
 
 @bp.route("/accounts/<int:account_id>", methods=["DELETE"])
-@jwt_required()  # type: ignore[misc]
+@jwt_required()
 @api
 @permissions_required([PERMISSIONS.ACCOUNT.DELETE])
 def delete_account(account_id: int) -> APIResult:
@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 
 
-from flask_jwt_extended import jwt_required
 from marshmallow import Schema
 from marshmallow import fields
 
@@ -11,8 +10,11 @@ from ..utils import validate_json_arguments
 from ...api import APIResult
 from ...api import GetPermissions
 from ...api import api
+from ...cache import cached_response
+from ...database import read_only
 from ...models.auth import Permission
 from ...permission import PERMISSIONS
+from ...permission import jwt_required
 from ...permission import permissions_required
 
 
@@ -22,9 +24,11 @@ class PermissionsFilterSchema(Schema):
 
 
 @bp.route("/permissions", methods=["GET"])
-@jwt_required()  # type: ignore[misc]
+@jwt_required()
 @api
 @permissions_required([PERMISSIONS.PERMISSION.GET])
+@cached_response(("permissions",))
+@read_only
 def get_permissions() -> APIResult:
     data: JSONLike = validate_json_arguments(PermissionsFilterSchema, optional=True)
 
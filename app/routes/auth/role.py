@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 
 
-from flask_jwt_extended import jwt_required
 from marshmallow import Schema
 from marshmallow import fields
 
@@ -12,10 +11,13 @@ from ...api import APIResult
 from ...api import GetRoles
 from ...api import RequestSuccess
 from ...api import api
+from ...cache import cached_response
+from ...database import read_only
 from ...extensions import db
 from ...models.auth import Permission
 from ...models.auth import Role
 from ...permission import PERMISSIONS
+from ...permission import jwt_required
 from ...permission import permissions_required
 
 
@@ -26,9 +28,11 @@ class RolesFilterSchema(Schema):
 
 
 @bp.route("/roles", methods=["GET"])
-@jwt_required()  # type: ignore[misc]
+@jwt_required()
 @api
 @permissions_required([PERMISSIONS.ROLE.GET])
+@cached_response(("roles", "permissions", "role_permissions"))
+@read_only
 def get_roles() -> APIResult:
     data = validate_json_arguments(RolesFilterSchema, optional=True)
 
@@ -55,7 +59,7 @@ class RoleCreateSchema(Schema):
 
 
 @bp.route("/roles", methods=["POST"])
-@jwt_required()  # type: ignore[misc]
+@jwt_required()
 @api
 @permissions_required([PERMISSIONS.ROLE.CREATE])
 def create_role() -> APIResult:
@@ -1,24 +1,54 @@
 # -*- coding: utf-8 -*-
 
 
-from collections.abc import Callable
-from dataclasses import dataclass
+import importlib
 
+import click
 from flask import Flask
-from mypy_extensions import NamedArg
 
-from .routers import bp
+from .bp import bp
+from ...database import SeedSet
+from ...database import compact_changes
+from ...database import track_tables
+from ...database import tracked_tables
+from ...extensions import db
 from ...models.data import FamilyDifficultyType
+from ...models.data import TABLES
 
 
-def initialize_hooks(_app: Flask) -> None:
-    ...
+def initialize_hooks(app: Flask) -> None:
+    # 数据表的写入记录到变更日志，供 /tables/<name>/changes 增量同步
+    track_tables(app, (table.__tablename__ for table in TABLES))
 
 
-def initialize_setup() -> None:
-    from flask_sqlalchemy.model import Model
+def initialize_commands(app: Flask) -> None:
+    @app.cli.command("compact-changes")
+    @click.option("--keep", type=int, default=None, help="每张表保留的变更记录数，默认为 CHANGES_KEEP")
+    def compact(keep: int | None) -> None:
+        """压缩数据表的变更记录"""
+        keep = app.config["CHANGES_KEEP"] if keep is None else keep
+        with db.engine.begin() as connection:
+            for table_name in sorted(tracked_tables()):
+                merged, dropped = compact_changes(connection, table_name, keep)
+                if merged or dropped:
+                    print(f"{table_name}：合并 {merged} 条，丢弃 {dropped} 条")
+        print("变更记录压缩完成")
 
-    from ...extensions import db
+
+def load_views() -> None:
+    """
+    导入视图模块，将路由注册到蓝图
+    """
+    importlib.import_module(".routers", __package__)
+
+
+def seed_sets() -> list[SeedSet]:
+    """
+    基础数据（枚举表）的种子数据，每张枚举表为一个数据集
+
+    :return: 种子数据集
+    :rtype: list[SeedSet]
+    """
     from ...models.data import CertificateType
     from ...models.data import PreviousEducationLevel
     from ...models.data import EthnicGroup
@@ -39,8 +69,6 @@ def initialize_setup() -> None:
     from ...models.data import FinancialAidType
     from ...models.data import Nationality
 
-    type ModelType = Callable[[NamedArg(str, "name")], Model]  # noqa: F821
-
     # noinspection PyPep8Naming
     ENUM_DATA = (
         ("证件类型", CertificateType, [
@@ -448,25 +476,12 @@ def initialize_setup() -> None:
         ])
     )
 
-    @dataclass
-    class EnumData:
-        name: str
-        model: ModelType
-        types: list[str]
-
-    def add_enum(data: EnumData) -> None:
-        for t in data.types:
-            print(f"添加{data.name}： {t}")
-            # noinspection PyArgumentList
-            db.session.add(data.model(name=t))
-            db.session.commit()
-
-    print("正在初始化基础数据")
+    sets: list[SeedSet] = []
     for (name, model, types) in ENUM_DATA:
-        print()
-        add_enum(EnumData(name=name, model=model, types=types))
-    print()
-    print("初始化基础数据成功")
+        seed_set = SeedSet(name)
+        seed_set.add(model.__tablename__, *(dict(name=t) for t in types))
+        sets.append(seed_set)
+    return sets
 
 
-__all__ = ("bp", "initialize_hooks",)
+__all__ = ("bp", "initialize_hooks", "initialize_commands", "load_views", "seed_sets",)
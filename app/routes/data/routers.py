@@ -2,46 +2,163 @@
 
 
 import ast
+import functools
 import re
+from collections.abc import Sequence
+from typing import Any
+from typing import Optional
 
-from flask import Blueprint
+from flask import current_app
 from flask import request
-from flask_jwt_extended import jwt_required
+from flask_jwt_extended import get_jwt_identity
+from marshmallow import Schema
+from marshmallow import ValidationError
+from marshmallow import fields
+from marshmallow import validate
+from sqlalchemy import Select
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
 
+from .bp import bp
+from ..utils import validate_json_arguments
 from ...api import APIArgumentError
+from ...api import ChangesCompacted
 from ...api import DataTableNotFound
+from ...api import EventStream
+from ...api import GetAnalytics
+from ...api import GetChanges
+from ...api import GetColumnArrays
+from ...api import GetJob
+from ...api import GetRowArrays
 from ...api import GetRows
 from ...api import GetTables
+from ...api import JobQueueFull
 from ...api import RequestSuccess
 from ...api import api
+from ...cache import cached_response
+from ...conditional import conditional_response
+from ...database import changes_since
+from ...database import read_only
+from ...database import table_version
+from ...database import tracked_tables
+from ...events import event_stream
+from ...events import get_broker
 from ...extensions import db
+from ...jobs import enqueue
+from ...jobs import job_info
+from ...jobs import remove_upload
+from ...jobs import save_upload
+from ...jobs.tasks import DATA_TABLES
+from ...jobs.tasks import EXPORT_FORMATS
 from ...model_utils import BaseModel
 from ...model_utils.utils import ColumnInfo
 from ...models.data import EDITABLE_TABLE_NAMES
 from ...permission import PERMISSIONS
+from ...permission import jwt_required
 from ...permission import permissions_required
-
-bp = Blueprint("data", __name__)
+from ...serialization import request_payload
 
 COLUMN_INFO: dict[str, dict[str, ColumnInfo]] = BaseModel.get_columns_info()  # type: ignore[assignment]
 NAME2TABLE: dict[str, type[BaseModel]] = BaseModel.name2table()  # type: ignore[assignment]
 
 LIMIT_VISIBILITY = False
 
+ROW_FORMATS = {
+    "objects": "application/json",
+    "rows": "application/vnd.tusr.rows+json",
+    "columns": "application/vnd.tusr.columns+json",
+}
+"""
+行数据的格式到对应媒体类型的映射：``objects`` 每行为一个对象；``rows`` 列信息只出现一次，每行为数组；
+``columns`` 列信息只出现一次，每列为数组
+"""
+
+
+def requested_row_format() -> Optional[str]:
+    """
+    获取请求的行数据格式
+
+    优先使用查询参数 ``format``，否则按 ``Accept`` 在 :py:data:`ROW_FORMATS` 的媒体类型中协商，默认为 ``objects``
+
+    :return: 格式名，查询参数无效时返回 None
+    :rtype: Optional[str]
+    """
+    if (name := request.args.get("format")) is not None:
+        return name if name in ROW_FORMATS else None
+    mimetype = request.accept_mimetypes.best_match(ROW_FORMATS.values(), default=ROW_FORMATS["objects"])
+    return next(name for name, value in ROW_FORMATS.items() if value == mimetype)
+
+
+def row_format_error() -> APIArgumentError:
+    return APIArgumentError(arguments={"format": [f"must be one of: {', '.join(ROW_FORMATS)}"]})
+
+
+@functools.cache
+def column_headers(table_name: str) -> list[dict[str, Any]]:
+    """
+    获取数组格式中的列信息，顺序与 :py:func:`select_rows` 选择的列一致
+    """
+    return [
+        dict(name=name, type=info.type, nullable=info.nullable, foreign_key=info.foreign_key)
+        for name, info in COLUMN_INFO[table_name].items()
+    ]
+
+
+def select_columns(table_name: str) -> Select[Any]:
+    """
+    按 ``COLUMN_INFO`` 的列顺序选择各列，结果为元组，不构造模型对象
+    """
+    table = NAME2TABLE[table_name]
+    return select(*(getattr(table, name) for name in COLUMN_INFO[table_name]))
+
+
+def select_rows(table_name: str, offset: int, limit: int) -> Select[Any]:
+    return select_columns(table_name).offset(offset).limit(limit)
+
+
+def array_rows(table_name: str, row_format: str, rows: Sequence[Sequence[Any]]) -> GetRowArrays | GetColumnArrays:
+    """
+    由 :py:func:`select_rows` 的结果构造数组格式的返回值
+
+    :param table_name: 表名
+    :type table_name: str
+    :param row_format: ``rows`` 或 ``columns``
+    :type row_format: str
+    :param rows: 查询结果
+    :type rows: Sequence[Sequence[Any]]
+
+    :return: 返回值
+    :rtype: GetRowArrays | GetColumnArrays
+    """
+    columns = column_headers(table_name)
+    if row_format == "rows":
+        return GetRowArrays(columns=columns, rows=[tuple(row) for row in rows])
+    return GetColumnArrays(columns=columns, data=[list(values) for values in zip(*rows)] or [[] for _ in columns])
+
+
+def row_tables(table_name: str, **_: Any) -> tuple[str]:
+    """
+    行数据接口的响应所依赖的表
+    """
+    return (table_name,)
+
 
 @bp.route("/tables", methods=["GET"])
-@jwt_required()  # type: ignore[misc]
+@jwt_required()
 @api
 @permissions_required([PERMISSIONS.TABLE.LIST, PERMISSIONS.TABLE.GET])
+@cached_response()
+@read_only
 def get_tables() -> GetTables:
     return GetTables(tables={k: COLUMN_INFO[k] for k in EDITABLE_TABLE_NAMES})
 
 
 @bp.route("/tables/<string:table_name>", methods=["GET"])
-@jwt_required()  # type: ignore[misc]
+@jwt_required()
 @api
 @permissions_required([PERMISSIONS.TABLE.GET])
+@cached_response()
+@read_only
 def get_table(table_name: str) -> GetTables | DataTableNotFound:
     if LIMIT_VISIBILITY and table_name not in EDITABLE_TABLE_NAMES:
         return DataTableNotFound()
@@ -49,19 +166,247 @@ def get_table(table_name: str) -> GetTables | DataTableNotFound:
 
 
 @bp.route("/tables/<string:table_name>/rows/<int:offset>/<int:limit>", methods=["GET"])
-@jwt_required()  # type: ignore[misc]
+@jwt_required()
 @api
 @permissions_required([PERMISSIONS.DATA.GET])
-def get_rows(table_name: str, offset: int, limit: int) -> GetRows | DataTableNotFound:  # todo perm limit
+@conditional_response(row_tables)
+@cached_response(row_tables)
+@read_only
+def get_rows(
+        table_name: str, offset: int, limit: int
+) -> GetRows | GetRowArrays | GetColumnArrays | DataTableNotFound | APIArgumentError:  # todo perm limit
     if LIMIT_VISIBILITY and table_name not in EDITABLE_TABLE_NAMES:
         return DataTableNotFound()
+    row_format = requested_row_format()
+    if row_format is None:
+        return row_format_error()
+    if row_format != "objects":
+        return array_rows(table_name, row_format, db.session.execute(select_rows(table_name, offset, limit)).all())
     query = NAME2TABLE[table_name].query
     rows = [row.to_dict() for row in query.offset(offset).limit(limit).all()]
     return GetRows(rows=rows)
 
 
+class ChangesQuerySchema(Schema):
+    """
+    增量同步参数
+    """
+    since = fields.Integer(load_default=0, validate=validate.Range(min=0))
+    limit = fields.Integer(load_default=None, validate=validate.Range(min=1))
+
+
+@bp.route("/tables/<string:table_name>/changes", methods=["GET"])
+@jwt_required()
+@api
+@permissions_required([PERMISSIONS.DATA.GET])
+@read_only
+def get_changes(table_name: str) -> GetChanges | ChangesCompacted | DataTableNotFound | APIArgumentError:
+    """
+    获取 ``since`` 版本之后的变更
+
+    返回新增或修改的行的当前内容与被删除的行的主键；``more`` 为真时以返回的 ``version`` 继续请求。
+    返回 :py:class:`ChangesCompacted` 时，客户端记下其中的 ``version``，通过 ``get_rows`` 全量同步后再从该版本继续
+    """
+    if table_name not in tracked_tables() or (LIMIT_VISIBILITY and table_name not in EDITABLE_TABLE_NAMES):
+        return DataTableNotFound()
+    try:
+        args = ChangesQuerySchema().load(request.args, unknown="raise")
+    except ValidationError as err:
+        return APIArgumentError(arguments=err.messages)
+    page_size = current_app.config["CHANGES_PAGE_SIZE"]
+
+    # 同一连接读取版本、变更与行，使用只读副本时也是同一快照
+    connection = db.session.connection()
+    change_set = changes_since(connection, table_name, args["since"], min(args["limit"] or page_size, page_size))
+    if change_set is None:
+        return ChangesCompacted(version=table_version(connection, table_name).version)
+
+    rows: list[tuple[Any, ...]] = []
+    if change_set.upserted:
+        primary_key = getattr(NAME2TABLE[table_name], "id")
+        statement = select_columns(table_name).where(primary_key.in_(change_set.upserted))
+        rows = [tuple(row) for row in connection.execute(statement)]
+    # 读取前已被删除的行，其删除记录在更新的版本中
+    index = list(COLUMN_INFO[table_name]).index("id")
+    vanished = set(change_set.upserted) - {row[index] for row in rows}
+    return GetChanges(
+        version=change_set.version,
+        more=change_set.more,
+        columns=column_headers(table_name),
+        rows=rows,
+        deleted=change_set.deleted + sorted(vanished),
+    )
+
+
+@bp.route("/events", methods=["GET"])
+@jwt_required()
+@api
+@permissions_required([PERMISSIONS.DATA.GET])
+@read_only
+def subscribe_changes() -> EventStream | DataTableNotFound | APIArgumentError:
+    """
+    订阅数据表的变更，``tables`` 为逗号分隔的表名
+
+    返回 ``text/event-stream``：``ready`` 给出订阅时各表的版本号，``change`` 为提交的变更批次，
+    ``overflow`` 表示有事件被丢弃，客户端需通过 :py:func:`get_changes` 补齐
+    """
+    tables = sorted({name for name in request.args.get("tables", "").split(",") if name})
+    if not tables:
+        return APIArgumentError(arguments={"tables": ["at least one table is required"]})
+    tracked = tracked_tables()
+    if any(name not in tracked or (LIMIT_VISIBILITY and name not in EDITABLE_TABLE_NAMES) for name in tables):
+        return DataTableNotFound()
+
+    broker = get_broker()
+    subscriber = broker.subscribe(tables)
+    try:
+        # 先订阅再读取版本号，此后提交的变更都会推送
+        connection = db.session.connection()
+        versions = {name: table_version(connection, name).version for name in tables}
+    except BaseException:
+        broker.unsubscribe(subscriber)
+        raise
+    config = current_app.config
+    return EventStream(
+        events=event_stream(
+            broker,
+            subscriber,
+            versions,
+            heartbeat=config["EVENTS_HEARTBEAT_SECONDS"],
+            max_seconds=config["EVENTS_MAX_SECONDS"],
+            retry_ms=config["EVENTS_RETRY_MS"],
+        ),
+        on_close=functools.partial(broker.unsubscribe, subscriber),
+    )
+
+
+class AnalyticsFilterSchema(Schema):
+    field = fields.String(required=True)
+    in_ = fields.List(fields.Raw(allow_none=True), data_key="in", attribute="in")
+    min = fields.Float()
+    max = fields.Float()
+
+
+class AnalyticsBinsSchema(Schema):
+    field = fields.String(required=True)
+    edges = fields.List(fields.Float(), required=True, validate=validate.Length(min=1))
+
+
+class AnalyticsAggregateSchema(Schema):
+    op = fields.String(required=True)
+    field = fields.String(load_default=None)
+
+
+class AnalyticsQuerySchema(Schema):
+    """
+    分析查询参数
+    """
+    group_by = fields.List(fields.String(), load_default=list)
+    filters = fields.List(fields.Nested(AnalyticsFilterSchema), load_default=list)
+    aggregates = fields.List(
+        fields.Nested(AnalyticsAggregateSchema), load_default=lambda: [dict(op="count", field=None)],
+    )
+    bins = fields.List(fields.Nested(AnalyticsBinsSchema), load_default=list)
+    labels = fields.Boolean(load_default=False)
+    limit = fields.Integer(load_default=None, validate=validate.Range(min=1))
+
+
+@bp.route("/analytics", methods=["POST"])
+@jwt_required()
+@api
+@permissions_required([PERMISSIONS.DATA.LIST])
+@read_only
+def get_analytics() -> GetAnalytics | APIArgumentError:
+    """
+    按学生的维度（外键与布尔字段）分组、筛选并聚合数值字段
+
+    ``aggregates`` 的 ``op`` 为 ``count``、``sum``、``mean``、``min`` 或 ``max``，除 ``count`` 外需要指定度量 ``field``；
+    ``labels`` 为真时同时返回外键维度取值对应的名称
+    """
+    # numpy 只在首次分析时导入，避免拖慢应用启动
+    from ...analytics import Aggregate
+    from ...analytics import AnalyticsError
+    from ...analytics import TABLE_NAME
+    from ...analytics import CubeQuery
+    from ...analytics import get_cube
+    from ...analytics import group_labels
+
+    args = validate_json_arguments(AnalyticsQuerySchema)
+    query = CubeQuery(
+        group_by=args["group_by"],
+        filters=[(spec.pop("field"), spec) for spec in args["filters"]],
+        aggregates=[Aggregate(agg["op"], agg["field"]) for agg in args["aggregates"]],
+        bins={spec["field"]: spec["edges"] for spec in args["bins"]},
+        limit=args["limit"],
+    )
+    cube = get_cube(COLUMN_INFO[TABLE_NAME])
+    connection = db.session.connection()
+    try:
+        result = cube.run(connection, query)
+    except AnalyticsError as err:
+        return APIArgumentError(arguments={err.argument: [err.message]})
+    return GetAnalytics(
+        version=result.version,
+        total=result.total,
+        columns=result.columns,
+        rows=result.rows,
+        labels=group_labels(connection, cube, result) if args["labels"] else {},
+    )
+
+
+class ExportSchema(Schema):
+    """
+    导出参数
+    """
+    format = fields.String(load_default="csv", validate=validate.OneOf(list(EXPORT_FORMATS)))
+    gzip = fields.Boolean(load_default=True)
+
+
+@bp.route("/tables/<string:table_name>/export", methods=["POST"])
+@jwt_required()
+@api
+@permissions_required([PERMISSIONS.DATA.LIST])
+def create_export_job(table_name: str) -> GetJob | DataTableNotFound | JobQueueFull | APIArgumentError:
+    """
+    创建导出数据表的后台任务，完成后通过 ``/api/jobs/<id>/result`` 下载
+
+    请求体可省略，``format`` 为 ``csv`` 或 ``jsonl``，``gzip`` 默认为真
+    """
+    if table_name not in DATA_TABLES or (LIMIT_VISIBILITY and table_name not in EDITABLE_TABLE_NAMES):
+        return DataTableNotFound()
+    args = validate_json_arguments(ExportSchema, optional=True)
+    params = dict(table=table_name, format=args.get("format", "csv"), gzip=args.get("gzip", True))
+    row = enqueue("export-table", params, user_id=int(get_jwt_identity()))
+    if row is None:
+        return JobQueueFull()
+    return GetJob(job=job_info(row))
+
+
+@bp.route("/tables/<string:table_name>/import", methods=["POST"])
+@jwt_required()
+@api
+@permissions_required([PERMISSIONS.DATA.CREATE])
+def create_import_job(table_name: str) -> GetJob | DataTableNotFound | JobQueueFull | APIArgumentError:
+    """
+    创建从 CSV 导入数据表的后台任务，文件以 ``multipart/form-data`` 的 ``file`` 字段上传
+
+    CSV 的第一行为列名，``id`` 列被忽略，空单元格为 NULL
+    """
+    if table_name not in EDITABLE_TABLE_NAMES:
+        return DataTableNotFound()
+    upload = request.files.get("file")
+    if upload is None:
+        return APIArgumentError(arguments={"file": ["Missing data for required field."]})
+    input_file = save_upload(upload, ".csv")
+    row = enqueue("import-table", dict(table=table_name), user_id=int(get_jwt_identity()), input_file=input_file)
+    if row is None:
+        remove_upload(input_file)
+        return JobQueueFull()
+    return GetJob(job=job_info(row))
+
+
 @bp.route("/tables/<string:table_name>/rows", methods=["POST"])
-@jwt_required()  # type: ignore[misc]
+@jwt_required()
 @api
 @permissions_required([PERMISSIONS.DATA.CREATE])
 def create_row(table_name: str) -> RequestSuccess | DataTableNotFound | APIArgumentError:
@@ -70,11 +415,12 @@ def create_row(table_name: str) -> RequestSuccess | DataTableNotFound | APIArgum
 
     table = NAME2TABLE[table_name]
 
-    if not isinstance(request.json, dict):
+    payload = request_payload()
+    if not isinstance(payload, dict):
         return APIArgumentError(arguments={"_schema": ["Invalid input type."]})
 
     try:
-        obj = table(**{k: request.json[k] for k in request.json.keys() - {"id"}})
+        obj = table(**{k: payload[k] for k in payload.keys() - {"id"}})
     except TypeError as err:
         if match := re.match(r"'(.*)' is an invalid keyword argument for ", str(err)):
             return APIArgumentError(arguments={match.group(1): ["invalid argument"]})
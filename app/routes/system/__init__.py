@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+
+
+import importlib
+
+from .bp import bp
+
+
+def load_views() -> None:
+    """
+    导入视图模块，将路由注册到蓝图
+    """
+    importlib.import_module(".routers", __package__)
+
+
+__all__ = (
+    "bp",
+    "load_views",
+)
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+
+
+from flask import Blueprint
+
+bp = Blueprint("system", __name__)
+
+__all__ = (
+    "bp",
+)
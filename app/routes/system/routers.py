@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+
+import mimetypes
+import os
+from typing import Any
+from typing import Optional
+
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import Row
+
+from .bp import bp
+from ...api import DownloadJobResult
+from ...api import DownloadProfile
+from ...api import GetJob
+from ...api import GetJobs
+from ...api import GetMetrics
+from ...api import GetProfile
+from ...api import GetProfiles
+from ...api import JobNotFound
+from ...api import JobResultNotFound
+from ...api import ProfileNotFound
+from ...api import api
+from ...database import read_only
+from ...jobs import cancel_job
+from ...jobs import get_job
+from ...jobs import job_info
+from ...jobs import list_jobs
+from ...jobs import result_path
+from ...metrics import registry
+from ...permission import PERMISSIONS
+from ...permission import jwt_required
+from ...permission import permissions_required
+from ...profiling import FILE_SUFFIXES
+from ...profiling import get_store
+
+
+@bp.route("/metrics", methods=["GET"])
+@jwt_required()
+@api
+@permissions_required([PERMISSIONS.SYSTEM.METRICS])
+def get_metrics() -> GetMetrics:
+    """
+    获取所有工作进程合并后的监控指标，格式为 Prometheus 文本格式
+
+    需求登录， :py:attr:`PERMISSIONS.SYSTEM.METRICS`
+    """
+    return GetMetrics(text=registry.expose())
+
+
+@bp.route("/profiles", methods=["GET"])
+@jwt_required()
+@api
+@permissions_required([PERMISSIONS.SYSTEM.PROFILES])
+def get_profiles() -> GetProfiles:
+    """
+    获取已保存的请求剖析，最新的在前
+
+    需求登录， :py:attr:`PERMISSIONS.SYSTEM.PROFILES`
+    """
+    return GetProfiles(profiles=get_store().summaries())
+
+
+@bp.route("/profiles/<capture_id>", methods=["GET"])
+@jwt_required()
+@api
+@permissions_required([PERMISSIONS.SYSTEM.PROFILES])
+def get_profile(capture_id: str) -> GetProfile | ProfileNotFound:
+    """
+    获取请求剖析的详情：端点、参数、耗时最多的函数与分配内存最多的代码行
+
+    需求登录， :py:attr:`PERMISSIONS.SYSTEM.PROFILES`
+
+    :param capture_id: 剖析 ID
+    :type capture_id: str
+    """
+    meta = get_store().load(capture_id)
+    if meta is None:
+        return ProfileNotFound()
+    return GetProfile(profile=meta)
+
+
+@bp.route("/profiles/<capture_id>/<kind>", methods=["GET"])
+@jwt_required()
+@api
+@permissions_required([PERMISSIONS.SYSTEM.PROFILES])
+def download_profile(capture_id: str, kind: str) -> DownloadProfile | ProfileNotFound:
+    """
+    下载剖析文件，``cprofile`` 可用 :py:mod:`pstats` 或 snakeviz 打开，
+    ``tracemalloc`` 可用 :py:meth:`tracemalloc.Snapshot.load` 读取
+
+    需求登录， :py:attr:`PERMISSIONS.SYSTEM.PROFILES`
+
+    :param capture_id: 剖析 ID
+    :type capture_id: str
+    :param kind: 文件类型，``cprofile`` 或 ``tracemalloc``
+    :type kind: str
+    """
+    path = get_store().file(capture_id, kind)
+    if path is None:
+        return ProfileNotFound()
+    return DownloadProfile(path=path, filename=f"{capture_id}{FILE_SUFFIXES[kind]}")
+
+
+def own_job(job_id: int) -> Optional[Row[Any]]:
+    """
+    获取当前用户的任务，任务不存在或属于其他用户时返回 None
+    """
+    row = get_job(job_id)
+    if row is None or row.user_id != int(get_jwt_identity()):
+        return None
+    return row
+
+
+@bp.route("/jobs", methods=["GET"])
+@jwt_required()
+@api
+@read_only
+def get_jobs() -> GetJobs:
+    """
+    获取当前用户的后台任务，最新的在前
+
+    需求登录
+    """
+    return GetJobs(jobs=[job_info(row) for row in list_jobs(int(get_jwt_identity()))])
+
+
+@bp.route("/jobs/<int:job_id>", methods=["GET"])
+@jwt_required()
+@api
+@read_only
+def get_job_status(job_id: int) -> GetJob | JobNotFound:
+    """
+    获取后台任务的状态与进度，``state`` 为 queued / running / succeeded / failed / cancelled
+
+    需求登录，只能获取自己创建的任务
+
+    :param job_id: 任务 ID
+    :type job_id: int
+    """
+    row = own_job(job_id)
+    if row is None:
+        return JobNotFound()
+    return GetJob(job=job_info(row))
+
+
+@bp.route("/jobs/<int:job_id>/cancel", methods=["POST"])
+@jwt_required()
+@api
+def cancel_job_request(job_id: int) -> GetJob | JobNotFound:
+    """
+    取消后台任务，执行中的任务在下次报告进度时结束
+
+    需求登录，只能取消自己创建的任务
+
+    :param job_id: 任务 ID
+    :type job_id: int
+    """
+    if own_job(job_id) is None or (row := cancel_job(job_id)) is None:
+        return JobNotFound()
+    return GetJob(job=job_info(row))
+
+
+@bp.route("/jobs/<int:job_id>/result", methods=["GET"])
+@jwt_required()
+@api
+@read_only
+def download_job_result(job_id: int) -> DownloadJobResult | JobNotFound | JobResultNotFound:
+    """
+    下载后台任务的结果文件
+
+    需求登录，只能下载自己创建的任务的结果
+
+    :param job_id: 任务 ID
+    :type job_id: int
+    """
+    row = own_job(job_id)
+    if row is None:
+        return JobNotFound()
+    path = result_path(row)
+    if path is None:
+        return JobResultNotFound()
+    mimetype, encoding = mimetypes.guess_type(row.result_name)
+    if encoding == "gzip":
+        # 以压缩文件下载，不再经过响应压缩
+        mimetype = "application/gzip"
+    return DownloadJobResult(
+        path=path,
+        filename=row.result_name or os.path.basename(path),
+        mimetype=mimetype or "application/octet-stream",
+    )
@@ -6,20 +6,33 @@ from typing import Any
 from typing import Mapping
 from typing import cast
 
-from flask import request
 from marshmallow import Schema
 from marshmallow import ValidationError
 from werkzeug.exceptions import UnsupportedMediaType
 
 from ..api import APIArgumentError
 from ..api import APIException
+from ..serialization import request_payload
 
 type JSONLike = Mapping[str, Any]
 
 
 def validate_json_arguments(schema: type[Schema], optional: bool = False) -> JSONLike:
+    """
+    按 ``schema`` 校验请求体，请求体可以是 JSON 或已启用的二进制格式
+
+    :param schema: 校验模式
+    :type schema: type[Schema]
+    :param optional: 请求体是否可以省略，省略时返回空字典
+    :type optional: bool
+
+    :return: 校验后的参数
+    :rtype: JSONLike
+
+    :raise APIException: 校验失败
+    """
     try:
-        return schema().load(cast(JSONLike, request.json), unknown="raise")  # type: ignore[no-any-return]
+        return schema().load(cast(JSONLike, request_payload()), unknown="raise")  # type: ignore[no-any-return]
     except ValidationError as err:
         raise APIException(APIArgumentError(arguments=err.messages))
     except UnsupportedMediaType as err:
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+二进制序列化格式
+
+:py:class:`app.api.APIResult` 的响应按 ``Accept`` 在 JSON 与 ``SERIALIZATION_FORMATS`` 中的格式之间协商，
+请求体按 ``Content-Type`` 解码。MessagePack 与 CBOR 分别需要安装 ``msgpack`` 与 ``cbor2``，未安装时跳过。
+两种格式中日期时间均编码为原生时间戳（未带时区的视为 UTC，日期视为当天零点），``code`` / ``message`` 结构与 JSON 相同
+"""
+
+import dataclasses
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import date
+from datetime import datetime
+from datetime import time
+from datetime import timezone
+from decimal import Decimal
+from typing import Any
+from typing import Optional
+from uuid import UUID
+
+from flask import Flask
+from flask import Response
+from flask import current_app
+from flask import jsonify
+from flask import request
+from werkzeug.exceptions import BadRequest
+
+from .compression import optional_module
+
+SERIALIZATION_EXTENSION = "serialization"
+JSON_MIMETYPE = "application/json"
+
+
+@dataclass(frozen=True)
+class Format:
+    """
+    序列化格式
+    """
+    name: str
+    mimetypes: tuple[str, ...]
+    """
+    可识别的媒体类型，响应使用客户端请求的那个
+    """
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[bytes], Any]
+
+
+def plain_value(value: Any) -> Any:
+    """
+    将格式不支持的值转换为基本类型，与 Flask 的 JSON 编码保持一致
+    """
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def as_utc(value: date) -> datetime:
+    if not isinstance(value, datetime):
+        return datetime.combine(value, time(), timezone.utc)
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+def msgpack_format(msgpack: Any) -> Format:
+    def default(value: Any) -> Any:
+        if isinstance(value, date):
+            return msgpack.Timestamp.from_datetime(as_utc(value))
+        return plain_value(value)
+
+    return Format(
+        name="msgpack",
+        mimetypes=("application/msgpack", "application/x-msgpack", "application/vnd.msgpack"),
+        dumps=lambda obj: bytes(msgpack.packb(obj, default=default)),
+        # timestamp=3：时间戳解码为带时区的 datetime
+        loads=lambda data: msgpack.unpackb(data, timestamp=3),
+    )
+
+
+def cbor_format(cbor2: Any) -> Format:
+    def default(encoder: Any, value: Any) -> None:
+        encoder.encode(plain_value(value))
+
+    return Format(
+        name="cbor",
+        mimetypes=("application/cbor",),
+        dumps=lambda obj: bytes(cbor2.dumps(
+            obj, default=default, timezone=timezone.utc, datetime_as_timestamp=True, date_as_datetime=True,
+        )),
+        loads=lambda data: cbor2.loads(data),
+    )
+
+
+def available_formats() -> dict[str, Format]:
+    """
+    获取已安装的二进制格式
+
+    :return: 名称到格式的映射
+    :rtype: dict[str, Format]
+    """
+    formats = {}
+    if (msgpack := optional_module("msgpack")) is not None:
+        formats["msgpack"] = msgpack_format(msgpack)
+    if (cbor2 := optional_module("cbor2")) is not None:
+        formats["cbor"] = cbor_format(cbor2)
+    return formats
+
+
+@dataclass(frozen=True)
+class SerializationSettings:
+    formats: tuple[Format, ...]
+    """
+    启用的二进制格式，按优先顺序排列
+    """
+    offers: tuple[str, ...]
+    """
+    响应可选的媒体类型，JSON 在最前，``Accept`` 未指明偏好时使用 JSON
+    """
+    by_mimetype: dict[str, Format]
+
+
+def get_settings() -> Optional[SerializationSettings]:
+    settings: Optional[SerializationSettings] = current_app.extensions.get(SERIALIZATION_EXTENSION)
+    return settings if settings is not None and settings.formats else None
+
+
+def response_mimetype() -> str:
+    """
+    按 ``Accept`` 选择响应的媒体类型
+
+    :return: 媒体类型，未启用二进制格式或客户端未指明偏好时为 JSON
+    :rtype: str
+    """
+    if (settings := get_settings()) is None:
+        return JSON_MIMETYPE
+    return request.accept_mimetypes.best_match(settings.offers, default=JSON_MIMETYPE) or JSON_MIMETYPE
+
+
+def encode_response(payload: dict[str, Any]) -> Response:
+    """
+    按协商的格式序列化响应体
+
+    :param payload: 响应内容
+    :type payload: dict[str, Any]
+
+    :return: 响应
+    :rtype: Response
+    """
+    if (settings := get_settings()) is None:
+        return jsonify(payload)
+    mimetype = response_mimetype()
+    if (fmt := settings.by_mimetype.get(mimetype)) is None:
+        response = jsonify(payload)
+    else:
+        response = Response(fmt.dumps(payload), mimetype=mimetype)
+    response.vary.add("Accept")
+    return response
+
+
+def request_payload() -> Any:
+    """
+    按 ``Content-Type`` 解码请求体，非二进制格式时与 ``request.json`` 相同
+
+    :return: 请求内容
+    :rtype: Any
+
+    :raise UnsupportedMediaType: 请求体不是 JSON 或已启用的二进制格式
+    :raise BadRequest: 请求体无法解码
+    """
+    settings = get_settings()
+    if settings is None or (fmt := settings.by_mimetype.get(request.mimetype)) is None:
+        return request.json
+    try:
+        return fmt.loads(request.get_data(cache=False))
+    except ValueError as err:
+        raise BadRequest(f"Failed to decode {fmt.name} object: {err}")
+
+
+def initialize_serialization(app: Flask) -> None:
+    """
+    根据配置启用二进制格式，未启用任何格式时只使用 JSON
+
+    :param app: 应用
+    :type app: Flask
+    """
+    available = available_formats()
+    names = [name.strip() for name in app.config["SERIALIZATION_FORMATS"].split(",")]
+    formats = tuple(available[name] for name in names if name in available)
+    app.extensions[SERIALIZATION_EXTENSION] = SerializationSettings(
+        formats=formats,
+        offers=(JSON_MIMETYPE, *(mimetype for fmt in formats for mimetype in fmt.mimetypes)),
+        by_mimetype={mimetype: fmt for fmt in formats for mimetype in fmt.mimetypes},
+    )
+
+
+__all__ = (
+    "Format",
+    "available_formats",
+    "response_mimetype",
+    "encode_response",
+    "request_payload",
+    "initialize_serialization",
+)
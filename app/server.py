@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+生产环境多进程服务器
+
+基于 gunicorn 的预派生 (pre-fork) 模型：
+应用在主进程中只创建一次并完成预热，随后冻结垃圾回收追踪的对象，
+使子进程可以通过写时复制 (copy-on-write) 共享这些内存页
+
+.. note::
+   gunicorn 仅支持类 Unix 系统，Windows 下请继续使用 ``python app.py``
+"""
+
+import gc
+import os
+from typing import Any
+from typing import Optional
+
+import click
+from flask import Flask
+
+from .extensions import db
+from .metrics import metrics_directory
+from .metrics import registry
+from .startup import warm_up
+
+
+def dispose_engines(app: Flask) -> None:
+    """
+    丢弃从主进程继承的数据库连接，避免多个进程共用同一连接
+
+    :param app: 应用
+    :type app: Flask
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def ssl_options(app: Flask) -> dict[str, str]:
+    """
+    获取 SSL 配置，证书不存在时不启用 SSL
+
+    :param app: 应用
+    :type app: Flask
+
+    :return: gunicorn SSL 配置
+    :rtype: dict[str, str]
+    """
+    if not os.path.exists(app.config["SSL_CERTIFICATE"]):
+        return {}
+    return dict(certfile=app.config["SSL_CERTIFICATE"], keyfile=app.config["SSL_PRIVATE_KEY"])
+
+
+def serve(app: Flask, **options: Any) -> None:
+    """
+    使用多进程服务器运行应用
+
+    :param app: 已创建的应用，将在主进程中预加载
+    :type app: Flask
+    :param options: gunicorn 配置项，未指定的项从 ``SERVER_*`` 配置读取
+    :type options: Any
+    """
+    from gunicorn.app.base import BaseApplication  # type: ignore[import-untyped]
+
+    config: dict[str, Any] = dict(
+        bind=app.config["SERVER_BIND"],
+        workers=app.config["SERVER_WORKERS"],
+        threads=app.config["SERVER_THREADS"],
+        worker_class="gthread",
+        max_requests=app.config["SERVER_MAX_REQUESTS"],
+        max_requests_jitter=app.config["SERVER_MAX_REQUESTS_JITTER"],
+        graceful_timeout=app.config["SERVER_GRACEFUL_TIMEOUT"],
+        timeout=app.config["SERVER_TIMEOUT"],
+        preload_app=True,
+        **ssl_options(app),
+    )
+    config.update({k: v for k, v in options.items() if v is not None})
+
+    def when_ready(_server: Any) -> None:
+        # 主进程已完成导入和预热，此后分配的对象不再被垃圾回收遍历
+        gc.collect()
+        gc.freeze()
+
+    def post_fork(_server: Any, _worker: Any) -> None:
+        dispose_engines(app)
+        registry.reset()
+
+    class Server(BaseApplication):  # type: ignore[misc]
+        def load_config(self) -> None:
+            for key, value in (config | dict(when_ready=when_ready, post_fork=post_fork)).items():
+                self.cfg.set(key, value)
+
+        def load(self) -> Flask:
+            return app
+
+    if app.config["METRICS_ENABLED"]:
+        # 各工作进程将指标写入共享目录，由处理 /api/metrics 的进程合并
+        registry.use_directory(metrics_directory(app), clear=True)
+    warm_up(app)
+    Server().run()
+
+
+def initialize_commands(app: Flask) -> None:
+    @app.cli.command("serve")
+    @click.option("--bind", "-b", default=None, help="监听地址")
+    @click.option("--workers", "-w", type=int, default=None, help="工作进程数")
+    @click.option("--threads", "-t", type=int, default=None, help="每个工作进程的线程数")
+    @click.option("--max-requests", type=int, default=None, help="工作进程处理多少请求后重启")
+    @click.option("--graceful-timeout", type=int, default=None, help="优雅关闭的超时时间（秒）")
+    def serve_command(
+            bind: Optional[str],
+            workers: Optional[int],
+            threads: Optional[int],
+            max_requests: Optional[int],
+            graceful_timeout: Optional[int],
+    ) -> None:
+        """使用多进程服务器运行应用"""
+        serve(
+            app,
+            bind=bind,
+            workers=workers,
+            threads=threads,
+            max_requests=max_requests,
+            graceful_timeout=graceful_timeout,
+        )
+
+
+__all__ = (
+    "dispose_engines",
+    "ssl_options",
+    "serve",
+    "initialize_commands",
+)
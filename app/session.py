@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+
+from collections.abc import Callable
+from typing import Any
+from typing import Optional
+
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Connection
+from sqlalchemy import Engine
+from sqlalchemy.sql.dml import UpdateBase
+
+type ReplicaSelector = Callable[[bool], Optional[str]]
+
+REPLICA_SELECTOR_EXTENSION = "replica_selector"
+"""
+副本选择函数在 ``app.extensions`` 中的键名
+
+参数为本次操作是否为写入，返回副本的绑定名，返回 None 表示使用主库
+"""
+
+
+class RoutingSession(Session):
+    """
+    支持读写分离的会话
+
+    默认绑定上的查询交由应用注册的副本选择函数决定是否改用只读副本，
+    写入语句总是使用主库，具体的路由策略见 :py:mod:`app.database.routing`
+
+    .. note::
+       该模块不能导入 ``extensions``，否则会产生循环导入
+    """
+
+    def get_bind(
+            self,
+            mapper: Optional[Any] = None,
+            clause: Optional[Any] = None,
+            bind: Optional[Engine | Connection] = None,
+            **kwargs: Any,
+    ) -> Engine | Connection:
+        engine = super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+        selector: Optional[ReplicaSelector] = current_app.extensions.get(REPLICA_SELECTOR_EXTENSION)
+        if bind is not None or selector is None or engine is not self._db.engines.get(None):
+            return engine
+
+        replica_key = selector(isinstance(clause, UpdateBase))
+        if replica_key is None:
+            return engine
+        return self._db.engines[replica_key]
+
+
+__all__ = (
+    "ReplicaSelector",
+    "REPLICA_SELECTOR_EXTENSION",
+    "RoutingSession",
+)
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+数据表的版本戳
+
+每张表有一个版本戳（版本号与最后修改时间）。ORM 会话提交后，递增本次写入涉及的各表的版本号；绕过 ORM 的批量写入
+（如 ``flask generate-data``）调用 :py:func:`invalidate_all` 递增所有表共用的 :py:data:`GENERATION`。
+读取版本戳不访问数据库：``REDIS_URL`` 为 ``memory://`` 时保存在进程内，否则保存在 Redis 中，各进程共享。
+
+:py:data:`GENERATION` 的修改时间在进程内创建版本戳或首次读取 Redis 中的版本戳时设置为当前时间，
+进程重启或 Redis 被清空后版本号从 0 重新开始，其修改时间总是不同，由版本戳计算的缓存键与 ETag 不会与之前的重复。
+响应缓存（:py:mod:`app.cache`）与条件请求（:py:mod:`app.conditional`）以版本戳判断内容是否变化
+"""
+
+import logging
+import threading
+import time
+from collections.abc import Collection
+from collections.abc import Iterable
+from dataclasses import dataclass
+from typing import Any
+from typing import Optional
+from typing import Protocol
+
+import redis
+from flask import Flask
+from flask import current_app
+from flask import has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import ORMExecuteState
+from sqlalchemy.orm import Session
+
+from .extensions import jwt_redis_blocklist
+from .memory_redis import MemoryRedis
+from .models.system import app_meta
+from .models.system import change_log
+from .models.system import jobs
+from .models.system import table_versions
+from .session import RoutingSession
+
+STAMPS_EXTENSION = "stamps"
+WRITTEN_TABLES = "stamps_written_tables"
+"""
+``Session.info`` 中当前事务写入的表名，提交后递增其版本号
+"""
+GENERATION = "*"
+"""
+所有表共用的版本戳，:py:func:`invalidate_all` 递增
+"""
+IGNORED_TABLES = frozenset(table.name for table in (app_meta, table_versions, change_log, jobs))
+"""
+不对外提供读取的系统表，写入时不递增版本号
+"""
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Stamp:
+    version: int
+    modified: float
+    """
+    最后一次递增的时间（Unix 时间戳），从未递增时为 0
+    """
+
+
+class StampStore(Protocol):
+    def get(self, names: Collection[str]) -> Optional[list[Stamp]]:
+        """
+        读取各表的版本戳，无法读取时返回 None，此时不使用缓存与条件请求
+        """
+        ...
+
+    def bump(self, names: Collection[str]) -> None:
+        ...
+
+
+class LocalStamps:
+    """
+    进程内的版本戳，用于 ``memory://``
+    """
+
+    def __init__(self) -> None:
+        self._stamps: dict[str, Stamp] = {GENERATION: Stamp(0, time.time())}
+        self._lock = threading.Lock()
+
+    def get(self, names: Collection[str]) -> Optional[list[Stamp]]:
+        with self._lock:
+            return [self._stamps.get(name, Stamp(0, 0)) for name in names]
+
+    def bump(self, names: Collection[str]) -> None:
+        now = time.time()
+        with self._lock:
+            for name in names:
+                self._stamps[name] = Stamp(self._stamps.get(name, Stamp(0, 0)).version + 1, now)
+
+
+class RedisStamps:
+    """
+    Redis 中各进程共享的版本戳，版本号与修改时间分别保存在两个哈希中
+    """
+
+    def __init__(self, client: redis.StrictRedis, prefix: str) -> None:
+        self.client = client
+        self.versions_key = f"{prefix}versions"
+        self.modified_key = f"{prefix}modified"
+
+    def initialize(self) -> None:
+        self.client.hsetnx(self.modified_key, GENERATION, repr(time.time()))
+
+    def get(self, names: Collection[str]) -> Optional[list[Stamp]]:
+        try:
+            versions, modified = self.read(names)
+            if modified[0] is None:
+                # Redis 被清空，重新设置 GENERATION 的修改时间
+                self.initialize()
+                versions, modified = self.read(names)
+        except redis.exceptions.RedisError:
+            logger.warning("读取数据表版本戳失败", exc_info=True)
+            return None
+        return [Stamp(int(version or 0), float(stamp or 0)) for version, stamp in zip(versions, modified)]
+
+    def read(self, names: Collection[str]) -> tuple[list[Any], list[Any]]:
+        """
+        读取版本号与修改时间，``names`` 的第一项须为 :py:data:`GENERATION`
+        """
+        pipeline = self.client.pipeline(transaction=False)
+        pipeline.hmget(self.versions_key, list(names))
+        pipeline.hmget(self.modified_key, list(names))
+        versions, modified = pipeline.execute()
+        return versions, modified
+
+    def bump(self, names: Collection[str]) -> None:
+        now = time.time()
+        pipeline = self.client.pipeline(transaction=False)
+        for name in names:
+            pipeline.hincrby(self.versions_key, name, 1)
+        pipeline.hset(self.modified_key, mapping={name: repr(now) for name in names})
+        pipeline.execute()
+
+
+def get_stamps(names: Collection[str]) -> Optional[list[Stamp]]:
+    """
+    读取各表的版本戳
+
+    :param names: 表名
+    :type names: Collection[str]
+
+    :return: :py:data:`GENERATION` 与各表的版本戳，无法读取时返回 None
+    :rtype: Optional[list[Stamp]]
+    """
+    store: StampStore = current_app.extensions[STAMPS_EXTENSION]
+    return store.get((GENERATION, *names))
+
+
+def bump_stamps(names: Iterable[str]) -> None:
+    """
+    递增各表的版本号
+    """
+    if not has_app_context() or STAMPS_EXTENSION not in current_app.extensions:
+        return
+    if names := sorted(set(names) - IGNORED_TABLES):
+        store: StampStore = current_app.extensions[STAMPS_EXTENSION]
+        try:
+            store.bump(names)
+        except redis.exceptions.RedisError:
+            # 数据已提交，缓存的旧条目最迟在 CACHE_TTL_SECONDS 后过期
+            logger.warning("递增数据表版本戳失败", exc_info=True)
+
+
+def invalidate_all() -> None:
+    """
+    递增所有表共用的版本号，用于绕过 ORM 的批量写入
+    """
+    bump_stamps((GENERATION,))
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def collect_flushed(session: Session, _flush_context: Any) -> None:
+    written: set[str] = session.info.setdefault(WRITTEN_TABLES, set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if (table_name := getattr(obj, "__tablename__", None)) is not None:
+            written.add(table_name)
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def collect_executed(state: ORMExecuteState) -> None:
+    # 经会话执行的 INSERT / UPDATE / DELETE 语句，如批量写入关联表
+    if state.is_insert or state.is_update or state.is_delete:
+        if (table_name := getattr(getattr(state.statement, "table", None), "name", None)) is not None:
+            state.session.info.setdefault(WRITTEN_TABLES, set()).add(table_name)
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def bump_committed(session: Session) -> None:
+    if written := session.info.pop(WRITTEN_TABLES, None):
+        bump_stamps(written)
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def discard_written(session: Session) -> None:
+    session.info.pop(WRITTEN_TABLES, None)
+
+
+def initialize_stamps(app: Flask) -> None:
+    """
+    创建版本戳的存储
+
+    :param app: 应用
+    :type app: Flask
+    """
+    if isinstance(jwt_redis_blocklist, MemoryRedis):
+        app.extensions[STAMPS_EXTENSION] = LocalStamps()
+        return
+    # GENERATION 的修改时间在首次读取时设置，不处理请求的命令行命令无需连接 Redis
+    client = redis.StrictRedis.from_url(app.config["REDIS_URL"])
+    app.extensions[STAMPS_EXTENSION] = RedisStamps(client, app.config["STAMPS_KEY_PREFIX"])
+
+
+__all__ = (
+    "GENERATION",
+    "Stamp",
+    "LocalStamps",
+    "RedisStamps",
+    "get_stamps",
+    "bump_stamps",
+    "invalidate_all",
+    "initialize_stamps",
+)
@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+启动过程
+
+* 记录 ``create_app`` 各阶段的耗时，``flask startup-profile`` 同时给出各模块的导入耗时
+* 启动服务前预热：配置映射、检查数据库结构、预编译常用查询并检查 Redis 连接，避免首个请求变慢
+* 路由延迟加载：不处理 HTTP 请求的命令行命令不导入视图模块
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections.abc import Callable
+from collections.abc import Iterable
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import asdict
+from dataclasses import dataclass
+from typing import Any
+from typing import Optional
+
+import click
+from flask import Flask
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm import configure_mappers
+
+from .extensions import check_redis
+from .extensions import db
+
+STARTUP_EXTENSION = "startup_profiler"
+PROFILE_MARKER = "STARTUP-PROFILE:"
+"""
+子进程输出阶段耗时所在行的前缀
+"""
+
+
+@dataclass
+class Phase:
+    """
+    启动阶段
+    """
+    name: str
+    seconds: float
+    depth: int
+
+
+class StartupProfiler:
+    """
+    启动阶段计时
+    """
+
+    def __init__(self) -> None:
+        self.phases: list[Phase] = []
+        self._depth = 0
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        记录一个阶段的耗时，可嵌套
+
+        :param name: 阶段名
+        :type name: str
+        """
+        phase = Phase(name=name, seconds=0, depth=self._depth)
+        self.phases.append(phase)
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            phase.seconds = time.perf_counter() - start
+            self._depth -= 1
+
+    def report(self) -> list[dict[str, Any]]:
+        return [asdict(phase) for phase in self.phases]
+
+
+def get_profiler(app: Flask) -> StartupProfiler:
+    """
+    获取应用的启动阶段计时，应用未记录时返回新的空计时
+    """
+    profiler: StartupProfiler = app.extensions.get(STARTUP_EXTENSION) or StartupProfiler()
+    return profiler
+
+
+class LazyRoutes:
+    """
+    延迟加载路由的 WSGI 中间件
+
+    在处理第一个请求之前（或调用 :py:meth:`load` 时）加载路由，此时 Flask 仍允许注册蓝图
+    """
+
+    def __init__(self, app: Flask, loader: Callable[[Flask], None]) -> None:
+        self.app = app
+        self.wsgi_app = app.wsgi_app
+        self.loader = loader
+        self.loaded = False
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        if self.loaded:
+            return
+        with self._lock:
+            if not self.loaded:
+                with get_profiler(self.app).phase("加载路由"):
+                    self.loader(self.app)
+                self.loaded = True
+
+    def __call__(self, environ: dict[str, Any], start_response: Callable[..., Any]) -> Iterable[bytes]:
+        self.load()
+        return self.wsgi_app(environ, start_response)
+
+
+def install_routes(app: Flask, loader: Callable[[Flask], None]) -> None:
+    """
+    加载路由
+
+    通过 Flask 命令行运行且启用了 ``STARTUP_LAZY_ROUTES`` 时延迟到第一个请求或预热时再加载，
+    其余情况立即加载
+
+    :param app: 应用
+    :type app: Flask
+    :param loader: 导入视图模块并注册蓝图的函数
+    :type loader: Callable[[Flask], None]
+    """
+    lazy = LazyRoutes(app, loader)
+    if not (app.config["STARTUP_LAZY_ROUTES"] and os.environ.get("FLASK_RUN_FROM_CLI") == "true"):
+        lazy.load()
+        return
+    app.wsgi_app = lazy  # type: ignore[method-assign]
+
+
+def load_routes(app: Flask) -> None:
+    """
+    确保路由已加载
+    """
+    if isinstance(app.wsgi_app, LazyRoutes):
+        app.wsgi_app.load()
+
+
+def warm_up_queries(app: Flask) -> None:
+    """
+    在每个引擎上执行一次常用查询，使查询编译缓存在第一个请求之前就绪
+
+    :param app: 应用
+    :type app: Flask
+    """
+    from .model_utils import BaseModel
+    from .models.auth import User
+
+    models: dict[str, type[BaseModel]] = BaseModel.name2table()  # type: ignore[assignment]
+    with app.app_context():
+        for engine in db.engines.values():
+            with Session(engine) as session:
+                try:
+                    session.query(User).filter_by(id=0).one_or_none()
+                    for model in models.values():
+                        session.query(model).offset(0).limit(0).all()
+                except SQLAlchemyError as err:
+                    print(f"查询预热失败：{err.__class__.__name__}，数据库可能尚未初始化")
+                    return
+
+
+def warm_up(app: Flask) -> None:
+    """
+    启动服务（包括在派生工作进程之前）时预热应用
+
+    :param app: 应用
+    :type app: Flask
+    """
+    from .database import verify_schema
+
+    profiler = get_profiler(app)
+    with profiler.phase("预热"):
+        load_routes(app)
+        with profiler.phase("配置映射"):
+            with app.app_context():
+                configure_mappers()
+        with profiler.phase("检查数据库结构"):
+            verify_schema(app)
+        with profiler.phase("预编译查询"):
+            warm_up_queries(app)
+        with profiler.phase("检查 Redis"):
+            check_redis()
+
+
+def parse_import_times(lines: Iterable[str]) -> list[tuple[str, int, int]]:
+    """
+    解析 ``python -X importtime`` 的输出
+
+    :param lines: 标准错误输出的各行
+    :type lines: Iterable[str]
+
+    :return: (模块名, 自身耗时, 累计耗时)，耗时单位为微秒
+    :rtype: list[tuple[str, int, int]]
+    """
+    imports: list[tuple[str, int, int]] = []
+    for line in lines:
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+PROFILE_SCRIPT = """
+import json
+import sys
+import time
+
+start = time.perf_counter()
+from app import create_app
+from app.startup import PROFILE_MARKER
+from app.startup import get_profiler
+from app.startup import warm_up
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+if sys.argv[1] == "warm":
+    warm_up(app)
+print(PROFILE_MARKER + json.dumps(dict(
+    import_seconds=imported - start,
+    create_seconds=created - imported,
+    total_seconds=time.perf_counter() - start,
+    phases=get_profiler(app).report(),
+)))
+"""
+
+
+def profile_startup(*, warm: bool, lazy_routes: bool) -> tuple[dict[str, Any], list[tuple[str, int, int]]]:
+    """
+    在子进程中启动应用并计时，子进程的模块缓存为空，与实际冷启动一致
+
+    :param warm: 是否同时执行预热
+    :type warm: bool
+    :param lazy_routes: 是否延迟加载路由
+    :type lazy_routes: bool
+
+    :return: 阶段耗时与模块导入耗时
+    :rtype: tuple[dict[str, Any], list[tuple[str, int, int]]]
+
+    :raise click.ClickException: 子进程启动失败
+    """
+    env = os.environ | dict(
+        FLASK_RUN_FROM_CLI="true",
+        STARTUP_LAZY_ROUTES=str(lazy_routes).lower(),
+        DATABASE_PROFILE_REPORT="false",
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROFILE_SCRIPT, "warm" if warm else "cold"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    profile: Optional[dict[str, Any]] = None
+    for line in result.stdout.splitlines():
+        if line.startswith(PROFILE_MARKER):
+            profile = json.loads(line.removeprefix(PROFILE_MARKER))
+    if result.returncode != 0 or profile is None:
+        raise click.ClickException(f"启动失败：\n{result.stderr[-2000:]}")
+    return profile, parse_import_times(result.stderr.splitlines())
+
+
+def print_profile(profile: dict[str, Any], imports: list[tuple[str, int, int]], top: int) -> None:
+    print(f"导入 app：{profile['import_seconds'] * 1000:.1f} ms")
+    print(f"create_app：{profile['create_seconds'] * 1000:.1f} ms")
+    print(f"合计：{profile['total_seconds'] * 1000:.1f} ms")
+    print()
+    print("启动阶段：")
+    for phase in profile["phases"]:
+        print(f"    {'    ' * phase['depth']}{phase['name']}：{phase['seconds'] * 1000:.1f} ms")
+    print()
+    print(f"累计导入耗时最长的 {top} 个模块：")
+    for name, self_us, cumulative_us in sorted(imports, key=lambda i: i[2], reverse=True)[:top]:
+        print(f"    {cumulative_us / 1000:8.1f} ms (自身 {self_us / 1000:6.1f} ms)  {name}")
+    print()
+    print("应用模块：")
+    for name, self_us, cumulative_us in imports:
+        if name == "app" or name.startswith("app."):
+            print(f"    {cumulative_us / 1000:8.1f} ms (自身 {self_us / 1000:6.1f} ms)  {name}")
+
+
+def initialize_commands(app: Flask) -> None:
+    @app.cli.command("startup-profile")
+    @click.option("--top", type=int, default=20, help="显示导入耗时最长的模块数")
+    @click.option("--warm/--no-warm", default=True, help="是否包括启动服务前的预热")
+    @click.option("--lazy-routes/--eager-routes", default=False, help="是否延迟加载路由")
+    def startup_profile(top: int, warm: bool, lazy_routes: bool) -> None:
+        """分析应用启动各阶段与各模块导入的耗时"""
+        profile, imports = profile_startup(warm=warm, lazy_routes=lazy_routes)
+        print_profile(profile, imports, top)
+
+
+__all__ = (
+    "Phase",
+    "StartupProfiler",
+    "get_profiler",
+    "LazyRoutes",
+    "install_routes",
+    "load_routes",
+    "warm_up_queries",
+    "warm_up",
+    "parse_import_times",
+    "profile_startup",
+    "initialize_commands",
+)
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+请求追踪
+
+按 ``TRACE_SAMPLE_RATE`` 采样请求，记录请求经过的各个阶段：令牌验证（:py:func:`app.permission.jwt_required`，
+其中包括黑名单查询与用户加载）、``api``、``permissions_required``、``build_response``、
+``refresh_expiring_jwts``，以及每条 SQL 语句与 Redis 命令。
+追踪写入 ``TRACE_DIR``，``flask trace-summary`` 汇总所有追踪中耗时最多的跨度
+"""
+
+import functools
+import itertools
+import os
+import random
+import time
+from collections.abc import Callable
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any
+from typing import Optional
+
+import click
+from flask import Flask
+from flask import current_app
+from flask import g
+from flask import has_request_context
+from flask import request
+
+from .recorder import SpanSummary
+from .recorder import Trace
+from .recorder import TraceWriter
+from .recorder import group_traces
+from .recorder import read_events
+from .recorder import summarize
+from .recorder import trace_files
+from ..database.queries import fingerprint
+from ..database.timing import ExecutedStatement
+from ..database.timing import on_statement
+from ..extensions import jwt_redis_blocklist
+from ..redis_timing import ExecutedCommand
+from ..redis_timing import instrument_redis
+from ..redis_timing import on_command
+
+TRACING_EXTENSION = "tracing"
+
+
+@dataclass
+class Tracer:
+    writer: TraceWriter
+    sample_rate: float
+
+
+_trace_ids = itertools.count(1)
+
+
+def current_trace() -> Optional[Trace]:
+    """
+    获取当前请求的追踪，请求未被采样或不在请求中时返回 None
+    """
+    if not has_request_context():
+        return None
+    trace: Optional[Trace] = g.get("_trace")
+    return trace
+
+
+def start_trace() -> None:
+    """
+    按采样率决定是否追踪当前请求，对应 :py:func:`finish_trace`
+    """
+    tracer: Optional[Tracer] = current_app.extensions.get(TRACING_EXTENSION)
+    if tracer is None or random.random() >= tracer.sample_rate:
+        return
+    g._trace = Trace(id=next(_trace_ids), name=f"{request.method} {request.path}")
+    g._trace_started = time.perf_counter()
+
+
+def finish_trace() -> None:
+    """
+    结束当前请求的追踪并写入文件
+    """
+    trace: Optional[Trace] = g.pop("_trace", None)
+    if trace is None:
+        return
+    args = dict(method=request.method, path=request.path)
+    trace.add(f"{request.method} {request.endpoint}", "request", g.pop("_trace_started"), time.perf_counter(), args)
+    tracer: Tracer = current_app.extensions[TRACING_EXTENSION]
+    tracer.writer.write(trace)
+
+
+@contextmanager
+def span(name: str, category: str = "app", **args: Any) -> Iterator[None]:
+    """
+    在当前请求的追踪中记录一个跨度，请求未被采样时不做任何事
+
+    :param name: 跨度名
+    :type name: str
+    :param category: 类别
+    :type category: str
+    :param args: 附加信息
+    :type args: Any
+    """
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, category, start, time.perf_counter(), args)
+
+
+def traced[**P, R](name: str, category: str = "app") -> Callable[[Callable[P, R]], Callable[P, R]]:
+    """
+    将函数的每次调用记录为跨度
+    """
+
+    def wrapper(func: Callable[P, R]) -> Callable[P, R]:
+        @functools.wraps(func)
+        def inner(*args: P.args, **kwargs: P.kwargs) -> R:
+            with span(name, category):
+                return func(*args, **kwargs)
+
+        return inner
+
+    return wrapper
+
+
+def record_statement(executed: ExecutedStatement) -> None:
+    if (trace := current_trace()) is not None:
+        trace.add("sql", "sql", executed.start, executed.end, dict(statement=fingerprint(executed.statement)))
+
+
+def record_command(executed: ExecutedCommand) -> None:
+    if (trace := current_trace()) is not None:
+        trace.add(f"redis {executed.name.upper()}", "redis", executed.start, executed.end)
+
+
+def trace_directory(app: Flask) -> str:
+    """
+    获取追踪文件目录，未配置时使用实例目录下的 ``traces``
+    """
+    return str(app.config["TRACE_DIR"] or os.path.join(app.instance_path, "traces"))
+
+
+def initialize_hooks(app: Flask) -> None:
+    """
+    注册追踪所需的钩子，需在其余钩子之前调用，使请求跨度包括其余钩子的耗时
+    """
+    if app.config["TRACE_SAMPLE_RATE"] <= 0:
+        return
+    writer = TraceWriter(trace_directory(app), app.config["TRACE_MAX_BYTES"], app.config["TRACE_BACKUP_COUNT"])
+    app.extensions[TRACING_EXTENSION] = Tracer(writer=writer, sample_rate=app.config["TRACE_SAMPLE_RATE"])
+
+    # 语句与 Redis 命令的计时与接口指标共用
+    on_statement(record_statement)
+    on_command(record_command)
+    instrument_redis(jwt_redis_blocklist)
+
+    @app.before_request
+    def start() -> None:
+        start_trace()
+
+    @app.teardown_request
+    def finish(_exc: Optional[BaseException]) -> None:
+        finish_trace()
+
+
+def print_summary(summaries: list[SpanSummary], traces: int, top: int) -> None:
+    print(f"共 {traces} 个追踪，自身耗时最多的 {min(top, len(summaries))} 个跨度：")
+    print()
+    for summary in summaries[:top]:
+        print(
+            f"    自身 {summary.self_total / 1000:9.1f} ms  合计 {summary.total / 1000:9.1f} ms  "
+            f"{summary.count:6d} 次  平均 {summary.total / summary.count / 1000:7.2f} ms  "
+            f"p95 {summary.percentile(0.95) / 1000:7.2f} ms  最大 {max(summary.durations) / 1000:7.2f} ms  "
+            f"[{summary.category}] {summary.name}"
+        )
+
+
+def initialize_commands(app: Flask) -> None:
+    @app.cli.command("trace-summary")
+    @click.option("--dir", "directory", default=None, help="追踪文件目录，默认为 TRACE_DIR")
+    @click.option("--top", type=int, default=20, show_default=True, help="显示的跨度数")
+    @click.option("--statements", is_flag=True, help="按语句指纹分别统计 SQL 跨度")
+    @click.option("--endpoint", default=None, help="只统计该端点的请求，如 data.get_rows")
+    def trace_summary(directory: Optional[str], top: int, statements: bool, endpoint: Optional[str]) -> None:
+        """汇总追踪文件，列出自身耗时最多的跨度"""
+        directory = directory or trace_directory(app)
+        files = trace_files(directory)
+        if not files:
+            print(f"{directory} 中没有追踪文件，请设置 TRACE_SAMPLE_RATE 后处理一些请求")
+            return
+        traces = group_traces(itertools.chain.from_iterable(read_events(path) for path in files))
+        selected = [
+            events for events in traces.values()
+            if endpoint is None or any(e["cat"] == "request" and e["name"].endswith(f" {endpoint}") for e in events)
+        ]
+        print_summary(summarize(selected, statements=statements), len(selected), top)
+
+
+__all__ = (
+    "Trace",
+    "TraceWriter",
+    "current_trace",
+    "start_trace",
+    "finish_trace",
+    "span",
+    "traced",
+    "trace_directory",
+    "initialize_hooks",
+    "initialize_commands",
+)
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+追踪记录
+
+追踪以 Chrome 追踪事件格式（JSON 数组格式，末尾的 ``]`` 可省略）写入文件，
+可直接用 Perfetto 或 ``chrome://tracing`` 打开。每个进程写入单独的文件，
+文件超过大小上限后轮转；每个请求占用一条时间线（``tid`` 为进程内的追踪序号），
+跨度之间的嵌套关系由时间上的包含关系表示
+"""
+
+import glob
+import json
+import math
+import os
+import threading
+import time
+from collections.abc import Iterable
+from collections.abc import Iterator
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Optional
+
+type Event = dict[str, Any]
+
+FILE_PREFIX = "trace-"
+FILE_SUFFIX = ".json"
+EPOCH_OFFSET = time.time() - time.perf_counter()
+"""
+:py:func:`time.perf_counter` 与 Unix 时间的差，用于将计时转换为时间戳
+"""
+
+
+def timestamp(counter: float) -> float:
+    """
+    将 :py:func:`time.perf_counter` 的值转换为追踪事件的时间戳（微秒）
+    """
+    return round((counter + EPOCH_OFFSET) * 1_000_000, 3)
+
+
+@dataclass
+class Trace:
+    """
+    一个请求的追踪
+    """
+    id: int
+    """
+    进程内的追踪序号，作为事件的 ``tid``
+    """
+    name: str
+    pid: int = field(default_factory=os.getpid)
+    events: list[Event] = field(default_factory=list)
+
+    def add(self, name: str, category: str, start: float, end: float, args: Optional[dict[str, Any]] = None) -> None:
+        """
+        添加一个跨度
+
+        :param name: 跨度名
+        :type name: str
+        :param category: 类别，如 ``request``、``auth``、``sql``、``redis``
+        :type category: str
+        :param start: :py:func:`time.perf_counter` 表示的开始时间
+        :type start: float
+        :param end: :py:func:`time.perf_counter` 表示的结束时间
+        :type end: float
+        :param args: 附加信息
+        :type args: Optional[dict[str, Any]]
+        """
+        event: Event = dict(
+            name=name,
+            cat=category,
+            ph="X",
+            ts=timestamp(start),
+            dur=round((end - start) * 1_000_000, 3),
+            pid=self.pid,
+            tid=self.id,
+        )
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def export(self) -> list[Event]:
+        """
+        获取追踪的全部事件，包括为时间线命名的元数据事件
+        """
+        metadata: Event = dict(name="thread_name", ph="M", pid=self.pid, tid=self.id, args=dict(name=self.name))
+        return [metadata, *self.events]
+
+
+class TraceWriter:
+    """
+    将追踪追加到当前进程的追踪文件，超过 ``max_bytes`` 时轮转
+
+    :ivar directory: 追踪文件目录
+    :ivar max_bytes: 单个文件的最大字节数
+    :ivar backup_count: 保留的轮转文件数，文件名依次为 ``trace-<pid>.json.1``、``.2`` ……
+    """
+
+    def __init__(self, directory: str, max_bytes: int, backup_count: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        # 每次写入时获取进程号，fork 出的工作进程写入各自的文件
+        return os.path.join(self.directory, f"{FILE_PREFIX}{os.getpid()}{FILE_SUFFIX}")
+
+    def rotate(self, path: str) -> None:
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f"{path}.{i}"):
+                os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(path, f"{path}.1")
+        else:
+            os.remove(path)
+
+    def write(self, trace: Trace) -> None:
+        content = "".join(json.dumps(e, ensure_ascii=False, separators=(",", ":")) + ",\n" for e in trace.export())
+        data = content.encode("utf-8")
+        path = self.path
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            if size and size + len(data) > self.max_bytes:
+                self.rotate(path)
+                size = 0
+            with open(path, "ab") as f:
+                f.write(data if size else b"[\n" + data)
+
+
+def trace_files(directory: str) -> list[str]:
+    """
+    获取目录中的所有追踪文件，包括轮转后的文件
+    """
+    return sorted(glob.glob(os.path.join(glob.escape(directory), f"{FILE_PREFIX}*{FILE_SUFFIX}*")))
+
+
+def read_events(path: str) -> Iterator[Event]:
+    """
+    读取追踪文件中的事件，忽略写入中断造成的不完整行
+
+    :param path: 追踪文件
+    :type path: str
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip().rstrip(",")
+            if line in ("", "[", "]"):
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def group_traces(events: Iterable[Event]) -> dict[tuple[int, int], list[Event]]:
+    """
+    按追踪分组跨度事件
+
+    :return: ``(pid, tid)`` 到该追踪的跨度事件的映射
+    :rtype: dict[tuple[int, int], list[Event]]
+    """
+    traces: dict[tuple[int, int], list[Event]] = {}
+    for event in events:
+        if event.get("ph") == "X":
+            traces.setdefault((event["pid"], event["tid"]), []).append(event)
+    return traces
+
+
+def self_times(events: list[Event]) -> list[tuple[Event, float]]:
+    """
+    计算一个追踪中各跨度的自身耗时，即扣除直接子跨度后的耗时
+
+    :param events: 同一追踪的跨度事件
+    :type events: list[Event]
+
+    :return: 跨度事件及其自身耗时（微秒）
+    :rtype: list[tuple[Event, float]]
+    """
+    ordered = sorted(events, key=lambda e: (e["ts"], -e["dur"]))
+    own = [float(e["dur"]) for e in ordered]
+    stack: list[int] = []
+    for i, event in enumerate(ordered):
+        while stack and ordered[stack[-1]]["ts"] + ordered[stack[-1]]["dur"] <= event["ts"]:
+            stack.pop()
+        if stack:
+            own[stack[-1]] -= event["dur"]
+        stack.append(i)
+    return [(event, max(0.0, value)) for event, value in zip(ordered, own)]
+
+
+@dataclass
+class SpanSummary:
+    """
+    同名跨度在所有追踪中的统计，时间单位为微秒
+    """
+    name: str
+    category: str
+    durations: list[float] = field(default_factory=list)
+    self_total: float = 0
+
+    @property
+    def count(self) -> int:
+        return len(self.durations)
+
+    @property
+    def total(self) -> float:
+        return sum(self.durations)
+
+    def percentile(self, q: float) -> float:
+        ordered = sorted(self.durations)
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))] if ordered else 0
+
+
+def summarize(traces: Iterable[list[Event]], *, statements: bool = False) -> list[SpanSummary]:
+    """
+    汇总所有追踪中的跨度
+
+    :param traces: 各追踪的跨度事件
+    :type traces: Iterable[list[Event]]
+    :param statements: 是否按语句指纹分别统计 SQL 跨度
+    :type statements: bool
+
+    :return: 按自身总耗时降序排列的统计
+    :rtype: list[SpanSummary]
+    """
+    summaries: dict[tuple[str, str], SpanSummary] = {}
+    for events in traces:
+        for event, own in self_times(events):
+            name = event["name"]
+            if statements and "statement" in event.get("args", {}):
+                name = f"{name} {event['args']['statement']}"
+            summary = summaries.get((event["cat"], name))
+            if summary is None:
+                summary = summaries[event["cat"], name] = SpanSummary(name=name, category=event["cat"])
+            summary.durations.append(event["dur"])
+            summary.self_total += own
+    return sorted(summaries.values(), key=lambda s: s.self_total, reverse=True)
+
+
+__all__ = (
+    "Event",
+    "Trace",
+    "TraceWriter",
+    "trace_files",
+    "read_events",
+    "group_traces",
+    "self_times",
+    "SpanSummary",
+    "summarize",
+)
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+请求热路径的基准测试
+
+在临时 SQLite 数据库与进程内 Redis 替代实现上运行，分别测量各组成部分与完整请求的耗时，
+并与提交到仓库中的基准线比较::
+
+    python -m benchmarks                       # 运行并与 benchmarks/baseline.json 比较
+    python -m benchmarks --output result.json  # 保存结果
+    python -m benchmarks --save-baseline       # 更新基准线
+"""
+
+import os
+
+# 须在导入 app 之前设置，Config 在导入时读取环境变量
+os.environ.setdefault("REDIS_URL", "memory://")
+os.environ.setdefault("DATABASE_PROFILE_REPORT", "false")
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark-jwt-secret-key-of-sufficient-length")
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+
+import os
+import sys
+from typing import Optional
+
+import click
+
+from .cases import PAGE_SIZES
+from .cases import ROLE_COUNTS
+from .fixtures import benchmark_env
+from .harness import BenchmarkResult
+from .harness import CASES
+from .harness import compare
+from .harness import dump_results
+from .harness import format_time
+from .harness import load_results
+from .harness import measure
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def print_comparisons(results: list[BenchmarkResult], baseline_path: str, tolerance: float) -> int:
+    """
+    输出与基准线的比较结果
+
+    :return: 超出容差的用例数
+    :rtype: int
+    """
+    regressions = 0
+    print()
+    print(f"与基准线 {baseline_path} 比较（容差 {tolerance:.0%}）：")
+    for comparison in compare(results, load_results(baseline_path)):
+        if comparison.ratio is None:
+            print(f"    {comparison.name:<40} 基准线中不存在")
+            continue
+        mark = "变慢" if comparison.regressed(tolerance) else "正常"
+        regressions += comparison.regressed(tolerance)
+        print(f"    {comparison.name:<40} {comparison.ratio:6.2f}x  {mark}")
+    return regressions
+
+
+@click.command()
+@click.option("--filter", "name_filter", default="", help="只运行名称包含该字符串的用例")
+@click.option("--rows", type=int, default=max(PAGE_SIZES), show_default=True, help="生成的数据行数")
+@click.option("--rounds", type=int, default=7, show_default=True, help="每个用例的轮数")
+@click.option("--min-time", type=float, default=0.05, show_default=True, help="每轮最短耗时（秒）")
+@click.option("--output", type=click.Path(dir_okay=False), default=None, help="将结果写入 JSON 文件")
+@click.option("--baseline", type=click.Path(dir_okay=False), default=DEFAULT_BASELINE, show_default=True)
+@click.option("--tolerance", type=float, default=0.25, show_default=True, help="允许比基准线慢的比例")
+@click.option("--save-baseline", is_flag=True, help="将结果写入基准线文件")
+def main(
+        name_filter: str,
+        rows: int,
+        rounds: int,
+        min_time: float,
+        output: Optional[str],
+        baseline: str,
+        tolerance: float,
+        save_baseline: bool,
+) -> None:
+    """运行请求热路径的基准测试，存在超出容差的用例时以状态码 1 退出"""
+    cases = sorted((case for case in CASES.values() if name_filter in case.name), key=lambda case: case.group)
+    results: list[BenchmarkResult] = []
+    with benchmark_env(rows, ROLE_COUNTS) as env:
+        for case in cases:
+            result = measure(case, env, rounds=rounds, min_time=min_time)
+            results.append(result)
+            print(
+                f"{case.group}  {case.name:<40} {format_time(result.median):>10}"
+                f"  (最小 {format_time(result.min)}, {result.rounds}×{result.number})"
+            )
+
+    if output is not None:
+        dump_results(results, output)
+    if save_baseline:
+        dump_results(results, baseline)
+        print(f"已更新基准线 {baseline}")
+        return
+    if not os.path.exists(baseline):
+        print(f"基准线 {baseline} 不存在，使用 --save-baseline 创建")
+        return
+
+    regressions = print_comparisons(results, baseline, tolerance)
+    if regressions:
+        print(f"{regressions} 个用例超出容差")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+
+from collections.abc import Callable
+from typing import Any
+
+from flask import g
+
+from app.api import GetRows
+from app.api import RequestSuccess
+from app.api import api
+from app.models.auth import User
+from app.models.data import SchoolClass
+from app.permission import PERMISSIONS
+from app.permission import permissions_required
+from .fixtures import ADMIN_PASSWORD
+from .fixtures import ADMIN_USERNAME
+from .fixtures import BenchmarkEnv
+from .fixtures import role_user_name
+from .harness import benchmark
+
+PAGE_SIZES = (10, 100, 1000, 5000)
+ROLE_COUNTS = (1, 5, 10, 20)
+
+
+def load_rows(limit: int) -> list[dict[str, Any]]:
+    return [row.to_dict() for row in SchoolClass.query.limit(limit).all()]
+
+
+def success() -> RequestSuccess:
+    return RequestSuccess()
+
+
+# 单独测量
+
+def to_dict_case(size: int) -> Callable[[BenchmarkEnv], Callable[[], Any]]:
+    def setup(_env: BenchmarkEnv) -> Callable[[], Any]:
+        rows = SchoolClass.query.limit(size).all()
+        return lambda: [row.to_dict() for row in rows]
+
+    return setup
+
+
+def build_response_case(size: int) -> Callable[[BenchmarkEnv], Callable[[], Any]]:
+    def setup(_env: BenchmarkEnv) -> Callable[[], Any]:
+        result = GetRows(rows=load_rows(size))
+        return result.build_response
+
+    return setup
+
+
+@benchmark("api", "组成部分")
+def api_case(_env: BenchmarkEnv) -> Callable[[], Any]:
+    return api(success)
+
+
+def permissions_case(role_count: int) -> Callable[[BenchmarkEnv], Callable[[], Any]]:
+    def setup(_env: BenchmarkEnv) -> Callable[[], Any]:
+        user = User.query.filter_by(username=role_user_name(role_count)).one()
+        view = permissions_required([PERMISSIONS.DATA.GET])(success)
+
+        def run() -> Any:
+            # current_user 要求已验证令牌
+            g._jwt_extended_jwt = {"sub": str(user.id)}
+            g._jwt_extended_jwt_user = {"loaded_user": user}
+            result = view()
+            assert isinstance(result, RequestSuccess), result
+            return result
+
+        return run
+
+    return setup
+
+
+# 完整请求
+
+def get_rows_case(size: int) -> Callable[[BenchmarkEnv], Callable[[], Any]]:
+    def setup(env: BenchmarkEnv) -> Callable[[], Any]:
+        if size > env.rows:
+            raise ValueError(f"page size {size} exceeds generated rows {env.rows}")
+        url = f"/api/data/tables/classes/rows/0/{size}"
+
+        def run() -> Any:
+            response = env.client.get(url)
+            assert response.status_code == 200, response.get_json()
+            return response
+
+        return run
+
+    return setup
+
+
+@benchmark("login", "完整请求")
+def login_case(env: BenchmarkEnv) -> Callable[[], Any]:
+    client = env.app.test_client()
+    client.environ_base["wsgi.url_scheme"] = "https"
+    credentials = dict(username=ADMIN_USERNAME, password=ADMIN_PASSWORD)
+
+    def run() -> Any:
+        response = client.post("/api/auth/login", json=credentials)
+        assert response.status_code == 200, response.get_json()
+        return response
+
+    return run
+
+
+for _size in PAGE_SIZES:
+    benchmark(f"to_dict[{_size}]", "组成部分")(to_dict_case(_size))
+    benchmark(f"GetRows.build_response[{_size}]", "组成部分")(build_response_case(_size))
+    benchmark(f"get_rows[{_size}]", "完整请求")(get_rows_case(_size))
+
+for _role_count in ROLE_COUNTS:
+    benchmark(f"permissions_required[{_role_count} roles]", "组成部分")(permissions_case(_role_count))
+
+
+__all__ = (
+    "PAGE_SIZES",
+    "ROLE_COUNTS",
+)
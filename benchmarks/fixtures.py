@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+
+import shutil
+import tempfile
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from flask import Flask
+from flask.testing import FlaskClient
+from sqlalchemy import insert
+
+from app import create_app
+from app.extensions import db
+from app.models.auth import Permission
+from app.models.auth import Role
+from app.models.auth import User
+from app.models.data import SchoolClass
+from app.permission import PERMISSIONS
+
+ADMIN_USERNAME = "admin"
+ADMIN_PASSWORD = "admin"
+
+
+@dataclass
+class BenchmarkEnv:
+    """
+    基准测试环境
+    """
+    app: Flask
+    client: FlaskClient
+    """
+    已以管理员身份登录的测试客户端
+    """
+    rows: int
+    """
+    ``classes`` 表中的行数
+    """
+
+
+def populate_classes(rows: int) -> None:
+    db.session.execute(insert(SchoolClass), [dict(name=f"班级{i:07d}") for i in range(rows)])
+    db.session.commit()
+
+
+def role_user_name(role_count: int) -> str:
+    return f"bench_roles_{role_count}"
+
+
+def populate_role_users(role_counts: tuple[int, ...]) -> None:
+    """
+    为每个角色数量创建一个用户，所需权限只属于最后一个角色，即权限检查的最坏情况
+    """
+    permission = Permission.query.filter_by(name=PERMISSIONS.DATA.GET).one()
+    for role_count in role_counts:
+        roles = [
+            Role(name=f"bench_{role_count}_{i}", description="基准测试", permissions=[])
+            for i in range(role_count)
+        ]
+        roles[-1].permissions = [permission]  # type: ignore[assignment]
+        user = User(username=role_user_name(role_count), roles=roles, active=True)
+        user.password = ADMIN_PASSWORD
+        db.session.add(user)
+    db.session.commit()
+
+
+@contextmanager
+def benchmark_env(rows: int, role_counts: tuple[int, ...]) -> Iterator[BenchmarkEnv]:
+    """
+    创建基准测试环境，退出时删除临时数据库
+
+    环境存在期间保持一个请求上下文，用于单独测量各组成部分
+
+    :param rows: ``classes`` 表中生成的行数
+    :type rows: int
+    :param role_counts: 需要创建的用户的角色数量
+    :type role_counts: tuple[int, ...]
+    """
+    directory = tempfile.mkdtemp(prefix="tusr-benchmark-")
+    try:
+        app = create_app(
+            SQLALCHEMY_DATABASE_URI=f"sqlite:///{directory}/benchmark.db",
+            SQLALCHEMY_BINDS={},
+            DATABASE_READ_REPLICAS=0,
+            DATABASE_REPLICA_URIS=[],
+            DATABASE_SCHEMA_CHECK=False,
+        )
+        result = app.test_cli_runner().invoke(args=["init"])
+        if result.exit_code != 0:
+            raise RuntimeError(f"flask init failed:\n{result.output}") from result.exception
+
+        with app.test_request_context():
+            populate_classes(rows)
+            populate_role_users(role_counts)
+
+            client = app.test_client()
+            client.environ_base["wsgi.url_scheme"] = "https"
+            response = client.post("/api/auth/login", json=dict(username=ADMIN_USERNAME, password=ADMIN_PASSWORD))
+            if response.status_code != 200:
+                raise RuntimeError(f"login failed: {response.get_json()}")
+
+            yield BenchmarkEnv(app=app, client=client, rows=rows)
+
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+__all__ = (
+    "ADMIN_USERNAME",
+    "ADMIN_PASSWORD",
+    "BenchmarkEnv",
+    "role_user_name",
+    "benchmark_env",
+)
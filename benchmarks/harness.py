@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+
+import gc
+import json
+import platform
+import statistics
+import sys
+import time
+from collections.abc import Callable
+from dataclasses import asdict
+from dataclasses import dataclass
+from datetime import datetime
+from datetime import timezone
+from typing import Any
+from typing import Optional
+
+type Setup = Callable[[Any], Callable[[], Any]]
+
+
+@dataclass
+class BenchmarkCase:
+    """
+    基准测试用例
+    """
+    name: str
+    group: str
+    setup: Setup
+    """
+    接收测试环境，返回被测函数；准备工作在此完成，不计入耗时
+    """
+
+
+@dataclass
+class BenchmarkResult:
+    """
+    基准测试结果，耗时单位为秒
+    """
+    name: str
+    group: str
+    median: float
+    """
+    每次调用耗时的中位数（按轮计算）
+    """
+    min: float
+    stdev: float
+    rounds: int
+    number: int
+    """
+    每轮调用次数
+    """
+
+
+CASES: dict[str, BenchmarkCase] = {}
+
+
+def benchmark(name: str, group: str) -> Callable[[Setup], Setup]:
+    """
+    注册基准测试用例
+
+    :param name: 用例名，需唯一
+    :type name: str
+    :param group: 分组
+    :type group: str
+    """
+
+    def wrapper(setup: Setup) -> Setup:
+        if name in CASES:
+            raise ValueError(f"duplicate benchmark {name!r}")
+        CASES[name] = BenchmarkCase(name=name, group=group, setup=setup)
+        return setup
+
+    return wrapper
+
+
+def calibrate(func: Callable[[], Any], min_time: float) -> int:
+    """
+    计算每轮调用次数，使每轮耗时不少于 ``min_time``
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return number
+        number *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+
+def measure(case: BenchmarkCase, env: Any, *, rounds: int, min_time: float) -> BenchmarkResult:
+    """
+    运行基准测试用例
+
+    测量期间关闭垃圾回收，以减少不同轮之间的抖动
+
+    :param case: 用例
+    :type case: BenchmarkCase
+    :param env: 测试环境
+    :type env: Any
+    :param rounds: 轮数
+    :type rounds: int
+    :param min_time: 每轮最短耗时（秒）
+    :type min_time: float
+
+    :return: 测试结果
+    :rtype: BenchmarkResult
+    """
+    func = case.setup(env)
+    number = calibrate(func, min_time)
+    timings: list[float] = []
+    gc_enabled = gc.isenabled()
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            timings.append((time.perf_counter() - start) / number)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return BenchmarkResult(
+        name=case.name,
+        group=case.group,
+        median=statistics.median(timings),
+        min=min(timings),
+        stdev=statistics.stdev(timings) if len(timings) > 1 else 0,
+        rounds=rounds,
+        number=number,
+    )
+
+
+def environment_info() -> dict[str, str]:
+    return dict(
+        python=sys.version.split()[0],
+        implementation=platform.python_implementation(),
+        platform=platform.platform(),
+        machine=platform.machine(),
+        processor=platform.processor(),
+    )
+
+
+def dump_results(results: list[BenchmarkResult], path: str) -> None:
+    """
+    将测试结果写入 JSON 文件
+    """
+    content = dict(
+        created_at=datetime.now(timezone.utc).isoformat(),
+        environment=environment_info(),
+        results={result.name: asdict(result) for result in results},
+    )
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(content, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+def load_results(path: str) -> dict[str, dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        results: dict[str, dict[str, Any]] = json.load(f)["results"]
+    return results
+
+
+@dataclass
+class Comparison:
+    """
+    与基准线的比较结果
+    """
+    name: str
+    baseline: Optional[float]
+    current: float
+
+    @property
+    def ratio(self) -> Optional[float]:
+        """
+        当前耗时与基准线的比值，大于 1 表示变慢
+        """
+        return None if self.baseline is None else self.current / self.baseline
+
+    def regressed(self, tolerance: float) -> bool:
+        return self.ratio is not None and self.ratio > 1 + tolerance
+
+
+def compare(results: list[BenchmarkResult], baseline: dict[str, dict[str, Any]]) -> list[Comparison]:
+    """
+    按耗时中位数与基准线比较
+
+    :param results: 测试结果
+    :type results: list[BenchmarkResult]
+    :param baseline: 基准线
+    :type baseline: dict[str, dict[str, Any]]
+
+    :return: 比较结果，基准线中没有的用例 ``baseline`` 为 None
+    :rtype: list[Comparison]
+    """
+    return [
+        Comparison(
+            name=result.name,
+            baseline=baseline[result.name]["median"] if result.name in baseline else None,
+            current=result.median,
+        )
+        for result in results
+    ]
+
+
+def format_time(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+__all__ = (
+    "BenchmarkCase",
+    "BenchmarkResult",
+    "CASES",
+    "benchmark",
+    "measure",
+    "dump_results",
+    "load_results",
+    "Comparison",
+    "compare",
+    "format_time",
+)
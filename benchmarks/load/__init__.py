@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+闭环负载测试
+
+按 :py:data:`PERSONAS` 中的用户类型创建账户，每个虚拟用户在一个线程中循环发送请求，
+报告各接口的吞吐量、延迟百分位数、错误率及 SQLite 写锁竞争::
+
+    python -m benchmarks.load                                  # 进程内，临时数据库
+    python -m benchmarks.load --users viewer=20,editor=5       # 指定各类型用户数
+    python -m benchmarks.load --weight create_row=0            # 调整操作权重
+    python -m benchmarks.load --url https://127.0.0.1:5000     # 对本地服务器运行
+"""
+
+from .clients import Client
+from .clients import HttpClient
+from .clients import InProcessClient
+from .clients import Reply
+from .runner import LockMonitor
+from .runner import prepare_personas
+from .runner import run_load
+from .runner import summarize
+from .workload import OPERATIONS
+from .workload import PERSONAS
+from .workload import Persona
+from .workload import WorkloadSettings
+from .workload import operation
+
+__all__ = (
+    "Client",
+    "HttpClient",
+    "InProcessClient",
+    "Reply",
+    "LockMonitor",
+    "prepare_personas",
+    "run_load",
+    "summarize",
+    "OPERATIONS",
+    "PERSONAS",
+    "Persona",
+    "WorkloadSettings",
+    "operation",
+)
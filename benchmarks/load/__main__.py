@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+
+import json
+import sys
+import unicodedata
+from collections.abc import Callable
+from collections.abc import Collection
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import asdict
+from dataclasses import dataclass
+from typing import Any
+from typing import Optional
+
+import click
+
+from app.extensions import db
+from ..fixtures import ADMIN_PASSWORD
+from ..fixtures import ADMIN_USERNAME
+from ..fixtures import benchmark_env
+from ..harness import environment_info
+from ..harness import format_time
+from .clients import Client
+from .clients import HttpClient
+from .clients import InProcessClient
+from .runner import LockMonitor
+from .runner import LockStats
+from .runner import OperationStats
+from .runner import prepare_personas
+from .runner import run_load
+from .runner import status_counts
+from .runner import summarize
+from .workload import OPERATIONS
+from .workload import PERSONAS
+from .workload import WorkloadSettings
+
+DEFAULT_USERS = "viewer=8,editor=2,admin=1,user=2"
+LOAD_PASSWORD = "load-password"
+
+
+@dataclass
+class Target:
+    """
+    被测对象
+    """
+    client_factory: Callable[[], Client]
+    monitor: Optional[LockMonitor]
+    """
+    写锁监视器，只在进程内运行时可用
+    """
+
+
+@contextmanager
+def in_process_target(rows: int, students: int) -> Iterator[Target]:
+    """
+    在临时数据库上创建应用，退出时删除
+    """
+    with benchmark_env(rows, ()) as env:
+        if students:
+            args = ["generate-data", "--students", str(students), "--classes", "0", "--accounts", "0", "--roles", "0"]
+            result = env.app.test_cli_runner().invoke(args=args)
+            if result.exit_code != 0:
+                raise RuntimeError(f"flask generate-data failed:\n{result.output}") from result.exception
+        monitor = LockMonitor(db.engine)
+        try:
+            yield Target(client_factory=lambda: InProcessClient(env.app), monitor=monitor)
+        finally:
+            monitor.close()
+
+
+@contextmanager
+def remote_target(url: str) -> Iterator[Target]:
+    yield Target(client_factory=lambda: HttpClient(url), monitor=None)
+
+
+def parse_pairs(text: str, choices: Collection[str], name: str) -> dict[str, float]:
+    """
+    解析 ``key=value,key=value`` 形式的参数
+
+    :raise click.BadParameter: 格式错误或键不在 ``choices`` 中
+    """
+    pairs: dict[str, float] = {}
+    for item in filter(None, text.split(",")):
+        key, sep, value = item.partition("=")
+        if not sep or key.strip() not in choices:
+            raise click.BadParameter(f"{item!r}, expected one of {', '.join(choices)}", param_hint=name)
+        try:
+            pairs[key.strip()] = float(value)
+        except ValueError:
+            raise click.BadParameter(f"{item!r} is not a number", param_hint=name) from None
+    return pairs
+
+
+def cell(text: str, width: int, *, left: bool = False) -> str:
+    """
+    按显示宽度对齐，中文字符占两列
+    """
+    padding = " " * max(0, width - sum(2 if unicodedata.east_asian_width(c) in "WF" else 1 for c in text))
+    return text + padding if left else padding + text
+
+
+def print_report(stats: list[OperationStats], locks: Optional[LockStats], errors: dict[str, dict[int, int]]) -> None:
+    widths = (16, 8, 12, 8, 11, 11, 11, 11)
+    header = ("操作", "请求数", "吞吐量/秒", "错误率", "p50", "p95", "p99", "最大")
+    print()
+    print("".join(cell(text, width, left=i == 0) for i, (text, width) in enumerate(zip(header, widths))))
+    for item in stats:
+        row = (
+            item.operation,
+            str(item.count),
+            f"{item.throughput:.1f}",
+            f"{item.error_rate:.1%}",
+            *(format_time(value) for value in (item.p50, item.p95, item.p99, item.max)),
+        )
+        print("".join(cell(text, width, left=i == 0) for i, (text, width) in enumerate(zip(row, widths))))
+    for name, statuses in sorted(errors.items()):
+        print(f"    {name} 失败的状态码：{', '.join(f'{status}×{count}' for status, count in sorted(statuses.items()))}")
+
+    print()
+    if locks is None:
+        print("写锁竞争：仅在进程内运行时可测量")
+    elif locks.writes:
+        print(
+            f"写锁竞争：{locks.writes} 条写语句，耗时 p50 {format_time(locks.p50)}、p99 {format_time(locks.p99)}、"
+            f"最大 {format_time(locks.max)}，数据库锁定错误 {locks.locked_errors} 次"
+        )
+    else:
+        print(f"写锁竞争：没有写语句，数据库锁定错误 {locks.locked_errors} 次")
+
+
+def dump_report(path: str, options: dict[str, Any], stats: list[OperationStats], locks: Optional[LockStats]) -> None:
+    content = dict(
+        environment=environment_info(),
+        options=options,
+        operations={item.operation: asdict(item) for item in stats},
+        locks=None if locks is None else asdict(locks),
+    )
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(content, f, ensure_ascii=False, indent=2, default=str)
+        f.write("\n")
+
+
+@click.command()
+@click.option("--url", default=None, help="本地服务器地址，不指定时在进程内使用临时数据库运行")
+@click.option("--users", default=DEFAULT_USERS, show_default=True, help=f"各类型用户数，可选 {', '.join(PERSONAS)}")
+@click.option("--weight", "weights", multiple=True, help="覆盖操作权重，如 create_row=0，可多次指定")
+@click.option("--duration", type=float, default=15, show_default=True, help="持续时间（秒）")
+@click.option("--warmup", type=float, default=3, show_default=True, help="不计入统计的预热时间（秒）")
+@click.option("--think-time", type=float, default=0, show_default=True, help="相邻请求间的平均等待时间（秒）")
+@click.option("--rows", type=int, default=5000, show_default=True, help="进程内运行时 classes 表的行数；翻页的范围")
+@click.option("--students", type=int, default=0, show_default=True, help="进程内运行时生成的学生数")
+@click.option("--table", default=None, help="get_rows 翻页的表，默认生成学生时为 students，否则为 classes")
+@click.option("--page-size", type=int, default=50, show_default=True)
+@click.option("--admin-username", default=ADMIN_USERNAME, show_default=True, help="用于创建测试账户的管理员")
+@click.option("--admin-password", default=ADMIN_PASSWORD, show_default=True)
+@click.option("--seed", type=int, default=0, show_default=True, help="随机数种子")
+@click.option("--output", type=click.Path(dir_okay=False), default=None, help="将结果写入 JSON 文件")
+def main(
+        url: Optional[str],
+        users: str,
+        weights: tuple[str, ...],
+        duration: float,
+        warmup: float,
+        think_time: float,
+        rows: int,
+        students: int,
+        table: Optional[str],
+        page_size: int,
+        admin_username: str,
+        admin_password: str,
+        seed: int,
+        output: Optional[str],
+) -> None:
+    """以闭环方式运行混合负载，报告吞吐量、延迟百分位数、错误率与写锁竞争"""
+    population = {name: int(count) for name, count in parse_pairs(users, PERSONAS, "--users").items() if count > 0}
+    table = table or ("students" if students else "classes")
+    settings = WorkloadSettings(
+        password=LOAD_PASSWORD,
+        table=table,
+        rows=students if table == "students" and students else rows,
+        page_size=page_size,
+        weights=parse_pairs(",".join(weights), OPERATIONS, "--weight"),
+    )
+
+    with (in_process_target(rows, students) if url is None else remote_target(url)) as target:
+        admin = target.client_factory()
+        reply = admin.request("POST", "/api/auth/login", dict(username=admin_username, password=admin_password))
+        if not reply.ok:
+            print(f"管理员登录失败（HTTP {reply.status}，代码 {reply.code}）")
+            sys.exit(1)
+        prepare_personas(admin, population, LOAD_PASSWORD)
+        print(
+            f"{sum(population.values())} 个虚拟用户（{users}），持续 {duration:g} 秒，"
+            f"预热 {warmup:g} 秒，翻页 {settings.table}（{settings.rows} 行）"
+        )
+
+        samples = run_load(
+            target.client_factory,
+            population,
+            settings,
+            duration=duration,
+            think_time=think_time,
+            seed=seed,
+        )
+        locks = None if target.monitor is None else LockStats.from_monitor(target.monitor)
+
+    stats = summarize(samples, warmup=warmup, duration=duration)
+    print_report(stats, locks, status_counts(samples))
+    if output is not None:
+        options = dict(
+            url=url,
+            users=population,
+            weights=settings.weights,
+            duration=duration,
+            warmup=warmup,
+            think_time=think_time,
+            table=settings.table,
+            rows=settings.rows,
+            page_size=page_size,
+        )
+        dump_report(output, options, stats, locks)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+
+import json
+import ssl
+import urllib.error
+import urllib.request
+from dataclasses import dataclass
+from http.cookiejar import Cookie
+from http.cookiejar import CookieJar
+from http.cookiejar import DefaultCookiePolicy
+from typing import Any
+from typing import Optional
+from typing import Protocol
+
+from flask import Flask
+
+CSRF_COOKIE = "csrf_access_token"
+CSRF_HEADER = "X-CSRF-TOKEN"
+
+
+@dataclass
+class Reply:
+    """
+    响应摘要
+    """
+    status: int
+    """
+    HTTP 状态码
+    """
+    code: Optional[int]
+    """
+    API 代码，响应不是 JSON 时为 None
+    """
+    size: int
+    """
+    响应体字节数
+    """
+
+    @property
+    def ok(self) -> bool:
+        """
+        HTTP 状态码小于 400 且 API 代码表示成功（个位为 1）
+        """
+        return self.status < 400 and self.code is not None and self.code % 10 == 1
+
+
+class Client(Protocol):
+    """
+    保存登录状态的客户端，每个虚拟用户一个
+    """
+
+    def request(self, method: str, path: str, body: Any = None) -> Reply:
+        ...
+
+
+def parse_code(content: bytes) -> Optional[int]:
+    try:
+        code = json.loads(content).get("code")
+    except (ValueError, AttributeError):
+        return None
+    return code if isinstance(code, int) else None
+
+
+class InProcessClient:
+    """
+    通过 Flask 测试客户端在进程内发送请求
+    """
+
+    def __init__(self, app: Flask) -> None:
+        self.client = app.test_client()
+        self.client.environ_base["wsgi.url_scheme"] = "https"
+
+    def request(self, method: str, path: str, body: Any = None) -> Reply:
+        headers = {}
+        if method != "GET" and (cookie := self.client.get_cookie(CSRF_COOKIE)) is not None:
+            headers[CSRF_HEADER] = cookie.value
+        response = self.client.open(path, method=method, json=body, headers=headers)
+        content = response.get_data()
+        return Reply(status=response.status_code, code=parse_code(content), size=len(content))
+
+
+class LocalCookiePolicy(DefaultCookiePolicy):
+    """
+    本地服务器在证书不存在时不启用 HTTPS，此时仍需发送带 Secure 属性的登录 Cookie
+    """
+
+    def return_ok_secure(self, cookie: Cookie, request: urllib.request.Request) -> bool:
+        return True
+
+
+class HttpClient:
+    """
+    通过 HTTP 向本地服务器发送请求
+
+    本地服务器使用自签名证书，因此不校验证书
+    """
+
+    def __init__(self, base_url: str) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.cookies = CookieJar(LocalCookiePolicy())
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies),
+            urllib.request.HTTPSHandler(context=context),
+        )
+
+    def csrf_token(self) -> Optional[str]:
+        return next((cookie.value for cookie in self.cookies if cookie.name == CSRF_COOKIE), None)
+
+    def request(self, method: str, path: str, body: Any = None) -> Reply:
+        headers = {"Content-Type": "application/json"}
+        if method != "GET" and (token := self.csrf_token()) is not None:
+            headers[CSRF_HEADER] = token
+        data = None if body is None else json.dumps(body).encode()
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with self.opener.open(request) as response:
+                status, content = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, content = e.code, e.read()
+        return Reply(status=status, code=parse_code(content), size=len(content))
+
+
+__all__ = (
+    "Reply",
+    "Client",
+    "InProcessClient",
+    "HttpClient",
+)
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+
+
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+from typing import Optional
+from typing import Self
+
+from sqlalchemy import Engine
+from sqlalchemy import event
+
+from .clients import Client
+from .clients import Reply
+from .workload import OPERATIONS
+from .workload import PERSONAS
+from .workload import VirtualUser
+from .workload import WorkloadSettings
+
+LOGIN_STORM = "login_storm"
+"""
+虚拟用户开始时同时登录的请求的记录名，统计时不受预热时间影响
+"""
+
+
+@dataclass
+class Sample:
+    """
+    一次请求的记录
+    """
+    operation: str
+    persona: str
+    start: float
+    """
+    相对测试开始的秒数
+    """
+    latency: float
+    ok: bool
+    status: int
+    size: int
+
+
+def prepare_personas(admin: Client, population: dict[str, int], password: str) -> None:
+    """
+    通过 API 创建各用户类型的角色与账户，已存在的角色与账户保持不变
+
+    :param admin: 已以管理员身份登录的客户端
+    :type admin: Client
+    :param population: 用户类型到用户数的映射
+    :type population: dict[str, int]
+    :param password: 账户密码
+
+    :raise RuntimeError: 创建失败
+    """
+    for name, count in population.items():
+        persona = PERSONAS[name]
+        reply = admin.request("POST", "/api/auth/roles", dict(
+            name=persona.role,
+            description=persona.description,
+            permissions=list(persona.permissions),
+        ))
+        # 角色已存在时返回参数错误
+        if reply.status >= 500:
+            raise RuntimeError(f"failed to create role {persona.role}: {reply}")
+        accounts = [
+            dict(username=persona.username(i), password=password, roles=[persona.role], active=True)
+            for i in range(count)
+        ]
+        reply = admin.request("POST", "/api/auth/accounts/batch", dict(accounts=accounts))
+        if not reply.ok:
+            raise RuntimeError(f"failed to create accounts for {name}: {reply}")
+
+
+class LockMonitor:
+    """
+    记录写语句的耗时及数据库被锁定的错误次数
+
+    SQLite 同一时刻只允许一个写事务，其他写事务在 ``busy_timeout`` 内等待，
+    等待时间计入写语句的耗时
+    """
+
+    def __init__(self, engine: Engine) -> None:
+        self.engine = engine
+        self.write_latencies: list[float] = []
+        self.locked_errors = 0
+        self.starts = threading.local()
+        event.listen(engine, "before_cursor_execute", self.before)
+        event.listen(engine, "after_cursor_execute", self.after)
+        event.listen(engine, "handle_error", self.error)
+
+    @staticmethod
+    def is_write(statement: str) -> bool:
+        return statement.lstrip()[:6].upper() in ("INSERT", "UPDATE", "DELETE")
+
+    def before(self, _conn: Any, _cursor: Any, statement: str, *_: Any) -> None:
+        if self.is_write(statement):
+            self.starts.value = time.perf_counter()
+
+    def after(self, _conn: Any, _cursor: Any, statement: str, *_: Any) -> None:
+        if self.is_write(statement):
+            self.write_latencies.append(time.perf_counter() - self.starts.value)
+
+    def error(self, context: Any) -> None:
+        if "database is locked" in str(context.original_exception):
+            self.locked_errors += 1
+
+    def close(self) -> None:
+        event.remove(self.engine, "before_cursor_execute", self.before)
+        event.remove(self.engine, "after_cursor_execute", self.after)
+        event.remove(self.engine, "handle_error", self.error)
+
+
+def run_load(
+        client_factory: Callable[[], Client],
+        population: dict[str, int],
+        settings: WorkloadSettings,
+        *,
+        duration: float,
+        think_time: float,
+        seed: int,
+) -> list[Sample]:
+    """
+    以闭环方式运行负载：每个虚拟用户在一个线程中循环发送请求，收到响应并等待思考时间后才发送下一个
+
+    除了只登录的用户类型，所有虚拟用户在开始时同时登录，构成一次登录风暴
+
+    :param client_factory: 创建客户端
+    :type client_factory: Callable[[], Client]
+    :param population: 用户类型到用户数的映射
+    :type population: dict[str, int]
+    :param settings: 负载设置
+    :type settings: WorkloadSettings
+    :param duration: 持续时间（秒）
+    :type duration: float
+    :param think_time: 相邻两次请求之间的平均等待时间（秒），按指数分布抽取
+    :type think_time: float
+    :param seed: 随机数种子
+    :type seed: int
+
+    :return: 所有请求的记录
+    :rtype: list[Sample]
+    """
+    users = [
+        VirtualUser(PERSONAS[name], index, client_factory(), settings, random.Random(f"{seed}-{name}-{index}"))
+        for name, count in population.items()
+        for index in range(count)
+    ]
+    samples: list[Sample] = []
+    barrier = threading.Barrier(len(users) + 1)
+    origin = 0.0
+
+    def call(user: VirtualUser, name: str, label: Optional[str] = None) -> None:
+        start = time.perf_counter()
+        try:
+            reply = OPERATIONS[name](user)
+        except Exception:
+            reply = Reply(status=0, code=None, size=0)
+        end = time.perf_counter()
+        samples.append(Sample(
+            operation=label or name,
+            persona=user.persona.name,
+            start=start - origin,
+            latency=end - start,
+            ok=reply.ok,
+            status=reply.status,
+            size=reply.size,
+        ))
+
+    def loop(user: VirtualUser) -> None:
+        barrier.wait()
+        if "login" not in user.persona.weights:
+            call(user, "login", LOGIN_STORM)
+        while time.perf_counter() - origin < duration:
+            call(user, user.choose_operation())
+            if think_time > 0:
+                time.sleep(user.rng.expovariate(1 / think_time))
+
+    threads = [threading.Thread(target=loop, args=(user,), daemon=True) for user in users]
+    for thread in threads:
+        thread.start()
+    origin = time.perf_counter()
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    最近秩百分位数
+
+    :param values: 已排序的值
+    :type values: list[float]
+    :param q: 百分位，0 至 100
+    :type q: float
+    """
+    if not values:
+        return math.nan
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+@dataclass
+class OperationStats:
+    """
+    一个操作的统计结果，耗时单位为秒
+    """
+    operation: str
+    count: int
+    errors: int
+    throughput: float
+    """
+    每秒完成的请求数
+    """
+    p50: float
+    p95: float
+    p99: float
+    max: float
+    bytes: int
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.count if self.count else 0
+
+
+def summarize(samples: list[Sample], *, warmup: float, duration: float) -> list[OperationStats]:
+    """
+    按操作统计，忽略预热期间开始的请求，但开始时的登录风暴总会被统计
+
+    :param samples: 请求记录
+    :type samples: list[Sample]
+    :param warmup: 预热时间（秒）
+    :type warmup: float
+    :param duration: 持续时间（秒）
+    :type duration: float
+
+    :return: 各操作及全部请求（操作名为 ``*``）的统计结果
+    :rtype: list[OperationStats]
+    """
+    groups: defaultdict[str, list[Sample]] = defaultdict(list)
+    for sample in samples:
+        if sample.operation == LOGIN_STORM:
+            groups[LOGIN_STORM].append(sample)
+        elif sample.start >= warmup:
+            groups[sample.operation].append(sample)
+            groups["*"].append(sample)
+    window = max(duration - warmup, 1e-9)
+    stats = []
+    for name, group in sorted(groups.items()):
+        latencies = sorted(sample.latency for sample in group)
+        stats.append(OperationStats(
+            operation=name,
+            count=len(group),
+            errors=sum(not sample.ok for sample in group),
+            throughput=len(group) / window,
+            p50=percentile(latencies, 50),
+            p95=percentile(latencies, 95),
+            p99=percentile(latencies, 99),
+            max=latencies[-1],
+            bytes=sum(sample.size for sample in group),
+        ))
+    return stats
+
+
+@dataclass
+class LockStats:
+    """
+    写语句耗时与数据库锁定错误的统计结果
+    """
+    writes: int
+    p50: float
+    p99: float
+    max: float
+    locked_errors: int
+
+    @classmethod
+    def from_monitor(cls, monitor: LockMonitor) -> Self:
+        latencies = sorted(monitor.write_latencies)
+        return cls(
+            writes=len(latencies),
+            p50=percentile(latencies, 50),
+            p99=percentile(latencies, 99),
+            max=latencies[-1] if latencies else math.nan,
+            locked_errors=monitor.locked_errors,
+        )
+
+
+def status_counts(samples: list[Sample]) -> dict[str, dict[int, int]]:
+    """
+    各操作失败请求的 HTTP 状态码分布，状态码 0 表示客户端异常
+    """
+    counts: defaultdict[str, defaultdict[int, int]] = defaultdict(lambda: defaultdict(int))
+    for sample in samples:
+        if not sample.ok:
+            counts[sample.operation][sample.status] += 1
+    return {name: dict(statuses) for name, statuses in counts.items()}
+
+
+__all__ = (
+    "LOGIN_STORM",
+    "Sample",
+    "prepare_personas",
+    "LockMonitor",
+    "run_load",
+    "percentile",
+    "OperationStats",
+    "summarize",
+    "LockStats",
+    "status_counts",
+)
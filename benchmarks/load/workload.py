@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+
+import random
+from collections.abc import Callable
+from dataclasses import dataclass
+from dataclasses import field
+
+from app.permission import PERMISSIONS
+from .clients import Client
+from .clients import Reply
+
+ALL_PERMISSIONS = tuple(
+    str(permission)
+    for group in (
+        PERMISSIONS.PERMISSION,
+        PERMISSIONS.ROLE,
+        PERMISSIONS.ACCOUNT,
+        PERMISSIONS.TABLE,
+        PERMISSIONS.DATA,
+        PERMISSIONS.SYSTEM,
+    )
+    for permission in group
+)
+WRITE_TABLE = "classes"
+"""
+``create_row`` 写入的表，只有一个必填的唯一列
+"""
+
+
+@dataclass(frozen=True)
+class Persona:
+    """
+    虚拟用户类型，对应一个角色
+    """
+    name: str
+    description: str
+    permissions: tuple[str, ...]
+    weights: dict[str, float] = field(hash=False)
+    """
+    操作名到权重的映射
+    """
+
+    @property
+    def role(self) -> str:
+        return f"load_{self.name}"
+
+    def username(self, index: int) -> str:
+        return f"load_{self.name}_{index}"
+
+
+PERSONAS: dict[str, Persona] = {
+    persona.name: persona
+    for persona in (
+        Persona(
+            name="viewer",
+            description="仪表盘，轮询数据表并翻页",
+            permissions=(PERMISSIONS.TABLE.LIST, PERMISSIONS.TABLE.GET, PERMISSIONS.DATA.GET),
+            weights=dict(get_tables=2, get_rows=5),
+        ),
+        Persona(
+            name="editor",
+            description="录入人员，翻页并成批新增数据",
+            permissions=(PERMISSIONS.TABLE.LIST, PERMISSIONS.TABLE.GET, PERMISSIONS.DATA.GET, PERMISSIONS.DATA.CREATE),
+            weights=dict(get_rows=2, create_row=3),
+        ),
+        Persona(
+            name="admin",
+            description="管理员，拥有全部权限",
+            permissions=ALL_PERMISSIONS,
+            weights=dict(get_tables=1, get_rows=2, create_row=1),
+        ),
+        Persona(
+            name="user",
+            description="普通用户，反复登录",
+            permissions=(PERMISSIONS.ACCOUNT.UPDATE_SELF_PASSWORD,),
+            weights=dict(login=1),
+        ),
+    )
+}
+
+
+@dataclass(kw_only=True)
+class WorkloadSettings:
+    """
+    所有虚拟用户共用的设置
+    """
+    password: str
+    table: str
+    rows: int
+    """
+    ``table`` 中的行数，``get_rows`` 的偏移量不超过该值
+    """
+    page_size: int
+    weights: dict[str, float] = field(default_factory=dict)
+    """
+    覆盖各用户类型中同名操作的权重
+    """
+
+
+@dataclass
+class VirtualUser:
+    """
+    虚拟用户
+    """
+    persona: Persona
+    index: int
+    client: Client
+    settings: WorkloadSettings
+    rng: random.Random
+    created: int = 0
+
+    @property
+    def username(self) -> str:
+        return self.persona.username(self.index)
+
+    def choose_operation(self) -> str:
+        weights = {name: self.settings.weights.get(name, weight) for name, weight in self.persona.weights.items()}
+        names = [name for name, weight in weights.items() if weight > 0]
+        if not names:
+            raise ValueError(f"persona {self.persona.name!r} has no operation with positive weight")
+        return self.rng.choices(names, weights=[weights[name] for name in names])[0]
+
+
+type Operation = Callable[[VirtualUser], Reply]
+
+OPERATIONS: dict[str, Operation] = {}
+
+
+def operation(name: str) -> Callable[[Operation], Operation]:
+    """
+    注册操作
+
+    :param name: 操作名，需唯一
+    :type name: str
+    """
+
+    def wrapper(func: Operation) -> Operation:
+        if name in OPERATIONS:
+            raise ValueError(f"duplicate operation {name!r}")
+        OPERATIONS[name] = func
+        return func
+
+    return wrapper
+
+
+@operation("login")
+def login(user: VirtualUser) -> Reply:
+    return user.client.request("POST", "/api/auth/login", dict(username=user.username, password=user.settings.password))
+
+
+@operation("get_tables")
+def get_tables(user: VirtualUser) -> Reply:
+    return user.client.request("GET", "/api/data/tables")
+
+
+@operation("get_rows")
+def get_rows(user: VirtualUser) -> Reply:
+    settings = user.settings
+    offset = user.rng.randrange(max(1, settings.rows - settings.page_size + 1))
+    return user.client.request("GET", f"/api/data/tables/{settings.table}/rows/{offset}/{settings.page_size}")
+
+
+@operation("create_row")
+def create_row(user: VirtualUser) -> Reply:
+    user.created += 1
+    return user.client.request(
+        "POST",
+        f"/api/data/tables/{WRITE_TABLE}/rows",
+        dict(name=f"{user.username}_{user.rng.getrandbits(32):08x}_{user.created}"),
+    )
+
+
+__all__ = (
+    "Persona",
+    "PERSONAS",
+    "WorkloadSettings",
+    "VirtualUser",
+    "Operation",
+    "OPERATIONS",
+    "operation",
+)
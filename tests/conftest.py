@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+测试夹具
+
+每个测试使用临时目录中新建并初始化的 SQLite 数据库；``REDIS_URL`` 为 ``memory://``，
+令牌黑名单、版本戳与响应缓存均在进程内，无需 Redis 服务
+"""
+
+import os
+import shutil
+from collections.abc import Callable
+from collections.abc import Collection
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+# 须在导入应用之前设置，令牌黑名单在导入时创建
+os.environ.setdefault("REDIS_URL", "memory://")
+
+import pytest  # noqa: E402
+from flask import Flask  # noqa: E402
+from flask.testing import FlaskClient  # noqa: E402
+
+from app import create_app  # noqa: E402
+from app.extensions import db  # noqa: E402
+from app.permission import PERMISSIONS  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path: Path) -> Iterator[Flask]:
+    app = create_app(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'app.db'}",
+        DATABASE_PROFILE_REPORT=False,
+    )
+    result = app.test_cli_runner().invoke(args=["init"])
+    assert result.exit_code == 0, result.output
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+def login(app: Flask, username: str, password: str) -> FlaskClient:
+    """
+    登录并返回带有令牌 Cookie 的客户端
+    """
+    client = app.test_client()
+    # 令牌 Cookie 带有 Secure 属性
+    client.environ_base["wsgi.url_scheme"] = "https"
+    response = client.post("/api/auth/login", json=dict(username=username, password=password))
+    assert response.json is not None and response.json["code"] % 10 == 1, response.json
+    return client
+
+
+def csrf_headers(client: FlaskClient) -> dict[str, str]:
+    cookie = client.get_cookie("csrf_access_token")
+    assert cookie is not None
+    return {"X-CSRF-TOKEN": cookie.value}
+
+
+def succeeded(response: Any) -> bool:
+    return response.json is not None and response.json["code"] % 10 == 1
+
+
+@pytest.fixture
+def admin(app: Flask) -> FlaskClient:
+    return login(app, "admin", "admin")
+
+
+def create_account(admin: FlaskClient, username: str, role: str, permissions: Collection[str]) -> None:
+    """
+    创建拥有 ``role`` 角色的账户，角色不存在时以 ``permissions`` 创建，密码与用户名相同
+    """
+    roles = admin.get("/api/auth/roles").json
+    assert roles is not None
+    if role not in {r["name"] for r in roles["roles"]}:
+        response = admin.post(
+            "/api/auth/roles",
+            json=dict(name=role, description=role, permissions=list(permissions)),
+            headers=csrf_headers(admin),
+        )
+        assert succeeded(response), response.json
+    response = admin.post(
+        "/api/auth/accounts",
+        json=dict(username=username, password=username, roles=[role], active=True),
+        headers=csrf_headers(admin),
+    )
+    assert succeeded(response), response.json
+
+
+@pytest.fixture
+def readers(app: Flask, admin: FlaskClient) -> tuple[FlaskClient, FlaskClient]:
+    """
+    两个权限相同（只能读取数据）的账户
+    """
+    create_account(admin, "reader1", "reader", [PERMISSIONS.DATA.GET])
+    create_account(admin, "reader2", "reader", [PERMISSIONS.DATA.GET])
+    return login(app, "reader1", "reader1"), login(app, "reader2", "reader2")
+
+
+@pytest.fixture
+def lagging_replica(app: Flask, tmp_path: Path) -> Iterator[Callable[..., Flask]]:
+    """
+    以当前数据库的副本作为只读副本创建应用，此后对主库的写入不会出现在副本中，模拟落后的副本
+    """
+    apps: list[Flask] = []
+
+    def create(**config: Any) -> Flask:
+        with app.app_context():
+            db.engine.dispose()
+        replica = tmp_path / f"replica{len(apps)}.db"
+        shutil.copyfile(tmp_path / "app.db", replica)
+        apps.append(create_app(
+            SQLALCHEMY_DATABASE_URI=app.config["SQLALCHEMY_DATABASE_URI"],
+            DATABASE_REPLICA_URIS=[f"sqlite:///{replica}"],
+            DATABASE_READ_YOUR_WRITES_SECONDS=0,
+            DATABASE_PROFILE_REPORT=False,
+            **config,
+        ))
+        return apps[-1]
+
+    yield create
+    for created in apps:
+        with created.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+
+from collections import Counter
+from collections.abc import Callable
+
+from flask import Flask
+from flask.testing import FlaskClient
+
+from app.metrics import CACHE_REQUESTS
+
+from .conftest import csrf_headers
+from .conftest import login
+from .conftest import succeeded
+
+ROWS = "/api/data/tables/classes/rows/0/5"
+
+
+def cache_results(endpoint: str) -> Counter[str]:
+    """
+    获取端点各查找结果的次数，指标在测试之间累计，比较前后的差值
+    """
+    return Counter({
+        labels[1]: int(values[0]) for labels, values in CACHE_REQUESTS.series.items() if labels[0] == endpoint
+    })
+
+
+def results_of(client: FlaskClient, url: str) -> Counter[str]:
+    before = cache_results("data.get_rows")
+    response = client.get(url)
+    assert response.status_code == 200
+    return cache_results("data.get_rows") - before
+
+
+def test_repeated_read_hits_cache(admin: FlaskClient) -> None:
+    assert results_of(admin, ROWS) == Counter(miss=1)
+    assert results_of(admin, ROWS) == Counter(local=1)
+
+
+def test_commit_invalidates_cache(admin: FlaskClient) -> None:
+    assert results_of(admin, ROWS) == Counter(miss=1)
+    response = admin.post("/api/data/tables/classes/rows", json=dict(name="test-class"), headers=csrf_headers(admin))
+    assert succeeded(response), response.json
+
+    assert results_of(admin, ROWS) == Counter(miss=1)
+    rows = admin.get(ROWS).json
+    assert rows is not None
+    assert [row["name"] for row in rows["rows"]] == ["test-class"]
+
+
+def test_rolled_back_write_keeps_cache(admin: FlaskClient) -> None:
+    headers = csrf_headers(admin)
+    assert succeeded(admin.post("/api/data/tables/classes/rows", json=dict(name="test-class"), headers=headers))
+    assert results_of(admin, ROWS) == Counter(miss=1)
+    # 违反唯一约束，写入回滚
+    response = admin.post("/api/data/tables/classes/rows", json=dict(name="test-class"), headers=headers)
+    assert not succeeded(response)
+    assert results_of(admin, ROWS) == Counter(local=1)
+
+
+def test_cache_is_per_permission_set(admin: FlaskClient, readers: tuple[FlaskClient, FlaskClient]) -> None:
+    reader1, reader2 = readers
+    assert results_of(admin, ROWS) == Counter(miss=1)
+    # 权限不同的调用者不共用条目
+    assert results_of(reader1, ROWS) == Counter(miss=1)
+    # 权限相同的调用者共用条目
+    assert results_of(reader2, ROWS) == Counter(local=1)
+
+
+def test_miss_is_computed_on_primary(lagging_replica: Callable[..., Flask]) -> None:
+    admin = login(lagging_replica(), "admin", "admin")
+    response = admin.post("/api/data/tables/classes/rows", json=dict(name="test-class"), headers=csrf_headers(admin))
+    assert succeeded(response), response.json
+
+    for expected in (Counter(miss=1), Counter(local=1)):
+        before = cache_results("data.get_rows")
+        rows = admin.get(ROWS).json
+        assert cache_results("data.get_rows") - before == expected
+        assert rows is not None
+        assert [row["name"] for row in rows["rows"]] == ["test-class"]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+
+from flask import Flask
+from flask.testing import FlaskClient
+from flask_jwt_extended import verify_jwt_in_request
+
+from app.coalescing import CONTEXT_ATTR
+from app.coalescing import request_key
+
+ROWS = "/api/data/tables/classes/rows/0/5"
+
+
+def coalescing_key(app: Flask, client: FlaskClient, url: str) -> str:
+    """
+    计算 ``client`` 请求 ``url`` 时用于合并的键
+    """
+    token = client.get_cookie("access_token_cookie")
+    assert token is not None
+    with app.test_request_context(url, headers={"Cookie": f"access_token_cookie={token.value}"}):
+        verify_jwt_in_request()
+        context = getattr(app.view_functions["data.get_rows"], CONTEXT_ATTR)
+        key = request_key(context)
+    assert key is not None
+    return key
+
+
+def test_coalescing_is_per_permission_set(
+        app: Flask, admin: FlaskClient, readers: tuple[FlaskClient, FlaskClient],
+) -> None:
+    reader1, reader2 = readers
+    admin_key = coalescing_key(app, admin, ROWS)
+    reader_key = coalescing_key(app, reader1, ROWS)
+    assert admin_key != reader_key
+    assert coalescing_key(app, reader2, ROWS) == reader_key
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+
+from pathlib import Path
+
+from flask import Flask
+from flask import send_file
+
+from app.compression import compress_response
+
+
+def test_file_responses_are_not_compressed(app: Flask, tmp_path: Path) -> None:
+    path = tmp_path / "result.txt"
+    path.write_text("row\n" * 10000)
+    with app.test_request_context(headers={"Accept-Encoding": "gzip"}):
+        response = compress_response(send_file(path, mimetype="text/plain", conditional=True))
+        assert "Content-Encoding" not in response.headers
+        assert response.direct_passthrough
+        assert response.headers["Accept-Ranges"] == "bytes"
+        assert not response.get_etag()[0].endswith("-gzip")  # type: ignore[union-attr]
+        response.close()
+
+
+def test_api_payloads_are_compressed(app: Flask) -> None:
+    with app.test_request_context(headers={"Accept-Encoding": "gzip"}):
+        response = compress_response(app.response_class("x" * 10000, mimetype="application/json"))
+        assert response.headers["Content-Encoding"] == "gzip"
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+
+import asyncio
+from collections.abc import Callable
+from typing import Any
+
+import pytest
+from flask import Flask
+from flask.testing import FlaskClient
+from sqlalchemy import event
+
+from app import conditional
+from app.asgi import AsyncDataApp
+from app.conditional import CACHE_CONTROL
+from app.stamps import bump_stamps
+
+from .conftest import csrf_headers
+from .conftest import login
+from .conftest import succeeded
+
+ROWS = "/api/data/tables/classes/rows/0/5"
+
+
+def test_rows_carry_validators(admin: FlaskClient) -> None:
+    response = admin.get(ROWS)
+    assert response.status_code == 200
+    assert response.headers["ETag"].startswith('W/"')
+    assert response.headers["Cache-Control"] == CACHE_CONTROL
+
+
+def test_matching_etag_answers_304(admin: FlaskClient) -> None:
+    etag = admin.get(ROWS).headers["ETag"]
+    response = admin.get(ROWS, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+
+
+def test_stamp_bump_invalidates_etag(app: Flask, admin: FlaskClient) -> None:
+    etag = admin.get(ROWS).headers["ETag"]
+    with app.app_context():
+        bump_stamps(["classes"])
+    response = admin.get(ROWS, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_other_tables_keep_etag(app: Flask, admin: FlaskClient) -> None:
+    etag = admin.get(ROWS).headers["ETag"]
+    with app.app_context():
+        bump_stamps(["students"])
+    assert admin.get(ROWS, headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_write_invalidates_etag(admin: FlaskClient) -> None:
+    etag = admin.get(ROWS).headers["ETag"]
+    response = admin.post("/api/data/tables/classes/rows", json=dict(name="test-class"), headers=csrf_headers(admin))
+    assert succeeded(response), response.json
+    response = admin.get(ROWS, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_if_modified_since(admin: FlaskClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    # 修改时间距今不足 MODIFIED_DELAY 秒时不发送 Last-Modified
+    monkeypatch.setattr(conditional, "MODIFIED_DELAY", 0)
+    last_modified = admin.get(ROWS).headers["Last-Modified"]
+    assert admin.get(ROWS, headers={"If-Modified-Since": last_modified}).status_code == 304
+    # 带有 If-None-Match 时忽略 If-Modified-Since
+    response = admin.get(ROWS, headers={"If-Modified-Since": last_modified, "If-None-Match": 'W/"other"'})
+    assert response.status_code == 200
+
+
+def test_compressed_etag_matches(admin: FlaskClient) -> None:
+    url = "/api/data/tables/ethnic_groups/rows/0/500"
+    response = admin.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.headers.get("Content-Encoding") == "gzip"
+    etag = response.headers["ETag"]
+    assert etag.endswith('-gzip"')
+    assert admin.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": etag}).status_code == 304
+
+
+def test_etag_is_computed_on_primary(lagging_replica: Callable[..., Flask]) -> None:
+    # 不使用响应缓存，视图每次执行
+    admin = login(lagging_replica(CACHE_ENABLED=False), "admin", "admin")
+    response = admin.post("/api/data/tables/classes/rows", json=dict(name="test-class"), headers=csrf_headers(admin))
+    assert succeeded(response), response.json
+
+    response = admin.get(ROWS)
+    assert response.json is not None
+    assert [row["name"] for row in response.json["rows"]] == ["test-class"]
+    assert admin.get(ROWS, headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+
+def asgi_get(app: AsyncDataApp, path: str, headers: dict[str, str]) -> tuple[int, dict[str, str], bytes]:
+    """
+    以最简的 ASGI 调用请求 ``path``，返回状态码、响应头与响应体
+    """
+    messages: list[dict[str, Any]] = []
+
+    async def receive() -> dict[str, Any]:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: dict[str, Any]) -> None:
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "https",
+        "path": path,
+        "root_path": "",
+        "query_string": b"",
+        "server": ("localhost", 443),
+        "client": ("127.0.0.1", 50000),
+        "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()],
+    }
+    asyncio.run(app(scope, receive, send))
+    start, body = messages[0], messages[-1]
+    response_headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in start["headers"]}
+    return start["status"], response_headers, body["body"]
+
+
+def test_asgi_conditional_rows(app: Flask, admin: FlaskClient) -> None:
+    asgi = AsyncDataApp(app)
+    token = admin.get_cookie("access_token_cookie")
+    assert token is not None
+    cookie = {"Cookie": f"access_token_cookie={token.value}"}
+
+    etag = admin.get(ROWS).headers["ETag"]
+    status, headers, _body = asgi_get(asgi, ROWS, cookie)
+    assert status == 200
+    assert headers["etag"] == etag
+    assert headers["cache-control"] == CACHE_CONTROL
+
+    status, _headers, body = asgi_get(asgi, ROWS, {**cookie, "If-None-Match": etag})
+    assert status == 304
+    assert body == b""
+
+    response = admin.post("/api/data/tables/classes/rows", json=dict(name="test-class"), headers=csrf_headers(admin))
+    assert succeeded(response), response.json
+    status, headers, _body = asgi_get(asgi, ROWS, {**cookie, "If-None-Match": etag})
+    assert status == 200
+    assert headers["etag"] != etag
+
+
+def test_asgi_binds_integer_user_id(app: Flask, admin: FlaskClient) -> None:
+    # SQLite 会隐式转换字符串参数，asyncpg 不会，检查绑定的参数类型
+    asgi = AsyncDataApp(app)
+    token = admin.get_cookie("access_token_cookie")
+    assert token is not None
+    parameters: list[Any] = []
+
+    def record(_conn: Any, _cursor: Any, _statement: str, params: Any, *_: Any) -> None:
+        parameters.extend(params)
+
+    event.listen(asgi.engine.sync_engine, "before_cursor_execute", record)
+    status, _headers, _body = asgi_get(asgi, ROWS, {"Cookie": f"access_token_cookie={token.value}"})
+    assert status == 200
+    assert parameters and not any(isinstance(param, str) and param.isdigit() for param in parameters)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+
+import json
+import threading
+from collections.abc import Iterator
+from typing import Any
+
+import pytest
+import redis
+
+from app import events
+from app.database import ChangeBatch
+from app.events import RedisBroker
+
+
+class PubSub:
+    def __init__(self, messages: list[Any], ready: threading.Event) -> None:
+        self.messages = messages
+        self.ready = ready
+
+    def subscribe(self, _channel: str) -> None:
+        pass
+
+    def listen(self) -> Iterator[dict[str, Any]]:
+        # 等待测试中的订阅者订阅
+        self.ready.wait(5)
+        for message in self.messages:
+            if isinstance(message, Exception):
+                raise message
+            yield {"type": "message", "data": message}
+
+    def close(self) -> None:
+        pass
+
+
+class Client:
+    """
+    依次返回 ``connections`` 中的订阅连接，之后订阅时抛出意外的异常
+    """
+
+    def __init__(self, connections: list[list[Any]]) -> None:
+        self.connections = connections
+        self.ready = threading.Event()
+
+    def pubsub(self, **_: Any) -> PubSub:
+        if not self.connections:
+            raise RuntimeError("unexpected")
+        return PubSub(self.connections.pop(0), self.ready)
+
+
+def test_listener_survives_errors_and_restarts(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(events, "RECONNECT_SECONDS", 0)
+    batch = ChangeBatch("classes", 1, 2, [(1, "insert")])
+    client = Client([
+        ["{", json.dumps(dict(table="classes")), redis.exceptions.TimeoutError()],
+        [json.dumps(dict(table="classes", since=1, version=2, changes=[[1, "insert"]]))],
+    ])
+    broker = RedisBroker(10, client, "events")  # type: ignore[arg-type]
+    subscriber = broker.subscribe(["classes"])
+    listener = broker._listener
+    assert listener is not None
+    client.ready.set()
+    listener.join(5)
+
+    # 无法解析的消息被跳过，订阅出错后重新订阅，线程意外退出后通知订阅者并可重新启动
+    assert not listener.is_alive()
+    assert subscriber.events.get_nowait() == batch
+    assert subscriber.overflowed.is_set()
+    assert broker._listener is None
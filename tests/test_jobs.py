@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+
+import time
+
+from flask.testing import FlaskClient
+
+from .conftest import csrf_headers
+from .conftest import succeeded
+
+
+def finished_job(admin: FlaskClient, job_id: int, timeout: float = 30) -> dict[str, object]:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = admin.get(f"/api/jobs/{job_id}")
+        assert response.json is not None
+        job: dict[str, object] = response.json["job"]
+        if job["state"] not in ("queued", "running"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"任务 {job_id} 未在 {timeout} 秒内结束")
+
+
+def test_result_download_is_sent_as_file(admin: FlaskClient) -> None:
+    response = admin.post(
+        "/api/data/tables/ethnic_groups/export", json=dict(format="csv", gzip=False), headers=csrf_headers(admin),
+    )
+    assert succeeded(response), response.json
+    assert response.json is not None
+    job = finished_job(admin, response.json["job"]["id"])
+    assert job["state"] == "succeeded", job
+
+    url = f"/api/jobs/{job['id']}/result"
+    response = admin.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.mimetype == "text/csv"
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Accept-Ranges"] == "bytes"
+    etag = response.headers["ETag"]
+    response.close()
+
+    response = admin.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert response.status_code == 304
+
+    response = admin.get(url, headers={"Range": "bytes=0-3"})
+    assert response.status_code == 206
+    assert len(response.data) == 4
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+
+from flask import Flask
+from sqlalchemy import func
+from sqlalchemy import select
+
+from app.database import seed
+from app.extensions import db
+from app.routes import auth
+from app.routes import data
+
+
+def row_counts() -> dict[str, int]:
+    with db.engine.connect() as connection:
+        return {
+            name: connection.scalar(select(func.count()).select_from(table)) or 0
+            for name, table in db.metadata.tables.items()
+        }
+
+
+def test_seeding_skips_unchanged_sets(app: Flask) -> None:
+    with app.app_context():
+        counts = row_counts()
+        with db.engine.begin() as connection:
+            reports = seed(connection, [*auth.seed_sets(), *data.seed_sets()])
+        assert reports and all(report.skipped for report in reports)
+        assert row_counts() == counts
+
+
+def test_forced_seeding_inserts_nothing_twice(app: Flask) -> None:
+    with app.app_context():
+        counts = row_counts()
+        with db.engine.begin() as connection:
+            reports = seed(connection, [*auth.seed_sets(), *data.seed_sets()], force=True)
+        assert not any(report.skipped for report in reports)
+        assert all(sum(report.inserted.values()) == 0 for report in reports)
+        assert row_counts() == counts
+
+
+def test_init_is_repeatable(app: Flask) -> None:
+    result = app.test_cli_runner().invoke(args=["init"])
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        assert db.session.scalar(select(func.count()).select_from(db.metadata.tables["users"])) == 2